@@ -203,6 +203,7 @@ class AuxiliaryApplication(OpenStackApplication):
                     coro=self.model.run_action(
                         unit.name, "run-deferred-hooks", raise_on_failure=True
                     ),
+                    unit=unit,
                 )
                 for unit in units or self.units.values()
             ]
@@ -257,6 +258,7 @@ class AuxiliaryApplication(OpenStackApplication):
                     coro=self.model.run_action(
                         unit.name, "run-deferred-hooks", raise_on_failure=True
                     ),
+                    unit=unit,
                 )
                 for unit in units or self.units.values()
             ]
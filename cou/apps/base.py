@@ -17,6 +17,7 @@ from __future__ import annotations
 
 import asyncio
 import logging
+import math
 import os
 from collections import defaultdict
 from dataclasses import dataclass, field
@@ -27,6 +28,8 @@ import yaml
 from cou.exceptions import ApplicationError, HaltUpgradePlanGeneration, MismatchedOpenStackVersions
 from cou.steps import (
     ApplicationUpgradePlan,
+    BaseStep,
+    PackageUpgradeStep,
     PostUpgradeStep,
     PreUpgradeStep,
     UnitUpgradeStep,
@@ -318,6 +321,19 @@ class OpenStackApplication(Application):
 
         return dict(o7k_versions)
 
+    @property
+    def is_clustered(self) -> bool:
+        """Check if the application is clustered with hacluster.
+
+        :return: True if the application has more units with hacluster subordinate, False
+                 otherwise
+        :rtype: bool
+        """
+        return len(self.units) > 1 and all(
+            any(subordinate.charm == "hacluster" for subordinate in unit.subordinates)
+            for unit in self.units.values()
+        )
+
     @property
     def need_crossgrade(self) -> bool:
         """Check if need a charm crossgrade.
@@ -533,6 +549,88 @@ class OpenStackApplication(Application):
 
         return upgrade_plan
 
+    def generate_rolling_upgrade_plan(
+        self, target: OpenStackRelease, force: bool
+    ) -> ApplicationUpgradePlan:
+        """Generate upgrade plan upgrading the units in rolling waves.
+
+        The application is upgraded unit by unit. A single canary unit is upgraded first and the
+        remaining units follow in waves of ceil(n/2)-1 units, so the majority of n units stays
+        in service and the cluster keeps its quorum. Applications without the
+        action-managed-upgrade config option are upgraded using the all-in-one method.
+
+        :param target: OpenStack codename to upgrade.
+        :type target: OpenStackRelease
+        :param force: Whether the plan generation should be forced
+        :type force: bool
+        :return: Full upgrade plan if the Application is able to generate it.
+        :rtype: ApplicationUpgradePlan
+        """
+        if "action-managed-upgrade" not in self.config:
+            logger.warning(
+                "%s cannot be upgraded in rolling waves, because it doesn't have the "
+                "action-managed-upgrade config option. The upgrade will proceed using the "
+                "all-in-one method.",
+                self.name,
+            )
+            return self.generate_upgrade_plan(target, force)
+
+        units = list(self.units.values())
+        upgrade_plan = self.generate_upgrade_plan(target, force, units)
+        for index, step in enumerate(upgrade_plan.sub_steps):
+            if self._is_units_upgrade_step(step):
+                waves = self._get_units_upgrade_waves(step)
+                upgrade_plan.replace_sub_steps([waves], index, index + 1)
+
+        return upgrade_plan
+
+    @staticmethod
+    def _is_units_upgrade_step(step: BaseStep) -> bool:
+        """Check if the step upgrades the units in parallel.
+
+        :param step: Step of the application upgrade plan.
+        :type step: BaseStep
+        :return: True if the step contains only upgrade plans of individual units.
+        :rtype: bool
+        """
+        # pylint: disable=protected-access
+        return (
+            step._coro is None
+            and step.parallel
+            and not isinstance(step, PackageUpgradeStep)
+            and bool(step.sub_steps)
+            and all(
+                isinstance(sub_step, UnitUpgradeStep) and sub_step.unit is not None
+                for sub_step in step.sub_steps
+            )
+        )
+
+    @staticmethod
+    def _get_units_upgrade_waves(units_plan: BaseStep) -> UpgradeStep:
+        """Split the upgrade plans of units to a canary unit and rolling waves.
+
+        :param units_plan: Step upgrading the units in parallel.
+        :type units_plan: BaseStep
+        :return: Step upgrading the canary unit and then the waves of units one by one.
+        :rtype: UpgradeStep
+        """
+        unit_plans = list(units_plan.sub_steps)
+        wave_size = max(math.ceil(len(unit_plans) / 2) - 1, 1)
+        rolling_plan = UpgradeStep(f"{units_plan.description} in rolling waves")
+        rolling_plan.add_step(unit_plans[0])
+        for start in range(1, len(unit_plans), wave_size):
+            end = start + wave_size
+            wave_plans = unit_plans[start:end]
+            wave = UpgradeStep(
+                f"Upgrade wave {len(rolling_plan.sub_steps)} of units: "
+                f"{', '.join(plan.unit.name for plan in wave_plans if plan.unit)}",
+                parallel=True,
+            )
+            wave.add_steps(wave_plans)
+            rolling_plan.add_step(wave)
+
+        return rolling_plan
+
     def _get_unit_upgrade_steps(self, unit: Unit, force: bool) -> UnitUpgradeStep:
         """Get the upgrade steps for a single unit.
 
@@ -544,7 +642,7 @@ class OpenStackApplication(Application):
         :rtype: UnitUpgradeStep
         """
         # pylint: disable=unused-argument
-        unit_plan = UnitUpgradeStep(description=f"Upgrade plan for unit '{unit.name}'")
+        unit_plan = UnitUpgradeStep(description=f"Upgrade plan for unit '{unit.name}'", unit=unit)
         unit_plan.add_step(self._get_pause_unit_step(unit))
         unit_plan.add_step(self._get_openstack_upgrade_step(unit))
         unit_plan.add_step(self._get_resume_unit_step(unit))
@@ -573,15 +671,15 @@ class OpenStackApplication(Application):
 
     def _get_upgrade_current_release_packages_step(
         self, units: Optional[list[Unit]]
-    ) -> PreUpgradeStep:
+    ) -> PackageUpgradeStep:
         """Get step for upgrading software packages to the latest of the current release.
 
         :param units: Units to generate upgrade plan
         :type units: Optional[list[Unit]]
         :return: Step for upgrading software packages to the latest of the current release.
-        :rtype: PreUpgradeStep
+        :rtype: PackageUpgradeStep
         """
-        step = PreUpgradeStep(
+        step = PackageUpgradeStep(
             f"Upgrade software packages of '{self.name}' from the current APT repositories",
             parallel=True,
         )
@@ -589,6 +687,7 @@ class OpenStackApplication(Application):
             UnitUpgradeStep(
                 description=f"Upgrade software packages on unit '{unit.name}'",
                 coro=upgrade_packages(unit.name, self.model, self.packages_to_hold),
+                unit=unit,
             )
             for unit in units or self.units.values()
         )
@@ -776,6 +875,7 @@ class OpenStackApplication(Application):
             description=f"Pause the unit: '{unit.name}'",
             coro=self.model.run_action(unit.name, "pause", raise_on_failure=True),
             dependent=dependent,
+            unit=unit,
         )
 
     def _get_resume_unit_step(self, unit: Unit, dependent: bool = False) -> UnitUpgradeStep:
@@ -792,6 +892,8 @@ class OpenStackApplication(Application):
             description=f"Resume the unit: '{unit.name}'",
             coro=self.model.run_action(unit.name, "resume", raise_on_failure=True),
             dependent=dependent,
+            unit=unit,
+            compensating=True,
         )
 
     def _get_openstack_upgrade_step(self, unit: Unit, dependent: bool = False) -> UnitUpgradeStep:
@@ -808,6 +910,7 @@ class OpenStackApplication(Application):
             description=f"Upgrade the unit: '{unit.name}'",
             coro=self.model.run_action(unit.name, "openstack-upgrade", raise_on_failure=True),
             dependent=dependent,
+            unit=unit,
         )
 
     def _get_change_install_repository_step(self, target: OpenStackRelease) -> UpgradeStep:
@@ -119,7 +119,7 @@ class NovaCompute(OpenStackApplication):
         :return: Unit upgrade step
         :rtype: UnitUpgradeStep
         """
-        unit_plan = UnitUpgradeStep(f"Upgrade plan for unit '{unit.name}'")
+        unit_plan = UnitUpgradeStep(f"Upgrade plan for unit '{unit.name}'", unit=unit)
 
         if not force:
             unit_plan.add_step(self._get_empty_hypervisor_step(unit))
@@ -144,6 +144,7 @@ class NovaCompute(OpenStackApplication):
         return UnitUpgradeStep(
             f"Verify that unit '{unit.name}' has no VMs running",
             coro=verify_empty_hypervisor(unit, self.model),
+            unit=unit,
         )
 
     def _get_enable_scheduler_step(self, units: Optional[list[Unit]]) -> list[PostUpgradeStep]:
@@ -161,6 +162,8 @@ class NovaCompute(OpenStackApplication):
                 coro=self.model.run_action(
                     unit_name=unit.name, action_name="enable", raise_on_failure=True
                 ),
+                unit=unit,
+                compensating=True,
             )
             for unit in units_to_enable
         ]
@@ -180,6 +183,7 @@ class NovaCompute(OpenStackApplication):
                 coro=self.model.run_action(
                     unit_name=unit.name, action_name="disable", raise_on_failure=True
                 ),
+                unit=unit,
             )
             for unit in units_to_disable
         ]
@@ -199,6 +203,8 @@ class NovaCompute(OpenStackApplication):
             description=(f"Resume the unit: '{unit.name}'"),
             coro=resume_nova_compute_unit(self.model, unit),
             dependent=dependent,
+            unit=unit,
+            compensating=True,
         )
 
 
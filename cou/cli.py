@@ -25,16 +25,47 @@ from typing import Optional
 from juju.errors import JujuError
 
 from cou.commands import CLIargs, parse_args
-from cou.exceptions import COUException, HighestReleaseAchieved, TimeoutException
-from cou.logging import get_log_file, setup_logging
+from cou.exceptions import COUException, HighestReleaseAchieved, RunAnalysisError, TimeoutException
+from cou.logging import (
+    get_api_stats_file,
+    get_log_file,
+    get_loop_profile_file,
+    get_profile_files,
+    get_trace_file,
+    setup_logging,
+)
 from cou.ssdlc import SSDLCSysEvent, log_ssdlc_system_event
 from cou.steps import UpgradePlan
 from cou.steps.analyze import Analysis
-from cou.steps.execute import apply_step
-from cou.steps.plan import PlanStatus, generate_plan, post_upgrade_sanity_checks, verify_cloud
+from cou.steps.deadline import load_step_deadlines
+from cou.steps.estimate import (
+    estimate_application_durations,
+    estimate_scheduled_durations,
+    format_duration,
+    order_by_duration,
+)
+from cou.steps.execute import add_observer, apply_step, remove_observer
+from cou.steps.history import DurationHistory
+from cou.steps.journal import StepJournal
+from cou.steps.metrics import MetricsExporter
+from cou.steps.optimize import optimize_plan
+from cou.steps.plan import (
+    PlanStatus,
+    estimate_upgrade_duration,
+    generate_plan,
+    post_upgrade_sanity_checks,
+    verify_cloud,
+)
+from cou.steps.plan_file import PlanFile
+from cou.steps.progress import ProgressView
+from cou.steps.run_analysis import format_run_report, load_run
+from cou.steps.trace import StepTracer
 from cou.utils import print_and_debug, progress_indicator, prompt_input
+from cou.utils.api_stats import api_stats
 from cou.utils.cli import interrupt_handler
 from cou.utils.juju_utils import Model
+from cou.utils.loop_profiler import LoopProfiler
+from cou.utils.profiler import Profiler
 
 AVAILABLE_OPTIONS = "cas"
 
@@ -122,21 +153,34 @@ async def get_model(args: CLIargs) -> Model:
     return model
 
 
-async def analyze_and_generate_plan(model: Model, args: CLIargs) -> UpgradePlan:
+async def analyze_and_generate_plan(
+    model: Model, args: CLIargs, history: Optional[DurationHistory] = None
+) -> UpgradePlan:
     """Analyze the cloud and generate plan for cloud upgrade.
 
     :param model: The model to run on
     :type model: Model
     :param args: CLI arguments
     :type args: CLIargs
+    :param history: History of the step durations used to predict duration of the upgrade
+    :type history: Optional[DurationHistory]
     :return: The generated upgrade plan.
     :rtype: UpgradePlan
     :raises COUException: when cloud is not ready for upgrade
     """
-    progress_indicator.start("Analyzing cloud...")
-    analysis_result = await Analysis.create(model, skip_apps=args.skip_apps)
+    plan_file = PlanFile.load(args.plan_file) if args.plan_file is not None else None
+    analysis_result = None
+    if plan_file is not None:
+        progress_indicator.start("Checking saved upgrade plan...")
+        analysis_result = await plan_file.get_analysis(model, args)
+        progress_indicator.succeed()
+
+    if analysis_result is None:
+        progress_indicator.start("Analyzing cloud...")
+        analysis_result = await Analysis.create(model, skip_apps=args.skip_apps)
+        progress_indicator.succeed()
+
     logger.info(analysis_result)
-    progress_indicator.succeed()
 
     progress_indicator.start("Verifying cloud...")
     await verify_cloud(analysis_result, args=args)
@@ -146,6 +190,18 @@ async def analyze_and_generate_plan(model: Model, args: CLIargs) -> UpgradePlan:
     upgrade_plan = await generate_plan(analysis_result, args)
     progress_indicator.succeed()
 
+    if args.optimize_plan:
+        progress_indicator.start("Optimizing upgrade plan...")
+        plan_optimization = optimize_plan(upgrade_plan)
+        progress_indicator.succeed(str(plan_optimization))
+
+    if history is not None:
+        history.set_expected_durations(upgrade_plan, analysis_result.apps)
+        order_by_duration(upgrade_plan)
+
+    if plan_file is not None:
+        plan_file.verify_plan(upgrade_plan)
+
     print_and_debug(upgrade_plan)
 
     for warning in PlanStatus.warning_messages:
@@ -159,21 +215,58 @@ async def analyze_and_generate_plan(model: Model, args: CLIargs) -> UpgradePlan:
             "are resolved"
         )
 
+    if args.output is not None:
+        plan_file = await PlanFile.create(analysis_result, upgrade_plan, args)
+        plan_file.save(args.output)
+        print(
+            f"Upgrade plan saved to '{args.output}'. Run 'cou upgrade --plan-file "
+            f"{args.output}' to upgrade the cloud without analyzing it again."
+        )
+
     print(
         "Please note that the actual upgrade steps could be different if the cloud state "
         "changes because the plan will be re-calculated at upgrade time."
     )
+    print("Estimated duration of the application upgrade plans:")
+    for app_plan, duration in estimate_application_durations(upgrade_plan):
+        print(f"    {format_duration(duration):>8}  {app_plan.description}")
+    if scheduled_durations := list(estimate_scheduled_durations(upgrade_plan)):
+        print("Estimated duration of the scheduled hypervisors upgrades:")
+        for step, duration in scheduled_durations:
+            print(f"    {format_duration(duration):>8}  {step.description}")
+    print(
+        "Estimated duration of the upgrade: "
+        f"{format_duration(estimate_upgrade_duration(upgrade_plan))}"
+    )
 
     return upgrade_plan
 
 
-async def apply_upgrade_plan(upgrade_plan: UpgradePlan, args: CLIargs) -> None:
+async def apply_upgrade_plan(
+    upgrade_plan: UpgradePlan,
+    args: CLIargs,
+    journal: Optional[StepJournal] = None,
+    tracer: Optional[StepTracer] = None,
+    history: Optional[DurationHistory] = None,
+    metrics: Optional[MetricsExporter] = None,
+    progress: Optional[ProgressView] = None,
+) -> None:
     """Apply upgrade plan to upgrade cloud.
 
     :param upgrade_plan: CLI arguments
     :type upgrade_plan: UpgradePlan
     :param args: CLI arguments
     :type args: CLIargs
+    :param journal: Journal recording the completed steps, used to resume interrupted upgrade
+    :type journal: Optional[StepJournal]
+    :param tracer: Tracer recording the duration of all steps, saved next to the log file
+    :type tracer: Optional[StepTracer]
+    :param history: History recording the durations of completed steps
+    :type history: Optional[DurationHistory]
+    :param metrics: Exporter of the upgrade progress metrics
+    :type metrics: Optional[MetricsExporter]
+    :param progress: Live view of the upgrade progress
+    :type progress: Optional[ProgressView]
     """
     if args.prompt and not await continue_upgrade():
         return
@@ -183,11 +276,56 @@ async def apply_upgrade_plan(upgrade_plan: UpgradePlan, args: CLIargs) -> None:
     loop.add_signal_handler(SIGINT, interrupt_handler, upgrade_plan, loop, 130)
     loop.add_signal_handler(SIGTERM, interrupt_handler, upgrade_plan, loop, 143)
 
+    if args.failure_policy is not None:
+        upgrade_plan.set_default_failure_policy(args.failure_policy)
+
+    if journal is not None:
+        if args.resume:
+            skipped_steps = journal.resume()
+            print(f"Resuming interrupted upgrade, skipping {skipped_steps} completed step(s).")
+
+        journal.start(resume=args.resume)
+        add_observer(journal)
+
+    if tracer is not None:
+        add_observer(tracer)
+
+    if history is not None:
+        add_observer(history)
+
+    if metrics is not None:
+        await metrics.start()
+        add_observer(metrics)
+
     # don't print plan if in quiet mode
     if not args.quiet:
         print("Running cloud upgrade...")
 
-    await apply_step(upgrade_plan, args.prompt)
+    if progress is not None:
+        progress.start()
+        add_observer(progress)
+
+    try:
+        await apply_step(upgrade_plan, args.prompt)
+    finally:
+        if progress is not None:
+            remove_observer(progress)
+            progress.stop()
+        if journal is not None:
+            remove_observer(journal)
+        if tracer is not None:
+            remove_observer(tracer)
+            tracer.save(get_trace_file())
+        if history is not None:
+            remove_observer(history)
+            history.close()
+        if metrics is not None:
+            remove_observer(metrics)
+            await metrics.stop()
+
+    if journal is not None:
+        journal.finish()
+
     print("Upgrade completed.")
 
 
@@ -213,7 +351,11 @@ async def run_plan_subcommand(args: CLIargs) -> None:
     :type args: CLIargs
     """
     model = await get_model(args)
-    await analyze_and_generate_plan(model, args)
+    history = DurationHistory()
+    try:
+        await analyze_and_generate_plan(model, args, history)
+    finally:
+        history.close()
 
 
 async def run_upgrade_subcommand(args: CLIargs) -> None:
@@ -222,22 +364,63 @@ async def run_upgrade_subcommand(args: CLIargs) -> None:
     :param args: CLI arguments
     :type args: CLIargs
     """
+    load_step_deadlines()
+    # the live view would overwrite the prompts, so it is shown only without them
+    progress = None if args.quiet or args.prompt else ProgressView()
     model = await get_model(args)
-    cloud_upgrade_plan = await analyze_and_generate_plan(model, args)
-    await apply_upgrade_plan(cloud_upgrade_plan, args)
+    history = DurationHistory()
+    try:
+        cloud_upgrade_plan = await analyze_and_generate_plan(model, args, history)
+        journal = StepJournal(model.uuid, cloud_upgrade_plan)
+        metrics = None
+        if args.metrics_file is not None or args.metrics_port is not None:
+            metrics = MetricsExporter(cloud_upgrade_plan, args.metrics_file, args.metrics_port)
+
+        await apply_upgrade_plan(
+            cloud_upgrade_plan, args, journal, StepTracer(), history, metrics, progress
+        )
+    finally:
+        history.close()
+
+
+def run_analyze_run_subcommand(args: CLIargs) -> None:
+    """Run the `analyze-run` subcommand.
+
+    :param args: CLI arguments
+    :type args: CLIargs
+    :raises RunAnalysisError: When no log or trace file of the run was given.
+    """
+    if args.run_file is None:
+        raise RunAnalysisError("No log or trace file of the upgrade run was given.")
+
+    print(format_run_report(load_run(args.run_file)))
 
 
 async def _run_command(args: CLIargs) -> None:
     """Run 'charmed-openstack-upgrade' command.
 
+    The asyncio tasks and the event loop are profiled if the run is profiled.
+
     :param args: CLI arguments
     :type args: CLIargs
     """
-    match args.command:
-        case "plan":
-            await run_plan_subcommand(args)
-        case "upgrade":
-            await run_upgrade_subcommand(args)
+    loop_profiler = LoopProfiler() if args.profile else None
+    if loop_profiler is not None:
+        loop_profiler.start()
+
+    try:
+        match args.command:
+            case "plan":
+                await run_plan_subcommand(args)
+            case "upgrade":
+                await run_upgrade_subcommand(args)
+            case "analyze-run":
+                run_analyze_run_subcommand(args)
+    finally:
+        if loop_profiler is not None:
+            loop_profiler.stop()
+            logger.info(loop_profiler.get_summary())
+            loop_profiler.save(get_loop_profile_file())
 
 
 def entrypoint() -> None:
@@ -250,7 +433,11 @@ def entrypoint() -> None:
     args = parse_args(sys.argv[1:])
 
     log_file: Optional[Path] = None
+    profiler = Profiler() if args.profile else None
     try:
+        if profiler is not None:
+            profiler.start()
+
         # disable progress indicator when in quiet mode to suppress its console output
         progress_indicator.enabled = not args.quiet
         log_level = get_log_level(quiet=args.quiet, verbosity=args.verbosity)
@@ -318,8 +505,15 @@ def entrypoint() -> None:
         logger.exception(exc)
         sys.exit(2)
     finally:
+        if profiler is not None:
+            profiler.stop()
+            profiler.save(*get_profile_files())
         if args.command == "upgrade":
             asyncio.run(run_post_upgrade_sanity_check(args))
+        if api_stats.calls:
+            api_stats.save(get_api_stats_file())
+            if not args.quiet:
+                print(api_stats.get_summary())
         if log_file is not None and not args.quiet:
             print(f"Full execution log: '{log_file}'")
         progress_indicator.stop()
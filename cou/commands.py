@@ -18,11 +18,17 @@ import logging
 from dataclasses import dataclass, field
 from datetime import datetime
 from importlib.metadata import version
+from pathlib import Path
 from typing import Any, Iterable, Optional
 
+from cou.steps import FailurePolicy
+from cou.utils.openstack import OPENSTACK_CODENAMES
+
 CONTROL_PLANE = "control-plane"
 DATA_PLANE = "data-plane"
 HYPERVISORS = "hypervisors"
+# metadata of CLIargs fields, which do not affect the upgrade plan
+NOT_PLANNED = {"fingerprint": False}
 
 
 logger = logging.getLogger(__name__)
@@ -108,6 +114,82 @@ def batch_size_arg(value: str) -> int:
     return batch_size
 
 
+def pipeline_window_arg(value: str) -> int:
+    """Type converter for argparse.
+
+    :param value: input arg value to validate and convert
+    :type value: str
+    :return: the input value converted to an int
+    :rtype: int
+    :raises argparse.ArgumentTypeError: if integer is an invalid pipeline window
+    """
+    window = int(value)
+    if window <= 0:
+        raise argparse.ArgumentTypeError("pipeline window must be greater than 0")
+    return window
+
+
+def max_parallel_azs_arg(value: str) -> int:
+    """Type converter for argparse.
+
+    :param value: input arg value to validate and convert
+    :type value: str
+    :return: the input value converted to an int
+    :rtype: int
+    :raises argparse.ArgumentTypeError: if integer is an invalid number of AZs
+    """
+    max_parallel_azs = int(value)
+    if max_parallel_azs <= 0:
+        raise argparse.ArgumentTypeError("number of AZs must be greater than 0")
+    return max_parallel_azs
+
+
+def port_arg(value: str) -> int:
+    """Type converter for argparse.
+
+    :param value: input arg value to validate and convert
+    :type value: str
+    :return: the input value converted to an int
+    :rtype: int
+    :raises argparse.ArgumentTypeError: if integer is an invalid port
+    """
+    port = int(value)
+    if not 0 < port < 65536:
+        raise argparse.ArgumentTypeError("port must be between 1 and 65535")
+    return port
+
+
+def failure_policy_arg(value: str) -> FailurePolicy:
+    """Type converter for argparse.
+
+    :param value: input arg value to validate and convert
+    :type value: str
+    :return: the input value converted to a FailurePolicy
+    :rtype: FailurePolicy
+    :raises argparse.ArgumentTypeError: if value is an invalid failure policy
+    """
+    try:
+        return FailurePolicy.from_string(value)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(str(exc)) from exc
+
+
+def release_arg(value: str) -> str:
+    """Verify the OpenStack release is known.
+
+    :param value: input arg value to validate
+    :type value: str
+    :return: same as input string
+    :rtype: str
+    :raises argparse.ArgumentTypeError: if the release is unknown
+    """
+    if value not in OPENSTACK_CODENAMES:
+        raise argparse.ArgumentTypeError(
+            f"unknown OpenStack release '{value}', choose from: {', '.join(OPENSTACK_CODENAMES)}"
+        )
+    return value
+
+
 def purge_before_arg(value: str) -> str:
     """Verify the datetime string is acceptable.
 
@@ -218,6 +300,15 @@ def get_subcommand_common_opts_parser() -> argparse.ArgumentParser:
         ),
         required=False,
     )
+    subcommand_common_opts_parser.add_argument(
+        "--optimize-plan",
+        help="Optimize the upgrade plan by merging adjacent charm config changes\n"
+        "of the same application and dropping redundant wait steps.\n"
+        "Default to disable plan optimization.",
+        action=argparse.BooleanOptionalAction,
+        dest="optimize_plan",
+        default=argparse.SUPPRESS,
+    )
     subcommand_common_opts_parser.add_argument(
         "--force",
         action="store_true",
@@ -225,7 +316,14 @@ def get_subcommand_common_opts_parser() -> argparse.ArgumentParser:
         help="Force the plan/upgrade of non-empty hypervisors.",
         default=argparse.SUPPRESS,
     )
-
+    subcommand_common_opts_parser.add_argument(
+        "--profile",
+        help="Profile the CPU time and the memory of the run and save the profile\n"
+        "and its summary next to the log file.",
+        action="store_true",
+        dest="profile",
+        default=argparse.SUPPRESS,
+    )
     # quiet and verbose options are mutually exclusive
     group = subcommand_common_opts_parser.add_mutually_exclusive_group()
     group.add_argument(
@@ -285,6 +383,96 @@ def get_hypervisors_common_opts_parser() -> argparse.ArgumentParser:
     return hypervisors_subparser
 
 
+def get_control_plane_opts_parser() -> argparse.ArgumentParser:
+    """Create a shared parser for options of the control-plane upgrade.
+
+    The options are shared by the whole cloud and the control-plane commands.
+
+    :return: a parser groups options specific to the control-plane
+    :rtype: argparse.ArgumentParser
+    """
+    control_plane_parser = argparse.ArgumentParser(add_help=False)
+    control_plane_parser.add_argument(
+        "--rolling",
+        help=(
+            "Upgrade the units of clustered control plane applications in rolling waves."
+            "\nA single canary unit is upgraded first and then the remaining units in waves,"
+            "\nso the majority of units stays in service and the cluster keeps its quorum."
+            "\nDefault to upgrade all units of an application at the same time."
+        ),
+        action=argparse.BooleanOptionalAction,
+        dest="rolling",
+        default=argparse.SUPPRESS,
+    )
+    return control_plane_parser
+
+
+def get_data_plane_opts_parser() -> argparse.ArgumentParser:
+    """Create a shared parser for options of the hypervisors upgrade.
+
+    The options are shared by the whole cloud, the data-plane and the hypervisors commands.
+
+    :return: a parser groups options specific to the upgrade of hypervisors
+    :rtype: argparse.ArgumentParser
+    """
+    data_plane_parser = argparse.ArgumentParser(add_help=False)
+    data_plane_parser.add_argument(
+        "--pipeline-hypervisors",
+        dest="pipeline_hypervisors",
+        metavar="N",
+        type=pipeline_window_arg,
+        help=(
+            "Upgrade the hypervisors of each availability zone in a pipeline, where each"
+            "\nmachine goes through disable scheduler, package upgrade, pause, upgrade,"
+            "\nresume and enable scheduler independently of the other machines,"
+            "\nwith at most N machines in flight at the same time."
+            "\nBy default, all machines of the availability zone go through each stage"
+            "\ntogether."
+        ),
+        default=argparse.SUPPRESS,
+    )
+    data_plane_parser.add_argument(
+        "--max-parallel-azs",
+        dest="max_parallel_azs",
+        metavar="N",
+        type=max_parallel_azs_arg,
+        help=(
+            "Upgrade the hypervisors of up to N availability zones of each region at the"
+            "\nsame time. At least one availability zone of each region is always left"
+            "\nuntouched, so N is lowered to the number of availability zones of the"
+            "\nregion minus one if needed."
+            "\nBy default, availability zones are upgraded one by one."
+        ),
+        default=argparse.SUPPRESS,
+    )
+
+    return data_plane_parser
+
+
+def get_target_release_opts_parser() -> argparse.ArgumentParser:
+    """Create a shared parser for the target release option of the whole cloud upgrade.
+
+    The option is not shared with the child commands, because only the whole cloud can be
+    upgraded across several releases.
+
+    :return: a parser groups options specific to the target release
+    :rtype: argparse.ArgumentParser
+    """
+    target_release_parser = argparse.ArgumentParser(add_help=False)
+    target_release_parser.add_argument(
+        "--to",
+        help="Upgrade the cloud to the given OpenStack release, e.g. 'yoga'.\n"
+        "If the release is more than one release ahead, the plan chains\n"
+        "the upgrade to each release in between. The plan for each of\n"
+        "the following releases is generated once the previous one is\n"
+        "upgraded.\n(default: the next release)",
+        type=release_arg,
+        dest="to",
+        default=argparse.SUPPRESS,
+    )
+    return target_release_parser
+
+
 def create_plan_subparser(
     subparsers: argparse._SubParsersAction,
     subcommand_common_opts_parser: argparse.ArgumentParser,
@@ -299,14 +487,31 @@ def create_plan_subparser(
     :param hypervisors_parser: a parser grouping options specific to hypervisors
     :type hypervisors_parser: argparse.ArgumentParser
     """
-    # Arg parser for "cou plan" sub-command
+    # Arg parser for "cou plan" sub-command and set up common options
+    plan_args_parser = argparse.ArgumentParser(add_help=False)
+    plan_args_parser.add_argument(
+        "--output",
+        "-o",
+        help="Save the upgrade plan to a file, which can be passed to\n"
+        "'cou upgrade --plan-file' to upgrade the cloud without analyzing\n"
+        "it again, if the cloud has not changed.",
+        type=Path,
+        dest="output",
+        default=argparse.SUPPRESS,
+    )
     plan_parser = subparsers.add_parser(
         "plan",
         description="Show the steps COU will take to upgrade the cloud to the next release.\n"
         "If upgrade-group is unspecified, plan upgrade for the whole cloud.",
         help="Show the steps COU will take to upgrade the cloud to the next release.",
         usage="cou plan [options]",
-        parents=[subcommand_common_opts_parser],
+        parents=[
+            subcommand_common_opts_parser,
+            plan_args_parser,
+            get_target_release_opts_parser(),
+            get_control_plane_opts_parser(),
+            get_data_plane_opts_parser(),
+        ],
         formatter_class=CapitalizeHelpFormatter,
     )
 
@@ -321,7 +526,7 @@ def create_plan_subparser(
         description="Show the steps for upgrading the control-plane components.",
         help="Show the steps for upgrading the control-plane components.",
         usage="cou plan control-plane [options]",
-        parents=[subcommand_common_opts_parser],
+        parents=[subcommand_common_opts_parser, plan_args_parser, get_control_plane_opts_parser()],
         formatter_class=CapitalizeHelpFormatter,
     )
     plan_subparser.add_parser(
@@ -331,7 +536,7 @@ def create_plan_subparser(
         help="Show the steps for upgrading all data-plane components.\nThis is possible "
         "only if control-plane has been fully upgraded,\notherwise an error will be thrown.",
         usage="cou plan data-plane [options]",
-        parents=[subcommand_common_opts_parser],
+        parents=[subcommand_common_opts_parser, plan_args_parser, get_data_plane_opts_parser()],
         formatter_class=CapitalizeHelpFormatter,
     )
     plan_subparser.add_parser(
@@ -346,7 +551,12 @@ def create_plan_subparser(
         "This is possible only if control-plane\nhas been fully upgraded, otherwise an error "
         "will be thrown.",
         usage="cou plan hypervisors [options]",
-        parents=[subcommand_common_opts_parser, hypervisors_parser],
+        parents=[
+            subcommand_common_opts_parser,
+            hypervisors_parser,
+            plan_args_parser,
+            get_data_plane_opts_parser(),
+        ],
         formatter_class=CapitalizeHelpFormatter,
     )
 
@@ -374,13 +584,67 @@ def create_upgrade_subparser(
         dest="auto_approve",
         default=argparse.SUPPRESS,
     )
+    upgrade_args_parser.add_argument(
+        "--failure-policy",
+        help="Policy applied when some of the steps running in parallel fail.\n"
+        "'wait-all' waits for all the steps to finish, 'fail-fast' cancels\n"
+        "the steps which have not started yet after the first failure and\n"
+        "'threshold=N%%' cancels them once more than N%% of the steps failed.\n"
+        "Steps already running are always allowed to finish.\n(default: wait-all)",
+        type=failure_policy_arg,
+        dest="failure_policy",
+        default=argparse.SUPPRESS,
+    )
+    upgrade_args_parser.add_argument(
+        "--resume",
+        help="Resume the interrupted upgrade of the model.\nSteps completed by the "
+        "interrupted run are skipped if they are still\npart of the upgrade plan.",
+        action="store_true",
+        dest="resume",
+        default=argparse.SUPPRESS,
+    )
+    upgrade_args_parser.add_argument(
+        "--plan-file",
+        help="Upgrade the cloud with the plan saved by 'cou plan --output'.\n"
+        "The cloud is analyzed again only if it changed since the plan\n"
+        "was saved. The upgrade fails if the plan generated for the upgrade\n"
+        "differs from the saved one.",
+        type=Path,
+        dest="plan_file",
+        default=argparse.SUPPRESS,
+    )
+    upgrade_args_parser.add_argument(
+        "--metrics-file",
+        help="Write metrics of the upgrade progress in the Prometheus text\n"
+        "format to the file, e.g. in the node-exporter textfile directory.\n"
+        "The file is replaced atomically every COU_METRICS_INTERVAL seconds.",
+        type=Path,
+        dest="metrics_file",
+        metavar="PATH",
+        default=argparse.SUPPRESS,
+    )
+    upgrade_args_parser.add_argument(
+        "--metrics-port",
+        help="Serve metrics of the upgrade progress in the Prometheus text\n"
+        "format at http://127.0.0.1:PORT/metrics.",
+        type=port_arg,
+        dest="metrics_port",
+        metavar="PORT",
+        default=argparse.SUPPRESS,
+    )
     upgrade_parser = subparsers.add_parser(
         "upgrade",
         description="Run the cloud upgrade.\nIf upgrade-group is unspecified, "
         "upgrade the whole cloud.",
         help="Run the cloud upgrade.",
         usage="cou upgrade [options]",
-        parents=[subcommand_common_opts_parser, upgrade_args_parser],
+        parents=[
+            subcommand_common_opts_parser,
+            upgrade_args_parser,
+            get_target_release_opts_parser(),
+            get_control_plane_opts_parser(),
+            get_data_plane_opts_parser(),
+        ],
         formatter_class=CapitalizeHelpFormatter,
     )
 
@@ -395,7 +659,11 @@ def create_upgrade_subparser(
         description="Run upgrade for the control-plane components.",
         help="Run upgrade for the control-plane components.",
         usage="cou upgrade control-plane [options]",
-        parents=[subcommand_common_opts_parser, upgrade_args_parser],
+        parents=[
+            subcommand_common_opts_parser,
+            upgrade_args_parser,
+            get_control_plane_opts_parser(),
+        ],
         formatter_class=CapitalizeHelpFormatter,
     )
     upgrade_subparser.add_parser(
@@ -405,7 +673,7 @@ def create_upgrade_subparser(
         help="Upgrade all data-plane components.\nThis is possible only if "
         "control-plane has been fully upgraded,\notherwise an error will be thrown.",
         usage="cou upgrade data-plane [options]",
-        parents=[subcommand_common_opts_parser, upgrade_args_parser],
+        parents=[subcommand_common_opts_parser, upgrade_args_parser, get_data_plane_opts_parser()],
         formatter_class=CapitalizeHelpFormatter,
     )
     upgrade_subparser.add_parser(
@@ -423,11 +691,35 @@ def create_upgrade_subparser(
             subcommand_common_opts_parser,
             hypervisors_parser,
             upgrade_args_parser,
+            get_data_plane_opts_parser(),
         ],
         formatter_class=CapitalizeHelpFormatter,
     )
 
 
+def create_analyze_run_subparser(subparsers: argparse._SubParsersAction) -> None:
+    """Create and configure 'analyze-run' subcommand parser.
+
+    :param subparsers: subparsers that 'analyze-run' subparser belongs to
+    :type subparsers: argparse.ArgumentParser
+    """
+    analyze_run_parser = subparsers.add_parser(
+        "analyze-run",
+        description="Show the critical path of an upgrade run and the steps which would\n"
+        "save the most time if they were faster or their sub-steps ran\nin parallel. "
+        "The run is analyzed offline from the trace it saved.",
+        help="Show the critical path of an upgrade run.",
+        usage="cou analyze-run <log-or-trace>",
+        formatter_class=CapitalizeHelpFormatter,
+    )
+    analyze_run_parser.add_argument(
+        "run_file",
+        help="Log file or trace file of the upgrade run.",
+        type=Path,
+        metavar="log-or-trace",
+    )
+
+
 def create_subparsers(parser: argparse.ArgumentParser) -> argparse._SubParsersAction:
     """Create and configure subparsers.
 
@@ -451,7 +743,7 @@ def create_subparsers(parser: argparse.ArgumentParser) -> argparse._SubParsersAc
     help_parser.add_argument(
         "subcommand",
         nargs="?",
-        choices=["plan", "upgrade"],
+        choices=["plan", "upgrade", "analyze-run"],
         type=str,
         help="A sub-command to get information of.",
     )
@@ -460,6 +752,7 @@ def create_subparsers(parser: argparse.ArgumentParser) -> argparse._SubParsersAc
     hypervisors_parser = get_hypervisors_common_opts_parser()
     create_plan_subparser(subparsers, subcommand_common_opts_parser, hypervisors_parser)
     create_upgrade_subparser(subparsers, subcommand_common_opts_parser, hypervisors_parser)
+    create_analyze_run_subparser(subparsers)
 
     return subparsers
 
@@ -469,27 +762,41 @@ class CLIargs:
     """Wrap CLI arguments instead of using argparse.Namespace.
 
     Keep in sync with the argument parser defined in parse_args and check types.
+    Fields which do not affect the upgrade plan are excluded from the plan fingerprint.
     """
 
     # pylint: disable=too-many-instance-attributes
 
-    command: str
-    verbosity: int = 0
+    command: str = field(metadata=NOT_PLANNED)
+    verbosity: int = field(default=0, metadata=NOT_PLANNED)
     backup: bool = True
     set_noout: bool = False
     archive: bool = True
     archive_batch_size: int = 1000
-    quiet: bool = False
+    quiet: bool = field(default=False, metadata=NOT_PLANNED)
     force: bool = False
-    auto_approve: bool = False
-    model_name: Optional[str] = None
+    auto_approve: bool = field(default=False, metadata=NOT_PLANNED)
+    model_name: Optional[str] = field(default=None, metadata=NOT_PLANNED)
     upgrade_group: Optional[str] = None
-    subcommand: Optional[str] = None  # for help option
+    subcommand: Optional[str] = field(default=None, metadata=NOT_PLANNED)  # for help option
     machines: Optional[set[str]] = None
     availability_zones: Optional[set[str]] = None
     purge: bool = False
     purge_before: Optional[str] = None
     skip_apps: set[str] = field(default_factory=set)
+    optimize_plan: bool = False
+    failure_policy: Optional[FailurePolicy] = field(default=None, metadata=NOT_PLANNED)
+    resume: bool = field(default=False, metadata=NOT_PLANNED)
+    output: Optional[Path] = field(default=None, metadata=NOT_PLANNED)
+    plan_file: Optional[Path] = field(default=None, metadata=NOT_PLANNED)
+    to: Optional[str] = None
+    rolling: bool = False
+    pipeline_hypervisors: Optional[int] = None
+    max_parallel_azs: Optional[int] = None
+    run_file: Optional[Path] = field(default=None, metadata=NOT_PLANNED)
+    metrics_file: Optional[Path] = field(default=None, metadata=NOT_PLANNED)
+    metrics_port: Optional[int] = field(default=None, metadata=NOT_PLANNED)
+    profile: bool = field(default=False, metadata=NOT_PLANNED)
 
     @property
     def prompt(self) -> bool:
@@ -551,6 +858,8 @@ def parse_args(args: list[str]) -> CLIargs:  # pylint: disable=inconsistent-retu
                     subparsers.choices["plan"].print_help()
                 case "upgrade":
                     subparsers.choices["upgrade"].print_help()
+                case "analyze-run":
+                    subparsers.choices["analyze-run"].print_help()
             parser.exit()
 
         # validate arguments
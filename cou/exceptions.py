@@ -69,6 +69,10 @@ class RunUpgradeError(COUException):
     """Exception raised when an upgrade fails."""
 
 
+class StepDeadlineExceeded(RunUpgradeError):
+    """Exception raised when a step runs longer than its hard deadline."""
+
+
 class DataPlaneMachineFilterError(COUException):
     """Exception raised when filtering data-plane machines fails."""
 
@@ -151,3 +155,15 @@ class ApplicationNotSupported(COUException):
 
 class VaultSealed(COUException):
     """COU exception when the application vault is sealed."""
+
+
+class PlanFileError(COUException):
+    """COU exception when the upgrade plan file can not be used."""
+
+
+class RunAnalysisError(COUException):
+    """COU exception when the recorded upgrade run can not be analyzed."""
+
+
+class EnvironmentVariableError(COUException):
+    """COU exception when an environment variable has an invalid value."""
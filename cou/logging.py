@@ -17,10 +17,13 @@ import logging
 import logging.handlers
 from datetime import datetime
 from pathlib import Path
+from typing import Any, Callable, Optional
 
 from cou.utils import COU_DATA, progress_indicator
 
 COU_DIR_LOG = COU_DATA / "log"
+# log file of the run, set by setup_logging
+_log_file: Optional[Path] = None
 
 logger = logging.getLogger(__name__)
 
@@ -50,6 +53,78 @@ def get_log_file() -> Path:
     return Path(f"{COU_DIR_LOG}/cou-{time_stamp}.log")
 
 
+def _get_run_file(suffix: str) -> Path:
+    """Get path of the file of the run next to its log file.
+
+    The name is derived from the log file set up by setup_logging, so all the files of the run
+    share its time stamp.
+
+    :param suffix: suffix replacing '.log', e.g. '.trace.json'
+    :type suffix: str
+    :return: Returns file path
+    :rtype: Path
+    """
+    return (_log_file or get_log_file()).with_suffix(suffix)
+
+
+def get_trace_file() -> Path:
+    """Get trace file path.
+
+    :return: Returns trace file path
+    :rtype: Path
+    """
+    return _get_run_file(".trace.json")
+
+
+def get_api_stats_file() -> Path:
+    """Get file path of the Juju API calls statistics.
+
+    :return: Returns file path of the Juju API calls statistics
+    :rtype: Path
+    """
+    return _get_run_file(".api-stats.json")
+
+
+def get_profile_files() -> tuple[Path, Path]:
+    """Get file paths of the run profile and its summary.
+
+    :return: Returns file paths of the run profile and its summary
+    :rtype: tuple[Path, Path]
+    """
+    return _get_run_file(".prof"), _get_run_file(".profile.txt")
+
+
+def get_loop_profile_file() -> Path:
+    """Get file path of the event loop profile.
+
+    :return: Returns file path of the event loop profile
+    :rtype: Path
+    """
+    return _get_run_file(".asyncio.json")
+
+
+def save_run_file(path: Path, write: Callable[[Path], Any], description: str) -> None:
+    """Save file of the run.
+
+    Failing to save the file never affects the run, the error is only logged.
+
+    :param path: path to the file
+    :type path: Path
+    :param write: function writing the content to the path
+    :type write: Callable[[Path], Any]
+    :param description: description of the content used for logging, e.g. 'trace of the steps'
+    :type description: str
+    """
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        write(path)
+    except OSError as exc:
+        logger.warning("could not save %s to %s: %r", description, path, exc)
+        return
+
+    logger.info("%s saved to %s", description, path)
+
+
 def setup_logging(log_file: Path, log_level: str = "INFO") -> None:
     """Do setup for logging.
 
@@ -58,6 +133,8 @@ def setup_logging(log_file: Path, log_level: str = "INFO") -> None:
     :param log_level: Logging level, defaults to "INFO"
     :type log_level: str, optional
     """
+    global _log_file  # pylint: disable=global-statement
+
     progress_indicator.start("Configuring logging...")
     COU_DIR_LOG.mkdir(parents=True, exist_ok=True)
 
@@ -88,6 +165,7 @@ def setup_logging(log_file: Path, log_level: str = "INFO") -> None:
 
     root_logger.addHandler(log_file_handler)
     root_logger.addHandler(console_handler)
+    _log_file = log_file
 
     progress_indicator.stop_and_persist(text=f"Full execution log: '{log_file}'")
 
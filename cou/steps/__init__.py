@@ -17,13 +17,19 @@
 from __future__ import annotations
 
 import asyncio
+import hashlib
 import inspect
+import json
 import logging
 import os
 import warnings
-from typing import Any, Coroutine, Iterable, List, Optional
+from dataclasses import dataclass, fields, is_dataclass
+from enum import Enum
+from typing import Any, ClassVar, Coroutine, Iterable, List, Optional
 
 from cou.exceptions import CanceledStep
+from cou.utils.juju_utils import Unit
+from cou.utils.openstack import OpenStackRelease
 
 logger = logging.getLogger(__name__)
 DEPENDENCY_DESCRIPTION_PREFIX = "├── "
@@ -56,6 +62,151 @@ def compare_step_coroutines(coro1: Optional[Coroutine], coro2: Optional[Coroutin
     )
 
 
+def get_coroutine_call(coro: Coroutine) -> tuple[str, dict[str, Any]]:
+    """Get the name of the function and the arguments used to create the coroutine.
+
+    Coroutines created by functions decorated with cou.utils.juju_utils.retry are unwrapped, so
+    the arguments are bound to the signature of the original function.
+
+    :param coro: coroutine which has not been started yet
+    :type coro: Coroutine
+    :return: qualified name of the function and its arguments
+    :rtype: tuple[str, dict[str, Any]]
+    """
+    local_vars = inspect.getcoroutinelocals(coro)
+    func = local_vars.get("func")
+    if (
+        callable(func)
+        and getattr(func, "__qualname__", None) == coro.__qualname__
+        and {"args", "kwargs"} <= local_vars.keys()
+    ):
+        arguments = inspect.signature(func).bind(*local_vars["args"], **local_vars["kwargs"])
+        arguments.apply_defaults()
+        return coro.__qualname__, dict(arguments.arguments)
+
+    return coro.__qualname__, dict(local_vars)
+
+
+def _get_stable_value(value: Any) -> Any:
+    """Get JSON serializable representation of a value, which is the same in every process.
+
+    Objects with a name, e.g. models, applications and units, are represented by their type and
+    name, steps by their type and description, OpenStack releases by their codename and
+    dataclasses by their fields. Dataclass fields with the metadata 'fingerprint' set to False
+    are left out. Steps are not represented by their fingerprint, because a step can get the plan
+    containing it as argument, e.g. the step refreshing the data-plane plan.
+
+    :param value: value to represent, e.g. argument of coroutine
+    :type value: Any
+    :return: JSON serializable representation of the value
+    :rtype: Any
+    :raises TypeError: if the value has no stable representation
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+
+    if isinstance(value, Enum):
+        return f"{type(value).__name__}.{value.name}"
+
+    if isinstance(value, dict):
+        return [[_get_stable_value(key), _get_stable_value(item)] for key, item in value.items()]
+
+    if isinstance(value, (list, tuple)):
+        return [_get_stable_value(item) for item in value]
+
+    if isinstance(value, (set, frozenset)):
+        return sorted((_get_stable_value(item) for item in value), key=json.dumps)
+
+    if isinstance(value, BaseStep):
+        return f"{type(value).__name__}({value.description})"
+
+    if isinstance(value, OpenStackRelease):
+        return f"{type(value).__name__}({value.codename})"
+
+    if isinstance(name := getattr(value, "name", None), str):
+        return f"{type(value).__name__}({name})"
+
+    if is_dataclass(value) and not isinstance(value, type):
+        return [type(value).__name__] + [
+            [field.name, _get_stable_value(getattr(value, field.name))]
+            for field in fields(value)
+            if field.metadata.get("fingerprint", True)
+        ]
+
+    if callable(value) and hasattr(value, "__qualname__"):
+        return value.__qualname__
+
+    raise TypeError(f"value of type {type(value).__name__} has no stable representation")
+
+
+@dataclass(frozen=True)
+class FailurePolicy:
+    """Policy defining when to stop running parallel sub-steps after some of them failed.
+
+    Sub-steps that have not started yet are safely canceled once more than max_failed_percentage
+    of all sub-steps failed. Sub-steps already running are always allowed to finish.
+    """
+
+    WAIT_ALL: ClassVar[FailurePolicy]
+    FAIL_FAST: ClassVar[FailurePolicy]
+
+    max_failed_percentage: float = 100
+
+    def __str__(self) -> str:
+        """Get string representation of the failure policy.
+
+        :return: wait-all, fail-fast or threshold=N%
+        :rtype: str
+        """
+        if self == FailurePolicy.WAIT_ALL:
+            return "wait-all"
+        if self == FailurePolicy.FAIL_FAST:
+            return "fail-fast"
+
+        return f"threshold={self.max_failed_percentage:g}%"
+
+    @classmethod
+    def from_string(cls, value: str) -> FailurePolicy:
+        """Create failure policy from its string representation.
+
+        :param value: wait-all, fail-fast or threshold=N%, where N is between 0 and 100
+        :type value: str
+        :return: failure policy
+        :rtype: FailurePolicy
+        :raises ValueError: When the value is not a valid failure policy.
+        """
+        match value.strip().lower():
+            case "wait-all":
+                return cls.WAIT_ALL
+            case "fail-fast":
+                return cls.FAIL_FAST
+            case policy if policy.startswith("threshold="):
+                percentage = float(policy.removeprefix("threshold=").removesuffix("%"))
+                if not 0 <= percentage <= 100:
+                    raise ValueError(f"threshold must be between 0 and 100, got {percentage:g}")
+                return cls(percentage)
+
+        raise ValueError(
+            f"invalid failure policy '{value}', use 'wait-all', 'fail-fast' or 'threshold=N%'"
+        )
+
+    def should_cancel(self, failed: int, total: int) -> bool:
+        """Check if the remaining sub-steps should be canceled.
+
+        :param failed: number of failed sub-steps
+        :type failed: int
+        :param total: number of all sub-steps
+        :type total: int
+        :return: True if the remaining sub-steps should be canceled
+        :rtype: bool
+        """
+        return failed * 100 > self.max_failed_percentage * total
+
+
+FailurePolicy.WAIT_ALL = FailurePolicy(100)
+FailurePolicy.FAIL_FAST = FailurePolicy(0)
+
+
 class BaseStep:
     """Represents a basic upgrade step.
 
@@ -71,6 +222,8 @@ class BaseStep:
     # pylint: disable=too-many-instance-attributes
 
     prompt: bool = True  # whether to prompt for user input during execution
+    _fingerprint: Optional[str] = None  # cached fingerprint of the step
+    _parent: Optional[BaseStep] = None  # step containing this step as sub-step
 
     def __init__(
         self,
@@ -78,6 +231,10 @@ class BaseStep:
         parallel: bool = False,
         coro: Optional[Coroutine] = None,
         dependent: bool = False,
+        unit: Optional[Unit] = None,
+        failure_policy: Optional[FailurePolicy] = None,
+        max_parallel: Optional[int] = None,
+        compensating: bool = False,
     ):
         """Initialize BaseStep.
 
@@ -92,6 +249,18 @@ class BaseStep:
         :type coro: Optional[coroutine]
         :param dependent: Whether the step is dependent on another step.
         :type dependent: bool, defaults to False
+        :param unit: Unit targeted by the step, used to find out on which machine the step runs.
+        :type unit: Optional[Unit], defaults to None
+        :param failure_policy: Policy applied when parallel sub-steps fail. If not set, the
+        default policy provided by set_default_failure_policy or wait-all is used.
+        :type failure_policy: Optional[FailurePolicy], defaults to None
+        :param max_parallel: Maximum number of sub-steps running at the same time, if they run
+        in parallel. If not set, all sub-steps run at the same time.
+        :type max_parallel: Optional[int], defaults to None
+        :param compensating: Whether the step returns the application to its original state,
+        e.g. resumes the unit. Such step is not canceled by the failure policy once its parent
+        step has started.
+        :type compensating: bool, defaults to False
         """
         if coro is not None:
             # NOTE(rgildein): We need to ignore coroutine not to be awaited if step is not run
@@ -99,15 +268,23 @@ class BaseStep:
                 "ignore", message=f"coroutine '.*{coro.__name__}' was never awaited"
             )
 
+        self._call: Optional[tuple[str, dict[str, Any]]] = None
         self._coro: Optional[Coroutine] = coro
-        self.parallel = parallel
-        self.dependent = dependent
+        self._parallel = parallel
+        self._dependent = dependent
+        self._unit = unit
+        self._failure_policy = failure_policy
+        self._max_parallel = max_parallel
+        self._compensating = compensating
         self.description = (
             DEPENDENCY_DESCRIPTION_PREFIX + description if dependent else description
         )
         self._sub_steps: List[BaseStep] = []
         self._canceled: bool = False
+        self._skipped: bool = False
         self._task: Optional[asyncio.Task] = None
+        # duration of the step predicted from the previous runs, in seconds
+        self.expected_duration: Optional[float] = None
 
     def __hash__(self) -> int:
         """Get hash for BaseStep."""
@@ -165,11 +342,234 @@ class BaseStep:
     def __bool__(self) -> bool:
         """Boolean magic method for BaseStep.
 
-        :return: True if there is at least one coroutine in a BaseStep
+        :return: True if there is at least one not skipped coroutine in a BaseStep
         or in its sub steps.
         :rtype: bool
         """
-        return self._coro is not None or any(bool(step) for step in self.sub_steps)
+        return (self._coro is not None and not self.skipped) or any(
+            bool(step) for step in self.sub_steps
+        )
+
+    def _get_call(self) -> tuple[str, dict[str, Any]]:
+        """Get the function call of the step coroutine.
+
+        The call is obtained only once, before the coroutine is started, because the local
+        variables of a running coroutine do not contain only its arguments.
+
+        :return: qualified name of the function and its arguments
+        :rtype: tuple[str, dict[str, Any]]
+        """
+        if self._call is None:
+            self._call = get_coroutine_call(self._coro) if self._coro is not None else ("", {})
+
+        return self._call
+
+    def _get_stable_call(self) -> tuple[str, dict[str, Any]]:
+        """Get the function call of the step coroutine with stable representation of arguments.
+
+        :return: qualified name of the function and stable representation of its arguments
+        :rtype: tuple[str, dict[str, Any]]
+        :raises TypeError: if any argument has no stable representation
+        """
+        name, arguments = self._get_call()
+        return name, {key: _get_stable_value(value) for key, value in arguments.items()}
+
+    @property
+    def kind(self) -> str:
+        """Get the kind of the step.
+
+        The kind of step with a coroutine is the qualified name of the called function, followed
+        by the name of the action if the function runs one, e.g. 'Model.run_action:pause'.
+        The kind of step without a coroutine is the name of its class.
+
+        :return: kind of the step
+        :rtype: str
+        """
+        if self._coro is None:
+            return type(self).__name__
+
+        name, arguments = self._get_call()
+        if isinstance(action_name := arguments.get("action_name"), str):
+            return f"{name}:{action_name}"
+
+        return name
+
+    @property
+    def fingerprint(self) -> str:
+        """Get the structural fingerprint of the step.
+
+        The fingerprint is derived from the class, kind, description, target unit, failure policy,
+        compensating flag and function call of the step together with the fingerprints of all its
+        sub-steps, so equal steps have the same fingerprint even if they were generated by
+        different processes. The order of the sub-steps running in parallel is not part of
+        the fingerprint, because it depends on their estimated durations, see order_by_duration.
+        The fingerprint is cached and the cache is cleared when the step or any of its sub-steps
+        changes.
+
+        :return: SHA-256 hex digest of the step
+        :rtype: str
+        """
+        if self._fingerprint is None:
+            sub_steps = [step.fingerprint for step in self._sub_steps]
+            content = [
+                type(self).__name__,
+                self.kind,
+                self.description,
+                self.parallel,
+                self.max_parallel,
+                self.dependent,
+                self.compensating,
+                _get_stable_value(self.failure_policy),
+                _get_stable_value(self.unit),
+                self._get_stable_call()[1],
+                sorted(sub_steps) if self.parallel else sub_steps,
+            ]
+            self._fingerprint = hashlib.sha256(json.dumps(content).encode()).hexdigest()
+
+        return self._fingerprint
+
+    def _clear_fingerprint(self) -> None:
+        """Clear the cached fingerprint of the step and all its parents."""
+        step: Optional[BaseStep] = self
+        # NOTE: the fingerprint of a parent is cached only if the fingerprints of all its
+        # sub-steps are cached, so the parents of a step without the cache do not have it either
+        while step is not None and step._fingerprint is not None:
+            step._fingerprint = None
+            step = step._parent
+
+    @property
+    def coro(self) -> Optional[Coroutine]:
+        """Get the step coroutine.
+
+        :return: coroutine or None if the step does not have any
+        :rtype: Optional[Coroutine]
+        """
+        return self._coro
+
+    @coro.setter
+    def coro(self, coro: Optional[Coroutine]) -> None:
+        """Set the step coroutine.
+
+        :param coro: coroutine
+        :type coro: Optional[Coroutine]
+        """
+        self._coro = coro
+        self._call = None
+        self._clear_fingerprint()
+
+    @property
+    def parallel(self) -> bool:
+        """Get whether the sub-steps run in parallel.
+
+        :return: True if the sub-steps run in parallel
+        :rtype: bool
+        """
+        return self._parallel
+
+    @parallel.setter
+    def parallel(self, parallel: bool) -> None:
+        """Set whether the sub-steps run in parallel.
+
+        :param parallel: True if the sub-steps run in parallel
+        :type parallel: bool
+        """
+        self._parallel = parallel
+        self._clear_fingerprint()
+
+    @property
+    def max_parallel(self) -> Optional[int]:
+        """Get the maximum number of sub-steps running at the same time.
+
+        :return: maximum number of sub-steps or None if it is not limited
+        :rtype: Optional[int]
+        """
+        return self._max_parallel
+
+    @max_parallel.setter
+    def max_parallel(self, max_parallel: Optional[int]) -> None:
+        """Set the maximum number of sub-steps running at the same time.
+
+        :param max_parallel: maximum number of sub-steps or None if it is not limited
+        :type max_parallel: Optional[int]
+        """
+        self._max_parallel = max_parallel
+        self._clear_fingerprint()
+
+    @property
+    def dependent(self) -> bool:
+        """Get whether the step is dependent on another step.
+
+        :return: True if the step is dependent on another step
+        :rtype: bool
+        """
+        return self._dependent
+
+    @dependent.setter
+    def dependent(self, dependent: bool) -> None:
+        """Set whether the step is dependent on another step.
+
+        :param dependent: True if the step is dependent on another step
+        :type dependent: bool
+        """
+        self._dependent = dependent
+        self._clear_fingerprint()
+
+    @property
+    def unit(self) -> Optional[Unit]:
+        """Get the unit targeted by the step.
+
+        :return: unit or None if the step does not target any unit
+        :rtype: Optional[Unit]
+        """
+        return self._unit
+
+    @unit.setter
+    def unit(self, unit: Optional[Unit]) -> None:
+        """Set the unit targeted by the step.
+
+        :param unit: unit or None if the step does not target any unit
+        :type unit: Optional[Unit]
+        """
+        self._unit = unit
+        self._clear_fingerprint()
+
+    @property
+    def failure_policy(self) -> Optional[FailurePolicy]:
+        """Get the policy applied when parallel sub-steps fail.
+
+        :return: failure policy or None if the default policy is used
+        :rtype: Optional[FailurePolicy]
+        """
+        return self._failure_policy
+
+    @failure_policy.setter
+    def failure_policy(self, failure_policy: Optional[FailurePolicy]) -> None:
+        """Set the policy applied when parallel sub-steps fail.
+
+        :param failure_policy: failure policy or None if the default policy is used
+        :type failure_policy: Optional[FailurePolicy]
+        """
+        self._failure_policy = failure_policy
+        self._clear_fingerprint()
+
+    @property
+    def compensating(self) -> bool:
+        """Get whether the step returns the application to its original state.
+
+        :return: True if the step returns the application to its original state
+        :rtype: bool
+        """
+        return self._compensating
+
+    @compensating.setter
+    def compensating(self, compensating: bool) -> None:
+        """Set whether the step returns the application to its original state.
+
+        :param compensating: True if the step returns the application to its original state
+        :type compensating: bool
+        """
+        self._compensating = compensating
+        self._clear_fingerprint()
 
     @property
     def description(self) -> str:
@@ -192,6 +592,16 @@ class BaseStep:
             raise ValueError("Every coroutine should have a description")
 
         self._description = description
+        self._clear_fingerprint()
+
+    @property
+    def machine_id(self) -> Optional[str]:
+        """Get the id of the machine targeted by the step.
+
+        :return: Machine id or None if the step does not target any unit.
+        :rtype: Optional[str]
+        """
+        return self.unit.machine.machine_id if self.unit else None
 
     @property
     def all_done(self) -> bool:
@@ -201,11 +611,21 @@ class BaseStep:
 
         return all(step.all_done for step in self.sub_steps)
 
+    @property
+    def started(self) -> bool:
+        """Return boolean represent if step or any of its sub-steps has started running."""
+        return self._task is not None or any(step.started for step in self.sub_steps)
+
     @property
     def canceled(self) -> bool:
         """Return boolean represent if step was canceled."""
         return self._canceled
 
+    @property
+    def skipped(self) -> bool:
+        """Return boolean represent if step coroutine was skipped."""
+        return self._skipped
+
     @property
     def done(self) -> bool:
         """Return boolean represent if step is done.
@@ -222,6 +642,9 @@ class BaseStep:
     def sub_steps(self) -> List[BaseStep]:
         """Return list of sub-steps.
 
+        The list should be changed only by add_step, add_steps or replace_sub_steps, which clear
+        the cached fingerprints.
+
         :return: List of BaseStep.
         :rtype: List[BaseStep]
         """
@@ -251,7 +674,9 @@ class BaseStep:
             logger.debug("skipping adding empty step")
             return
 
+        step._parent = self
         self._sub_steps.append(step)
+        self._clear_fingerprint()
 
     def add_steps(self, steps: Iterable[BaseStep]) -> None:
         """Add multiple steps.
@@ -262,6 +687,46 @@ class BaseStep:
         for step in steps:
             self.add_step(step)
 
+    def replace_sub_steps(
+        self, steps: Iterable[BaseStep], start: int = 0, end: Optional[int] = None
+    ) -> None:
+        """Replace sub-steps from start to end by steps.
+
+        :param steps: Steps replacing the sub-steps.
+        :type steps: Iterable[BaseStep]
+        :param start: Index of the first replaced sub-step, defaults to 0
+        :type start: int
+        :param end: Index after the last replaced sub-step, defaults to None meaning all the
+                    following sub-steps
+        :type end: Optional[int]
+        """
+        steps = list(steps)
+        for step in steps:
+            step._parent = self
+
+        self._sub_steps[start:end] = steps
+        self._clear_fingerprint()
+
+    def set_default_failure_policy(self, failure_policy: FailurePolicy) -> None:
+        """Set failure policy of step and all its sub-steps without explicit policy.
+
+        :param failure_policy: Policy applied when parallel sub-steps fail.
+        :type failure_policy: FailurePolicy
+        """
+        if self.failure_policy is None:
+            self.failure_policy = failure_policy
+
+        for step in self.sub_steps:
+            step.set_default_failure_policy(failure_policy)
+
+    def skip(self) -> None:
+        """Skip the step coroutine, e.g. when it was already completed by an interrupted run.
+
+        Sub-steps are not affected, so they are still run unless they are skipped as well.
+        """
+        self._skipped = True
+        logger.debug("skipped %s", self)
+
     def cancel(self, safe: bool = True) -> None:
         """Cancel step and all its sub steps.
 
@@ -293,9 +758,10 @@ class BaseStep:
         if self.canceled:
             raise CanceledStep(f"Could not run canceled step: {repr(self)}")
 
-        if self._coro is None:
-            return  # do nothing if coro was not provided
+        if self._coro is None or self.skipped:
+            return  # do nothing if coro was not provided or was skipped
 
+        self._get_call()  # the call can not be obtained once the coroutine is started
         try:
             self._task = asyncio.create_task(self._coro, name=repr(self))
             return await self._task  # wait until task is completed
@@ -384,3 +850,11 @@ class PreUpgradeStep(UpgradeStep):
 
 class PostUpgradeStep(UpgradeStep):
     """Represents the post-upgrade step."""
+
+
+class PackageUpgradeStep(PreUpgradeStep):
+    """Represents the pre-upgrade step for upgrading software packages on units.
+
+    Planners upgrading co-located applications together can replace these steps with a single
+    package upgrade per machine.
+    """
@@ -107,8 +107,31 @@ class Analysis:
 
         return Analysis(model=model, apps=[app for app in apps if app.name not in skip_apps])
 
+    async def refresh(self, skip_apps: set[str], touched_apps: set[str]) -> Analysis:
+        """Analyze the deployment again, reusing the applications that have not changed.
+
+        Only the applications touched since this analysis, e.g. by the upgrade, and the
+        applications with a changed Juju status are queried for their config and actions.
+
+        :param skip_apps: Applications to skip upgrading
+        :type skip_apps: set[str]
+        :param touched_apps: Applications touched since this analysis
+        :type touched_apps: set[str]
+        :return: Analysis object populated with the current model applications.
+        :rtype: Analysis
+        """
+        logger.info("Refreshing the analysis of the OpenStack deployment...")
+        cached = {app.name: app for app in self.apps if app.name not in touched_apps}
+        apps = await Analysis._populate(self.model, cached)
+
+        return Analysis(model=self.model, apps=[app for app in apps if app.name not in skip_apps])
+
     @classmethod
-    async def _populate(cls, model: juju_utils.Model) -> list[OpenStackApplication]:
+    async def _populate(
+        cls,
+        model: juju_utils.Model,
+        cached: Optional[dict[str, juju_utils.Application]] = None,
+    ) -> list[OpenStackApplication]:
         """Analyze the applications in the model.
 
         Applications that must be upgraded in a specific order will be returned first, followed
@@ -117,10 +140,12 @@ class Analysis:
 
         :param model: Model object
         :type model: Model
+        :param cached: Applications whose config and actions are reused if they have not changed
+        :type cached: Optional[dict[str, Application]]
         :return: Application objects with their respective information.
         :rtype: List[OpenStackApplication]
         """
-        juju_applications = await model.get_applications()
+        juju_applications = await model.get_applications(cached)
         apps = set()
         for name, app in juju_applications.items():
             if o7k_app := AppFactory.create(app):
@@ -0,0 +1,233 @@
+#  Copyright 2023 Canonical Limited
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Deadlines of the upgrade steps."""
+import asyncio
+import logging
+import math
+import os
+from datetime import timedelta
+from typing import NamedTuple, Optional
+
+from cou.exceptions import EnvironmentVariableError, StepDeadlineExceeded
+from cou.steps import BaseStep
+
+# multiple of the expected duration after which the step is reported as slow
+SOFT_DEADLINE_FACTOR = 2.0
+# multiple of the expected duration after which the step is failed
+HARD_DEADLINE_FACTOR = 5.0
+# shortest deadlines derived from the expected duration, in seconds
+MIN_SOFT_DEADLINE = 60.0
+MIN_HARD_DEADLINE = 1800.0
+# hard deadlines of the steps without previous runs by their kind, in seconds
+DEFAULT_HARD_DEADLINES: dict[str, float] = {
+    "backup": 7200.0,
+    "archive": 3600.0,
+    "purge": 3600.0,
+    "upgrade_packages": 3600.0,
+    "Model.upgrade_charm": 1800.0,
+    "Model.set_application_config": 1800.0,
+    "Model.run_action:openstack-upgrade": 3600.0,
+    "JubilantModelMixin.wait_for_idle": 3600.0,
+}
+
+logger = logging.getLogger(__name__)
+
+
+class Deadline(NamedTuple):
+    """Soft and hard deadline of the step, in seconds."""
+
+    soft: Optional[float] = None
+    hard: Optional[float] = None
+
+
+def parse_deadlines(value: str) -> dict[str, Deadline]:
+    """Parse deadlines of the steps by their kind.
+
+    The deadlines are separated by commas, each in the format KIND=SOFT/HARD, where either of
+    the limits can be empty, e.g. 'Model.run_action:openstack-upgrade=900/3600,backup=/7200'.
+
+    :param value: deadlines of the steps
+    :type value: str
+    :return: deadlines by the kind of the step
+    :rtype: dict[str, Deadline]
+    :raises ValueError: if any deadline is not in the expected format
+    """
+    deadlines = {}
+    for entry in filter(None, (entry.strip() for entry in value.split(","))):
+        kind, _, limits = entry.rpartition("=")
+        soft, _, hard = limits.partition("/")
+        if not kind:
+            raise ValueError(f"step deadline '{entry}' is not in the format KIND=SOFT/HARD")
+
+        deadlines[kind] = Deadline(_parse_limit(soft, entry), _parse_limit(hard, entry))
+
+    return deadlines
+
+
+def _parse_limit(limit: str, entry: str) -> Optional[float]:
+    """Parse limit of the deadline.
+
+    :param limit: limit in seconds or empty string if there is no limit
+    :type limit: str
+    :param entry: deadline the limit belongs to
+    :type entry: str
+    :return: limit in seconds or None if there is no limit
+    :rtype: Optional[float]
+    :raises ValueError: if the limit is not a positive number
+    """
+    if not limit:
+        return None
+
+    try:
+        seconds = float(limit)
+    except ValueError:
+        seconds = math.nan
+
+    if not math.isfinite(seconds) or seconds <= 0:
+        raise ValueError(f"limit of step deadline '{entry}' must be a positive number of seconds")
+
+    return seconds
+
+
+# deadlines configured by the kind of the step, loaded by load_step_deadlines
+STEP_DEADLINES: dict[str, Deadline] = {}
+
+
+def load_step_deadlines() -> None:
+    """Load deadlines of the steps configured by the COU_STEP_DEADLINES environment variable.
+
+    :raises EnvironmentVariableError: if the deadlines are not in the expected format
+    """
+    try:
+        deadlines = parse_deadlines(os.environ.get("COU_STEP_DEADLINES", ""))
+    except ValueError as error:
+        raise EnvironmentVariableError(f"COU_STEP_DEADLINES is not valid: {error}") from error
+
+    STEP_DEADLINES.clear()
+    STEP_DEADLINES.update(deadlines)
+
+
+def _get_timeout(step: BaseStep) -> float:
+    """Get timeout the step coroutine is called with.
+
+    :param step: step to get the timeout of
+    :type step: BaseStep
+    :return: timeout in seconds or 0 if the coroutine is not called with any
+    :rtype: float
+    """
+    _, arguments = step._get_call()  # pylint: disable=protected-access
+    timeout = arguments.get("timeout")
+    if isinstance(timeout, bool) or not isinstance(timeout, (int, float)):
+        return 0.0
+
+    return float(timeout)
+
+
+def get_deadline(step: BaseStep) -> Deadline:
+    """Get deadline of the step.
+
+    The deadline configured for the kind of the step takes precedence, otherwise the deadline
+    is derived from the duration predicted from the previous runs. Steps without previous runs
+    have only the default hard deadline of their kind, if there is any. A derived or default
+    hard deadline never expires before the timeout the step coroutine is called with, so e.g.
+    a wait for the model to be idle fails with its own timeout.
+
+    :param step: step to get the deadline of
+    :type step: BaseStep
+    :return: deadline of the step
+    :rtype: Deadline
+    """
+    if step._coro is None:  # pylint: disable=protected-access
+        return Deadline()
+
+    if (deadline := STEP_DEADLINES.get(step.kind)) is not None:
+        return deadline
+
+    if step.expected_duration is not None:
+        soft = max(step.expected_duration * SOFT_DEADLINE_FACTOR, MIN_SOFT_DEADLINE)
+        hard = max(step.expected_duration * HARD_DEADLINE_FACTOR, MIN_HARD_DEADLINE)
+    elif (default := DEFAULT_HARD_DEADLINES.get(step.kind)) is not None:
+        soft, hard = None, default
+    else:
+        return Deadline()
+
+    return Deadline(soft, max(hard, _get_timeout(step)))
+
+
+def _format_limit(limit: float) -> str:
+    """Format limit of the deadline.
+
+    :param limit: limit in seconds
+    :type limit: float
+    :return: limit, e.g. '0:15:00'
+    :rtype: str
+    """
+    return str(timedelta(seconds=round(limit)))
+
+
+async def run_with_deadline(step: BaseStep) -> None:
+    """Run the step coroutine watched by its deadline.
+
+    A step running past its soft deadline is reported, so a stuck step is noticed while it is
+    still running. A step running past its hard deadline is canceled and fails, so e.g. a hung
+    action fails only the branch of the plan it belongs to instead of blocking it forever.
+
+    The cancellation is unsafe, it only stops waiting for the step coroutine. An operation
+    started in the model, such as a Juju action, is not aborted and keeps running. The step
+    is failed even though BaseStep.run ignores the cancellation.
+
+    :param step: step to run
+    :type step: BaseStep
+    :raises StepDeadlineExceeded: if the step runs longer than its hard deadline
+    """
+    deadline = get_deadline(step)
+    loop = asyncio.get_running_loop()
+    expired = False
+
+    def _warn(soft: float) -> None:
+        logger.warning(
+            "step is running longer than its soft deadline of %s: %s",
+            _format_limit(soft),
+            step.description,
+        )
+
+    def _expire(hard: float) -> None:
+        nonlocal expired
+        expired = True
+        logger.error(
+            "canceling step running longer than its hard deadline of %s: %s",
+            _format_limit(hard),
+            step.description,
+        )
+        # NOTE: the operation started by the step in the model is abandoned, not aborted
+        step.cancel(safe=False)
+
+    handles = []
+    if deadline.soft is not None:
+        handles.append(loop.call_later(deadline.soft, _warn, deadline.soft))
+    if deadline.hard is not None:
+        handles.append(loop.call_later(deadline.hard, _expire, deadline.hard))
+
+    try:
+        await step.run()
+    finally:
+        for handle in handles:
+            handle.cancel()
+
+    if expired:
+        raise StepDeadlineExceeded(
+            f"Step '{step.description}' exceeded its hard deadline of "
+            f"{_format_limit(deadline.hard or 0)}, the operation it started in the model "
+            "may still be running"
+        )
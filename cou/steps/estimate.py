@@ -0,0 +1,140 @@
+#  Copyright 2023 Canonical Limited
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Estimation of the duration of the upgrade steps."""
+import heapq
+from datetime import timedelta
+from typing import Iterator
+
+from cou.steps import ApplicationUpgradePlan, BaseStep
+
+# default duration of a step with unknown kind, in seconds
+DEFAULT_STEP_DURATION = 30.0
+# default durations of the steps by their kind, in seconds
+STEP_DURATIONS: dict[str, float] = {
+    "backup": 600.0,
+    "archive": 300.0,
+    "purge": 300.0,
+    "upgrade_packages": 300.0,
+    "Model.upgrade_charm": 90.0,
+    "Model.set_application_config": 15.0,
+    "Model.run_action:openstack-upgrade": 600.0,
+    "JubilantModelMixin.wait_for_idle": 300.0,
+}
+
+
+def estimate_duration(step: BaseStep) -> float:
+    """Estimate duration of the step and all its sub-steps.
+
+    Each step with a coroutine takes the duration predicted from the previous runs, if there is
+    any, otherwise the default duration of its kind. Sub-steps running in parallel take as long
+    as the longest one, sequential sub-steps take the sum of their durations. If the number of
+    sub-steps running at the same time is limited, each sub-step starts once the first of the
+    running ones is finished.
+
+    :param step: step to estimate
+    :type step: BaseStep
+    :return: estimated duration in seconds
+    :rtype: float
+    """
+    duration = 0.0
+    if step._coro is not None:  # pylint: disable=protected-access
+        duration = (
+            step.expected_duration
+            if step.expected_duration is not None
+            else STEP_DURATIONS.get(step.kind, DEFAULT_STEP_DURATION)
+        )
+    sub_steps = [estimate_duration(sub_step) for sub_step in step.sub_steps]
+    if not sub_steps:
+        return duration
+
+    if step.parallel and step.max_parallel:
+        finish_times = [0.0] * min(step.max_parallel, len(sub_steps))
+        for sub_step_duration in sub_steps:
+            heapq.heappush(finish_times, heapq.heappop(finish_times) + sub_step_duration)
+
+        return duration + max(finish_times)
+
+    if step.parallel:
+        return duration + max(sub_steps)
+
+    return duration + sum(sub_steps)
+
+
+def estimate_application_durations(plan: BaseStep) -> Iterator[tuple[BaseStep, float]]:
+    """Estimate duration of each application upgrade plan.
+
+    :param plan: upgrade plan
+    :type plan: BaseStep
+    :return: application upgrade plans in the upgrade order with their estimated durations
+    :rtype: Iterator[tuple[BaseStep, float]]
+    """
+    steps_to_visit = [plan]
+    while steps_to_visit:
+        step = steps_to_visit.pop()
+        if isinstance(step, ApplicationUpgradePlan):
+            yield step, estimate_duration(step)
+        else:
+            steps_to_visit.extend(reversed(step.sub_steps))
+
+
+def order_by_duration(plan: BaseStep) -> None:
+    """Order sub-steps of the scheduled steps in the plan by their estimated duration.
+
+    Sub-steps running in parallel with a limited number of them running at the same time,
+    e.g. the machines of a hypervisors pipeline, are ordered the longest first. This is the
+    longest processing time rule, which keeps the running sub-steps balanced and the short
+    ones fill the gaps at the end. Sub-steps run one by one are never reordered.
+
+    The order follows the estimated durations, so the plan needs to be ordered again once the
+    durations of the steps are predicted from the history. The order of the sub-steps running
+    in parallel is not part of the fingerprint of the plan, so the plan is still the same as
+    the saved one if only the history changed.
+
+    :param plan: upgrade plan
+    :type plan: BaseStep
+    """
+    steps_to_visit = [plan]
+    while steps_to_visit:
+        step = steps_to_visit.pop()
+        steps_to_visit.extend(step.sub_steps)
+        if step.parallel and step.max_parallel:
+            step.replace_sub_steps(sorted(step.sub_steps, key=estimate_duration, reverse=True))
+
+
+def estimate_scheduled_durations(plan: BaseStep) -> Iterator[tuple[BaseStep, float]]:
+    """Estimate duration of each step running a limited number of sub-steps at the same time.
+
+    :param plan: upgrade plan
+    :type plan: BaseStep
+    :return: scheduled steps in the upgrade order with their estimated durations
+    :rtype: Iterator[tuple[BaseStep, float]]
+    """
+    steps_to_visit = [plan]
+    while steps_to_visit:
+        step = steps_to_visit.pop()
+        if step.parallel and step.max_parallel:
+            yield step, estimate_duration(step)
+
+        steps_to_visit.extend(reversed(step.sub_steps))
+
+
+def format_duration(seconds: float) -> str:
+    """Format duration for the user.
+
+    :param seconds: duration in seconds
+    :type seconds: float
+    :return: duration in the H:MM:SS format
+    :rtype: str
+    """
+    return str(timedelta(seconds=round(seconds)))
@@ -16,9 +16,26 @@ import asyncio
 import logging
 import sys
 import time
+from collections import defaultdict
+from contextlib import AbstractAsyncContextManager, nullcontext
+from typing import Optional
+from weakref import WeakKeyDictionary
 
-from cou.exceptions import HaltUpgradeExecution, RunUpgradeError
-from cou.steps import ApplicationUpgradePlan, BaseStep, HypervisorUpgradePlan, UpgradeStep
+from cou.exceptions import (
+    CanceledStep,
+    HaltUpgradeExecution,
+    RunUpgradeError,
+    StepDeadlineExceeded,
+)
+from cou.steps import (
+    ApplicationUpgradePlan,
+    BaseStep,
+    FailurePolicy,
+    HypervisorUpgradePlan,
+    UpgradeStep,
+)
+from cou.steps.deadline import run_with_deadline
+from cou.steps.estimate import estimate_duration, format_duration
 from cou.utils import print_and_debug, progress_indicator, prompt_input
 
 GROUP_STEPS = (ApplicationUpgradePlan, HypervisorUpgradePlan)
@@ -26,6 +43,199 @@ AVAILABLE_OPTIONS = ["y", "yes", "n", "no"]
 
 logger = logging.getLogger(__name__)
 
+# NOTE: Locks are stored per event loop, because an asyncio.Lock can only be used in the loop
+# in which it was first awaited.
+_machine_locks: WeakKeyDictionary[asyncio.AbstractEventLoop, defaultdict[str, asyncio.Lock]] = (
+    WeakKeyDictionary()
+)
+_prompt_locks: WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock] = WeakKeyDictionary()
+# machines which may still run an operation abandoned by a step canceled by its hard deadline
+_abandoned_machines: WeakKeyDictionary[asyncio.AbstractEventLoop, set[str]] = WeakKeyDictionary()
+
+
+class StepObserver:
+    """Observer notified about the execution of steps.
+
+    Observers are registered with add_observer and notified about every step applied, including
+    the steps grouping other steps. The step is finished once all its sub-steps are finished.
+    """
+
+    def step_started(self, step: BaseStep) -> None:
+        """Handle step which started running.
+
+        :param step: Started step.
+        :type step: BaseStep
+        """
+
+    def step_running(self, step: BaseStep) -> None:
+        """Handle step which coroutine started running.
+
+        Unlike the start of the step, the coroutine starts running once the step acquired
+        the lock of its machine.
+
+        :param step: Step which coroutine started running.
+        :type step: BaseStep
+        """
+
+    def step_finished(self, step: BaseStep, error: Optional[BaseException]) -> None:
+        """Handle step which finished running.
+
+        :param step: Finished step.
+        :type step: BaseStep
+        :param error: Exception raised by the step or None if the step succeeded.
+        :type error: Optional[BaseException]
+        """
+
+    def plan_changed(self, step: BaseStep) -> None:
+        """Handle step which sub-steps were generated or replaced while the plan is run.
+
+        :param step: Step with the new sub-steps.
+        :type step: BaseStep
+        """
+
+
+_observers: list[StepObserver] = []
+
+
+def add_observer(observer: StepObserver) -> None:
+    """Register observer notified about the execution of steps.
+
+    :param observer: Observer to register.
+    :type observer: StepObserver
+    """
+    _observers.append(observer)
+
+
+def remove_observer(observer: StepObserver) -> None:
+    """Unregister observer notified about the execution of steps.
+
+    :param observer: Observer to unregister.
+    :type observer: StepObserver
+    """
+    if observer in _observers:
+        _observers.remove(observer)
+
+
+def _notify_observers(method: str, *args: object) -> None:
+    """Notify all registered observers.
+
+    :param method: Name of observer method to call.
+    :type method: str
+    :param args: Arguments passed to observer method.
+    :type args: object
+    """
+    for observer in list(_observers):
+        try:
+            getattr(observer, method)(*args)
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            logger.warning("observer %r failed to handle %s: %r", observer, method, exc)
+
+
+def notify_plan_changed(step: BaseStep) -> None:
+    """Notify all registered observers about the step which sub-steps were changed.
+
+    :param step: Step with the new sub-steps.
+    :type step: BaseStep
+    """
+    _notify_observers("plan_changed", step)
+
+
+def _get_machine_lock(machine_id: str) -> asyncio.Lock:
+    """Get lock for machine.
+
+    :param machine_id: Machine id.
+    :type machine_id: str
+    :return: Lock shared by all steps running on the machine.
+    :rtype: asyncio.Lock
+    """
+    locks = _machine_locks.setdefault(asyncio.get_running_loop(), defaultdict(asyncio.Lock))
+    return locks[machine_id]
+
+
+def _get_prompt_lock() -> asyncio.Lock:
+    """Get lock for prompting the user.
+
+    Steps running in parallel can prompt at the same time, so the prompts are asked one by one.
+
+    :return: Lock shared by all prompts.
+    :rtype: asyncio.Lock
+    """
+    return _prompt_locks.setdefault(asyncio.get_running_loop(), asyncio.Lock())
+
+
+def _get_abandoned_machines() -> set[str]:
+    """Get machines which may still run an operation abandoned by a step canceled by its deadline.
+
+    :return: Ids of the machines.
+    :rtype: set[str]
+    """
+    return _abandoned_machines.setdefault(asyncio.get_running_loop(), set())
+
+
+async def _run_step_coroutine(step: BaseStep) -> None:
+    """Run the step coroutine.
+
+    Steps targeting a unit are serialized per machine, so co-located applications never run
+    e.g. apt-get or service restarts on the same machine at the same time. Steps running on
+    different machines are not affected. Only steps without sub-steps hold the lock, as they are
+    the ones doing the actual work. The deadline of the step does not include waiting for
+    the lock and the observers are notified that the coroutine is running once the lock is
+    acquired.
+
+    A step canceled by its hard deadline abandons e.g. the Juju action it is waiting for, which
+    keeps running on the machine. No other step is run on that machine afterwards, because it
+    would no longer be serialized with the abandoned operation.
+
+    :param step: Step to be executed.
+    :type step: BaseStep
+    :raises RunUpgradeError: If the machine of the step may still run an abandoned operation.
+    """
+    if step.machine_id is None or step.sub_steps:
+        _notify_observers("step_running", step)
+        await run_with_deadline(step)
+        return
+
+    lock = _get_machine_lock(step.machine_id)
+    if lock.locked():
+        logger.debug("step %s is waiting for machine %s", repr(step), step.machine_id)
+
+    async with lock:
+        abandoned_machines = _get_abandoned_machines()
+        if step.machine_id in abandoned_machines:
+            raise RunUpgradeError(
+                f"Step '{step.description}' was not run, because machine {step.machine_id} may "
+                "still run an operation of a step canceled by its hard deadline"
+            )
+
+        _notify_observers("step_running", step)
+        try:
+            await run_with_deadline(step)
+        except StepDeadlineExceeded:
+            abandoned_machines.add(step.machine_id)
+            raise
+
+
+def _cancel_not_started_sub_steps(step: BaseStep) -> None:
+    """Safely cancel all sub-steps of step, which have not started yet.
+
+    Sub-steps that have already started are not canceled, so they can finish. Instead, their
+    own sub-steps, which have not started yet, are canceled recursively, except for
+    the compensating steps returning the application to its original state, e.g. resuming
+    the unit.
+
+    :param step: Step which sub-steps should be canceled.
+    :type step: BaseStep
+    """
+    for sub_step in step.sub_steps:
+        if sub_step.done or sub_step.compensating:
+            continue
+
+        if sub_step.started:
+            _cancel_not_started_sub_steps(sub_step)
+        else:
+            logger.warning("canceling not started step: %s", sub_step.description)
+            sub_step.cancel(safe=True)
+
 
 async def _run_sub_steps_in_parallel(
     step: BaseStep, prompt: bool, overwrite_progress: bool
@@ -33,7 +243,10 @@ async def _run_sub_steps_in_parallel(
     """Run all sub-steps of step in parallel.
 
     If any step fails, the error is caught and raised only after all steps have been completed.
-    This means that the steps are independent of each other.
+    This means that the steps are independent of each other. Once the failed sub-steps exceed
+    the step failure policy, sub-steps that have not started yet are safely canceled. If the step
+    limits the number of sub-steps running at the same time, the next sub-step starts once any
+    running one is finished.
 
     :param step: Step to be executed.
     :type step: BaseStep
@@ -45,10 +258,28 @@ async def _run_sub_steps_in_parallel(
     :type overwrite_progress: bool
     :raises RunUpgradeError: When any step failed, we gather all exceptions and raise them as one.
     """
-    logger.debug("running all sub-steps of %s step in parallel", step)
-    grouped_coroutines = (
-        apply_step(sub_step, prompt, overwrite_progress) for sub_step in step.sub_steps
+    failure_policy = step.failure_policy or FailurePolicy.WAIT_ALL
+    failed_sub_steps = 0
+    semaphore: AbstractAsyncContextManager = (
+        asyncio.Semaphore(step.max_parallel) if step.max_parallel else nullcontext()
     )
+
+    async def _apply_sub_step(sub_step: BaseStep) -> None:
+        nonlocal failed_sub_steps
+        try:
+            async with semaphore:
+                await apply_step(sub_step, prompt, overwrite_progress)
+        except CanceledStep:
+            raise
+        except Exception:
+            failed_sub_steps += 1
+            if failure_policy.should_cancel(failed_sub_steps, len(step.sub_steps)):
+                logger.debug("failure policy %s of %s step exceeded", failure_policy, step)
+                _cancel_not_started_sub_steps(step)
+            raise
+
+    logger.debug("running all sub-steps of %s step in parallel", step)
+    grouped_coroutines = (_apply_sub_step(sub_step) for sub_step in step.sub_steps)
     results = await asyncio.gather(*grouped_coroutines, return_exceptions=True)
     exceptions = [
         f"{sub_step.description}: {repr(result)}"
@@ -72,6 +303,12 @@ async def _run_sub_steps_sequentially(
     skipped and all other steps will be run normally.
     In this way, we will ensure that the steps to return the application to its original state will
     be executed. e.g. re-enabling the nova-compute scheduler
+    Sub-steps canceled by the failure policy are skipped in the same way, and CanceledStep is
+    raised once all the other sub-steps have been completed.
+
+    The sub-steps are iterated by index and the list is read again before each sub-step, so
+    a running sub-step can replace the sub-steps following it, e.g. when the data-plane plan is
+    refreshed. Sub-steps up to and including the running one must not be changed.
 
     :param step: Step to be executed.
     :type step: BaseStep
@@ -81,14 +318,24 @@ async def _run_sub_steps_sequentially(
                                for all sub-steps. True to overwrite and False (the default) to
                                persist.
     :type overwrite_progress: bool
+    :raises CanceledStep: When any sub-step was canceled.
     """
     halt = False
+    canceled_sub_steps = []
     logger.debug("running all sub-steps of %s step sequentially", step)
-    for sub_step in step.sub_steps:
+    index = 0
+    while index < len(step.sub_steps):
+        sub_step = step.sub_steps[index]
+        index += 1
         if halt and sub_step.dependent:
             logger.warning("skipping dependent step: %s", sub_step.description)
             continue
 
+        if sub_step.canceled:
+            logger.warning("skipping canceled step: %s", sub_step.description)
+            canceled_sub_steps.append(sub_step)
+            continue
+
         logger.debug("running sub-step %s of %s step", sub_step, step)
         try:
             await apply_step(sub_step, prompt, overwrite_progress)
@@ -96,6 +343,9 @@ async def _run_sub_steps_sequentially(
             logger.debug("halting step: %s", sub_step.description)
             halt = True
 
+    if canceled_sub_steps:
+        raise CanceledStep(f"Canceled sub-steps of {repr(step)}: {canceled_sub_steps}")
+
 
 async def _run_step(step: BaseStep, prompt: bool, overwrite_progress: bool = False) -> None:
     """Run a step and all its sub-steps.
@@ -111,13 +361,15 @@ async def _run_step(step: BaseStep, prompt: bool, overwrite_progress: bool = Fal
     if isinstance(step, GROUP_STEPS):
         start_time = time.time()
 
-    if isinstance(step, UpgradeStep):
+    if isinstance(step, UpgradeStep) and step.skipped:
+        logger.info("Skipping step completed by interrupted run: %s", step.description)
+    elif isinstance(step, UpgradeStep):
         progress_indicator.start(step.description)
-        await step.run()
+        await _run_step_coroutine(step)
         if not overwrite_progress:
             progress_indicator.succeed()
     else:
-        await step.run()
+        await _run_step_coroutine(step)
 
     # The progress indication message of ApplicationUpgradePlan's sub-steps and all their
     # sub-steps will get overwritten upon completion
@@ -160,17 +412,30 @@ async def apply_step(step: BaseStep, prompt: bool, overwrite_progress: bool = Fa
     if isinstance(step, ApplicationUpgradePlan):
         description_to_prompt = str(step)
 
+    if prompt and step.prompt:
+        description_to_prompt += (
+            f"\nEstimated duration: {format_duration(estimate_duration(step))}"
+        )
+
     result = ""
     while result not in AVAILABLE_OPTIONS:
         if not prompt or not step.prompt:
             result = "y"
         else:
-            result = await prompt_input([description_to_prompt, "Continue"])
+            async with _get_prompt_lock():
+                result = await prompt_input([description_to_prompt, "Continue"])
 
         match result:
             case "y" | "yes":
                 logger.info("Running: %s", step.description)
-                await _run_step(step, prompt, overwrite_progress)
+                _notify_observers("step_started", step)
+                try:
+                    await _run_step(step, prompt, overwrite_progress)
+                except BaseException as exc:
+                    _notify_observers("step_finished", step, exc)
+                    raise
+
+                _notify_observers("step_finished", step, None)
             case "n" | "no":
                 logger.info("Aborting plan")
                 sys.exit(1)
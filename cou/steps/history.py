@@ -0,0 +1,319 @@
+#  Copyright 2023 Canonical Limited
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""History of the durations of the upgrade steps."""
+import logging
+import re
+import sqlite3
+import statistics
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, Iterator, NamedTuple, Optional
+
+from cou.apps.base import OpenStackApplication
+from cou.steps import BaseStep
+from cou.steps.execute import StepObserver
+from cou.utils import COU_DATA
+
+COU_HISTORY_FILE = COU_DATA / "history.sqlite"
+# number of the latest durations used to predict the duration of a step
+HISTORY_SAMPLES = 20
+# description of the plan upgrading the cloud to the next release
+RELEASE_HOP_PATTERN = re.compile(r"^Upgrade cloud from '(?P<current>\w+)' to '(?P<target>\w+)'$")
+# arguments of the step calls naming the unit or the application
+TARGET_ARGUMENTS = ("unit", "unit_name", "application_name", "app_name", "name")
+
+logger = logging.getLogger(__name__)
+
+
+class StepKey(NamedTuple):
+    """Key of the recorded step durations."""
+
+    kind: str
+    charm: str
+    release_hop: str
+    units: int
+
+
+def _get_target(step: BaseStep) -> Optional[str]:
+    """Get name of the unit or the application changed by the step.
+
+    :param step: step with a coroutine
+    :type step: BaseStep
+    :return: name of the unit or the application, or None if the step does not target one
+    :rtype: Optional[str]
+    """
+    if step.unit is not None:
+        return step.unit.name
+
+    _, arguments = step._get_call()  # pylint: disable=protected-access
+    for argument in TARGET_ARGUMENTS:
+        if isinstance(value := arguments.get(argument), str):
+            return value
+
+    match arguments.get("apps"):
+        case [str(app_name)]:
+            return app_name
+
+    return None
+
+
+def _get_step_keys(
+    plan: BaseStep, apps: dict[str, OpenStackApplication]
+) -> Iterator[tuple[BaseStep, StepKey]]:
+    """Get key of each step with a coroutine in the plan.
+
+    The release hop of a step is given by the closest plan upgrading the cloud to the next
+    release. Steps changing a unit are keyed with one unit, steps changing an application with
+    all its units and steps not changing any known application with no charm and no units.
+
+    :param plan: upgrade plan
+    :type plan: BaseStep
+    :param apps: analyzed applications by their names
+    :type apps: dict[str, OpenStackApplication]
+    :return: steps in pre-order with their keys
+    :rtype: Iterator[tuple[BaseStep, StepKey]]
+    """
+    steps_to_visit: list[tuple[BaseStep, str]] = [(plan, "")]
+    while steps_to_visit:
+        step, release_hop = steps_to_visit.pop()
+        if match := RELEASE_HOP_PATTERN.match(step.description):
+            release_hop = f"{match['current']}->{match['target']}"
+
+        steps_to_visit.extend((sub_step, release_hop) for sub_step in reversed(step.sub_steps))
+        if step._coro is None:  # pylint: disable=protected-access
+            continue
+
+        target = _get_target(step) or ""
+        if (app := apps.get(target.split("/")[0])) is None:
+            yield step, StepKey(step.kind, "", release_hop, 0)
+        else:
+            units = 1 if "/" in target else len(app.units)
+            yield step, StepKey(step.kind, app.charm, release_hop, units)
+
+
+class DurationHistory(StepObserver):
+    """History of the durations of the upgrade steps stored in a local SQLite database.
+
+    Durations of the completed steps are recorded by every upgrade and keyed by the kind of the
+    step, the charm and the number of units it changes and the release hop of the upgrade.
+    The median of the latest durations with the same key is used to predict the duration of
+    the step.
+    """
+
+    def __init__(self, path: Path = COU_HISTORY_FILE):
+        """Initialize the duration history.
+
+        :param path: path to the database
+        :type path: Path
+        """
+        self.path = path
+        self._plan: Optional[BaseStep] = None
+        self._apps: dict[str, OpenStackApplication] = {}
+        self._keys: dict[int, tuple[BaseStep, StepKey]] = {}
+        self._running: dict[int, float] = {}
+        self._connection: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        """Connect to the database and create the table of durations if it does not exist.
+
+        The connection is opened once and shared by all reads and writes of the history.
+
+        :return: connection to the database
+        :rtype: sqlite3.Connection
+        """
+        if self._connection is not None:
+            return self._connection
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(self.path)
+        try:
+            with connection:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS step_durations (kind TEXT NOT NULL, "
+                    "charm TEXT NOT NULL, release_hop TEXT NOT NULL, units INTEGER NOT NULL, "
+                    "duration REAL NOT NULL, recorded_at TEXT NOT NULL)"
+                )
+                connection.execute(
+                    "CREATE INDEX IF NOT EXISTS step_durations_key "
+                    "ON step_durations (kind, charm, release_hop, units)"
+                )
+        except sqlite3.Error:
+            connection.close()
+            raise
+
+        self._connection = connection
+        return connection
+
+    def close(self) -> None:
+        """Close the connection to the database."""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _get_key(self, step: BaseStep) -> Optional[StepKey]:
+        """Get key of the step.
+
+        Keys are computed again if the step is not known, because the plan can be changed
+        while it is run, e.g. when the plan of the next release hop is generated.
+
+        :param step: step of the plan
+        :type step: BaseStep
+        :return: key of the step or None if the step is not part of the plan
+        :rtype: Optional[StepKey]
+        """
+        step_key = self._keys.get(id(step))
+        if (step_key is None or step_key[0] is not step) and self._plan is not None:
+            self._keys = {
+                id(step): (step, key) for step, key in _get_step_keys(self._plan, self._apps)
+            }
+            step_key = self._keys.get(id(step))
+
+        return step_key[1] if step_key is not None and step_key[0] is step else None
+
+    def set_expected_durations(self, plan: BaseStep, apps: list[OpenStackApplication]) -> int:
+        """Set durations of the steps in the plan predicted from the history.
+
+        The database is not created if it does not exist, e.g. when only planning the upgrade.
+
+        :param plan: upgrade plan
+        :type plan: BaseStep
+        :param apps: analyzed applications
+        :type apps: list[OpenStackApplication]
+        :return: number of steps with predicted duration
+        :rtype: int
+        """
+        self._plan = plan
+        self._apps = {app.name: app for app in apps}
+        self._keys = {id(step): (step, key) for step, key in _get_step_keys(plan, self._apps)}
+        return self._set_expected_durations(self._keys.values())
+
+    def plan_changed(self, step: BaseStep) -> None:
+        """Set durations of the steps generated while the plan is run predicted from the history.
+
+        :param step: step with the new sub-steps
+        :type step: BaseStep
+        """
+        if self._plan is None:
+            return
+
+        changed_steps = set()
+        steps_to_visit = [step]
+        while steps_to_visit:
+            changed_step = steps_to_visit.pop()
+            changed_steps.add(id(changed_step))
+            steps_to_visit.extend(changed_step.sub_steps)
+
+        # NOTE: keys are computed over the whole plan, which gives the release hop of the step
+        self._keys = {
+            id(plan_step): (plan_step, key)
+            for plan_step, key in _get_step_keys(self._plan, self._apps)
+        }
+        self._set_expected_durations(
+            step_key for step_id, step_key in self._keys.items() if step_id in changed_steps
+        )
+
+    def _set_expected_durations(self, steps: Iterable[tuple[BaseStep, StepKey]]) -> int:
+        """Set durations of the steps predicted from the history.
+
+        :param steps: steps with their keys
+        :type steps: Iterable[tuple[BaseStep, StepKey]]
+        :return: number of steps with predicted duration
+        :rtype: int
+        """
+        predicted = 0
+        if self._connection is None and not self.path.exists():
+            logger.debug("no history of step durations %s", self.path)
+            return predicted
+
+        try:
+            connection = self._connect()
+            predictions: dict[StepKey, Optional[float]] = {}
+            for step, key in steps:
+                if key not in predictions:
+                    predictions[key] = self._predict(connection, key)
+
+                if (duration := predictions[key]) is not None:
+                    step.expected_duration = duration
+                    predicted += 1
+        except sqlite3.Error as exc:
+            logger.warning("could not read history of step durations %s: %r", self.path, exc)
+
+        logger.debug("predicted duration of %d step(s) from history", predicted)
+        return predicted
+
+    @staticmethod
+    def _predict(connection: sqlite3.Connection, key: StepKey) -> Optional[float]:
+        """Predict duration of the step from the latest durations with the same key.
+
+        :param connection: connection to the database
+        :type connection: sqlite3.Connection
+        :param key: key of the step
+        :type key: StepKey
+        :return: median of the latest durations or None if there are none
+        :rtype: Optional[float]
+        """
+        rows = connection.execute(
+            "SELECT duration FROM step_durations WHERE kind = ? AND charm = ? AND "
+            "release_hop = ? AND units = ? ORDER BY recorded_at DESC LIMIT ?",
+            (*key, HISTORY_SAMPLES),
+        ).fetchall()
+        return statistics.median(row[0] for row in rows) if rows else None
+
+    def record(self, key: StepKey, duration: float) -> None:
+        """Record duration of the step.
+
+        :param key: key of the step
+        :type key: StepKey
+        :param duration: duration of the step in seconds
+        :type duration: float
+        """
+        connection = self._connect()
+        with connection:
+            connection.execute(
+                "INSERT INTO step_durations VALUES (?, ?, ?, ?, ?, ?)",
+                (*key, duration, datetime.now(timezone.utc).isoformat()),
+            )
+
+    def step_running(self, step: BaseStep) -> None:
+        """Record start of the step coroutine.
+
+        The duration does not include waiting for the lock of the machine, because it depends
+        on the other steps running on the machine.
+
+        :param step: step which coroutine started running
+        :type step: BaseStep
+        """
+        if step._coro is not None:  # pylint: disable=protected-access
+            self._running[id(step)] = time.monotonic()
+
+    def step_finished(self, step: BaseStep, error: Optional[BaseException]) -> None:
+        """Record duration of the completed step with a coroutine.
+
+        :param step: finished step
+        :type step: BaseStep
+        :param error: exception raised by the step or None if the step succeeded
+        :type error: Optional[BaseException]
+        """
+        start = self._running.pop(id(step), None)
+        if start is None or error is not None or step.canceled:
+            return
+
+        if (key := self._get_key(step)) is None:
+            return
+
+        try:
+            self.record(key, time.monotonic() - start)
+        except sqlite3.Error as exc:
+            logger.warning("could not record duration of step to %s: %r", self.path, exc)
@@ -17,16 +17,21 @@ import logging
 from collections import defaultdict
 from dataclasses import dataclass
 from itertools import chain
-from typing import Any
+from typing import Any, Optional
 
 from cou.apps.base import OpenStackApplication
 from cou.steps import (
+    BaseStep,
     HypervisorUpgradePlan,
+    PackageUpgradeStep,
     PostUpgradeStep,
     PreUpgradeStep,
+    UnitUpgradeStep,
     UpgradePlan,
     UpgradeStep,
 )
+from cou.steps.estimate import order_by_duration
+from cou.utils.app_utils import upgrade_packages
 from cou.utils.juju_utils import Machine, Unit
 from cou.utils.openstack import OpenStackRelease
 
@@ -42,6 +47,7 @@ class HypervisorGroup:
 
     name: str
     app_units: dict[str, list[Unit]]
+    region: str = ""
 
     def __eq__(self, other: Any) -> bool:
         """Equal magic method for HypervisorGroup.
@@ -85,7 +91,14 @@ class HypervisorUpgradePlanner:
     This planner is meant to be used to upgrade machines contains the nova-compute application.
     """
 
-    def __init__(self, apps: list[OpenStackApplication], machines: list[Machine]) -> None:
+    def __init__(
+        self,
+        apps: list[OpenStackApplication],
+        machines: list[Machine],
+        pipeline_window: Optional[int] = None,
+        max_parallel_azs: Optional[int] = None,
+        cloud_machines: Optional[list[Machine]] = None,
+    ) -> None:
         """Initialize the Hypervisor class.
 
         The application should be sorted by upgrade order.
@@ -94,9 +107,21 @@ class HypervisorUpgradePlanner:
         :type apps: list[OpenStackApplication]
         :param machines: Hypervisor machines to generate upgrade plan.
         :type machines: list[Machine]
+        :param pipeline_window: Maximum number of machines upgraded at the same time in
+                                pipeline, defaults to None which disables the pipeline
+        :type pipeline_window: Optional[int]
+        :param max_parallel_azs: Maximum number of AZs of each region upgraded at the same time,
+                                 defaults to None which upgrades AZs one by one
+        :type max_parallel_azs: Optional[int]
+        :param cloud_machines: All hypervisor machines of the cloud, including those which are
+                               not upgraded, defaults to the machines to upgrade
+        :type cloud_machines: Optional[list[Machine]]
         """
         self._apps = apps
         self._machines = machines
+        self._pipeline_window = pipeline_window
+        self._max_parallel_azs = max_parallel_azs
+        self._cloud_machines = machines if cloud_machines is None else cloud_machines
 
     @property
     def apps(self) -> list[OpenStackApplication]:
@@ -158,6 +183,7 @@ class HypervisorUpgradePlanner:
                 #                 units to a single hypervisor group.
                 az = unit.machine.az or ""
                 azs[az].app_units[app.name].append(unit)
+                azs[az].region = unit.machine.region or ""
 
         return azs
 
@@ -185,12 +211,53 @@ class HypervisorUpgradePlanner:
             #                 update plan if sanity checks for any application fails.
             app.upgrade_plan_sanity_checks(target)
 
+    def _generate_packages_upgrade_step(self, group: HypervisorGroup) -> PackageUpgradeStep:
+        """Generate step to upgrade software packages once per machine.
+
+        Applications co-located on the same machine share the same APT packages, so the packages
+        are upgraded only once per machine using one of its units, while holding the packages
+        required by all co-located applications.
+
+        :param group: HypervisorGroup object
+        :type group: HypervisorGroup
+        :return: Step for upgrading software packages on all machines of the group.
+        :rtype: PackageUpgradeStep
+        """
+        apps = [app for app in self.apps if app.name in group.app_units]
+        machines_units: dict[str, Unit] = {}
+        machines_packages_to_hold: dict[str, set[str]] = defaultdict(set)
+        for app in apps:
+            for unit in group.app_units[app.name]:
+                machine_id = unit.machine.machine_id
+                machines_units.setdefault(machine_id, unit)
+                machines_packages_to_hold[machine_id].update(app.packages_to_hold or [])
+
+        step = PackageUpgradeStep(
+            f"Upgrade software packages on machines: {', '.join(machines_units)} "
+            "from the current APT repositories",
+            parallel=True,
+        )
+        for machine_id, unit in machines_units.items():
+            packages_to_hold = sorted(machines_packages_to_hold[machine_id]) or None
+            step.add_step(
+                UnitUpgradeStep(
+                    description=f"Upgrade software packages on machine '{machine_id}' "
+                    f"using unit '{unit.name}'",
+                    coro=upgrade_packages(unit.name, apps[0].model, packages_to_hold),
+                    unit=unit,
+                )
+            )
+
+        return step
+
     def _generate_pre_upgrade_steps(
         self, target: OpenStackRelease, group: HypervisorGroup
     ) -> list[PreUpgradeStep]:
         """Generate pre upgrade plan for all applications.
 
         This section should create a list of steps like changing charm config option, etc.
+        The software packages upgrade steps of individual applications are replaced by a single
+        step upgrading the packages once per machine.
 
         :param target: OpenStack codename to upgrade.
         :type target: OpenStackRelease
@@ -199,7 +266,8 @@ class HypervisorUpgradePlanner:
         :return: List of pre-upgrade steps.
         :rtype: list[PreUpgradeStep]
         """
-        steps = []
+        steps: list[PreUpgradeStep] = []
+        packages_step: Optional[PackageUpgradeStep] = None
         for app in self.apps:
             if app.name not in group.app_units:
                 logger.debug(
@@ -211,7 +279,14 @@ class HypervisorUpgradePlanner:
 
             units = group.app_units[app.name]
             logger.info("generating pre-upgrade steps for %s units of %s app", app.name, units)
-            steps.extend(app.pre_upgrade_steps(target, units))
+            for step in app.pre_upgrade_steps(target, units):
+                if not isinstance(step, PackageUpgradeStep):
+                    steps.append(step)
+                elif packages_step is None:
+                    # NOTE: the machine-level step takes the place of the first application
+                    # package upgrade, so the order of pre-upgrade steps stays the same
+                    packages_step = self._generate_packages_upgrade_step(group)
+                    steps.append(packages_step)
 
         return steps
 
@@ -276,10 +351,307 @@ class HypervisorUpgradePlanner:
 
         return steps
 
+    @staticmethod
+    def _get_unit_steps(step: BaseStep) -> Optional[list[tuple[Unit, BaseStep]]]:
+        """Get steps of individual units contained in the step.
+
+        The step either belongs to a single unit, e.g. disabling the scheduler, or contains only
+        steps of individual units, e.g. the upgrade of all units of an application. Software
+        packages upgrade is not split, because it must be done before the APT sources are changed.
+
+        :param step: Step of the hypervisor group.
+        :type step: BaseStep
+        :return: Units with their steps or None if the step is not related to individual units.
+        :rtype: Optional[list[tuple[Unit, BaseStep]]]
+        """
+        if step.unit is not None:
+            return [(step.unit, step)]
+
+        unit_steps = [
+            (sub_step.unit, sub_step) for sub_step in step.sub_steps if sub_step.unit is not None
+        ]
+        # pylint: disable=protected-access
+        if (
+            step._coro is None
+            and not isinstance(step, PackageUpgradeStep)
+            and unit_steps
+            and len(unit_steps) == len(step.sub_steps)
+        ):
+            return unit_steps
+
+        return None
+
+    def _split_steps(self, steps: list[BaseStep]) -> tuple[list[BaseStep], list[BaseStep]]:
+        """Split steps of hypervisor group to steps of whole applications and of units.
+
+        :param steps: Steps of the hypervisor group.
+        :type steps: list[BaseStep]
+        :return: Steps affecting whole applications and steps of individual units.
+        :rtype: tuple[list[BaseStep], list[BaseStep]]
+        """
+        app_steps, units_steps = [], []
+        for step in steps:
+            if self._get_unit_steps(step) is None:
+                app_steps.append(step)
+            else:
+                units_steps.append(step)
+
+        return app_steps, units_steps
+
+    def _generate_pipeline_step(
+        self, group: HypervisorGroup, steps: list[BaseStep]
+    ) -> UpgradeStep:
+        """Generate pipeline of machines from the steps of individual units.
+
+        Steps of individual units are moved to the stage of the machine, where the unit is
+        deployed. Each machine goes through its stage independently of the other machines, with
+        at most pipeline window machines in flight at the same time.
+
+        :param group: HypervisorGroup object
+        :type group: HypervisorGroup
+        :param steps: Steps of individual units of the group.
+        :type steps: list[BaseStep]
+        :return: Step upgrading the machines of the group in pipeline.
+        :rtype: UpgradeStep
+        """
+        machines_steps: dict[str, list[BaseStep]] = defaultdict(list)
+        for step in steps:
+            for unit, unit_step in self._get_unit_steps(step) or []:
+                machines_steps[unit.machine.machine_id].append(unit_step)
+
+        pipeline = UpgradeStep(
+            f"Upgrade machines {', '.join(machines_steps)} in '{group.name}' in pipeline, "
+            f"at most {self._pipeline_window} at a time",
+            parallel=True,
+            max_parallel=self._pipeline_window,
+        )
+        for machine_id, machine_steps in machines_steps.items():
+            machine_plan = UpgradeStep(f"Upgrade plan for machine '{machine_id}'")
+            machine_plan.add_steps(machine_steps)
+            pipeline.add_step(machine_plan)
+
+        return pipeline
+
+    def _generate_group_steps(
+        self, target: OpenStackRelease, force: bool, group: HypervisorGroup
+    ) -> tuple[list[BaseStep], list[BaseStep]]:
+        """Generate steps for hypervisor group.
+
+        :param target: OpenStack codename to upgrade.
+        :type target: OpenStackRelease
+        :param force: Whether the plan generation should be forced
+        :type force: bool
+        :param group: HypervisorGroup object
+        :type group: HypervisorGroup
+        :return: Pre-upgrade and upgrade steps and post-upgrade steps of the group.
+        :rtype: tuple[list[BaseStep], list[BaseStep]]
+        """
+        # sanity checks
+        logger.debug("running sanity checks for %s AZ", group.name)
+        self._upgrade_plan_sanity_checks(target, group)
+
+        # pre upgrade steps
+        logger.debug("generating pre-upgrade steps for %s AZ", group.name)
+        steps: list[BaseStep] = [*self._generate_pre_upgrade_steps(target, group)]
+
+        # upgrade steps
+        logger.debug("generating upgrade steps for %s AZ", group.name)
+        steps.extend(self._generate_upgrade_steps(target, force, group))
+
+        # post upgrade steps
+        logger.debug("generating post-upgrade steps for %s AZ", group.name)
+        post_steps: list[BaseStep] = [*self._generate_post_upgrade_steps(target, group)]
+
+        return steps, post_steps
+
+    def _split_units_steps_by_az(self, steps: list[BaseStep]) -> dict[str, list[BaseStep]]:
+        """Split steps of individual units to the AZs of the units.
+
+        Step containing steps of units from several AZs, i.e. the upgrade plan of the units of
+        an application, is split to an upgrade plan of the units of each AZ.
+
+        :param steps: Steps of individual units.
+        :type steps: list[BaseStep]
+        :return: Steps of the units in each AZ.
+        :rtype: dict[str, list[BaseStep]]
+        """
+        azs_steps: dict[str, list[BaseStep]] = defaultdict(list)
+        for step in steps:
+            unit_steps = self._get_unit_steps(step) or []
+            azs_unit_steps: dict[str, list[tuple[Unit, BaseStep]]] = defaultdict(list)
+            for unit, unit_step in unit_steps:
+                azs_unit_steps[unit.machine.az or ""].append((unit, unit_step))
+
+            if step.unit is not None or len(azs_unit_steps) == 1:
+                azs_steps[next(iter(azs_unit_steps))].append(step)
+                continue
+
+            for az, az_unit_steps in azs_unit_steps.items():
+                az_step = type(step)(
+                    description="Upgrade plan for units: "
+                    f"{', '.join(unit.name for unit, _ in az_unit_steps)}",
+                    parallel=step.parallel,
+                    max_parallel=step.max_parallel,
+                )
+                az_step.add_steps(unit_step for _, unit_step in az_unit_steps)
+                azs_steps[az].append(az_step)
+
+        return azs_steps
+
+    def _get_regions_max_parallel_azs(self, azs: AZs) -> dict[str, int]:
+        """Get number of hypervisor groups of each region upgraded at the same time.
+
+        The number is limited, so at least one AZ of each region is not upgraded at any moment.
+        All AZs of the cloud in the region are counted, including those with no machines to
+        upgrade, because they keep serving during the upgrade.
+
+        :param azs: Hypervisor groups to upgrade.
+        :type azs: AZs
+        :return: Regions with groups to upgrade and the number of their groups upgraded at
+                 the same time, empty if the groups are upgraded one by one.
+        :rtype: dict[str, int]
+        """
+        if not self._max_parallel_azs:
+            return {}
+
+        cloud_azs: dict[str, set[str]] = defaultdict(set)
+        for machine in self._cloud_machines:
+            cloud_azs[machine.region or ""].add(machine.az or "")
+
+        regions_azs: dict[str, list[str]] = defaultdict(list)
+        for group in azs.values():
+            regions_azs[group.region].append(group.name)
+            cloud_azs[group.region].add(group.name)
+
+        regions_max_parallel_azs = {}
+        for region, region_azs in regions_azs.items():
+            max_parallel_azs = min(self._max_parallel_azs, len(region_azs))
+            if max_parallel_azs >= len(cloud_azs[region]):
+                max_parallel_azs = len(cloud_azs[region]) - 1
+                logger.warning(
+                    "upgrading at most %d of %d AZs of region '%s' at the same time to keep at "
+                    "least one AZ untouched",
+                    max(max_parallel_azs, 1),
+                    len(cloud_azs[region]),
+                    region,
+                )
+
+            regions_max_parallel_azs[region] = max(max_parallel_azs, 1)
+
+        if all(max_parallel_azs == 1 for max_parallel_azs in regions_max_parallel_azs.values()):
+            return {}
+
+        return regions_max_parallel_azs
+
+    def _generate_parallel_azs_step(
+        self,
+        target: OpenStackRelease,
+        groups: list[HypervisorGroup],
+        max_parallel_azs: int,
+        azs_units_steps: dict[str, list[BaseStep]],
+    ) -> UpgradeStep:
+        """Generate step upgrading hypervisor groups of a region at the same time.
+
+        :param target: OpenStack codename to upgrade.
+        :type target: OpenStackRelease
+        :param groups: Hypervisor groups of the region.
+        :type groups: list[HypervisorGroup]
+        :param max_parallel_azs: Number of groups upgraded at the same time.
+        :type max_parallel_azs: int
+        :param azs_units_steps: Steps of individual units in each group.
+        :type azs_units_steps: dict[str, list[BaseStep]]
+        :return: Step upgrading the groups of the region.
+        :rtype: UpgradeStep
+        """
+        region = f" of region '{groups[0].region}'" if groups[0].region else ""
+        azs_step = UpgradeStep(
+            f"Upgrade hypervisors in AZs {', '.join(repr(group.name) for group in groups)}"
+            f"{region} in parallel, at most {max_parallel_azs} at a time",
+            parallel=True,
+            max_parallel=max_parallel_azs,
+        )
+        for group in groups:
+            units = list(chain(*group.app_units.values()))
+            hypervisor_plan = HypervisorUpgradePlan(
+                f"Upgrade plan for {units} in '{group.name}' to '{target}'"
+            )
+            group_units_steps = azs_units_steps[group.name]
+            if self._pipeline_window:
+                hypervisor_plan.add_step(self._generate_pipeline_step(group, group_units_steps))
+            else:
+                hypervisor_plan.add_steps(group_units_steps)
+
+            azs_step.add_step(hypervisor_plan)
+
+        return azs_step
+
+    def _generate_parallel_azs_plan(
+        self,
+        target: OpenStackRelease,
+        force: bool,
+        azs: AZs,
+        regions_max_parallel_azs: dict[str, int],
+    ) -> UpgradePlan:
+        """Generate upgrade plan for hypervisor groups upgraded at the same time.
+
+        Steps are generated once for all groups. Steps affecting whole applications, e.g.
+        the charm upgrade, run before or after the groups, so they are never run concurrently.
+        Steps of individual units are split to the groups of the units. The groups of each
+        region are upgraded at the same time as the groups of the other regions.
+
+        :param target: OpenStack codename to upgrade.
+        :type target: OpenStackRelease
+        :param force: Whether the plan generation should be forced
+        :type force: bool
+        :param azs: Hypervisor groups to upgrade.
+        :type azs: AZs
+        :param regions_max_parallel_azs: Number of groups of each region upgraded at the same
+                                         time.
+        :type regions_max_parallel_azs: dict[str, int]
+        :return: Full upgrade plan
+        :rtype: UpgradePlan
+        """
+        plan = UpgradePlan("Upgrading all applications deployed on machines with hypervisor.")
+        all_azs = HypervisorGroup(name=", ".join(azs), app_units=defaultdict(list))
+        for group in azs.values():
+            for app_name, units in group.app_units.items():
+                all_azs.app_units[app_name].extend(units)
+
+        steps, post_steps = self._generate_group_steps(target, force, all_azs)
+        app_steps, units_steps = self._split_steps(steps)
+        app_post_steps, units_post_steps = self._split_steps(post_steps)
+        azs_units_steps = self._split_units_steps_by_az(units_steps + units_post_steps)
+
+        regions_steps = [
+            self._generate_parallel_azs_step(
+                target,
+                [group for group in azs.values() if group.region == region],
+                max_parallel_azs,
+                azs_units_steps,
+            )
+            for region, max_parallel_azs in regions_max_parallel_azs.items()
+        ]
+        if len(regions_steps) == 1:
+            plan.add_steps([*app_steps, *regions_steps, *app_post_steps])
+            return plan
+
+        regions_plan = UpgradeStep(
+            f"Upgrade hypervisors in regions {', '.join(map(repr, regions_max_parallel_azs))} "
+            "in parallel",
+            parallel=True,
+        )
+        regions_plan.add_steps(regions_steps)
+        plan.add_steps([*app_steps, regions_plan, *app_post_steps])
+        return plan
+
     def generate_upgrade_plan(self, target: OpenStackRelease, force: bool) -> UpgradePlan:
         """Generate full upgrade plan for all hypervisors.
 
-        This plan will be based on multiple HypervisorUpgradePlan.
+        This plan will be based on multiple HypervisorUpgradePlan, which are upgraded one by one
+        unless the maximum number of AZs of each region upgraded at the same time is set. If
+        the pipeline window is set, the machines of each hypervisor group are upgraded in
+        pipeline instead of going through each stage together. The groups and the machines are
+        ordered by their estimated duration, see order_by_duration.
 
         :param target: OpenStack codename to upgrade.
         :type target: OpenStackRelease
@@ -288,29 +660,32 @@ class HypervisorUpgradePlanner:
         :return: Full upgrade plan
         :rtype: UpgradePlan
         """
+        azs = self.get_azs(target)
+        if regions_max_parallel_azs := self._get_regions_max_parallel_azs(azs):
+            plan = self._generate_parallel_azs_plan(target, force, azs, regions_max_parallel_azs)
+            order_by_duration(plan)
+            return plan
+
         plan = UpgradePlan("Upgrading all applications deployed on machines with hypervisor.")
-        for az, group in self.get_azs(target).items():
+        for group in azs.values():
             units = list(chain(*group.app_units.values()))
             hypervisor_plan = HypervisorUpgradePlan(
                 f"Upgrade plan for {units} in '{group.name}' to '{target}'"
             )
-
-            # sanity checks
-            logger.debug("running sanity checks for %s AZ", az)
-            self._upgrade_plan_sanity_checks(target, group)
-
-            # pre upgrade steps
-            logger.debug("generating pre-upgrade steps for %s AZ", az)
-            hypervisor_plan.add_steps(self._generate_pre_upgrade_steps(target, group))
-
-            # upgrade steps
-            logger.debug("generating upgrade steps for %s AZ", az)
-            hypervisor_plan.add_steps(self._generate_upgrade_steps(target, force, group))
-
-            # post upgrade steps
-            logger.debug("generating post-upgrade steps for %s AZ", az)
-            hypervisor_plan.add_steps(self._generate_post_upgrade_steps(target, group))
+            steps, post_steps = self._generate_group_steps(target, force, group)
+            if self._pipeline_window:
+                logger.debug("generating pipeline of machines for %s AZ", group.name)
+                app_steps, units_steps = self._split_steps(steps)
+                app_post_steps, units_post_steps = self._split_steps(post_steps)
+                hypervisor_plan.add_steps(app_steps)
+                hypervisor_plan.add_step(
+                    self._generate_pipeline_step(group, units_steps + units_post_steps)
+                )
+                hypervisor_plan.add_steps(app_post_steps)
+            else:
+                hypervisor_plan.add_steps(steps + post_steps)
 
             plan.add_step(hypervisor_plan)
 
+        order_by_duration(plan)
         return plan
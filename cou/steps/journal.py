@@ -0,0 +1,222 @@
+#  Copyright 2023 Canonical Limited
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Journal of the completed upgrade steps."""
+import hashlib
+import json
+import logging
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Iterator, Optional
+
+from cou.steps import BaseStep
+from cou.steps.execute import StepObserver
+from cou.utils import COU_DATA
+
+COU_DIR_JOURNAL = COU_DATA / "journal"
+
+logger = logging.getLogger(__name__)
+
+
+def _get_step_keys(plan: BaseStep) -> Iterator[tuple[BaseStep, str]]:
+    """Get key of each step in the plan.
+
+    The key of a step is derived from its type, its description, the function call of its
+    coroutine, including the arguments, and the keys of all its parents, so the same step gets
+    the same key in every plan generated for the same cloud state. Identical steps under
+    the same parent are told apart by their order.
+
+    :param plan: upgrade plan
+    :type plan: BaseStep
+    :return: steps in pre-order with their keys
+    :rtype: Iterator[tuple[BaseStep, str]]
+    """
+    steps_to_visit: list[tuple[BaseStep, str]] = [(plan, "")]
+    while steps_to_visit:
+        step, key = steps_to_visit.pop()
+        yield step, key
+
+        occurrences: Counter[str] = Counter()
+        sub_steps = []
+        for sub_step in step.sub_steps:
+            # pylint: disable=protected-access
+            identity = json.dumps(
+                [type(sub_step).__name__, sub_step.description, *sub_step._get_stable_call()]
+            )
+            sub_step_key = hashlib.sha256(
+                json.dumps([key, identity, occurrences[identity]]).encode()
+            ).hexdigest()
+            occurrences[identity] += 1
+            sub_steps.append((sub_step, sub_step_key))
+
+        steps_to_visit.extend(reversed(sub_steps))
+
+
+class StepJournal(StepObserver):
+    """Append-only journal of the upgrade steps completed in a model.
+
+    Each model has its own journal file under COU_DATA, where every completed step is recorded
+    together with the fingerprint of the plan it belongs to. The journal is used to skip the
+    steps completed by an interrupted run when the upgrade is resumed.
+    """
+
+    def __init__(self, model_uuid: str, plan: BaseStep):
+        """Initialize the step journal.
+
+        :param model_uuid: UUID of the upgraded model
+        :type model_uuid: str
+        :param plan: upgrade plan
+        :type plan: BaseStep
+        """
+        self.path = COU_DIR_JOURNAL / f"{model_uuid}.jsonl"
+        self.plan = plan
+        self._keys = {id(step): (step, key) for step, key in _get_step_keys(plan)}
+        self.fingerprint = plan.fingerprint
+
+    def _get_key(self, step: BaseStep) -> Optional[str]:
+        """Get key of the step.
+
+        Keys are computed again if the step is not known, because the plan can be changed
+        while it is run, e.g. when the data-plane plan is refreshed.
+
+        :param step: step of the plan
+        :type step: BaseStep
+        :return: key of the step or None if the step is not part of the plan
+        :rtype: Optional[str]
+        """
+        step_key = self._keys.get(id(step))
+        if step_key is None or step_key[0] is not step:
+            self._keys = {id(step): (step, key) for step, key in _get_step_keys(self.plan)}
+            step_key = self._keys.get(id(step))
+
+        return step_key[1] if step_key is not None else None
+
+    def _write(self, event: str, **data: Any) -> None:
+        """Append a record to the journal.
+
+        :param event: type of the record
+        :type event: str
+        :param data: additional data of the record
+        :type data: Any
+        """
+        record = {
+            "event": event,
+            "time": datetime.now(timezone.utc).isoformat(),
+            "plan": self.fingerprint,
+            **data,
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(json.dumps(record) + "\n")
+
+    def _read(self) -> Iterator[dict[str, Any]]:
+        """Read all records of the journal.
+
+        Corrupted records, e.g. partially written by a killed process, are ignored.
+
+        :return: journal records
+        :rtype: Iterator[dict[str, Any]]
+        """
+        if not self.path.exists():
+            return
+
+        with open(self.path, encoding="utf-8") as file:
+            for line in file:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning("ignoring corrupted record in journal %s", self.path)
+
+    def get_interrupted_run(self) -> Optional[tuple[str, set[str]]]:
+        """Get the interrupted run recorded in the journal.
+
+        Run is interrupted if it was started, but never finished. Runs resuming it are part of
+        the same run.
+
+        :return: plan fingerprint of the interrupted run and keys of its completed steps or None
+                 if there is no interrupted run
+        :rtype: Optional[tuple[str, set[str]]]
+        """
+        interrupted_run: Optional[tuple[str, set[str]]] = None
+        for record in self._read():
+            match record.get("event"):
+                case "start" if not record.get("resume") or interrupted_run is None:
+                    interrupted_run = (record.get("plan", ""), set())
+                case "step" if interrupted_run is not None:
+                    interrupted_run[1].add(record.get("step", ""))
+                case "finish":
+                    interrupted_run = None
+
+        return interrupted_run
+
+    def resume(self) -> int:
+        """Skip steps completed by the interrupted run.
+
+        The steps are validated before they are skipped. Step completed by the interrupted run
+        is skipped only if the same step, with the same parents and the same function call
+        arguments, is still part of the plan. If the plan changed since the interrupted run,
+        e.g. because some applications have already been upgraded, only the unchanged steps are
+        skipped.
+
+        :return: number of skipped steps
+        :rtype: int
+        """
+        interrupted_run = self.get_interrupted_run()
+        if interrupted_run is None:
+            logger.info("no interrupted run found in journal %s", self.path)
+            return 0
+
+        fingerprint, completed_steps = interrupted_run
+        if fingerprint != self.fingerprint:
+            logger.warning(
+                "upgrade plan changed since the interrupted run, only unchanged steps are skipped"
+            )
+
+        skipped = 0
+        for step, key in _get_step_keys(self.plan):
+            # pylint: disable=protected-access
+            if key in completed_steps and step._coro is not None:
+                step.skip()
+                skipped += 1
+
+        logger.info("skipping %d step(s) completed by the interrupted run", skipped)
+        return skipped
+
+    def start(self, resume: bool) -> None:
+        """Record start of the run.
+
+        :param resume: whether the run resumes the interrupted run
+        :type resume: bool
+        """
+        self._write("start", resume=resume)
+
+    def finish(self) -> None:
+        """Record successful end of the run."""
+        self._write("finish")
+
+    def step_finished(self, step: BaseStep, error: Optional[BaseException]) -> None:
+        """Record the step if its coroutine was completed.
+
+        :param step: finished step
+        :type step: BaseStep
+        :param error: exception raised by the step or None if the step succeeded
+        :type error: Optional[BaseException]
+        """
+        # pylint: disable=protected-access
+        if error is not None or step.canceled or step._coro is None:
+            return
+
+        if (key := self._get_key(step)) is None:
+            return
+
+        self._write("step", step=key, description=step.description)
@@ -0,0 +1,405 @@
+#  Copyright 2023 Canonical Limited
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Metrics of the upgrade progress in the Prometheus text format."""
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Iterable, Optional
+
+from cou.steps import BaseStep
+from cou.steps.execute import StepObserver
+from cou.steps.trace import get_step_outcome
+from cou.utils import get_env_seconds
+from cou.utils.api_stats import LATENCY_BUCKETS, api_stats
+
+# interval of writing the metrics to the textfile, in seconds
+METRICS_INTERVAL: float = 15.0
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+logger = logging.getLogger(__name__)
+
+
+def _format_labels(**labels: str) -> str:
+    """Format labels of the metric sample.
+
+    :param labels: names and values of the labels
+    :type labels: str
+    :return: labels in the Prometheus text format
+    :rtype: str
+    """
+    if not labels:
+        return ""
+
+    escaped = {
+        name: value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        for name, value in labels.items()
+    }
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped.items()) + "}"
+
+
+def _format_metric(
+    name: str, metric_type: str, description: str, samples: Iterable[tuple[str, float]]
+) -> list[str]:
+    """Format metric with its samples.
+
+    :param name: name of the metric
+    :type name: str
+    :param metric_type: type of the metric, e.g. 'counter' or 'gauge'
+    :type metric_type: str
+    :param description: help of the metric
+    :type description: str
+    :param samples: name with labels and value of each sample
+    :type samples: Iterable[tuple[str, float]]
+    :return: lines of the metric in the Prometheus text format
+    :rtype: list[str]
+    """
+    lines = [f"# HELP {name} {description}", f"# TYPE {name} {metric_type}"]
+    lines.extend(f"{sample} {float(value)!r}" for sample, value in samples)
+    return lines
+
+
+class MetricsExporter(StepObserver):
+    """Exporter of the upgrade progress and the Juju API call statistics.
+
+    Metrics are written atomically to a textfile collected by the node-exporter, and/or served
+    from a local HTTP endpoint. Step events only update counters, the metrics are rendered
+    when they are written or scraped, so the overhead does not grow with the number of events.
+    """
+
+    def __init__(self, plan: BaseStep, path: Optional[Path] = None, port: Optional[int] = None):
+        """Initialize the metrics exporter.
+
+        :param plan: upgrade plan
+        :type plan: BaseStep
+        :param path: path to the textfile, e.g. in the node-exporter textfile directory
+        :type path: Optional[Path]
+        :param port: port of the local HTTP endpoint
+        :type port: Optional[int]
+        """
+        self.plan = plan
+        self.path = path
+        self.port = port
+        self.start_time = time.time()
+        self._finished: Counter[tuple[str, str]] = Counter()
+        self._failures: Counter[str] = Counter()
+        self._durations: defaultdict[str, list[float]] = defaultdict(lambda: [0.0, 0.0])
+        self._running: dict[int, tuple[BaseStep, float]] = {}
+        self._plan_fingerprint: Optional[str] = None
+        self._total_steps: Counter[str] = self._get_total_steps()
+        self._writer: Optional[asyncio.Task] = None
+        self._server: Optional[asyncio.Server] = None
+
+    def step_started(self, step: BaseStep) -> None:
+        """Record start of the step.
+
+        :param step: started step
+        :type step: BaseStep
+        """
+        self._running[id(step)] = (step, time.monotonic())
+
+    def step_finished(self, step: BaseStep, error: Optional[BaseException]) -> None:
+        """Record the step with its duration and outcome.
+
+        :param step: finished step
+        :type step: BaseStep
+        :param error: exception raised by the step or None if the step succeeded
+        :type error: Optional[BaseException]
+        """
+        now = time.monotonic()
+        _, start = self._running.pop(id(step), (step, now))
+        outcome = get_step_outcome(step, error)
+        self._finished[(type(step).__name__, outcome)] += 1
+        if step._coro is None:  # pylint: disable=protected-access
+            return
+
+        if outcome == "failed":
+            self._failures[step.kind] += 1
+
+        duration = self._durations[step.kind]
+        duration[0] += now - start
+        duration[1] += 1
+
+    def _get_total_steps(self) -> Counter[str]:
+        """Get number of the steps in the plan by their type.
+
+        The steps are counted once and counted again only if the plan changed, e.g. when
+        the plan of the next hop is added to it during the upgrade. Steps without any coroutine
+        are never run, so they are not counted.
+
+        :return: number of the steps by their type
+        :rtype: Counter[str]
+        """
+        if (fingerprint := self.plan.fingerprint) == self._plan_fingerprint:
+            return self._total_steps
+
+        total: Counter[str] = Counter()
+        steps_to_visit = [self.plan]
+        while steps_to_visit:
+            step = steps_to_visit.pop()
+            if step:
+                total[type(step).__name__] += 1
+                steps_to_visit.extend(step.sub_steps)
+
+        self._plan_fingerprint, self._total_steps = fingerprint, total
+        return total
+
+    def _get_running_steps(self, now: float) -> dict[tuple[str, str], tuple[int, float]]:
+        """Get number of the running steps and the longest running time by their type and kind.
+
+        :param now: current time
+        :type now: float
+        :return: number of the running steps and time elapsed since the start of the longest
+                 running one by their type and kind
+        :rtype: dict[tuple[str, str], tuple[int, float]]
+        """
+        running: dict[tuple[str, str], tuple[int, float]] = {}
+        for step, start in self._running.values():
+            key = (type(step).__name__, step.kind)
+            count, elapsed = running.get(key, (0, 0.0))
+            running[key] = (count + 1, max(elapsed, now - start))
+
+        return running
+
+    def _render_api_calls(self) -> list[str]:
+        """Render statistics of the Juju API calls.
+
+        :return: lines of the metrics in the Prometheus text format
+        :rtype: list[str]
+        """
+        calls = sorted(api_stats.calls.items())
+        histogram = []
+        for method, stats in calls:
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, stats.latency_histogram):
+                cumulative += count
+                le = str(bound) if math.isfinite(bound) else "+Inf"
+                sample = "cou_juju_api_call_duration_seconds_bucket" + _format_labels(
+                    method=method, le=le
+                )
+                histogram.append((sample, float(cumulative)))
+            labels = _format_labels(method=method)
+            histogram.append((f"cou_juju_api_call_duration_seconds_sum{labels}", stats.total_time))
+            histogram.append((f"cou_juju_api_call_duration_seconds_count{labels}", stats.calls))
+
+        return [
+            *_format_metric(
+                "cou_juju_api_call_duration_seconds",
+                "histogram",
+                "Latency of the Juju API calls, including waiting for the model to be idle.",
+                histogram,
+            ),
+            *_format_metric(
+                "cou_juju_api_call_errors_total",
+                "counter",
+                "Number of the Juju API calls which failed.",
+                (
+                    (
+                        f"cou_juju_api_call_errors_total{_format_labels(method=method)}",
+                        stats.errors,
+                    )
+                    for method, stats in calls
+                ),
+            ),
+            *_format_metric(
+                "cou_juju_api_call_retries_total",
+                "counter",
+                "Number of the retried Juju API calls.",
+                (
+                    (
+                        f"cou_juju_api_call_retries_total{_format_labels(method=method)}",
+                        stats.retries,
+                    )
+                    for method, stats in calls
+                ),
+            ),
+        ]
+
+    def render(self) -> str:
+        """Render all metrics.
+
+        :return: metrics in the Prometheus text format
+        :rtype: str
+        """
+        running = self._get_running_steps(time.monotonic())
+        lines = [
+            *_format_metric(
+                "cou_upgrade_start_time_seconds",
+                "gauge",
+                "Start time of the upgrade since the Unix epoch.",
+                [("cou_upgrade_start_time_seconds", self.start_time)],
+            ),
+            *_format_metric(
+                "cou_steps",
+                "gauge",
+                "Number of the steps in the upgrade plan by the plan level.",
+                (
+                    (f"cou_steps{_format_labels(type=step_type)}", count)
+                    for step_type, count in sorted(self._get_total_steps().items())
+                ),
+            ),
+            *_format_metric(
+                "cou_steps_finished_total",
+                "counter",
+                "Number of the finished steps by the plan level and the outcome.",
+                (
+                    (
+                        f"cou_steps_finished_total{_format_labels(type=step_type, outcome=outcome)}",
+                        count,
+                    )
+                    for (step_type, outcome), count in sorted(self._finished.items())
+                ),
+            ),
+            *_format_metric(
+                "cou_steps_running",
+                "gauge",
+                "Number of the running steps by the plan level and their kind.",
+                (
+                    (f"cou_steps_running{_format_labels(type=step_type, kind=kind)}", count)
+                    for (step_type, kind), (count, _) in sorted(running.items())
+                ),
+            ),
+            *_format_metric(
+                "cou_step_running_seconds",
+                "gauge",
+                "Time elapsed since the start of the longest running step by the plan level and "
+                "its kind.",
+                (
+                    (
+                        f"cou_step_running_seconds{_format_labels(type=step_type, kind=kind)}",
+                        elapsed,
+                    )
+                    for (step_type, kind), (_, elapsed) in sorted(running.items())
+                ),
+            ),
+            *_format_metric(
+                "cou_step_duration_seconds",
+                "summary",
+                "Duration of the finished steps by their kind, e.g. waiting for the model.",
+                (
+                    sample
+                    for kind, (total, count) in sorted(self._durations.items())
+                    for sample in (
+                        (f"cou_step_duration_seconds_sum{_format_labels(kind=kind)}", total),
+                        (f"cou_step_duration_seconds_count{_format_labels(kind=kind)}", count),
+                    )
+                ),
+            ),
+            *_format_metric(
+                "cou_step_failures_total",
+                "counter",
+                "Number of the failed steps by their kind, e.g. failed actions.",
+                (
+                    (f"cou_step_failures_total{_format_labels(kind=kind)}", count)
+                    for kind, count in sorted(self._failures.items())
+                ),
+            ),
+            *self._render_api_calls(),
+        ]
+        return "\n".join(lines) + "\n"
+
+    def write(self) -> None:
+        """Write the metrics atomically to the textfile.
+
+        The metrics are written to a temporary file first and then renamed, so the collector
+        never reads partially written metrics.
+        """
+        if self.path is None:
+            return
+
+        tmp_path = self.path.with_name(f".{self.path.name}.tmp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_text(self.render(), encoding="utf-8")
+            os.replace(tmp_path, self.path)
+        except OSError as exc:
+            logger.warning("could not write metrics to %s: %r", self.path, exc)
+
+    async def _write_periodically(self, interval: float) -> None:
+        """Write the metrics to the textfile every interval.
+
+        :param interval: interval of writing the metrics, in seconds
+        :type interval: float
+        """
+        while True:
+            self.write()
+            await asyncio.sleep(interval)
+
+    async def _handle_request(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Serve the metrics to the HTTP request.
+
+        :param reader: reader of the request
+        :type reader: asyncio.StreamReader
+        :param writer: writer of the response
+        :type writer: asyncio.StreamWriter
+        """
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()).strip():  # skip the request headers
+                pass
+
+            method, target, *_ = request_line.decode("latin-1").split() or ["", ""]
+            if method == "GET" and target.split("?")[0] in ("/", "/metrics"):
+                status, content_type, body = "200 OK", CONTENT_TYPE, self.render().encode()
+            else:
+                status, content_type, body = "404 Not Found", "text/plain", b"Not Found\n"
+
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (ConnectionError, ValueError) as exc:
+            logger.debug("could not serve metrics: %r", exc)
+        finally:
+            writer.close()
+
+    async def start(self) -> None:
+        """Start writing the metrics to the textfile and serving them from the HTTP endpoint.
+
+        :raises EnvironmentVariableError: if COU_METRICS_INTERVAL is not valid
+        """
+        if self.path is not None:
+            interval = get_env_seconds("COU_METRICS_INTERVAL", METRICS_INTERVAL)
+            self._writer = asyncio.create_task(self._write_periodically(interval))
+            logger.info("writing metrics of the upgrade to %s", self.path)
+
+        if self.port is not None:
+            try:
+                self._server = await asyncio.start_server(
+                    self._handle_request, "127.0.0.1", self.port
+                )
+            except OSError as exc:
+                logger.warning("could not serve metrics on port %d: %r", self.port, exc)
+                return
+
+            logger.info("serving metrics of the upgrade at http://127.0.0.1:%d/metrics", self.port)
+
+    async def stop(self) -> None:
+        """Stop serving the metrics and write the final metrics to the textfile."""
+        if self._writer is not None:
+            self._writer.cancel()
+            self._writer = None
+
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+        self.write()
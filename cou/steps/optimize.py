@@ -0,0 +1,209 @@
+#  Copyright 2023 Canonical Limited
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Optimization of the upgrade plan."""
+import logging
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any, Optional
+
+from cou.steps import DEPENDENCY_DESCRIPTION_PREFIX, BaseStep, get_coroutine_call
+
+SET_CONFIG_FUNCTION = "Model.set_application_config"
+WAIT_FOR_IDLE_FUNCTION = "JubilantModelMixin.wait_for_idle"
+# rough duration of a config-changed hook cycle, used only to estimate the time saved
+CONFIG_CHANGED_DURATION: int = 60
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PlanOptimization:
+    """Summary of the changes made by the plan optimization."""
+
+    merged_config_steps: int = 0
+    dropped_wait_steps: int = 0
+    time_saved: int = 0
+
+    def __str__(self) -> str:
+        """Get summary of the plan optimization.
+
+        :return: Human readable summary.
+        :rtype: str
+        """
+        if not self.merged_config_steps and not self.dropped_wait_steps:
+            return "Plan optimization found nothing to optimize."
+
+        return (
+            f"Plan optimization merged {self.merged_config_steps} charm config change step(s) "
+            f"and dropped {self.dropped_wait_steps} redundant wait step(s), saving an estimated "
+            f"{timedelta(seconds=self.time_saved)}."
+        )
+
+
+def _get_step_call(step: BaseStep) -> Optional[tuple[str, dict[str, Any]]]:
+    """Get the function call of a step without sub-steps.
+
+    :param step: step to inspect
+    :type step: BaseStep
+    :return: qualified name of the function and its arguments or None
+    :rtype: Optional[tuple[str, dict[str, Any]]]
+    """
+    # pylint: disable=protected-access
+    if step.sub_steps or step._coro is None or step.done:
+        return None
+
+    return get_coroutine_call(step._coro)
+
+
+def _merge_config_steps(first: BaseStep, second: BaseStep) -> Optional[BaseStep]:
+    """Merge two steps changing the charm config of the same application.
+
+    :param first: step changing the charm config
+    :type first: BaseStep
+    :param second: step changing the charm config right after the first one
+    :type second: BaseStep
+    :return: step changing both configs at once or None if steps could not be merged
+    :rtype: Optional[BaseStep]
+    """
+    first_call, second_call = _get_step_call(first), _get_step_call(second)
+    if (
+        first_call is None
+        or second_call is None
+        or first_call[0] != SET_CONFIG_FUNCTION
+        or second_call[0] != SET_CONFIG_FUNCTION
+        or type(first) is not type(second)
+        or first.dependent != second.dependent
+    ):
+        return None
+
+    first_args, second_args = first_call[1], second_call[1]
+    if (
+        first_args["self"] is not second_args["self"]
+        or first_args["name"] != second_args["name"]
+        # the same option changed twice must keep both config-changed hooks
+        or first_args["configuration"].keys() & second_args["configuration"].keys()
+    ):
+        return None
+
+    model, name = first_args["self"], first_args["name"]
+    first_description = first.description.removeprefix(DEPENDENCY_DESCRIPTION_PREFIX)
+    second_description = second.description.removeprefix(DEPENDENCY_DESCRIPTION_PREFIX)
+    merged = type(first)(
+        description=f"{first_description} and "
+        f"{second_description.removeprefix(f'Change charm config of {name!r} ')}",
+        parallel=first.parallel,
+        coro=model.set_application_config(
+            name, {**first_args["configuration"], **second_args["configuration"]}
+        ),
+        dependent=first.dependent,
+        unit=first.unit,
+    )
+    return merged
+
+
+def _get_redundant_wait_idle_period(first: BaseStep, second: BaseStep) -> Optional[int]:
+    """Get the idle period of the first wait step if it is covered by the second one.
+
+    The first wait is redundant if the second wait is waiting for the same state of at least the
+    same applications, for at least the same time and with the same or stricter error handling.
+
+    :param first: step waiting for applications
+    :type first: BaseStep
+    :param second: step waiting for applications right after the first one
+    :type second: BaseStep
+    :return: idle period of the first wait step if it can be dropped, otherwise None
+    :rtype: Optional[int]
+    """
+    first_call, second_call = _get_step_call(first), _get_step_call(second)
+    if (
+        first_call is None
+        or second_call is None
+        or first_call[0] != WAIT_FOR_IDLE_FUNCTION
+        or second_call[0] != WAIT_FOR_IDLE_FUNCTION
+        or first.dependent
+    ):
+        return None
+
+    first_args, second_args = first_call[1], second_call[1]
+    # apps set to None means waiting for all COU-related applications
+    second_apps = None if second_args["apps"] is None else set(second_args["apps"])
+    first_apps = None if first_args["apps"] is None else set(first_args["apps"])
+    redundant = (
+        first_args["self"] is second_args["self"]
+        and first_args["status"] == second_args["status"]
+        and first_args["timeout"] <= second_args["timeout"]
+        and first_args["idle_period"] <= second_args["idle_period"]
+        and first_args["raise_on_blocked"] <= second_args["raise_on_blocked"]
+        and first_args["raise_on_error"] <= second_args["raise_on_error"]
+        and (second_apps is None or (first_apps is not None and first_apps <= second_apps))
+    )
+    # NOTE: a wait lasts at least the idle period, so that is the minimal time saved
+    return first_args["idle_period"] if redundant else None
+
+
+def _optimize_sub_steps(step: BaseStep, optimization: PlanOptimization) -> None:
+    """Optimize sub-steps of step, which are run sequentially.
+
+    :param step: step to optimize
+    :type step: BaseStep
+    :param optimization: summary of the plan optimization
+    :type optimization: PlanOptimization
+    """
+    sub_steps: list[BaseStep] = []
+    for sub_step in step.sub_steps:
+        previous = sub_steps[-1] if sub_steps else None
+        if previous is None:
+            sub_steps.append(sub_step)
+        elif merged := _merge_config_steps(previous, sub_step):
+            logger.debug("merging steps '%s' and '%s'", previous, sub_step)
+            sub_steps[-1] = merged
+            optimization.merged_config_steps += 1
+            optimization.time_saved += CONFIG_CHANGED_DURATION
+        elif (idle_period := _get_redundant_wait_idle_period(previous, sub_step)) is not None:
+            logger.debug("dropping redundant wait step '%s'", previous)
+            sub_steps[-1] = sub_step
+            optimization.dropped_wait_steps += 1
+            optimization.time_saved += idle_period
+        else:
+            sub_steps.append(sub_step)
+
+    step.replace_sub_steps(sub_steps)
+
+
+def optimize_plan(plan: BaseStep) -> PlanOptimization:
+    """Optimize the upgrade plan in place.
+
+    Two kinds of optimization are applied to the sub-steps run sequentially:
+     - adjacent steps changing the charm config of the same application are merged into
+       a single step, so the charm runs only one config-changed hook cycle
+     - wait step followed by a wait step covering it is dropped
+
+    Sub-steps of parallel steps are left untouched, as they do not run one after another.
+
+    :param plan: upgrade plan to optimize
+    :type plan: BaseStep
+    :return: summary of the plan optimization
+    :rtype: PlanOptimization
+    """
+    optimization = PlanOptimization()
+    steps_to_visit = [plan]
+    while steps_to_visit:
+        step = steps_to_visit.pop()
+        if not step.parallel:
+            _optimize_sub_steps(step, optimization)
+
+        steps_to_visit.extend(step.sub_steps)
+
+    logger.info(optimization)
+    return optimization
@@ -48,11 +48,14 @@ from cou.exceptions import (
     HaltUpgradePlanGeneration,
     NoTargetError,
     OutOfSupportRange,
+    RunUpgradeError,
     VaultSealed,
 )
-from cou.steps import PostUpgradeStep, PreUpgradeStep, UpgradePlan, ceph
+from cou.steps import BaseStep, PostUpgradeStep, PreUpgradeStep, UpgradePlan, UpgradeStep, ceph
 from cou.steps.analyze import Analysis
 from cou.steps.backup import backup
+from cou.steps.estimate import estimate_duration, order_by_duration
+from cou.steps.execute import notify_plan_changed
 from cou.steps.hypervisor import HypervisorUpgradePlanner
 from cou.steps.nova_cloud_controller import archive, purge
 from cou.steps.vault import verify_vault_is_unsealed
@@ -63,6 +66,12 @@ from cou.utils.openstack import LTS_TO_OS_RELEASE, OpenStackRelease
 
 logger = logging.getLogger(__name__)
 
+# calls of the steps changing the applications, mapped to the argument with application name
+_APP_CHANGING_CALLS = {
+    "Model.set_application_config": "name",
+    "Model.upgrade_charm": "application_name",
+}
+
 
 class MessageType(Enum):
     """Representation of a collection of message type."""
@@ -112,6 +121,7 @@ async def verify_cloud(analysis_result: Analysis, args: CLIargs) -> None:
     _verify_highest_release_achieved(analysis_result)
     _verify_data_plane_ready_to_upgrade(args, analysis_result)
     _verify_hypervisors_cli_input(args, analysis_result)
+    _verify_target_release(args, analysis_result)
     _verify_nova_cloud_controller_scheduler_default_filters(args, analysis_result)
     await _verify_vault_is_unsealed(analysis_result)
     await _verify_ceph_running_versions_consistent(analysis_result)
@@ -122,6 +132,11 @@ async def verify_cloud(analysis_result: Analysis, args: CLIargs) -> None:
 async def generate_plan(analysis_result: Analysis, args: CLIargs) -> UpgradePlan:
     """Generate plan for upgrade.
 
+    If the target release is more than one release ahead, the plan chains the upgrade to each
+    release in between. Only the plan of the first hop can be generated from the analysis,
+    the plans of the following hops are generated during the upgrade, once the previous hop
+    is upgraded.
+
     :param analysis_result: Analysis result.
     :type analysis_result: Analysis
     :param args: CLI arguments
@@ -129,25 +144,180 @@ async def generate_plan(analysis_result: Analysis, args: CLIargs) -> UpgradePlan
     :return: A plan with all upgrade steps necessary based on the Analysis.
     :rtype: UpgradePlan
     """
-    target = _determine_upgrade_target(analysis_result)
-
+    targets = _determine_upgrade_targets(analysis_result, args.to)
     plan = UpgradePlan(
-        f"Upgrade cloud from '{analysis_result.current_cloud_o7k_release}' to '{target}'"
+        f"Upgrade cloud from '{analysis_result.current_cloud_o7k_release}' to '{targets[0]}'"
+    )
+    await _add_release_upgrade_steps(plan, targets[0], analysis_result, args)
+    if len(targets) == 1:
+        return plan
+
+    multi_hop_plan = UpgradePlan(
+        f"Upgrade cloud from '{analysis_result.current_cloud_o7k_release}' to '{targets[-1]}'"
     )
+    multi_hop_plan.add_step(plan)
+    analyses = [analysis_result]
+    for current, target in zip(targets, targets[1:]):
+        previous_hop_plan = plan
+        plan = UpgradePlan(f"Upgrade cloud from '{current}' to '{target}'")
+        plan.add_step(
+            UpgradeStep(
+                description=f"Analyze cloud and generate upgrade plan to '{target}'",
+                coro=_generate_next_hop_plan(plan, previous_hop_plan, target, analyses, args),
+            )
+        )
+        multi_hop_plan.add_step(plan)
+
+    return multi_hop_plan
+
+
+def estimate_upgrade_duration(plan: UpgradePlan) -> float:
+    """Estimate duration of the upgrade.
+
+    Plans of the hops following the first one are generated during the upgrade, so each of
+    them is expected to take as long as the first hop.
+
+    :param plan: upgrade plan
+    :type plan: UpgradePlan
+    :return: estimated duration in seconds
+    :rtype: float
+    """
+    next_hops = [step for step in plan.sub_steps if _is_next_hop_plan(step)]
+    if not next_hops:
+        return estimate_duration(plan)
+
+    return estimate_duration(plan) + len(next_hops) * estimate_duration(plan.sub_steps[0])
+
+
+async def _add_release_upgrade_steps(
+    plan: UpgradePlan, target: OpenStackRelease, analysis_result: Analysis, args: CLIargs
+) -> None:
+    """Add all steps necessary to upgrade the cloud to the next release to the plan.
+
+    :param plan: Upgrade plan.
+    :type plan: UpgradePlan
+    :param target: Target OpenStack release.
+    :type target: OpenStackRelease
+    :param analysis_result: Analysis result.
+    :type analysis_result: Analysis
+    :param args: CLI arguments
+    :type args: CLIargs
+    """
     plan.add_steps(_get_pre_upgrade_steps(analysis_result, args))
 
+    control_plane_plans: list[UpgradePlan] = []
     # upgrade_group == None means that the user wants to upgrade the whole cloud.
     if args.upgrade_group in {CONTROL_PLANE, None}:
-        plan.add_steps(
-            _generate_control_plane_plan(target, analysis_result.apps_control_plane, args.force)
+        control_plane_plans = _generate_control_plane_plan(
+            target, analysis_result.apps_control_plane, args.force, args.rolling
         )
+        plan.add_steps(control_plane_plans)
 
     if args.upgrade_group in {DATA_PLANE, HYPERVISORS, None}:
-        plan.add_steps(await _generate_data_plane_plan(target, analysis_result, args))
+        data_plane_plans = [
+            step for step in await _generate_data_plane_plan(target, analysis_result, args) if step
+        ]
+        if any(control_plane_plans) and data_plane_plans:
+            plan.add_step(
+                UpgradeStep(
+                    description="Refresh data plane upgrade plan after control plane upgrade",
+                    coro=_refresh_data_plane_plan(
+                        plan, data_plane_plans, target, analysis_result, args
+                    ),
+                )
+            )
+        plan.add_steps(data_plane_plans)
 
     plan.add_steps(_get_post_upgrade_steps(analysis_result, args))
 
-    return plan
+
+async def _generate_next_hop_plan(
+    plan: UpgradePlan,
+    previous_hop_plan: UpgradePlan,
+    target: OpenStackRelease,
+    analyses: list[Analysis],
+    args: CLIargs,
+) -> None:
+    """Generate plan of the next hop of the multi-hop upgrade.
+
+    The analysis of the previous hop is refreshed incrementally, only the applications
+    changed by the previous hop are queried again. The cloud is verified again and the steps
+    of the hop are added to its plan. The observers are notified about the new steps, so e.g.
+    the history predicts their durations, and the steps are ordered by them.
+
+    :param plan: Upgrade plan of the hop.
+    :type plan: UpgradePlan
+    :param previous_hop_plan: Upgrade plan of the previous hop.
+    :type previous_hop_plan: UpgradePlan
+    :param target: Target OpenStack release of the hop.
+    :type target: OpenStackRelease
+    :param analyses: Analysis results of the previous hops, the refreshed one is appended.
+    :type analyses: list[Analysis]
+    :param args: CLI arguments
+    :type args: CLIargs
+    :raises RunUpgradeError: When the plan of the hop cannot be generated.
+    """
+    touched_apps = _get_touched_apps(previous_hop_plan)
+    analysis_result = await analyses[-1].refresh(args.skip_apps, touched_apps)
+    analyses.append(analysis_result)
+
+    errors_count = len(PlanStatus.error_messages)
+    try:
+        if (next_release := _determine_upgrade_target(analysis_result)) != target:
+            raise RunUpgradeError(
+                f"The cloud should be upgraded to '{target}', but the next release is "
+                f"'{next_release}'"
+            )
+
+        await verify_cloud(analysis_result, args)
+        if errors := PlanStatus.error_messages[errors_count:]:
+            raise RunUpgradeError("\n".join(errors))
+
+        await _add_release_upgrade_steps(plan, target, analysis_result, args)
+    except COUException as exc:
+        raise RunUpgradeError(f"Could not generate the upgrade plan to '{target}': {exc}") from exc
+
+    if plan.failure_policy is not None:
+        plan.set_default_failure_policy(plan.failure_policy)
+
+    notify_plan_changed(plan)
+    order_by_duration(plan)
+    logger.debug("Upgrade plan to '%s' generated:\n%s", target, plan)
+
+
+def _get_touched_apps(plan: BaseStep) -> set[str]:
+    """Get names of the applications whose charm or configuration is changed by the plan.
+
+    :param plan: Upgrade plan.
+    :type plan: BaseStep
+    :return: Names of the applications.
+    :rtype: set[str]
+    """
+    touched_apps = set()
+    steps_to_visit = [plan]
+    while steps_to_visit:
+        step = steps_to_visit.pop()
+        steps_to_visit.extend(step.sub_steps)
+        if step._coro is None:  # pylint: disable=protected-access
+            continue
+
+        name, arguments = step._get_call()  # pylint: disable=protected-access
+        app_name = arguments.get(_APP_CHANGING_CALLS.get(name, ""))
+        if isinstance(app_name, str):
+            touched_apps.add(app_name)
+
+    return touched_apps
+
+
+def _is_next_hop_plan(step: BaseStep) -> bool:
+    """Check if the step is a plan of the next hop, which was not generated yet.
+
+    :param step: Step of the upgrade plan.
+    :type step: BaseStep
+    :return: Whether the step is a plan of the next hop.
+    :rtype: bool
+    """
+    return [sub_step.kind for sub_step in step.sub_steps] == [_generate_next_hop_plan.__qualname__]
 
 
 async def post_upgrade_sanity_checks(analysis_result: Analysis) -> None:
@@ -214,6 +384,97 @@ async def _generate_data_plane_plan(
     return plans
 
 
+async def _refresh_data_plane_plan(
+    plan: UpgradePlan,
+    data_plane_plans: list[UpgradePlan],
+    target: OpenStackRelease,
+    analysis_result: Analysis,
+    args: CLIargs,
+) -> None:
+    """Regenerate the data-plane part of the plan from the refreshed analysis.
+
+    The data-plane plans are generated from the analysis made before the control plane upgrade,
+    which may be stale by the time the data plane is upgraded. The analysis is refreshed
+    incrementally and only the data-plane plans, which changed, are replaced in the plan.
+    The data-plane plans follow this step in the plan, which is run sequentially, so they are
+    replaced before they are started. See _run_sub_steps_sequentially for this contract.
+    The observers are notified about the new data-plane plans, so e.g. the history predicts
+    the durations of their steps, and the steps are ordered by them.
+
+    :param plan: Upgrade plan containing the data-plane plans.
+    :type plan: UpgradePlan
+    :param data_plane_plans: Data-plane plans in the upgrade plan.
+    :type data_plane_plans: list[UpgradePlan]
+    :param target: Target OpenStack release.
+    :type target: OpenStackRelease
+    :param analysis_result: Analysis result used to generate the plan.
+    :type analysis_result: Analysis
+    :param args: CLI arguments
+    :type args: CLIargs
+    :raises RunUpgradeError: When the data-plane plan cannot be regenerated.
+    """
+    touched_apps = {app.name for app in analysis_result.apps_control_plane}
+    refreshed_analysis = await analysis_result.refresh(args.skip_apps, touched_apps)
+
+    errors_count = len(PlanStatus.error_messages)
+    new_plans = await _generate_data_plane_plan(target, refreshed_analysis, args)
+    if errors := PlanStatus.error_messages[errors_count:]:
+        raise RunUpgradeError(
+            "Could not regenerate the data plane upgrade plan:\n" + "\n".join(errors)
+        )
+
+    new_plans = [step for step in new_plans if step]
+    # NOTE: the failure policy is part of the fingerprint, so it is set before comparing steps
+    if plan.failure_policy is not None:
+        for step in new_plans:
+            step.set_default_failure_policy(plan.failure_policy)
+
+    steps = _reuse_unchanged_steps(data_plane_plans, new_plans)
+
+    start = next(index for index, step in enumerate(plan.sub_steps) if step is data_plane_plans[0])
+    end = start + len(data_plane_plans)
+    plan.replace_sub_steps(steps, start, end)
+    for step in steps:
+        notify_plan_changed(step)
+        order_by_duration(step)
+
+    logger.debug("Data plane upgrade plan refreshed:\n%s", plan)
+
+
+def _reuse_unchanged_steps(old_steps: list[BaseStep], new_steps: list[BaseStep]) -> list[BaseStep]:
+    """Replace the new steps by the equal steps from the old plan.
+
+    Steps are matched by their type and description. A matched step is reused if it has the same
+    fingerprint as the new one, so all its sub-steps are the same as well. The order of
+    the sub-steps running in parallel is not part of the fingerprint, so the old steps ordered
+    by their durations are reused as well. Otherwise the sub-steps of the new step are matched
+    with the sub-steps of the old step, if neither of them has a coroutine.
+
+    :param old_steps: Steps of the old plan.
+    :type old_steps: list[BaseStep]
+    :param new_steps: Steps of the regenerated plan.
+    :type new_steps: list[BaseStep]
+    :return: New steps with the unchanged ones replaced by the old steps.
+    :rtype: list[BaseStep]
+    """
+    old_steps_by_identity = {(type(step), step.description): step for step in old_steps}
+    steps = []
+    for new_step in new_steps:
+        old_step = old_steps_by_identity.get((type(new_step), new_step.description))
+        # pylint: disable=protected-access
+        if old_step is not None and old_step.fingerprint == new_step.fingerprint:
+            logger.debug("Reusing unchanged step %s", repr(old_step))
+            new_step = old_step
+        elif old_step is not None and old_step._coro is None and new_step._coro is None:
+            new_step.replace_sub_steps(
+                _reuse_unchanged_steps(old_step.sub_steps, new_step.sub_steps)
+            )
+
+        steps.append(new_step)
+
+    return steps
+
+
 def _verify_supported_series(analysis_result: Analysis) -> None:
     """Verify the Ubuntu series of the cloud to see if it is supported.
 
@@ -459,6 +720,71 @@ def _determine_upgrade_target(analysis_result: Analysis) -> OpenStackRelease:
     return target
 
 
+def _determine_upgrade_targets(
+    analysis_result: Analysis, to: Optional[str]
+) -> list[OpenStackRelease]:
+    """Determine the target releases of each hop of the upgrade.
+
+    :param analysis_result: Analysis result.
+    :type analysis_result: Analysis
+    :param to: Final target release or None to upgrade to the next release.
+    :type to: Optional[str]
+    :raises NoTargetError: When the final target is not newer than the current release.
+    :raises OutOfSupportRange: When the final target is not supported by the current series.
+    :return: The target OS releases of each hop, from the next release to the final one.
+    :rtype: list[OpenStackRelease]
+    """
+    targets = [_determine_upgrade_target(analysis_result)]
+    if to is None:
+        return targets
+
+    o7k_release, current_series = _get_o7k_release_and_series(analysis_result)
+    final_target = OpenStackRelease(to)
+    if final_target <= o7k_release:
+        raise NoTargetError(
+            f"Cannot upgrade cloud to '{final_target}'. Current minimum OS release is "
+            f"'{o7k_release}'."
+        )
+
+    if to not in (supporting_o7k_release := LTS_TO_OS_RELEASE.get(current_series, [])):
+        raise OutOfSupportRange(
+            f"Unable to upgrade cloud from Ubuntu series `{current_series}` to '{to}'. "
+            "The target release needs to be supported by the current "
+            f"Ubuntu series '{current_series}': {', '.join(supporting_o7k_release)}."
+        )
+
+    while (next_release := targets[-1].next_release) is not None and next_release <= final_target:
+        targets.append(next_release)
+
+    return targets
+
+
+def _verify_target_release(args: CLIargs, analysis_result: Analysis) -> None:
+    """Verify that the upgrade across several releases is done for the whole cloud.
+
+    :param args: CLI arguments
+    :type args: CLIargs
+    :param analysis_result: Analysis result
+    :type analysis_result: Analysis
+    """
+    o7k_release = analysis_result.current_cloud_o7k_release
+    if (
+        args.to is None
+        or args.upgrade_group is None
+        or o7k_release is None
+        or OpenStackRelease(args.to) <= o7k_release
+        or o7k_release.next_release == args.to
+    ):
+        return
+
+    PlanStatus.add_message(
+        f"Upgrade of the {args.upgrade_group} from '{o7k_release}' to '{args.to}' is not "
+        "possible, because it spans several releases. Only the whole cloud can be upgraded "
+        "across several releases.",
+        MessageType.ERROR,
+    )
+
+
 def _verify_hypervisors_cli_input(args: CLIargs, analysis_result: Analysis) -> None:
     """Sanity checks from the parameters passed in the cli to upgrade data-plane.
 
@@ -717,7 +1043,10 @@ def _get_post_upgrade_steps(analysis_result: Analysis, args: CLIargs) -> list[Po
 
 
 def _generate_control_plane_plan(
-    target: OpenStackRelease, apps: list[OpenStackApplication], force: bool
+    target: OpenStackRelease,
+    apps: list[OpenStackApplication],
+    force: bool,
+    rolling: bool = False,
 ) -> list[UpgradePlan]:
     """Generate upgrade plan for control plane.
 
@@ -727,6 +1056,9 @@ def _generate_control_plane_plan(
     :type apps: list[OpenStackApplication]
     :param force: Whether the plan generation should be forced
     :type force: bool
+    :param rolling: Whether the units of clustered principal applications should be upgraded in
+                    rolling waves, defaults to False
+    :type rolling: bool
     :return: A list containing control plane (Principal and Subordinate) upgrade plans.
     :rtype: list[UpgradePlan]
     """
@@ -735,6 +1067,7 @@ def _generate_control_plane_plan(
         description="Control Plane principal(s) upgrade plan",
         target=target,
         force=force,
+        rolling=rolling,
     )
 
     # NOTE: these are all subordinates on the cloud,
@@ -804,7 +1137,14 @@ async def _generate_data_plane_hypervisors_plan(
     """
     hypervisors_machines = await _filter_hypervisors_machines(args, analysis_result)
     logger.info("Hypervisors selected: %s", hypervisors_machines)
-    hypervisor_planner = HypervisorUpgradePlanner(apps, hypervisors_machines)
+    _, cloud_machines = _get_nova_compute_units_and_machines(analysis_result.apps_data_plane)
+    hypervisor_planner = HypervisorUpgradePlanner(
+        apps,
+        hypervisors_machines,
+        args.pipeline_hypervisors,
+        args.max_parallel_azs,
+        cloud_machines,
+    )
     # NOTE(agileshaw): Assign an empty UpgradePlan for hypervisor_plan if _generate_instance_plan
     #                  returns None
     hypervisor_plan = _generate_instance_plan(
@@ -819,7 +1159,9 @@ def _generate_data_plane_remaining_plan(
 ) -> list[UpgradePlan]:
     """Generate upgrade plan for remaining principal data-plane apps.
 
-    Those plans are done using the all-in-one upgrade strategy.
+    Those plans are done using the all-in-one upgrade strategy. Applications which do not share
+    any machine are upgraded in parallel, while applications sharing machines are upgraded one by
+    one in the upgrade order.
 
     :param target:  Target OpenStack release.
     :type target: OpenStackRelease
@@ -830,17 +1172,78 @@ def _generate_data_plane_remaining_plan(
     :return: A list of data plane (non-hypervisors Principal and Subordinate) upgrade plans.
     :rtype: list[UpgradePlan]
     """
-    principal_upgrade_plan = _create_upgrade_group(
-        apps=[app for app in apps if app.is_subordinate is False],
-        description="Remaining Data Plane principal(s) upgrade plan",
-        target=target,
-        force=force,
-    )
+    description = "Remaining Data Plane principal(s) upgrade plan"
+    principal_apps = [app for app in apps if app.is_subordinate is False]
+    apps_groups = _group_apps_by_machines(principal_apps)
+    if len(apps_groups) < 2:
+        principal_upgrade_plan = _create_upgrade_group(
+            apps=principal_apps,
+            description=description,
+            target=target,
+            force=force,
+        )
+    else:
+        logger.debug(
+            "upgrading %d groups of apps not sharing machines in parallel", len(apps_groups)
+        )
+        parallel_plan = UpgradeStep(
+            "Upgrade apps not sharing any machine in parallel", parallel=True
+        )
+        for apps_group in apps_groups:
+            group_plan = _create_upgrade_group(
+                apps=apps_group,
+                description="Upgrade plan for apps sharing machines: "
+                f"{', '.join(app.name for app in apps_group)}",
+                target=target,
+                force=force,
+            )
+            if len(group_plan.sub_steps) == 1:
+                parallel_plan.add_step(group_plan.sub_steps[0])
+            else:
+                parallel_plan.add_step(group_plan)
+
+        principal_upgrade_plan = UpgradePlan(description)
+        principal_upgrade_plan.add_step(parallel_plan)
 
     logger.debug("Generation of remaining data plane upgrade plan complete")
     return [principal_upgrade_plan]
 
 
+def _group_apps_by_machines(apps: list[OpenStackApplication]) -> list[list[OpenStackApplication]]:
+    """Group applications sharing machines.
+
+    Two applications belong to the same group if they share a machine, directly or through other
+    applications of the group. The applications of each group keep their order and the groups
+    are ordered by their first application.
+
+    :param apps: List of applications sorted by the upgrade order.
+    :type apps: list[OpenStackApplication]
+    :return: Groups of applications sharing machines.
+    :rtype: list[list[OpenStackApplication]]
+    """
+    parents = list(range(len(apps)))
+
+    def _find(index: int) -> int:
+        while parents[index] != index:
+            parents[index] = parents[parents[index]]
+            index = parents[index]
+        return index
+
+    machines_apps: dict[str, int] = {}
+    for index, app in enumerate(apps):
+        for machine_id in app.machines:
+            if machine_id in machines_apps:
+                parents[_find(index)] = _find(machines_apps[machine_id])
+            else:
+                machines_apps[machine_id] = index
+
+    groups: dict[int, list[OpenStackApplication]] = {}
+    for index, app in enumerate(apps):
+        groups.setdefault(_find(index), []).append(app)
+
+    return list(groups.values())
+
+
 async def _filter_hypervisors_machines(args: CLIargs, analysis_result: Analysis) -> list[Machine]:
     """Filter the hypervisors to generate plan and upgrade.
 
@@ -909,6 +1312,7 @@ def _create_upgrade_group(
     target: OpenStackRelease,
     description: str,
     force: bool,
+    rolling: bool = False,
 ) -> UpgradePlan:
     """Create upgrade group.
 
@@ -923,6 +1327,9 @@ def _create_upgrade_group(
     :type description: str
     :param force: Whether the plan generation should be forced
     :type force: bool
+    :param rolling: Whether the units of clustered applications should be upgraded in rolling
+                    waves, defaults to False
+    :type rolling: bool
     :raises Exception: When cannot generate upgrade plan.
     :return: Upgrade plan of an upgrade group.
     :rtype: UpgradePlan
@@ -930,7 +1337,7 @@ def _create_upgrade_group(
     group_upgrade_plan = UpgradePlan(description)
 
     for app in apps:
-        if app_upgrade_plan := _generate_instance_plan(app, target, force):
+        if app_upgrade_plan := _generate_instance_plan(app, target, force, rolling):
             group_upgrade_plan.add_step(app_upgrade_plan)
 
     return group_upgrade_plan
@@ -940,6 +1347,7 @@ def _generate_instance_plan(
     instance: Union[HypervisorUpgradePlanner, OpenStackApplication],
     target: OpenStackRelease,
     force: bool,
+    rolling: bool = False,
 ) -> Optional[UpgradePlan]:
     """Generate upgrade plan for an instance and handle exceptions.
 
@@ -953,6 +1361,9 @@ def _generate_instance_plan(
     :type target: OpenStackRelease
     :param force: Whether the plan generation should be forced
     :type force: bool
+    :param rolling: Whether the units of clustered application should be upgraded in rolling
+                    waves, defaults to False
+    :type rolling: bool
     :raises Exception: When cannot generate upgrade plan.
     :return: Upgrade plan of an instance.
     :rtype: Optional[UpgradePlan]:
@@ -964,6 +1375,9 @@ def _generate_instance_plan(
     )
 
     try:
+        if rolling and isinstance(instance, OpenStackApplication) and instance.is_clustered:
+            return instance.generate_rolling_upgrade_plan(target, force)
+
         instance_upgrade_plan = instance.generate_upgrade_plan(target, force)
         return instance_upgrade_plan
     except HaltUpgradePlanGeneration as exc:
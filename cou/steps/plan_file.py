@@ -0,0 +1,327 @@
+#  Copyright 2023 Canonical Limited
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Upgrade plan serialized to a file."""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from dataclasses import dataclass, fields
+from pathlib import Path
+from typing import Any, Optional
+
+from cou.apps.factory import AppFactory
+from cou.commands import CLIargs
+from cou.exceptions import PlanFileError
+from cou.steps import BaseStep
+from cou.steps.analyze import Analysis
+from cou.utils.juju_utils import Application, Machine, Model, SubordinateUnit, Unit
+
+PLAN_FILE_VERSION = 4
+
+logger = logging.getLogger(__name__)
+
+
+def _dump_step(step: BaseStep) -> dict[str, Any]:
+    """Dump step and all its sub-steps.
+
+    :param step: step to dump
+    :type step: BaseStep
+    :return: serializable representation of the step
+    :rtype: dict[str, Any]
+    """
+    return {
+        "type": type(step).__name__,
+        "description": step.description,
+        "parallel": step.parallel,
+        "sub_steps": [_dump_step(sub_step) for sub_step in step.sub_steps],
+    }
+
+
+def _dump_planned_args(args: CLIargs) -> dict[str, Any]:
+    """Dump CLI arguments affecting the upgrade plan.
+
+    :param args: CLI arguments
+    :type args: CLIargs
+    :return: serializable arguments which are part of the plan fingerprint
+    :rtype: dict[str, Any]
+    """
+    planned_args = {}
+    for arg in fields(args):
+        if arg.metadata.get("fingerprint", True):
+            value = getattr(args, arg.name)
+            planned_args[arg.name] = sorted(value) if isinstance(value, set) else value
+
+    return planned_args
+
+
+def _dump_machine(machine: Machine) -> dict[str, Any]:
+    """Dump machine.
+
+    :param machine: machine to dump
+    :type machine: Machine
+    :return: serializable representation of the machine
+    :rtype: dict[str, Any]
+    """
+    return {
+        "machine_id": machine.machine_id,
+        "apps_charms": [
+            list(app_charm) if isinstance(app_charm, tuple) else app_charm
+            for app_charm in machine.apps_charms
+        ],
+        "az": machine.az,
+        "region": machine.region,
+    }
+
+
+def _load_machine(data: dict[str, Any]) -> Machine:
+    """Load machine.
+
+    :param data: serialized machine
+    :type data: dict[str, Any]
+    :return: machine
+    :rtype: Machine
+    """
+    return Machine(
+        machine_id=data["machine_id"],
+        apps_charms=tuple(
+            tuple(app_charm) if isinstance(app_charm, list) else app_charm
+            for app_charm in data["apps_charms"]
+        ),
+        az=data["az"],
+        region=data["region"],
+    )
+
+
+def _dump_application(app: Application) -> dict[str, Any]:
+    """Dump application.
+
+    :param app: application to dump
+    :type app: Application
+    :return: serializable representation of the application
+    :rtype: dict[str, Any]
+    """
+    return {
+        "name": app.name,
+        "can_upgrade_to": app.can_upgrade_to,
+        "charm": app.charm,
+        "channel": app.channel,
+        "config": app.config,
+        "machines": {
+            machine_id: _dump_machine(machine) for machine_id, machine in app.machines.items()
+        },
+        "origin": app.origin,
+        "series": app.series,
+        "subordinate_to": app.subordinate_to,
+        "units": {
+            name: {
+                "machine": _dump_machine(unit.machine),
+                "workload_version": unit.workload_version,
+                "subordinates": [
+                    {"name": subordinate.name, "charm": subordinate.charm}
+                    for subordinate in unit.subordinates
+                ],
+            }
+            for name, unit in app.units.items()
+        },
+        "workload_version": app.workload_version,
+        "actions": app.actions,
+    }
+
+
+def _load_application(data: dict[str, Any], model: Model) -> Application:
+    """Load application.
+
+    :param data: serialized application
+    :type data: dict[str, Any]
+    :param model: model to which the application belongs
+    :type model: Model
+    :return: application
+    :rtype: Application
+    """
+    return Application(
+        name=data["name"],
+        can_upgrade_to=data["can_upgrade_to"],
+        charm=data["charm"],
+        channel=data["channel"],
+        config=data["config"],
+        machines={
+            machine_id: _load_machine(machine) for machine_id, machine in data["machines"].items()
+        },
+        model=model,
+        origin=data["origin"],
+        series=data["series"],
+        subordinate_to=data["subordinate_to"],
+        units={
+            name: Unit(
+                name=name,
+                machine=_load_machine(unit["machine"]),
+                workload_version=unit["workload_version"],
+                subordinates=[
+                    SubordinateUnit(subordinate["name"], subordinate["charm"])
+                    for subordinate in unit["subordinates"]
+                ],
+            )
+            for name, unit in data["units"].items()
+        },
+        workload_version=data["workload_version"],
+        actions=data["actions"],
+    )
+
+
+@dataclass(frozen=True)
+class PlanFile:
+    """Upgrade plan saved together with the analysis it was generated from.
+
+    The plan file stores the fingerprint of the model state, so the saved analysis can be used
+    instead of analyzing the cloud again only if the model has not changed since. The charm
+    configuration is not part of the model state, so it is always queried again. The saved
+    analysis already leaves out the skipped applications, so the plan file also stores the CLI
+    arguments affecting the plan and can be used only with the same arguments.
+    """
+
+    model_uuid: str
+    status_fingerprint: str
+    plan_fingerprint: str
+    arguments: dict[str, Any]
+    plan: dict[str, Any]
+    applications: list[dict[str, Any]]
+
+    @classmethod
+    async def create(cls, analysis_result: Analysis, plan: BaseStep, args: CLIargs) -> PlanFile:
+        """Create plan file for the upgrade plan.
+
+        :param analysis_result: analysis from which the plan was generated
+        :type analysis_result: Analysis
+        :param plan: upgrade plan
+        :type plan: BaseStep
+        :param args: CLI arguments the plan was generated with
+        :type args: CLIargs
+        :return: plan file
+        :rtype: PlanFile
+        """
+        model = analysis_result.model
+        return cls(
+            model_uuid=model.uuid,
+            status_fingerprint=await model.get_status_fingerprint(),
+            plan_fingerprint=plan.fingerprint,
+            arguments=_dump_planned_args(args),
+            plan=_dump_step(plan),
+            applications=[_dump_application(app) for app in analysis_result.apps],
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> PlanFile:
+        """Load plan file.
+
+        :param path: path to the plan file
+        :type path: Path
+        :return: plan file
+        :rtype: PlanFile
+        :raises PlanFileError: When the plan file can not be read or is not valid.
+        """
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+            if data.get("version") != PLAN_FILE_VERSION:
+                raise PlanFileError(
+                    f"Unsupported version {data.get('version')} of plan file '{path}'"
+                )
+
+            return cls(
+                model_uuid=data["model_uuid"],
+                status_fingerprint=data["status_fingerprint"],
+                plan_fingerprint=data["plan_fingerprint"],
+                arguments=data["arguments"],
+                plan=data["plan"],
+                applications=data["applications"],
+            )
+        except (OSError, ValueError, KeyError, AttributeError) as exc:
+            raise PlanFileError(f"Could not load plan file '{path}': {exc!r}") from exc
+
+    def save(self, path: Path) -> None:
+        """Save plan file.
+
+        :param path: path to the plan file
+        :type path: Path
+        """
+        data = {
+            "version": PLAN_FILE_VERSION,
+            "model_uuid": self.model_uuid,
+            "status_fingerprint": self.status_fingerprint,
+            "plan_fingerprint": self.plan_fingerprint,
+            "arguments": self.arguments,
+            "plan": self.plan,
+            "applications": self.applications,
+        }
+        path.write_text(json.dumps(data, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+        logger.info("upgrade plan saved to %s", path)
+
+    async def get_analysis(self, model: Model, args: CLIargs) -> Optional[Analysis]:
+        """Get the saved analysis if the model has not changed since the plan was saved.
+
+        The configuration of the saved applications is queried again, because its changes, e.g.
+        of the action-managed-upgrade or openstack-origin options, are not detected by
+        the fingerprint of the model state.
+
+        :param model: model to upgrade
+        :type model: Model
+        :param args: CLI arguments of the upgrade
+        :type args: CLIargs
+        :return: saved analysis or None if the model changed
+        :rtype: Optional[Analysis]
+        :raises PlanFileError: When the plan file was saved for another model or with other
+                               CLI arguments affecting the plan.
+        """
+        if model.uuid != self.model_uuid:
+            raise PlanFileError(
+                f"The plan file was saved for model '{self.model_uuid}', not for model "
+                f"'{model.name}' ({model.uuid})"
+            )
+
+        planned_args = _dump_planned_args(args)
+        if changed := sorted(
+            name for name, value in planned_args.items() if self.arguments.get(name) != value
+        ):
+            raise PlanFileError(
+                f"The plan file was saved with other values of {', '.join(changed)}. Please "
+                "use the same options as when the plan was saved or save it again with "
+                "'cou plan --output'."
+            )
+
+        if await model.get_status_fingerprint() != self.status_fingerprint:
+            logger.warning("model changed since the plan file was saved, analyzing it again")
+            return None
+
+        logger.info("model has not changed since the plan file was saved, using saved analysis")
+        configs = await asyncio.gather(
+            *(model.get_application_config(app["name"]) for app in self.applications)
+        )
+        apps = [
+            AppFactory.create(_load_application({**app, "config": config}, model))
+            for app, config in zip(self.applications, configs)
+        ]
+        return Analysis(model=model, apps=[app for app in apps if app is not None])
+
+    def verify_plan(self, plan: BaseStep) -> None:
+        """Verify that the upgrade plan is the same as the saved one.
+
+        :param plan: upgrade plan
+        :type plan: BaseStep
+        :raises PlanFileError: When the upgrade plan differs from the saved one.
+        """
+        if plan.fingerprint != self.plan_fingerprint:
+            raise PlanFileError(
+                "The upgrade plan differs from the saved plan. Please review the new plan and "
+                "save it again with 'cou plan --output'."
+            )
@@ -0,0 +1,320 @@
+#  Copyright 2023 Canonical Limited
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Live view of the upgrade progress."""
+import asyncio
+import heapq
+import shutil
+import sys
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Optional, TextIO
+
+from cou.steps import BaseStep
+from cou.steps.execute import GROUP_STEPS, StepObserver
+from cou.utils import get_env_seconds, progress_indicator
+
+# default interval of redrawing the live view in the terminal, in seconds
+PROGRESS_INTERVAL = 1.0
+# default interval of printing the progress if the output is not a terminal, in seconds
+PROGRESS_REPORT_INTERVAL = 60.0
+# number of the running units and steps shown in the live view
+MAX_IN_FLIGHT = 10
+# ANSI sequences moving the cursor up by the given number of lines and clearing the rest
+CURSOR_UP = "\x1b[{}F"
+CLEAR_DOWN = "\x1b[J"
+
+
+def _format_duration(seconds: float) -> str:
+    """Format duration rounded to seconds.
+
+    :param seconds: duration in seconds
+    :type seconds: float
+    :return: duration, e.g. '0:02:13'
+    :rtype: str
+    """
+    return str(timedelta(seconds=round(max(seconds, 0))))
+
+
+@dataclass
+class GroupProgress:
+    """Progress of the group of steps, e.g. the upgrade plan of one application."""
+
+    description: str
+    started: float
+    steps: int = 0
+    finished_steps: int = 0
+    failed_steps: int = 0
+    units: int = 0
+    finished_units: int = 0
+    running: int = 0
+    remaining_unit_steps: Counter[str] = field(default_factory=Counter)
+
+    def format(self, now: float, finished: bool = False) -> str:
+        """Format counts, throughput and remaining time of the group.
+
+        Groups with units report their throughput in units, the others in steps. The remaining
+        time assumes the throughput does not change.
+
+        :param now: current time
+        :type now: float
+        :param finished: whether the group is finished, so only its duration is shown
+        :type finished: bool
+        :return: progress of the group
+        :rtype: str
+        """
+        elapsed = now - self.started
+        total, done, unit = (
+            (self.units, self.finished_units, "units")
+            if self.units
+            else (self.steps, self.finished_steps, "steps")
+        )
+        failed = f", {self.failed_steps} failed" if self.failed_steps else ""
+        if finished:
+            return (
+                f"{self.description}: {done}/{total} {unit}{failed} in {_format_duration(elapsed)}"
+            )
+
+        text = f"{self.description}: {done}/{total} {unit}, {self.running} running{failed}"
+        if done and elapsed > 0:
+            throughput = done / elapsed * 60
+            text += f", {throughput:.1f} {unit}/min"
+            text += f", ~{_format_duration((total - done) / throughput * 60)} left"
+
+        return text
+
+
+@dataclass
+class InFlight:
+    """Unit or step without unit which is running."""
+
+    label: str
+    started: float
+    description: str
+    running: int = 0
+
+
+class ProgressView(StepObserver):
+    """Live view of the upgrade progress.
+
+    In a terminal, the view is redrawn in place of the progress spinner every
+    COU_PROGRESS_INTERVAL and shows the progress of the running groups of steps and the units
+    taking the longest. Otherwise, the progress of the groups is printed every
+    COU_PROGRESS_REPORT_INTERVAL. Step events
+    only update counters and the view shows a bounded number of lines, so the cost of a redraw
+    does not grow with the number of running units.
+    """
+
+    def __init__(self, stream: Optional[TextIO] = None):
+        """Initialize the progress view.
+
+        :param stream: output of the view, defaults to stdout
+        :type stream: Optional[TextIO]
+        :raises EnvironmentVariableError: if any interval is not a positive number
+        """
+        self.stream = stream or sys.stdout
+        self.live = self.stream.isatty()
+        self.interval = get_env_seconds("COU_PROGRESS_INTERVAL", PROGRESS_INTERVAL)
+        self.report_interval = get_env_seconds(
+            "COU_PROGRESS_REPORT_INTERVAL", PROGRESS_REPORT_INTERVAL
+        )
+        self.groups: dict[int, GroupProgress] = {}
+        self.in_flight: dict[str, InFlight] = {}
+        self._step_groups: dict[int, list[GroupProgress]] = {}
+        self._lines = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _get_label(step: BaseStep) -> str:
+        """Get label of the step in the running units and steps.
+
+        :param step: step
+        :type step: BaseStep
+        :return: name of the unit targeted by the step or the step description
+        :rtype: str
+        """
+        return step.unit.name if step.unit else step.description
+
+    def _start_group(self, step: BaseStep) -> None:
+        """Start tracking the progress of the group of steps.
+
+        :param step: group of steps
+        :type step: BaseStep
+        """
+        group = GroupProgress(step.description, time.monotonic())
+        steps_to_visit = list(step.sub_steps)
+        while steps_to_visit:
+            sub_step = steps_to_visit.pop()
+            steps_to_visit.extend(sub_step.sub_steps)
+            if sub_step._coro is None:  # pylint: disable=protected-access
+                continue
+
+            group.steps += 1
+            self._step_groups.setdefault(id(sub_step), []).append(group)
+            if sub_step.unit:
+                group.remaining_unit_steps[sub_step.unit.name] += 1
+
+        group.units = len(group.remaining_unit_steps)
+        self.groups[id(step)] = group
+
+    def step_started(self, step: BaseStep) -> None:
+        """Record start of the step.
+
+        :param step: started step
+        :type step: BaseStep
+        """
+        if isinstance(step, GROUP_STEPS):
+            self._start_group(step)
+        elif step.unit or step._coro is not None:  # pylint: disable=protected-access
+            label = self._get_label(step)
+            if (in_flight := self.in_flight.get(label)) is None:
+                in_flight = self.in_flight[label] = InFlight(
+                    label, time.monotonic(), step.description
+                )
+            in_flight.running += 1
+            if step._coro is not None:  # pylint: disable=protected-access
+                in_flight.description = step.description
+
+        for group in self._step_groups.get(id(step), []):
+            group.running += 1
+
+    def step_finished(self, step: BaseStep, error: Optional[BaseException]) -> None:
+        """Record the finished step.
+
+        :param step: finished step
+        :type step: BaseStep
+        :param error: exception raised by the step or None if the step succeeded
+        :type error: Optional[BaseException]
+        """
+        if (group := self.groups.pop(id(step), None)) is not None:
+            if self.live:
+                progress_indicator.stop()  # the text of the last step in the group is outdated
+            self.print(group.format(time.monotonic(), finished=True))
+            return
+
+        label = self._get_label(step)
+        tracked = step.unit or step._coro is not None  # pylint: disable=protected-access
+        if tracked and (in_flight := self.in_flight.get(label)) is not None:
+            in_flight.running -= 1
+            if in_flight.running <= 0:
+                del self.in_flight[label]
+
+        for group in self._step_groups.pop(id(step), []):
+            group.running -= 1
+            group.finished_steps += 1
+            if error is not None:
+                group.failed_steps += 1
+            if step.unit and group.remaining_unit_steps[step.unit.name] > 0:
+                group.remaining_unit_steps[step.unit.name] -= 1
+                if group.remaining_unit_steps[step.unit.name] == 0:
+                    group.finished_units += 1
+
+    def render(self, now: float) -> list[str]:
+        """Render the progress of the running groups and the units taking the longest.
+
+        :param now: current time
+        :type now: float
+        :return: lines of the view
+        :rtype: list[str]
+        """
+        lines = [group.format(now) for group in self.groups.values()]
+        longest = heapq.nsmallest(
+            MAX_IN_FLIGHT, self.in_flight.values(), key=lambda in_flight: in_flight.started
+        )
+        width = max((len(in_flight.label) for in_flight in longest), default=0)
+        for in_flight in longest:
+            elapsed = _format_duration(now - in_flight.started)
+            if in_flight.label == in_flight.description:
+                lines.append(f"  {elapsed:>8}  {in_flight.description}")
+            else:
+                lines.append(
+                    f"  {elapsed:>8}  {in_flight.label:<{width}}  {in_flight.description}"
+                )
+
+        if len(self.in_flight) > MAX_IN_FLIGHT:
+            lines.append(f"  ... and {len(self.in_flight) - MAX_IN_FLIGHT} more running")
+
+        # the text of the paused spinner is shown unless it is a running step already shown
+        text = progress_indicator.text
+        if text and all(in_flight.description != text for in_flight in longest):
+            lines.append(text)
+
+        return lines
+
+    def _erase(self) -> str:
+        """Get sequence erasing the drawn view.
+
+        :return: ANSI sequence moving the cursor to the start of the view and clearing it
+        :rtype: str
+        """
+        return CURSOR_UP.format(self._lines) + CLEAR_DOWN if self._lines else ""
+
+    def draw(self) -> None:
+        """Redraw the view in place, each line cut to the width of the terminal."""
+        columns = shutil.get_terminal_size().columns
+        lines = [line[: columns - 1] for line in self.render(time.monotonic())]
+        output = self._erase() + "".join(f"{line}\n" for line in lines)
+        self._lines = len(lines)
+        self.stream.write(output)
+        self.stream.flush()
+
+    def print(self, text: str) -> None:
+        """Print persistent message above the view.
+
+        :param text: message to print
+        :type text: str
+        """
+        if not self.live:
+            print(text, file=self.stream, flush=True)
+            return
+
+        self.stream.write(self._erase() + f"{text}\n")
+        self._lines = 0
+        self.draw()
+
+    def report(self) -> None:
+        """Print the progress of the running groups."""
+        now = time.monotonic()
+        for group in self.groups.values():
+            print(group.format(now), file=self.stream, flush=True)
+
+    async def _refresh(self) -> None:
+        """Redraw the view or print the progress every interval."""
+        while True:
+            if self.live:
+                self.draw()
+                await asyncio.sleep(self.interval)
+            else:
+                await asyncio.sleep(self.report_interval)
+                self.report()
+
+    def start(self) -> None:
+        """Start showing the progress."""
+        if self.live:
+            progress_indicator.pause(self.print)
+
+        self._task = asyncio.create_task(self._refresh())
+
+    def stop(self) -> None:
+        """Stop showing the progress and erase the live view."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+        if self.live:
+            progress_indicator.resume()
+            self.stream.write(self._erase())
+            self.stream.flush()
+            self._lines = 0
@@ -0,0 +1,232 @@
+#  Copyright 2023 Canonical Limited
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Critical path analysis of the executed upgrade plan."""
+from __future__ import annotations
+
+import json
+import logging
+import math
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Iterator
+
+from cou.exceptions import RunAnalysisError
+from cou.steps.estimate import format_duration
+
+# log message of the StepTracer, which saved the trace of the run
+TRACE_LOG_PATTERN = re.compile(r"trace of the upgrade steps saved to (?P<path>\S+)")
+# number of the largest potential savings shown in the report
+TOP_SAVINGS = 10
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ExecutedStep:
+    """Step of the executed upgrade plan rebuilt from the trace."""
+
+    description: str
+    start: float
+    duration: float
+    parallel: bool = False
+    outcome: str = "succeeded"
+    sub_steps: list[ExecutedStep] = field(default_factory=list)
+
+    @property
+    def end(self) -> float:
+        """Get the time when the step finished.
+
+        :return: end of the step in seconds since the start of the run
+        :rtype: float
+        """
+        return self.start + self.duration
+
+
+@dataclass(frozen=True)
+class Saving:
+    """Time which could be saved by changing a step on the critical path."""
+
+    step: ExecutedStep
+    change: str
+    seconds: float
+
+
+def _get_trace_path(path: Path) -> Path:
+    """Get path to the trace of the run.
+
+    The log file is searched for the path of the trace saved by the run.
+
+    :param path: path to the trace or the log file of the run
+    :type path: Path
+    :return: path to the trace
+    :rtype: Path
+    :raises RunAnalysisError: When no trace was saved by the run.
+    """
+    if path.suffix == ".json":
+        return path
+
+    try:
+        matches = TRACE_LOG_PATTERN.findall(path.read_text(encoding="utf-8"))
+    except OSError as exc:
+        raise RunAnalysisError(f"Could not read log file '{path}': {exc!r}") from exc
+
+    if not matches:
+        raise RunAnalysisError(f"No trace of the upgrade steps was saved by the run in '{path}'")
+
+    return Path(matches[-1])
+
+
+def load_run(path: Path) -> ExecutedStep:
+    """Rebuild the tree of the executed steps from the trace saved by the run.
+
+    If the run applied several plans, e.g. one per release hop, they are sub-steps of the
+    returned step.
+
+    :param path: path to the trace or the log file of the run
+    :type path: Path
+    :return: executed upgrade plan
+    :rtype: ExecutedStep
+    :raises RunAnalysisError: When the trace can not be loaded.
+    """
+    trace_path = _get_trace_path(path)
+    try:
+        data = json.loads(trace_path.read_text(encoding="utf-8"))
+        events = [event for event in data["traceEvents"] if event.get("ph") == "X"]
+        steps: dict[int, tuple[ExecutedStep, Any]] = {
+            event["args"]["id"]: (
+                ExecutedStep(
+                    description=event["name"],
+                    start=event["ts"] / 1_000_000,
+                    duration=event["dur"] / 1_000_000,
+                    parallel=event["args"]["parallel"],
+                    outcome=event["args"]["outcome"],
+                ),
+                event["args"]["parent"],
+            )
+            for event in events
+        }
+    except (OSError, ValueError, KeyError, TypeError) as exc:
+        raise RunAnalysisError(f"Could not load trace '{trace_path}': {exc!r}") from exc
+
+    roots = []
+    for step, parent in steps.values():
+        if parent in steps:
+            steps[parent][0].sub_steps.append(step)
+        else:
+            roots.append(step)
+
+    for step, _ in steps.values():
+        step.sub_steps.sort(key=lambda sub_step: sub_step.start)
+
+    if not roots:
+        raise RunAnalysisError(f"No steps were recorded in trace '{trace_path}'")
+
+    if len(roots) == 1:
+        return roots[0]
+
+    roots.sort(key=lambda root: root.start)
+    start = roots[0].start
+    duration = max(root.end for root in roots) - start
+    return ExecutedStep("Upgrade run", start, duration, sub_steps=roots)
+
+
+def get_critical_path(step: ExecutedStep) -> list[ExecutedStep]:
+    """Get the chain of steps which determined the duration of the step.
+
+    All sub-steps running sequentially are part of the critical path, while only the last
+    finished sub-step is part of it for sub-steps running in parallel.
+
+    :param step: executed step
+    :type step: ExecutedStep
+    :return: steps without sub-steps on the critical path, in order of execution
+    :rtype: list[ExecutedStep]
+    """
+    if not step.sub_steps:
+        return [step]
+
+    if step.parallel:
+        return get_critical_path(max(step.sub_steps, key=lambda sub_step: sub_step.end))
+
+    return [leaf for sub_step in step.sub_steps for leaf in get_critical_path(sub_step)]
+
+
+def _get_savings(step: ExecutedStep, slack: float) -> Iterator[Saving]:
+    """Get time which could be saved by changing the steps on the critical path.
+
+    Time saved by a change is limited by the slack of the parallel steps on the path, because
+    once the step finishes sooner than the other steps running in parallel, they determine the
+    duration instead.
+
+    :param step: executed step on the critical path
+    :type step: ExecutedStep
+    :param slack: the largest time which could be saved in the step
+    :type slack: float
+    :return: potential savings
+    :rtype: Iterator[Saving]
+    """
+    if not step.sub_steps:
+        yield Saving(step, "faster", min(step.duration, slack))
+        return
+
+    if step.parallel:
+        last, *others = sorted(step.sub_steps, key=lambda sub_step: sub_step.end, reverse=True)
+        next_end = max((other.end for other in others), default=step.start)
+        yield from _get_savings(last, min(slack, last.end - max(next_end, last.start)))
+        return
+
+    if len(step.sub_steps) > 1:
+        durations = [sub_step.duration for sub_step in step.sub_steps]
+        yield Saving(step, "parallel", min(sum(durations) - max(durations), slack))
+
+    for sub_step in step.sub_steps:
+        yield from _get_savings(sub_step, slack)
+
+
+def get_savings(step: ExecutedStep) -> list[Saving]:
+    """Rank the steps by the time saved if they were faster or their sub-steps were parallel.
+
+    :param step: executed upgrade plan
+    :type step: ExecutedStep
+    :return: potential savings sorted from the largest
+    :rtype: list[Saving]
+    """
+    savings = [saving for saving in _get_savings(step, math.inf) if saving.seconds > 0]
+    return sorted(savings, key=lambda saving: saving.seconds, reverse=True)
+
+
+def format_run_report(step: ExecutedStep) -> str:
+    """Format the critical path analysis of the executed upgrade plan.
+
+    :param step: executed upgrade plan
+    :type step: ExecutedStep
+    :return: report of the critical path and the largest potential savings
+    :rtype: str
+    """
+    lines = [f"{step.description} took {format_duration(step.duration)}", "", "Critical path:"]
+    for leaf in get_critical_path(step):
+        share = 100 * leaf.duration / step.duration if step.duration else 0.0
+        lines.append(
+            f"  {format_duration(leaf.duration):>8}  {share:5.1f}%  {leaf.description}"
+            + (f" ({leaf.outcome})" if leaf.outcome != "succeeded" else "")
+        )
+
+    lines.extend(["", "Largest potential savings:"])
+    for saving in get_savings(step)[:TOP_SAVINGS]:
+        lines.append(
+            f"  {format_duration(saving.seconds):>8}  {saving.change:<8}  "
+            f"{saving.step.description}"
+        )
+
+    return "\n".join(lines)
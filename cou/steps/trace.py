@@ -0,0 +1,174 @@
+#  Copyright 2023 Canonical Limited
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Trace of the upgrade steps in the Chrome trace event format."""
+import asyncio
+import json
+import os
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Optional
+
+from cou.logging import save_run_file
+from cou.steps import BaseStep
+from cou.steps.execute import StepObserver
+
+
+def get_step_outcome(step: BaseStep, error: Optional[BaseException]) -> str:
+    """Get outcome of the finished step.
+
+    :param step: finished step
+    :type step: BaseStep
+    :param error: exception raised by the step or None if the step succeeded
+    :type error: Optional[BaseException]
+    :return: outcome of the step, one of 'succeeded', 'skipped', 'canceled' or 'failed'
+    :rtype: str
+    """
+    if step.canceled:
+        return "canceled"
+
+    if error is not None:
+        return "failed"
+
+    return "skipped" if step.skipped else "succeeded"
+
+
+class StepTracer(StepObserver):
+    """Tracer recording the start, the end and the outcome of every upgrade step.
+
+    The trace is saved in the Chrome trace event format, which can be opened in Perfetto
+    (https://ui.perfetto.dev) or chrome://tracing. Steps running in the same asyncio task share
+    a track, so each branch of the steps running in parallel is shown as a separate track.
+    Every step records its id and the id of its parent step, so the tree of the executed steps
+    can be rebuilt from the trace.
+    """
+
+    def __init__(self) -> None:
+        """Initialize the step tracer."""
+        self.start_time = datetime.now(timezone.utc)
+        self._start = time.monotonic()
+        # start, track, id and parent id of the running steps
+        self._running: dict[int, tuple[float, int, int, Optional[int]]] = {}
+        self._tracks: dict[int, int] = {}
+        # id of the step running in the current asyncio task, inherited by the sub-steps
+        self._parent: ContextVar[Optional[int]] = ContextVar("parent", default=None)
+        self._steps = 0
+        self.events: list[dict[str, Any]] = []
+
+    def _get_timestamp(self) -> float:
+        """Get time elapsed since the tracer was created.
+
+        :return: elapsed time in microseconds
+        :rtype: float
+        """
+        return (time.monotonic() - self._start) * 1_000_000
+
+    def _get_track(self, step: BaseStep) -> int:
+        """Get track of the current asyncio task.
+
+        The new track is named after the first step started in it.
+
+        :param step: started step
+        :type step: BaseStep
+        :return: id of the track
+        :rtype: int
+        """
+        task_id = id(asyncio.current_task())
+        if task_id not in self._tracks:
+            track = self._tracks[task_id] = len(self._tracks) + 1
+            self.events.append(
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": os.getpid(),
+                    "tid": track,
+                    "args": {"name": step.description},
+                }
+            )
+
+        return self._tracks[task_id]
+
+    def step_started(self, step: BaseStep) -> None:
+        """Record start of the step.
+
+        :param step: started step
+        :type step: BaseStep
+        """
+        self._steps += 1
+        parent = self._parent.get()
+        self._running[id(step)] = (
+            self._get_timestamp(),
+            self._get_track(step),
+            self._steps,
+            parent,
+        )
+        self._parent.set(self._steps)
+
+    def step_finished(self, step: BaseStep, error: Optional[BaseException]) -> None:
+        """Record the step with its duration and outcome.
+
+        :param step: finished step
+        :type step: BaseStep
+        :param error: exception raised by the step or None if the step succeeded
+        :type error: Optional[BaseException]
+        """
+        if (running := self._running.pop(id(step), None)) is None:
+            return
+
+        start, track, step_id, parent = running
+        self._parent.set(parent)
+        args: dict[str, Any] = {
+            "id": step_id,
+            "parent": parent,
+            "type": type(step).__name__,
+            "kind": step.kind,
+            "parallel": step.parallel,
+            "outcome": get_step_outcome(step, error),
+        }
+        if step.unit is not None:
+            args["unit"] = step.unit.name
+            args["machine"] = step.machine_id
+        if error is not None:
+            args["error"] = repr(error)
+
+        self.events.append(
+            {
+                "name": step.description,
+                "cat": args["kind"],
+                "ph": "X",
+                "ts": round(start),
+                "dur": round(self._get_timestamp() - start),
+                "pid": os.getpid(),
+                "tid": track,
+                "args": args,
+            }
+        )
+
+    def save(self, path: Path) -> None:
+        """Save the trace.
+
+        :param path: path to the trace file
+        :type path: Path
+        """
+        data = {
+            "traceEvents": self.events,
+            "displayTimeUnit": "ms",
+            "otherData": {"start_time": self.start_time.isoformat()},
+        }
+        save_run_file(
+            path,
+            lambda path: path.write_text(json.dumps(data) + "\n", encoding="utf-8"),
+            "trace of the upgrade steps",
+        )
@@ -16,51 +16,98 @@
 
 import inspect
 import logging
+import math
 import os
 import sys
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, Callable, Optional
 
 from aioconsole import ainput
 from halo import Halo
+from log_symbols.symbols import LogSymbols
 
+from cou.exceptions import EnvironmentVariableError
 from cou.utils.text_styler import bold, normal
 
 COU_DATA = Path(f"/home/{os.getenv('USER')}/.local/share/cou") if os.getenv("USER") else Path(".")
 
 
 class SmartHalo:
-    """SmartHalo detects non-TTY and disable spinner accordingly."""
+    """SmartHalo detects non-TTY and disable spinner accordingly.
+
+    The spinner can be paused by a live view drawn in its place, which then shows the current
+    text and prints the persisted messages.
+    """
 
     def __init__(self) -> None:
         self.is_tty = sys.stdout.isatty()
         self.spinner = Halo(spinner="line", placement="right") if self.is_tty else None
+        self.printer: Optional[Callable[[str], None]] = None
+        self._text: Optional[str] = None
+
+    def pause(self, printer: Callable[[str], None]) -> None:
+        self.stop()
+        self.printer = printer
+
+    def resume(self) -> None:
+        self.printer = None
+        self._text = None
 
     def start(self, text: Optional[str] = None) -> None:
-        if self.spinner:
+        if self.printer:
+            self._text = text
+        elif self.spinner:
             self.spinner.start(text)
         elif text:
             print(text, flush=True)
 
+    def update(self, text: str) -> None:
+        if self.printer:
+            self._text = text
+        elif self.spinner:
+            self.spinner.text = text
+        else:
+            print(text, flush=True)
+
     def info(self, text: str) -> None:
-        self.spinner.info(text) if self.spinner else print(text, flush=True)
+        if self.printer:
+            self.printer(f"{text} {LogSymbols.INFO.value}")
+        else:
+            self.spinner.info(text) if self.spinner else print(text, flush=True)
 
     def stop(self) -> None:
-        if self.spinner:
+        if self.printer:
+            self._text = None
+        elif self.spinner:
             self.spinner.stop()
 
     def succeed(self, text: Optional[str] = None) -> None:
-        if self.spinner:
+        if self.printer:
+            if message := text or self._text:
+                self.printer(f"{message} {LogSymbols.SUCCESS.value}")
+            self._text = None
+        elif self.spinner:
             self.spinner.succeed(text)
         elif text:
             print(text, flush=True)
 
     def fail(self) -> None:
-        if self.spinner:
+        if self.printer:
+            self._text = None
+        elif self.spinner:
             self.spinner.fail()
 
     def stop_and_persist(self, text: str) -> None:
-        self.spinner.stop_and_persist(text) if self.spinner else print(text, flush=True)
+        if self.printer:
+            self.printer(text)
+        else:
+            self.spinner.stop_and_persist(text) if self.spinner else print(text, flush=True)
+
+    @property
+    def text(self) -> Optional[str]:
+        if self.printer:
+            return self._text
+        return self.spinner.text if self.spinner else None
 
     @property
     def spinner_id(self) -> Optional[str]:
@@ -70,6 +117,58 @@ class SmartHalo:
 progress_indicator = SmartHalo()
 
 
+def get_env_seconds(name: str, default: float) -> float:
+    """Get positive number of seconds from the environment variable.
+
+    :param name: name of the environment variable
+    :type name: str
+    :param default: number of seconds used if the variable is not set
+    :type default: float
+    :return: number of seconds
+    :rtype: float
+    :raises EnvironmentVariableError: if the value is not a positive number
+    """
+    if (value := os.environ.get(name)) is None:
+        return default
+
+    try:
+        seconds = float(value)
+    except ValueError:
+        seconds = math.nan
+
+    if not math.isfinite(seconds) or seconds <= 0:
+        raise EnvironmentVariableError(
+            f"{name} must be a positive number of seconds, got '{value}'"
+        )
+
+    return seconds
+
+
+def get_env_count(name: str, default: int) -> int:
+    """Get non-negative count from the environment variable.
+
+    :param name: name of the environment variable
+    :type name: str
+    :param default: count used if the variable is not set
+    :type default: int
+    :return: count
+    :rtype: int
+    :raises EnvironmentVariableError: if the value is not a non-negative integer
+    """
+    if (value := os.environ.get(name)) is None:
+        return default
+
+    try:
+        count = int(value)
+    except ValueError:
+        count = -1
+
+    if count < 0:
+        raise EnvironmentVariableError(f"{name} must be a non-negative integer, got '{value}'")
+
+    return count
+
+
 def print_and_debug(message: Any) -> None:
     """Print and log message at debug level.
 
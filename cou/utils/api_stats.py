@@ -0,0 +1,223 @@
+#  Copyright 2023 Canonical Limited
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Statistics of the Juju API calls."""
+import json
+import math
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from functools import wraps
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from cou.logging import save_run_file
+
+# upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS: tuple[float, ...] = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 600.0, math.inf)
+
+
+# name of the instrumented call running in the current asyncio task
+_current_call: ContextVar[Optional[str]] = ContextVar("current_call", default=None)
+
+
+def _get_payload_size(result: Any) -> int:
+    """Get approximate size of the call result.
+
+    :param result: result of the call
+    :type result: Any
+    :return: size of the serialized result in bytes or 0 if it can not be serialized
+    :rtype: int
+    """
+    try:
+        if isinstance(result, (str, bytes)):
+            return len(result)
+
+        if hasattr(result, "to_json"):  # objects of the Juju API, e.g. FullStatus
+            return len(result.to_json())
+
+        result = getattr(result, "results", result)  # results of the Juju action
+        if isinstance(result, (dict, list, tuple)):
+            return len(json.dumps(result, default=str))
+    except (TypeError, ValueError):
+        pass
+
+    return 0
+
+
+@dataclass
+class CallStats:
+    """Statistics of the calls of one method."""
+
+    calls: int = 0
+    errors: int = 0
+    retries: int = 0
+    total_time: float = 0.0
+    max_time: float = 0.0
+    payload_size: int = 0
+    latency_histogram: list[int] = field(default_factory=lambda: [0] * len(LATENCY_BUCKETS))
+
+    def add_call(self, duration: float, failed: bool, payload_size: int) -> None:
+        """Add finished call.
+
+        :param duration: duration of the call in seconds
+        :type duration: float
+        :param failed: whether the call raised an exception
+        :type failed: bool
+        :param payload_size: size of the call result in bytes
+        :type payload_size: int
+        """
+        self.calls += 1
+        self.errors += int(failed)
+        self.total_time += duration
+        self.max_time = max(self.max_time, duration)
+        self.payload_size += payload_size
+        bucket = next(i for i, bound in enumerate(LATENCY_BUCKETS) if duration <= bound)
+        self.latency_histogram[bucket] += 1
+
+
+class ApiStats:
+    """Statistics of the Juju API calls made during the run."""
+
+    def __init__(self) -> None:
+        """Initialize the statistics."""
+        self.calls: defaultdict[str, CallStats] = defaultdict(CallStats)
+
+    def reset(self) -> None:
+        """Remove all recorded calls."""
+        self.calls.clear()
+
+    def record_call(self, name: str, duration: float, failed: bool, payload_size: int) -> None:
+        """Record finished call.
+
+        :param name: name of the called method
+        :type name: str
+        :param duration: duration of the call in seconds
+        :type duration: float
+        :param failed: whether the call raised an exception
+        :type failed: bool
+        :param payload_size: size of the call result in bytes
+        :type payload_size: int
+        """
+        self.calls[name].add_call(duration, failed, payload_size)
+
+    def record_retry(self, name: str) -> None:
+        """Record retry of the call.
+
+        The retry is recorded for the instrumented call running in the current asyncio task,
+        so retries of inner functions are accounted to the public method.
+
+        :param name: name of the retried function, used if there is no instrumented call
+        :type name: str
+        """
+        self.calls[_current_call.get() or name].retries += 1
+
+    def get_summary(self) -> str:
+        """Get summary table of the calls sorted by their total time.
+
+        :return: summary table
+        :rtype: str
+        """
+        header = (
+            "Juju API call",
+            "Calls",
+            "Errors",
+            "Retries",
+            "Avg [s]",
+            "Max [s]",
+            "Size [KiB]",
+        )
+        rows = [
+            (
+                name,
+                str(stats.calls),
+                str(stats.errors),
+                str(stats.retries),
+                f"{stats.total_time / stats.calls:.2f}" if stats.calls else "-",
+                f"{stats.max_time:.2f}",
+                f"{stats.payload_size / 1024:.1f}",
+            )
+            for name, stats in sorted(
+                self.calls.items(), key=lambda item: item[1].total_time, reverse=True
+            )
+        ]
+        widths = [max(len(row[i]) for row in [header, *rows]) for i in range(len(header))]
+        lines = [
+            "  ".join(
+                cell.ljust(width) if i == 0 else cell.rjust(width)
+                for i, (cell, width) in enumerate(zip(row, widths))
+            )
+            for row in [header, *rows]
+        ]
+        return "\n".join(lines)
+
+    def to_dict(self) -> dict[str, Any]:
+        """Get serializable representation of the statistics.
+
+        :return: statistics of all calls with named latency histogram buckets
+        :rtype: dict[str, Any]
+        """
+        buckets = [str(bound) if math.isfinite(bound) else "+Inf" for bound in LATENCY_BUCKETS]
+        return {
+            "calls": {
+                name: {
+                    **asdict(stats),
+                    "latency_histogram": dict(zip(buckets, stats.latency_histogram)),
+                }
+                for name, stats in self.calls.items()
+            }
+        }
+
+    def save(self, path: Path) -> None:
+        """Save the statistics as JSON.
+
+        :param path: path to the statistics file
+        :type path: Path
+        """
+        data = self.to_dict()
+        save_run_file(
+            path,
+            lambda path: path.write_text(json.dumps(data, indent=2) + "\n", encoding="utf-8"),
+            "statistics of Juju API calls",
+        )
+
+
+def instrument(func: Callable) -> Callable:
+    """Record count, errors, latency and payload size of the calls of the coroutine function.
+
+    :param func: coroutine function to instrument
+    :type func: Callable
+    :return: wrapped function
+    :rtype: Callable
+    """
+
+    @wraps(func)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        token = _current_call.set(func.__name__)
+        start = time.monotonic()
+        failed, result = True, None
+        try:
+            result = await func(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            _current_call.reset(token)
+            api_stats.record_call(
+                func.__name__, time.monotonic() - start, failed, _get_payload_size(result)
+            )
+
+    return wrapper
+
+
+api_stats = ApiStats()
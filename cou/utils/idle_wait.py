@@ -0,0 +1,182 @@
+#  Copyright 2023 Canonical Limited
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Diagnostics of the units holding up waiting for the model to be idle."""
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import jubilant
+
+from cou.utils import progress_indicator
+
+# interval of reporting the units the wait is blocked by, in seconds
+WAIT_REPORT_INTERVAL: float = 300.0
+# number of the units shown in the compact summary
+SUMMARY_UNITS = 5
+# format of the time since the status was set, e.g. "18 Oct 2023 09:41:09Z"
+JUJU_SINCE_FORMAT = "%d %b %Y %H:%M:%SZ"
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_since(since: str) -> Optional[datetime]:
+    """Parse time since the status was set.
+
+    :param since: time in the Juju status format
+    :type since: str
+    :return: parsed time or None if the time could not be parsed
+    :rtype: Optional[datetime]
+    """
+    try:
+        return datetime.strptime(since, JUJU_SINCE_FORMAT).replace(tzinfo=timezone.utc)
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass(frozen=True)
+class BlockingUnit:
+    """Unit which is not yet in the target workload status or its agent is not idle."""
+
+    name: str
+    workload: str
+    agent: str
+    message: str
+    since: datetime
+
+    def format(self, now: datetime) -> str:
+        """Format the unit with its state, the time in the state and the status message.
+
+        :param now: current time
+        :type now: datetime
+        :return: formatted unit, e.g. "keystone/0 maintenance/executing for 0:12:00: 'msg'"
+        :rtype: str
+        """
+        duration = timedelta(seconds=round(max((now - self.since).total_seconds(), 0)))
+        text = f"{self.name} {self.workload}/{self.agent} for {duration}"
+        return f"{text}: '{self.message}'" if self.message else text
+
+
+class IdleWaitTracker:
+    """Tracker of the units holding up waiting for the model to be idle.
+
+    The tracker is updated with every status polled by the wait and reports the units which are
+    not yet ready every WAIT_REPORT_INTERVAL, so a long wait shows what it is waiting for.
+    """
+
+    def __init__(self, target_status: str, report_interval: float = WAIT_REPORT_INTERVAL):
+        """Initialize the tracker.
+
+        :param target_status: workload status the wait is waiting for
+        :type target_status: str
+        :param report_interval: interval of reporting the blocking units, in seconds
+        :type report_interval: float
+        """
+        self.target_status = target_status
+        self.report_interval = report_interval
+        self.blocking_units: dict[str, BlockingUnit] = {}
+        self._last_report = time.monotonic()
+        self._progress_text = progress_indicator.text
+        self._reported = False
+
+    def _get_blocking_unit(
+        self, name: str, unit: jubilant.statustypes.UnitStatus, now: datetime
+    ) -> Optional[BlockingUnit]:
+        """Get the unit if it is not ready, keeping the time it entered its current state.
+
+        :param name: name of the unit
+        :type name: str
+        :param unit: status of the unit
+        :type unit: jubilant.statustypes.UnitStatus
+        :param now: current time, used if the time since the status was set is unknown
+        :type now: datetime
+        :return: blocking unit or None if the unit is ready
+        :rtype: Optional[BlockingUnit]
+        """
+        workload, agent = unit.workload_status, unit.juju_status
+        if workload.current == self.target_status and agent.current == "idle":
+            return None
+
+        previous = self.blocking_units.get(name)
+        if previous and (previous.workload, previous.agent) == (workload.current, agent.current):
+            since = previous.since
+        else:
+            known = [t for t in (_parse_since(workload.since), _parse_since(agent.since)) if t]
+            since = max(known, default=now)
+
+        return BlockingUnit(name, workload.current, agent.current, workload.message, since)
+
+    def update(self, status: jubilant.Status, *apps: str) -> None:
+        """Update the blocking units from the polled status and report them periodically.
+
+        :param status: status of the model
+        :type status: jubilant.Status
+        :param apps: applications to wait for, all applications if none are provided
+        :type apps: str
+        """
+        now = datetime.now(timezone.utc)
+        blocking_units = {}
+        for app in apps or status.apps:
+            for name, unit in status.get_units(app).items():
+                if (blocking_unit := self._get_blocking_unit(name, unit, now)) is not None:
+                    blocking_units[name] = blocking_unit
+
+        self.blocking_units = blocking_units
+        if time.monotonic() - self._last_report >= self.report_interval:
+            self._last_report = time.monotonic()
+            self.report(now)
+
+    def report(self, now: datetime) -> None:
+        """Report the blocking units to the log and the progress output.
+
+        :param now: current time
+        :type now: datetime
+        """
+        if not self.blocking_units:
+            return
+
+        units = sorted(self.blocking_units.values(), key=lambda unit: unit.since)
+        logger.info(
+            "waiting for %d unit(s) to be %s and idle:\n%s",
+            len(units),
+            self.target_status,
+            "\n".join(f"  {unit.format(now)}" for unit in units),
+        )
+        summary = f"waiting for {self.get_summary(now)}"
+        progress_indicator.update(
+            f"{self._progress_text} ({summary})" if self._progress_text else summary
+        )
+        self._reported = True
+
+    def get_summary(self, now: Optional[datetime] = None) -> str:
+        """Get compact summary of the units the wait is blocked by, the longest blocked first.
+
+        :param now: current time, defaults to now
+        :type now: Optional[datetime]
+        :return: summary of the blocking units
+        :rtype: str
+        """
+        now = now or datetime.now(timezone.utc)
+        units = sorted(self.blocking_units.values(), key=lambda unit: unit.since)
+        summary = ", ".join(unit.format(now) for unit in units[:SUMMARY_UNITS])
+        if len(units) > SUMMARY_UNITS:
+            summary += f" and {len(units) - SUMMARY_UNITS} more"
+
+        return summary
+
+    def finish(self) -> None:
+        """Restore the progress output changed by the reports."""
+        if self._reported and self._progress_text is not None:
+            progress_indicator.update(self._progress_text)
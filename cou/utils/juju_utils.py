@@ -17,11 +17,15 @@
 from __future__ import annotations
 
 import asyncio
+import hashlib
+import json
 import logging
 import os
-from dataclasses import dataclass, field
+import random
+from collections import defaultdict
+from dataclasses import dataclass, field, replace
 from datetime import datetime
-from typing import Any, Callable, List, Optional, Sequence
+from typing import Any, Awaitable, Callable, List, Optional, Sequence, TypeVar
 
 import jubilant
 from juju.action import Action
@@ -45,6 +49,9 @@ from cou.exceptions import (
     UnitNotFound,
     WaitForApplicationsTimeout,
 )
+from cou.utils import get_env_count, get_env_seconds
+from cou.utils.api_stats import api_stats, instrument
+from cou.utils.idle_wait import WAIT_REPORT_INTERVAL, IdleWaitTracker
 from cou.utils.openstack import is_charm_supported
 
 # Increase Juju websocket connection MAX_FRAME_SIZE to 1024MiB to stop
@@ -57,6 +64,16 @@ DEFAULT_WAIT: float = 1.1
 DEFAULT_MODEL_RETRIES: int = int(os.environ.get("COU_MODEL_RETRIES", 5))
 DEFAULT_MODEL_RETRY_BACKOFF: int = int(os.environ.get("COU_MODEL_RETRY_BACKOFF", 2))
 DEFAULT_MODEL_IDLE_PERIOD: int = 30
+# retries of idempotent operations on units are disabled by default
+DEFAULT_UNIT_RETRIES: int = 0
+DEFAULT_UNIT_RETRY_BUDGET: int = 5
+DEFAULT_UNIT_RETRY_BACKOFF: float = 2.0
+# actions which can be run again without any side effect
+IDEMPOTENT_ACTIONS: frozenset[str] = frozenset(
+    {"instance-count", "pause", "resume", "run-deferred-hooks"}
+)
+
+T = TypeVar("T")
 
 logger = logging.getLogger(__name__)
 
@@ -73,6 +90,28 @@ def _convert_base_to_series(base: Base) -> str:
     return get_version_series(version)
 
 
+def _get_application_state(app: Application) -> tuple:
+    """Get the state of application obtained from the Juju status.
+
+    :param app: application
+    :type app: Application
+    :return: state of the application, which does not contain its config and actions
+    :rtype: tuple
+    """
+    return (
+        app.name,
+        app.can_upgrade_to,
+        app.charm,
+        app.channel,
+        app.machines,
+        app.origin,
+        app.series,
+        app.subordinate_to,
+        {name: (unit, unit.subordinates) for name, unit in app.units.items()},
+        app.workload_version,
+    )
+
+
 def retry(
     function: Optional[Callable] = None,
     timeout: int = DEFAULT_TIMEOUT,
@@ -103,6 +142,7 @@ def retry(
                     raise
                 except Exception:  # pylint: disable=broad-exception-caught
                     logger.info("function %s failed [%d]", func.__name__, attempt, exc_info=True)
+                    api_stats.record_retry(func.__name__)
                     await asyncio.sleep(DEFAULT_WAIT**attempt)
                     attempt += 1
 
@@ -124,6 +164,7 @@ class Machine:
     machine_id: str
     apps_charms: tuple[tuple[str, str], ...]
     az: Optional[str] = None  # simple deployments may not have azs
+    region: Optional[str] = None  # cloud region of the model
 
 
 @dataclass(frozen=True)
@@ -201,6 +242,9 @@ class Application:
 
 class JubilantModelMixin:
 
+    # interval of reporting the units not yet idle, in seconds
+    _wait_report_interval: float = WAIT_REPORT_INTERVAL
+
     @staticmethod
     def _get_error_callable(
         raise_on_error: bool, raise_on_blocked: bool
@@ -234,6 +278,7 @@ class JubilantModelMixin:
 
         return callable
 
+    @instrument
     async def wait_for_idle(  # pylint: disable=too-many-arguments,too-many-positional-arguments
         self,
         timeout: int,
@@ -246,6 +291,10 @@ class JubilantModelMixin:
         """Wait for application(s) to reach target idle state.
 
         If no applications are provided, this function will wait for all COU-related applications.
+        The units which are not yet ready are reported every COU_WAIT_REPORT_INTERVAL seconds and
+        summarized in the WaitForApplicationsTimeout. The status is polled in a thread, so
+        the event loop keeps running other steps. A canceled wait stops polling only once
+        the timeout expires.
 
         :param timeout: How long (in seconds) to wait for the bundle settles before raising an
                         WaitForApplicationsTimeout.
@@ -278,14 +327,27 @@ class JubilantModelMixin:
         @retry(timeout=timeout, no_retry_exceptions=(WaitForApplicationsTimeout,))
         @wraps(self.wait_for_idle)
         async def _wait_for_idle(*apps: str) -> None:
+            tracker = IdleWaitTracker(status, self._wait_report_interval)
+
+            def _ready(juju_status: jubilant.Status) -> bool:
+                tracker.update(juju_status, *apps)
+                return ready_callable(juju_status, *apps)
+
             try:
-                _juju.wait(
-                    ready=lambda status: ready_callable(status, *apps),
+                # NOTE: the wait is blocking, so it runs in a thread to not block the event loop
+                await asyncio.to_thread(
+                    _juju.wait,
+                    ready=_ready,
                     error=lambda status: error_callable(status, *apps),
                     successes=10,
                 )
             except (TimeoutError, jubilant.WaitError) as error:
-                raise WaitForApplicationsTimeout(str(error)) from error
+                message = str(error)
+                if tracker.blocking_units:
+                    message += f"\nUnits not yet {status} and idle: {tracker.get_summary()}"
+                raise WaitForApplicationsTimeout(message) from error
+            finally:
+                tracker.finish()
 
         tasks = [_wait_for_idle(*apps)]
         await asyncio.gather(*tasks)
@@ -299,10 +361,23 @@ class Model(JubilantModelMixin):
     """
 
     def __init__(self, name: Optional[str]):
-        """COU Model initialization with name and juju.model.Model."""
+        """COU Model initialization with name and juju.model.Model.
+
+        :raises EnvironmentVariableError: if the retries of operations on units or the interval
+                                          of reporting the units not yet idle are not valid
+        """
         self._juju_data = FileJujuData()
         self._model = JujuModel(max_frame_size=JUJU_MAX_FRAME_SIZE, jujudata=self.juju_data)
         self._name = name
+        self._unit_retries: defaultdict[str, int] = defaultdict(int)
+        self._unit_retry_limit = get_env_count("COU_UNIT_RETRIES", DEFAULT_UNIT_RETRIES)
+        self._unit_retry_budget = get_env_count("COU_UNIT_RETRY_BUDGET", DEFAULT_UNIT_RETRY_BUDGET)
+        self._unit_retry_backoff = get_env_seconds(
+            "COU_UNIT_RETRY_BACKOFF", DEFAULT_UNIT_RETRY_BACKOFF
+        )
+        self._wait_report_interval = get_env_seconds(
+            "COU_WAIT_REPORT_INTERVAL", WAIT_REPORT_INTERVAL
+        )
 
     @property
     def connected(self) -> bool:
@@ -329,6 +404,14 @@ class Model(JubilantModelMixin):
 
         return self._name
 
+    @property
+    def uuid(self) -> str:
+        """Return model UUID.
+
+        The UUID is available only for a connected model.
+        """
+        return self._model.info.uuid
+
     @retry(no_retry_exceptions=(ActionFailed,))
     async def _get_waited_action_object(self, action: Action, raise_on_failure: bool) -> Action:
         """Get waited action object.
@@ -353,6 +436,52 @@ class Model(JubilantModelMixin):
 
         return action_obj
 
+    async def _run_with_unit_retries(
+        self, unit_name: str, operation: str, func: Callable[[], Awaitable[T]]
+    ) -> T:
+        """Run idempotent operation on unit and retry it on failure.
+
+        The operation is retried up to COU_UNIT_RETRIES times with exponential backoff and full
+        jitter. Every unit has its own budget of COU_UNIT_RETRY_BUDGET retries for the whole run,
+        so a broken unit can not keep retrying forever.
+
+        :param unit_name: Name of unit on which the operation runs
+        :type unit_name: str
+        :param operation: Name of operation used for logging
+        :type operation: str
+        :param func: Function running the operation
+        :type func: Callable[[], Awaitable[T]]
+        :return: Result of the operation.
+        :rtype: T
+        """
+        attempt = 0
+        while True:
+            try:
+                return await func()
+            except UnitNotFound:
+                raise
+            except Exception as exc:  # pylint: disable=broad-exception-caught
+                if (
+                    attempt >= self._unit_retry_limit
+                    or self._unit_retries[unit_name] >= self._unit_retry_budget
+                ):
+                    raise
+
+                attempt += 1
+                self._unit_retries[unit_name] += 1
+                api_stats.record_retry(operation)
+                delay = random.uniform(0, self._unit_retry_backoff * 2 ** (attempt - 1))
+                logger.warning(
+                    "%s on unit %s failed with %r, retrying in %.1fs [%d/%d]",
+                    operation,
+                    unit_name,
+                    exc,
+                    delay,
+                    attempt,
+                    self._unit_retry_limit,
+                )
+                await asyncio.sleep(delay)
+
     async def _get_application(self, name: str) -> JujuApplication:
         """Get juju.application.Application from model.
 
@@ -382,6 +511,7 @@ class Model(JubilantModelMixin):
                 machine_id=machine.id,
                 apps_charms=self._get_machine_apps_and_charms(machine.id),
                 az=machine.hardware_characteristics.get("availability-zone"),
+                region=model.info.cloud_region,
             )
             for machine in model.machines.values()
         }
@@ -422,6 +552,7 @@ class Model(JubilantModelMixin):
             name for name, app in model.applications.items() if is_charm_supported(app.charm_name)
         ]
 
+    @instrument
     async def get_unit(self, name: str) -> JujuUnit:
         """Get juju.unit.unit from model.
 
@@ -438,6 +569,7 @@ class Model(JubilantModelMixin):
 
         return unit
 
+    @instrument
     @retry(no_retry_exceptions=(BakeryException, JujuConnectionError))
     async def connect(self) -> None:
         """Make sure that model is connected."""
@@ -448,10 +580,18 @@ class Model(JubilantModelMixin):
             retry_backoff=DEFAULT_MODEL_RETRY_BACKOFF,
         )
 
+    @instrument
     @retry
-    async def get_applications(self) -> dict[str, Application]:
+    async def get_applications(
+        self, cached: Optional[dict[str, Application]] = None
+    ) -> dict[str, Application]:
         """Return list of applications with all relevant information.
 
+        The configuration and actions of a cached application are reused if its status has not
+        changed, so only the new or changed applications are queried for them.
+
+        :param cached: applications obtained before, e.g. by the previous analysis
+        :type cached: Optional[dict[str, Application]]
         :returns: list of application with all information
         :rtype: list[Application]
         """
@@ -460,14 +600,16 @@ class Model(JubilantModelMixin):
         #                 information the status than from objects. e.g. workload_version for unit
         full_status = await self.get_status()
         machines = await self._get_machines()
+        cached = cached or {}
 
-        return {
-            app: Application(
+        applications = {}
+        for app, status in full_status.applications.items():
+            application = Application(
                 name=app,
                 can_upgrade_to=status.can_upgrade_to,
                 charm=model.applications[app].charm_name,
                 channel=status.charm_channel,
-                config=await model.applications[app].get_config(),
+                config={},
                 machines={
                     unit.machine.id: machines[unit.machine.id]
                     for unit in model.applications[app].units
@@ -492,11 +634,23 @@ class Model(JubilantModelMixin):
                     for name, unit in status.units.items()
                 },
                 workload_version=status.workload_version,
-                actions=await model.applications[app].get_actions(),
             )
-            for app, status in full_status.applications.items()
-        }
 
+            cached_app = cached.get(app)
+            if cached_app is not None and _get_application_state(
+                cached_app
+            ) == _get_application_state(application):
+                logger.debug("status of application %s has not changed, reusing its config", app)
+                config, actions = cached_app.config, cached_app.actions
+            else:
+                config = await model.applications[app].get_config()
+                actions = await model.applications[app].get_actions()
+
+            applications[app] = replace(application, config=config, actions=actions)
+
+        return applications
+
+    @instrument
     @retry(no_retry_exceptions=(ApplicationNotFound,))
     async def get_application_config(self, name: str) -> dict:
         """Return application configuration.
@@ -510,6 +664,7 @@ class Model(JubilantModelMixin):
         app = await self._get_application(name)
         return await app.get_config()
 
+    @instrument
     async def get_charm_name(self, application_name: str) -> str:
         """Get the charm name from the application.
 
@@ -525,6 +680,7 @@ class Model(JubilantModelMixin):
 
         return app.charm_name
 
+    @instrument
     @retry
     async def get_status(self) -> FullStatus:
         """Return the full juju status output.
@@ -535,6 +691,47 @@ class Model(JubilantModelMixin):
         model = await self._get_model()
         return await model.get_status()
 
+    @instrument
+    async def get_status_fingerprint(self) -> str:
+        """Return fingerprint of the model state relevant for upgrade planning.
+
+        The fingerprint is computed from a single juju status call and covers the charms,
+        channels, workload versions and statuses of all applications and units and the
+        machines hardware. Changes not visible in the juju status, e.g. a charm config
+        change, are not covered.
+
+        :returns: SHA-256 hex digest of the model state
+        :rtype: str
+        """
+        full_status = await self.get_status()
+        state = {
+            "applications": {
+                name: {
+                    "base": _convert_base_to_series(app.base),
+                    "can_upgrade_to": app.can_upgrade_to,
+                    "charm": app.charm,
+                    "channel": app.charm_channel,
+                    "subordinate_to": sorted(app.subordinate_to or []),
+                    "units": {
+                        unit_name: {
+                            "machine": unit.machine,
+                            "status": unit.workload_status.status,
+                            "subordinates": sorted(unit.subordinates or {}),
+                            "workload_version": unit.workload_version,
+                        }
+                        for unit_name, unit in (app.units or {}).items()
+                    },
+                    "workload_version": app.workload_version,
+                }
+                for name, app in full_status.applications.items()
+            },
+            "machines": {
+                machine_id: machine.hardware
+                for machine_id, machine in full_status.machines.items()
+            },
+        }
+        return hashlib.sha256(json.dumps(state, sort_keys=True).encode()).hexdigest()
+
     async def _dispatch_update_status_hook(self, unit_name: str) -> None:
         """Use dispatch to run the update-status hook.
 
@@ -563,9 +760,23 @@ class Model(JubilantModelMixin):
         """
         await self.run_on_unit(unit_name, "hooks/update-status")
 
+    @instrument
     async def update_status(self, unit_name: str) -> None:
         """Run the update_status hook on the given unit.
 
+        The hook is idempotent, so it is retried on failure if COU_UNIT_RETRIES is set.
+
+        :param unit_name: Name of the unit to run update-status hook
+        :type unit_name: str
+        :raises CommandRunFailed: When update-status hook failed
+        """
+        await self._run_with_unit_retries(
+            unit_name, "update-status", lambda: self._update_status(unit_name)
+        )
+
+    async def _update_status(self, unit_name: str) -> None:
+        """Run the update_status hook on the given unit without retries.
+
         :param unit_name: Name of the unit to run update-status hook
         :type unit_name: str
         :raises CommandRunFailed: When update-status hook failed
@@ -591,7 +802,9 @@ class Model(JubilantModelMixin):
         logger.debug("Skipped updating status: file does not exist")
 
     # NOTE (rgildein): There is no need to add retry here, because we don't want to repeat
-    # `unit.run_action(...)` and the rest of the function is covered by retry.
+    # `unit.run_action(...)` and the rest of the function is covered by retry. Only idempotent
+    # actions are repeated and only if it's enabled by COU_UNIT_RETRIES.
+    @instrument
     async def run_action(
         self,
         unit_name: str,
@@ -614,14 +827,20 @@ class Model(JubilantModelMixin):
         :return: When status is different from "completed"
         :rtype: Action
         """
-        action_params = action_params or {}
-        unit = await self.get_unit(unit_name)
-        action = await unit.run_action(action_name, **action_params)
-        action_obj = await self._get_waited_action_object(action, raise_on_failure)
-        return action_obj
+
+        async def _run_action() -> Action:
+            unit = await self.get_unit(unit_name)
+            action = await unit.run_action(action_name, **(action_params or {}))
+            return await self._get_waited_action_object(action, raise_on_failure)
+
+        if action_name in IDEMPOTENT_ACTIONS:
+            return await self._run_with_unit_retries(unit_name, action_name, _run_action)
+
+        return await _run_action()
 
     # NOTE (rgildein): There is no need to add retry here, because we don't want to repeat
     # `unit.run(...)` and the rest of the function is static.
+    @instrument
     async def run_on_unit(
         self, unit_name: str, command: str, timeout: Optional[int] = None
     ) -> dict[str, str]:
@@ -650,6 +869,7 @@ class Model(JubilantModelMixin):
 
         return results
 
+    @instrument
     @retry(no_retry_exceptions=(ApplicationNotFound,))
     async def set_application_config(self, name: str, configuration: dict[str, str]) -> None:
         """Set application configuration.
@@ -662,6 +882,7 @@ class Model(JubilantModelMixin):
         app = await self._get_application(name)
         await app.set_config(configuration)
 
+    @instrument
     @retry(no_retry_exceptions=(UnitNotFound,))
     async def scp_from_unit(  # pylint: disable=too-many-arguments,too-many-positional-arguments
         self,
@@ -691,6 +912,7 @@ class Model(JubilantModelMixin):
         unit = await self.get_unit(unit_name)
         await unit.scp_from(source, destination, user=user, proxy=proxy, scp_opts=scp_opts)
 
+    @instrument
     @retry(
         no_retry_exceptions=(
             ApplicationNotFound,
@@ -740,6 +962,7 @@ class Model(JubilantModelMixin):
             switch=switch,
         )
 
+    @instrument
     async def resolve_all(self) -> None:
         """Resolve all the units in the model if they are in error status."""
         model = await self._get_model()
@@ -748,6 +971,7 @@ class Model(JubilantModelMixin):
                 if unit.workload_status == "error":
                     await unit.resolved(retry=True)
 
+    @instrument
     async def get_application_names(self, charm_name: str) -> list[str]:
         """Get application name by charm name.
 
@@ -766,6 +990,7 @@ class Model(JubilantModelMixin):
             raise ApplicationNotFound(f"Cannot find '{charm_name}' charm in model '{self.name}'.")
         return app_names
 
+    @instrument
     async def get_application_status(self, app_name: str) -> ApplicationStatus:
         """Get ApplicationStatus by charm name.
 
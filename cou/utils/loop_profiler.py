@@ -0,0 +1,440 @@
+#  Copyright 2023 Canonical Limited
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Profiling of the asyncio tasks and the event loop."""
+import asyncio
+import heapq
+import json
+import logging
+import sys
+import threading
+import time
+import traceback
+import weakref
+from collections.abc import Coroutine
+from dataclasses import asdict, dataclass, field
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from cou.logging import save_run_file
+from cou.utils import get_env_seconds
+
+# interval of the event loop lag samples, in seconds
+LAG_INTERVAL = 0.1
+# default shortest time the event loop must be blocked for to be reported, in seconds
+BLOCKING_THRESHOLD = 0.5
+# upper bounds of the event loop lag histogram buckets, in seconds
+LAG_BUCKETS: tuple[float, ...] = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, float("inf"))
+# number of the tasks and the blocking calls shown in the summary
+TOP_ENTRIES = 10
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TaskStats:
+    """Statistics of the asyncio tasks running the same coroutine function.
+
+    The tasks are aggregated by their coroutine, so the profile does not grow with the number
+    of the tasks created during the run. The awaiting time is the time the tasks were suspended,
+    e.g. waiting for I/O, while the ready time is the time they could run, but waited for
+    the event loop to run them, e.g. because of the other tasks blocking it.
+    """
+
+    coroutine: str
+    tasks: int = 0
+    finished: int = 0
+    running_time: float = 0.0
+    awaiting_time: float = 0.0
+    ready_time: float = 0.0
+    steps: int = 0
+    longest_step: float = 0.0
+
+
+@dataclass(order=True)
+class BlockingCall:
+    """Call which blocked the event loop."""
+
+    duration: float
+    stack: str = field(compare=False)
+
+
+class _TimedCoroutine(Coroutine):
+    """Coroutine measuring time spent in each step of the wrapped coroutine.
+
+    Each step is a call of send or throw by the task, which runs the coroutine until its next
+    suspension, so the sum of the steps is the time the task was running. The time between
+    the steps is split into the time the coroutine was suspended and the time the task was
+    scheduled to run its next step, see ready.
+    """
+
+    def __init__(self, coro: Coroutine, stats: TaskStats):
+        """Initialize the coroutine.
+
+        :param coro: wrapped coroutine
+        :type coro: Coroutine
+        :param stats: statistics of the tasks running the coroutine function
+        :type stats: TaskStats
+        """
+        self._coro = coro
+        # statistics are detached once the coroutine is finished or flushed
+        self._stats: Optional[TaskStats] = stats
+        self._suspended = time.perf_counter()
+        self._ready: Optional[float] = None
+        self._started: Optional[float] = None
+
+    def __getattr__(self, name: str) -> Any:
+        """Get attribute of the wrapped coroutine, e.g. cr_frame used by the task stack.
+
+        :param name: name of the attribute
+        :type name: str
+        :return: attribute of the wrapped coroutine
+        :rtype: Any
+        """
+        return getattr(self._coro, name)
+
+    def ready(self) -> None:
+        """Record that the task was scheduled to run the next step of the coroutine."""
+        if self._ready is None:
+            self._ready = time.perf_counter()
+
+    def _record_waiting(self, stats: TaskStats, now: float) -> None:
+        """Record the time since the last step of the coroutine.
+
+        The time is recorded as awaiting if the task was not scheduled by the profiled event
+        loop, e.g. when the coroutine is run without a task.
+
+        :param stats: statistics of the tasks running the coroutine function
+        :type stats: TaskStats
+        :param now: current time
+        :type now: float
+        """
+        ready = self._ready if self._ready is not None else now
+        stats.awaiting_time += max(ready - self._suspended, 0.0)
+        stats.ready_time += max(now - ready, 0.0)
+        self._ready = None
+
+    def _record_step(self, stats: TaskStats, started: float, now: float) -> None:
+        """Record the step of the coroutine.
+
+        :param stats: statistics of the tasks running the coroutine function
+        :type stats: TaskStats
+        :param started: time the step started
+        :type started: float
+        :param now: current time
+        :type now: float
+        """
+        duration = now - started
+        stats.running_time += duration
+        stats.steps += 1
+        stats.longest_step = max(stats.longest_step, duration)
+        self._suspended = now
+        self._started = None
+
+    def _step(self, method: Callable, *args: Any) -> Any:
+        """Run one step of the wrapped coroutine.
+
+        :param method: send or throw method of the wrapped coroutine
+        :type method: Callable
+        :param args: arguments of the method
+        :type args: Any
+        :return: result of the step
+        :rtype: Any
+        """
+        if self._stats is None:
+            return method(*args)
+
+        started = self._started = time.perf_counter()
+        self._record_waiting(self._stats, started)
+        finished = False
+        try:
+            return method(*args)
+        except BaseException:
+            finished = True  # the coroutine returned or raised an exception
+            raise
+        finally:
+            # the statistics are detached if the coroutine was flushed during the step
+            if (stats := self._stats) is not None:
+                self._record_step(stats, started, time.perf_counter())
+                if finished:
+                    stats.finished += 1
+                    self._stats = None
+
+    def flush(self) -> None:
+        """Record the time of the unfinished coroutine and stop measuring it."""
+        if (stats := self._stats) is None:
+            return
+
+        now = time.perf_counter()
+        if self._started is not None:
+            self._record_step(stats, self._started, now)
+        else:
+            self._record_waiting(stats, now)
+
+        self._stats = None
+
+    def send(self, value: Any) -> Any:
+        """Send value to the wrapped coroutine.
+
+        :param value: sent value
+        :type value: Any
+        :return: value yielded by the wrapped coroutine
+        :rtype: Any
+        """
+        return self._step(self._coro.send, value)
+
+    def throw(self, *args: Any) -> Any:  # type: ignore[override]
+        """Throw exception to the wrapped coroutine.
+
+        :param args: exception to throw
+        :type args: Any
+        :return: value yielded by the wrapped coroutine
+        :rtype: Any
+        """
+        return self._step(self._coro.throw, *args)
+
+    def close(self) -> None:
+        """Close the wrapped coroutine."""
+        self._coro.close()
+
+    def __await__(self) -> Any:
+        """Await the wrapped coroutine.
+
+        :return: iterator of the wrapped coroutine
+        :rtype: Any
+        """
+        return self._coro.__await__()
+
+
+class LoopProfiler:
+    """Profiler of the asyncio tasks and the event loop.
+
+    Every task created in the event loop records the time it was running, the time it was
+    awaiting and the time it was ready to run, aggregated by the coroutine of the task. A task is
+    ready to run once the event loop schedules its next step, which the profiler observes by
+    wrapping call_soon of the loop. The time of the tasks not finished yet is recorded when
+    the profiler is stopped. The lag of the event loop is sampled
+    periodically and a watchdog thread captures the stack of the event loop thread whenever
+    the loop is blocked for longer than the blocking threshold, e.g. by a synchronous call in
+    a coroutine.
+    """
+
+    def __init__(self) -> None:
+        """Initialize the event loop profiler.
+
+        :raises EnvironmentVariableError: if COU_LOOP_BLOCKING_THRESHOLD is not a positive number
+        """
+        self.blocking_threshold = get_env_seconds(
+            "COU_LOOP_BLOCKING_THRESHOLD", BLOCKING_THRESHOLD
+        )
+        self.tasks: dict[str, TaskStats] = {}
+        self.lag_histogram = [0] * len(LAG_BUCKETS)
+        self.lag_total = 0.0
+        self.lag_max = 0.0
+        self.blocking_calls: list[BlockingCall] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task_factory: Any = None
+        self._call_soon: Optional[Callable[..., asyncio.Handle]] = None
+        self._coroutines: weakref.WeakSet[_TimedCoroutine] = weakref.WeakSet()
+        self._monitor: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._blocked_stack: Optional[str] = None
+
+    def _create_task(self, loop: asyncio.AbstractEventLoop, coro: Coroutine, **kwargs: Any) -> Any:
+        """Create task recording its running and awaiting time.
+
+        :param loop: event loop
+        :type loop: asyncio.AbstractEventLoop
+        :param coro: coroutine of the task
+        :type coro: Coroutine
+        :param kwargs: additional arguments of the task, e.g. context
+        :type kwargs: Any
+        :return: created task
+        :rtype: Any
+        """
+        coroutine = getattr(coro, "__qualname__", type(coro).__name__)
+        if (stats := self.tasks.get(coroutine)) is None:
+            stats = self.tasks[coroutine] = TaskStats(coroutine)
+
+        stats.tasks += 1
+        timed_coro = _TimedCoroutine(coro, stats)
+        self._coroutines.add(timed_coro)
+        if self._task_factory is not None:
+            return self._task_factory(loop, timed_coro, **kwargs)
+
+        return asyncio.Task(timed_coro, loop=loop, **kwargs)
+
+    @staticmethod
+    def _timed_call_soon(
+        call_soon: Callable[..., asyncio.Handle], callback: Callable, *args: Any, **kwargs: Any
+    ) -> asyncio.Handle:
+        """Schedule callback of the event loop, recording the tasks ready to run their next step.
+
+        The next step of a task is scheduled by call_soon with a method of the task as callback,
+        either when the task is created or when the future it awaits is done.
+
+        :param call_soon: original call_soon of the event loop
+        :type call_soon: Callable[..., asyncio.Handle]
+        :param callback: scheduled callback
+        :type callback: Callable
+        :param args: arguments of the callback
+        :type args: Any
+        :param kwargs: additional arguments of call_soon, e.g. context
+        :type kwargs: Any
+        :return: handle of the scheduled callback
+        :rtype: asyncio.Handle
+        """
+        task = getattr(callback, "__self__", None)
+        if isinstance(task, asyncio.Task) and isinstance(coro := task.get_coro(), _TimedCoroutine):
+            coro.ready()
+
+        return call_soon(callback, *args, **kwargs)
+
+    def _record_lag(self, lag: float) -> None:
+        """Record lag of the event loop.
+
+        :param lag: time the event loop was late to wake up the monitor, in seconds
+        :type lag: float
+        """
+        self.lag_total += lag
+        self.lag_max = max(self.lag_max, lag)
+        bucket = next(i for i, bound in enumerate(LAG_BUCKETS) if lag <= bound)
+        self.lag_histogram[bucket] += 1
+        if (stack := self._blocked_stack) is not None:
+            self._blocked_stack = None
+            heapq.heappush(self.blocking_calls, BlockingCall(lag, stack))
+            if len(self.blocking_calls) > TOP_ENTRIES:
+                heapq.heappop(self.blocking_calls)
+
+            logger.warning("event loop was blocked for %.2f s in:\n%s", lag, stack)
+
+    async def _monitor_lag(self) -> None:
+        """Sample lag of the event loop."""
+        while True:
+            expected = time.monotonic() + LAG_INTERVAL
+            await asyncio.sleep(LAG_INTERVAL)
+            self._heartbeat = time.monotonic()
+            self._record_lag(max(self._heartbeat - expected, 0.0))
+
+    def _watch_loop(self) -> None:
+        """Capture stack of the event loop thread while the loop is blocked."""
+        while not self._stopped.wait(LAG_INTERVAL):
+            blocked = time.monotonic() - self._heartbeat - LAG_INTERVAL
+            if blocked < self.blocking_threshold or self._blocked_stack is not None:
+                continue
+
+            # pylint: disable=protected-access
+            if (frame := sys._current_frames().get(self._loop_thread_id)) is not None:
+                self._blocked_stack = "".join(traceback.format_stack(frame)).rstrip("\n")
+
+    def start(self) -> None:
+        """Start profiling the running event loop."""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._monitor = self._loop.create_task(self._monitor_lag())
+        self._task_factory = self._loop.get_task_factory()
+        self._loop.set_task_factory(self._create_task)
+        self._call_soon = self._loop.call_soon
+        self._loop.call_soon = partial(  # type: ignore[method-assign]
+            self._timed_call_soon, self._call_soon
+        )
+        self._stopped.clear()
+        self._watchdog = threading.Thread(target=self._watch_loop, name="cou-loop-watchdog")
+        self._watchdog.daemon = True
+        self._watchdog.start()
+
+    def stop(self) -> None:
+        """Stop profiling the event loop and record the time of the unfinished tasks."""
+        if self._loop is None:
+            return
+
+        self._loop.set_task_factory(self._task_factory)
+        self._loop.call_soon = self._call_soon  # type: ignore[method-assign,assignment]
+        self._loop = None
+        self._call_soon = None
+        for coro in list(self._coroutines):
+            coro.flush()
+        self._coroutines = weakref.WeakSet()
+        if self._monitor is not None:
+            self._monitor.cancel()
+            self._monitor = None
+        if self._watchdog is not None:
+            self._stopped.set()
+            self._watchdog.join()
+            self._watchdog = None
+
+    def get_summary(self) -> str:
+        """Get summary of the busiest tasks, the event loop lag and the blocking calls.
+
+        :return: summary of the profile
+        :rtype: str
+        """
+        samples = sum(self.lag_histogram)
+        tasks = sum(stats.tasks for stats in self.tasks.values())
+        lines = [
+            f"Event loop lag: {samples} samples, "
+            f"mean {self.lag_total / samples if samples else 0.0:.3f} s, max {self.lag_max:.3f} s",
+            f"Coroutines of the tasks with the longest running time (of {tasks} tasks):",
+        ]
+        for stats in heapq.nlargest(
+            TOP_ENTRIES, self.tasks.values(), key=lambda stats: stats.running_time
+        ):
+            lines.append(
+                f"  {stats.coroutine}: {stats.tasks} tasks, running {stats.running_time:.3f} s, "
+                f"awaiting {stats.awaiting_time:.3f} s, ready {stats.ready_time:.3f} s, "
+                f"longest step {stats.longest_step:.3f} s"
+            )
+
+        lines.append(f"Calls blocking the event loop for more than {self.blocking_threshold} s:")
+        for call in sorted(self.blocking_calls, reverse=True):
+            lines.append(f"  blocked for {call.duration:.2f} s in:")
+            lines.extend(f"    {line}" for line in call.stack.splitlines())
+
+        return "\n".join(lines)
+
+    def to_dict(self) -> dict[str, Any]:
+        """Get serializable representation of the profile.
+
+        :return: statistics of the tasks by their coroutine, the event loop lag and the blocking
+                 calls
+        :rtype: dict[str, Any]
+        """
+        buckets = [str(bound) if bound != float("inf") else "+Inf" for bound in LAG_BUCKETS]
+        return {
+            "tasks": [asdict(stats) for stats in self.tasks.values()],
+            "lag": {
+                "interval": LAG_INTERVAL,
+                "total": self.lag_total,
+                "max": self.lag_max,
+                "histogram": dict(zip(buckets, self.lag_histogram)),
+            },
+            "blocking_calls": [asdict(call) for call in sorted(self.blocking_calls, reverse=True)],
+        }
+
+    def save(self, path: Path) -> None:
+        """Save the profile as JSON.
+
+        :param path: path to the profile file
+        :type path: Path
+        """
+        data = self.to_dict()
+        save_run_file(
+            path,
+            lambda path: path.write_text(json.dumps(data, indent=2) + "\n", encoding="utf-8"),
+            "profile of the event loop",
+        )
@@ -0,0 +1,116 @@
+#  Copyright 2023 Canonical Limited
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Profiling of the CPU time and the memory of the run."""
+import cProfile
+import io
+import pstats
+import tracemalloc
+from pathlib import Path
+from typing import Optional
+
+from cou.logging import save_run_file
+
+# number of the functions and allocation sites shown in the profile summary
+TOP_ENTRIES = 30
+# number of frames stored for each traced memory allocation
+TRACEMALLOC_FRAMES = 10
+
+
+class Profiler:
+    """Profiler recording where the run spends CPU time and allocates memory.
+
+    The CPU time is recorded by cProfile, including the time of every function awaited by
+    the coroutines, and the memory by tracemalloc. Both have a noticeable overhead, so the
+    profiler is used only on demand.
+    """
+
+    def __init__(self) -> None:
+        """Initialize the profiler."""
+        self._profile: Optional[cProfile.Profile] = None
+        self._snapshot: Optional[tracemalloc.Snapshot] = None
+        self.current_memory = 0
+        self.peak_memory = 0
+
+    def start(self) -> None:
+        """Start profiling."""
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+
+    def stop(self) -> None:
+        """Stop profiling.
+
+        Stopping the profiler which was not started does nothing.
+        """
+        if self._profile is None or self._snapshot is not None:
+            return
+
+        self._profile.disable()
+        self._snapshot = tracemalloc.take_snapshot()
+        self.current_memory, self.peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    def get_summary(self) -> str:
+        """Get summary of the functions with the longest cumulative time and the peak memory.
+
+        :return: summary of the profile
+        :rtype: str
+        """
+        if self._profile is None or self._snapshot is None:
+            return "No profile was recorded."
+
+        stream = io.StringIO()
+        stats = pstats.Stats(self._profile, stream=stream)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_ENTRIES)
+
+        lines = [
+            "CPU profile",
+            "===========",
+            stream.getvalue().strip("\n"),
+            "",
+            "Memory profile",
+            "==============",
+            f"Peak traced memory: {self.peak_memory / 1024 / 1024:.1f} MiB",
+            f"Traced memory at exit: {self.current_memory / 1024 / 1024:.1f} MiB",
+            "",
+            f"Top {TOP_ENTRIES} allocation sites at exit:",
+        ]
+        for statistic in self._snapshot.statistics("lineno")[:TOP_ENTRIES]:
+            lines.append(
+                f"{statistic.size / 1024:10.1f} KiB {statistic.count:8d} blocks  "
+                f"{statistic.traceback[0]}"
+            )
+
+        return "\n".join(lines) + "\n"
+
+    def save(self, profile_file: Path, summary_file: Path) -> None:
+        """Save the profile and its summary.
+
+        The profile can be loaded with pstats or visualized by tools like snakeviz.
+
+        :param profile_file: path to the profile
+        :type profile_file: Path
+        :param summary_file: path to the summary of the profile
+        :type summary_file: Path
+        """
+        if self._profile is None:
+            return
+
+        summary = self.get_summary()
+        save_run_file(profile_file, self._profile.dump_stats, "profile of the run")
+        save_run_file(
+            summary_file,
+            lambda path: path.write_text(summary, encoding="utf-8"),
+            "summary of the profile of the run",
+        )
@@ -19,7 +19,7 @@ import pytest
 from cou.apps.base import OpenStackApplication
 from cou.exceptions import ApplicationError, HaltUpgradePlanGeneration, MismatchedOpenStackVersions
 from cou.steps import PreUpgradeStep, UnitUpgradeStep, UpgradeStep
-from cou.utils.juju_utils import Machine, Unit
+from cou.utils.juju_utils import Machine, SubordinateUnit, Unit
 from cou.utils.openstack import OpenStackRelease
 from tests.unit.utils import assert_steps, generate_cou_machine
 
@@ -165,6 +165,7 @@ def test_get_pause_unit_step(model):
 
     step = app._get_pause_unit_step(unit)
     assert_steps(step, expected_upgrade_step)
+    assert step.unit == unit
 
 
 def test_get_resume_unit_step(model):
@@ -198,6 +199,7 @@ def test_get_resume_unit_step(model):
 
     step = app._get_resume_unit_step(unit)
     assert_steps(step, expected_upgrade_step)
+    assert step.unit == unit
 
 
 def test_get_openstack_upgrade_step(model):
@@ -1101,3 +1103,87 @@ def test_apt_source_codename_landscape_raises_application_error(monkeypatch, o7k
 
     with pytest.raises(ApplicationError):
         _ = app.apt_source_codename
+
+
+def _generate_clustered_app(
+    model, units: int, config: dict, subordinate_charm: str = "hacluster"
+) -> OpenStackApplication:
+    """Generate application with units clustered with hacluster."""
+    machines = {f"{i}": generate_cou_machine(f"{i}") for i in range(units)}
+    return OpenStackApplication(
+        name="my_app",
+        can_upgrade_to="ussuri/stable",
+        charm="keystone",
+        channel="ussuri/stable",
+        config=config,
+        machines=machines,
+        model=model,
+        origin="ch",
+        series="focal",
+        subordinate_to=[],
+        units={
+            f"my_app/{i}": Unit(
+                name=f"my_app/{i}",
+                workload_version="17.0.1",
+                machine=machines[f"{i}"],
+                subordinates=[SubordinateUnit(f"my_app-sub/{i}", subordinate_charm)],
+            )
+            for i in range(units)
+        },
+        workload_version="17.0.1",
+    )
+
+
+@pytest.mark.parametrize(
+    "units, subordinate_charm, exp_result",
+    [(3, "hacluster", True), (1, "hacluster", False), (3, "keystone-ldap", False)],
+)
+def test_is_clustered(units, subordinate_charm, exp_result, model):
+    """Test checking if the application is clustered with hacluster."""
+    app = _generate_clustered_app(model, units, {}, subordinate_charm)
+
+    assert app.is_clustered is exp_result
+
+
+@pytest.mark.parametrize(
+    "units, exp_waves",
+    [
+        (2, [["my_app/1"]]),
+        (3, [["my_app/1"], ["my_app/2"]]),
+        (5, [["my_app/1", "my_app/2"], ["my_app/3", "my_app/4"]]),
+        (6, [["my_app/1", "my_app/2"], ["my_app/3", "my_app/4"], ["my_app/5"]]),
+    ],
+)
+@patch("cou.apps.base.OpenStackApplication.upgrade_plan_sanity_checks")
+def test_generate_rolling_upgrade_plan(_, units, exp_waves, model):
+    """Test generating upgrade plan upgrading the units in rolling waves."""
+    config = {"openstack-origin": {"value": "distro"}, "action-managed-upgrade": {"value": False}}
+    app = _generate_clustered_app(model, units, config)
+    unit_names = ", ".join(app.units)
+
+    plan = app.generate_rolling_upgrade_plan(OpenStackRelease("victoria"), False)
+
+    rolling_plan = next(
+        step
+        for step in plan.sub_steps
+        if step.description == f"Upgrade plan for units: {unit_names} in rolling waves"
+    )
+    canary, *waves = rolling_plan.sub_steps
+    assert rolling_plan.parallel is False
+    assert canary.description == "Upgrade plan for unit 'my_app/0'"
+    assert [wave.parallel for wave in waves] == [True] * len(exp_waves)
+    assert [[step.unit.name for step in wave.sub_steps] for wave in waves] == exp_waves
+    assert [wave.description for wave in waves] == [
+        f"Upgrade wave {i} of units: {', '.join(wave)}" for i, wave in enumerate(exp_waves, 1)
+    ]
+
+
+@patch("cou.apps.base.OpenStackApplication.upgrade_plan_sanity_checks")
+def test_generate_rolling_upgrade_plan_all_in_one(_, model):
+    """Test generating rolling upgrade plan for application without action-managed-upgrade."""
+    app = _generate_clustered_app(model, 3, {"openstack-origin": {"value": "distro"}})
+
+    plan = app.generate_rolling_upgrade_plan(OpenStackRelease("victoria"), False)
+
+    assert str(plan) == str(app.generate_upgrade_plan(OpenStackRelease("victoria"), False))
+    assert "rolling waves" not in str(plan)
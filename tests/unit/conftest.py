@@ -18,6 +18,7 @@ import pytest
 
 from cou.commands import CLIargs
 from cou.steps.plan import PlanStatus
+from cou.utils.api_stats import api_stats
 from cou.utils.juju_utils import Model
 from tests.unit.utils import get_charm_name, get_status
 
@@ -58,7 +59,14 @@ def cli_args() -> MagicMock:
     :rtype: MagicMock
     """
     # spec_set needs an instantiated class to be strict with the fields.
-    return MagicMock(spec_set=CLIargs(command="plan"))()
+    cli_args = MagicMock(spec_set=CLIargs(command="plan"))()
+    # paths to files and target release are used only by tests which set them explicitly
+    cli_args.output = cli_args.plan_file = cli_args.to = None
+    cli_args.metrics_file = cli_args.metrics_port = None
+    cli_args.profile = False
+    cli_args.pipeline_hypervisors = cli_args.max_parallel_azs = None
+    cli_args.rolling = False
+    return cli_args
 
 
 @pytest.fixture(autouse=True)
@@ -66,3 +74,9 @@ def plan_status() -> None:
     """Get an empty PlanStatus for every test case."""
     PlanStatus.error_messages = []
     PlanStatus.warning_messages = []
+
+
+@pytest.fixture(autouse=True)
+def reset_api_stats() -> None:
+    """Get empty statistics of Juju API calls for every test case."""
+    api_stats.reset()
@@ -433,6 +433,47 @@ async def test_analysis_create_with_skip_apps(mock_populate, model):
     assert result.current_cloud_series == "focal"
 
 
+@pytest.mark.asyncio
+@patch.object(analyze.Analysis, "_populate", new_callable=AsyncMock)
+async def test_analysis_refresh(mock_populate, model):
+    """Test refreshing analysis with applications touched since the analysis."""
+    machines = {"0": MagicMock(spec_set=Machine)}
+    keystone, cinder, vault = (
+        OpenStackApplication(
+            name=name,
+            can_upgrade_to=f"{channel}/stable",
+            charm=name,
+            channel=f"{channel}/stable",
+            config={"source": {"value": "distro"}},
+            machines=machines,
+            model=model,
+            origin="ch",
+            series="focal",
+            subordinate_to=[],
+            units={
+                f"{name}/0": Unit(
+                    name=f"{name}/0", workload_version=workload_version, machine=machines["0"]
+                )
+            },
+            workload_version=workload_version,
+        )
+        for name, channel, workload_version in [
+            ("keystone", "ussuri", "17.1.0"),
+            ("cinder", "ussuri", "16.4.2"),
+            ("vault", "1.7", "1.7.9"),
+        ]
+    )
+    analysis = Analysis(model=model, apps=[keystone, cinder])
+    mock_populate.return_value = [keystone, cinder, vault]
+
+    result = await analysis.refresh(skip_apps={"vault"}, touched_apps={"keystone"})
+
+    mock_populate.assert_awaited_once_with(model, {"cinder": cinder})
+    assert result.model == model
+    assert result.apps == [keystone, cinder]
+    assert result.current_cloud_o7k_release == "ussuri"
+
+
 @pytest.mark.asyncio
 async def test_analysis_detect_current_cloud_o7k_release_different_releases(model):
     machines = {"0": MagicMock(spec_set=Machine)}
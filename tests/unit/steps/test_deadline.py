@@ -0,0 +1,215 @@
+#  Copyright 2023 Canonical Limited
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Test deadlines of the upgrade steps."""
+import asyncio
+import os
+from unittest.mock import patch
+
+import pytest
+
+from cou.exceptions import EnvironmentVariableError, StepDeadlineExceeded
+from cou.steps import UpgradePlan, UpgradeStep
+from cou.steps.deadline import (
+    STEP_DEADLINES,
+    Deadline,
+    get_deadline,
+    load_step_deadlines,
+    parse_deadlines,
+    run_with_deadline,
+)
+
+
+async def upgrade_packages(duration: float) -> str:
+    """Upgrade packages."""
+    await asyncio.sleep(duration)
+    return "upgraded"
+
+
+async def wait_for_idle(timeout: int) -> None:
+    """Wait for the model to be idle."""
+
+
+async def ignore_cancel(duration: float) -> str:
+    """Stop only once the duration has passed, even if the coroutine is canceled."""
+    try:
+        await asyncio.sleep(duration)
+    except asyncio.CancelledError:
+        pass
+
+    return "stopped"
+
+
+@pytest.mark.parametrize(
+    "value, exp_deadlines",
+    [
+        ("", {}),
+        ("backup=600", {"backup": Deadline(600.0, None)}),
+        (
+            "Model.run_action:openstack-upgrade=900/3600, backup=/7200",
+            {
+                "Model.run_action:openstack-upgrade": Deadline(900.0, 3600.0),
+                "backup": Deadline(None, 7200.0),
+            },
+        ),
+    ],
+)
+def test_parse_deadlines(value, exp_deadlines):
+    """Test parsing deadlines of the steps by their kind."""
+    assert parse_deadlines(value) == exp_deadlines
+
+
+@pytest.mark.parametrize(
+    "value", ["600", "backup=ten", "backup=1/2/3", "backup=0", "backup=/-5", "backup=/inf"]
+)
+def test_parse_deadlines_invalid(value):
+    """Test parsing deadlines in invalid format."""
+    with pytest.raises(ValueError):
+        parse_deadlines(value)
+
+
+@pytest.mark.parametrize(
+    "expected_duration, exp_deadline",
+    [
+        (None, Deadline(None, 3600.0)),
+        (10.0, Deadline(60.0, 1800.0)),
+        (600.0, Deadline(1200.0, 3000.0)),
+    ],
+)
+def test_get_deadline_expected_duration(expected_duration, exp_deadline):
+    """Test deadline derived from the duration predicted from the previous runs."""
+    step = UpgradeStep("Upgrade packages", coro=upgrade_packages(0))
+    step.expected_duration = expected_duration
+
+    assert get_deadline(step) == exp_deadline
+
+
+@patch.dict(os.environ, {"COU_STEP_DEADLINES": "backup=600/3600"})
+@patch.dict("cou.steps.deadline.STEP_DEADLINES", {"archive": Deadline(1, 2)}, clear=True)
+def test_load_step_deadlines():
+    """Test loading deadlines of the steps from the environment variable."""
+    load_step_deadlines()
+
+    assert STEP_DEADLINES == {"backup": Deadline(600.0, 3600.0)}
+
+
+@patch.dict(os.environ, {"COU_STEP_DEADLINES": "backup=600/ten"})
+def test_load_step_deadlines_invalid():
+    """Test loading deadlines of the steps in invalid format from the environment variable."""
+    with pytest.raises(EnvironmentVariableError, match="COU_STEP_DEADLINES is not valid"):
+        load_step_deadlines()
+
+
+@pytest.mark.parametrize(
+    "expected_duration, timeout, exp_deadline",
+    [
+        (None, 2400, Deadline()),
+        (10.0, 600, Deadline(60.0, 1800.0)),
+        (10.0, 2400, Deadline(60.0, 2400.0)),
+        (10.0, True, Deadline(60.0, 1800.0)),
+    ],
+)
+def test_get_deadline_timeout(expected_duration, timeout, exp_deadline):
+    """Test hard deadline not expiring before the timeout of the step coroutine."""
+    step = UpgradeStep("Wait for idle", coro=wait_for_idle(timeout))
+    step.expected_duration = expected_duration
+
+    assert get_deadline(step) == exp_deadline
+
+
+@pytest.mark.parametrize("timeout, exp_hard", [(600, 3600.0), (7200, 7200.0)])
+def test_get_deadline_default(timeout, exp_hard):
+    """Test default hard deadline of step without previous runs."""
+    step = UpgradeStep("Wait for idle", coro=wait_for_idle(timeout))
+
+    with patch.dict("cou.steps.deadline.DEFAULT_HARD_DEADLINES", {"wait_for_idle": 3600.0}):
+        assert get_deadline(step) == Deadline(None, exp_hard)
+
+
+def test_get_deadline_configured():
+    """Test deadline configured for the kind of the step."""
+    step = UpgradeStep("Upgrade packages", coro=upgrade_packages(0))
+    step.expected_duration = 600.0
+
+    with patch.dict("cou.steps.deadline.STEP_DEADLINES", {"upgrade_packages": Deadline(5, 10)}):
+        assert get_deadline(step) == Deadline(5, 10)
+
+
+def test_get_deadline_no_coroutine():
+    """Test deadline of step without coroutine."""
+    plan = UpgradePlan("Upgrade cloud")
+    plan.expected_duration = 600.0
+
+    assert get_deadline(plan) == Deadline()
+
+
+@pytest.mark.asyncio
+async def test_run_with_deadline():
+    """Test running step within its deadline."""
+    step = UpgradeStep("Upgrade packages", coro=upgrade_packages(0))
+
+    with patch("cou.steps.deadline.get_deadline", return_value=Deadline(1, 2)), patch(
+        "cou.steps.deadline.logger"
+    ) as mock_logger:
+        await run_with_deadline(step)
+
+    assert step.done
+    mock_logger.warning.assert_not_called()
+    mock_logger.error.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_run_with_deadline_soft():
+    """Test running step past its soft deadline."""
+    step = UpgradeStep("Upgrade packages", coro=upgrade_packages(0.05))
+
+    with patch("cou.steps.deadline.get_deadline", return_value=Deadline(0.01, None)), patch(
+        "cou.steps.deadline.logger"
+    ) as mock_logger:
+        await run_with_deadline(step)
+
+    mock_logger.warning.assert_called_once_with(
+        "step is running longer than its soft deadline of %s: %s", "0:00:00", "Upgrade packages"
+    )
+    mock_logger.error.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_run_with_deadline_hard():
+    """Test canceling step running past its hard deadline."""
+    step = UpgradeStep("Upgrade packages", coro=upgrade_packages(10))
+
+    with patch("cou.steps.deadline.get_deadline", return_value=Deadline(None, 0.01)), patch(
+        "cou.steps.deadline.logger"
+    ) as mock_logger:
+        with pytest.raises(StepDeadlineExceeded, match="exceeded its hard deadline of 0:00:00"):
+            await run_with_deadline(step)
+
+    mock_logger.error.assert_called_once()
+    assert step.canceled
+    assert step.done
+
+
+@pytest.mark.asyncio
+async def test_run_with_deadline_hard_ignoring_cancel():
+    """Test failing step past its hard deadline even if its coroutine ignores the cancel."""
+    step = UpgradeStep("Upgrade packages", coro=ignore_cancel(0.05))
+
+    with patch("cou.steps.deadline.get_deadline", return_value=Deadline(None, 0.01)), patch(
+        "cou.steps.deadline.logger"
+    ) as mock_logger:
+        with pytest.raises(StepDeadlineExceeded, match="exceeded its hard deadline of 0:00:00"):
+            await run_with_deadline(step)
+
+    mock_logger.error.assert_called_once()
+    assert step.canceled
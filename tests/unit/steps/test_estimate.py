@@ -0,0 +1,178 @@
+#  Copyright 2023 Canonical Limited
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Test estimation of the duration of the upgrade steps."""
+import pytest
+
+from cou.steps import (
+    ApplicationUpgradePlan,
+    HypervisorUpgradePlan,
+    PreUpgradeStep,
+    UpgradePlan,
+    UpgradeStep,
+)
+from cou.steps.backup import backup
+from cou.steps.estimate import (
+    DEFAULT_STEP_DURATION,
+    estimate_application_durations,
+    estimate_duration,
+    estimate_scheduled_durations,
+    format_duration,
+    order_by_duration,
+)
+from cou.utils.app_utils import upgrade_packages
+from tests.unit.utils import run_step
+
+
+def test_estimate_duration(model):
+    """Test estimating duration of sequential and parallel steps."""
+    plan = UpgradePlan("Upgrade cloud from 'ussuri' to 'victoria'")
+    plan.add_step(PreUpgradeStep("Back up MySQL databases", coro=backup(model)))
+    app_plan = ApplicationUpgradePlan("Upgrade plan for 'keystone' to 'victoria'")
+    packages = PreUpgradeStep("Upgrade software packages of 'keystone'", parallel=True)
+    packages.add_steps(
+        PreUpgradeStep(
+            f"Upgrade packages on 'keystone/{i}'",
+            coro=upgrade_packages(f"keystone/{i}", model, None),
+        )
+        for i in range(3)
+    )
+    app_plan.add_steps([packages, UpgradeStep("Verify 'keystone'", coro=run_step("verify"))])
+    plan.add_step(app_plan)
+
+    assert estimate_duration(packages) == 300.0
+    assert estimate_duration(plan) == 600.0 + 300.0 + DEFAULT_STEP_DURATION
+
+
+@pytest.mark.parametrize(
+    "max_parallel, exp_duration", [(None, 300.0), (1, 900.0), (2, 600.0), (3, 300.0), (5, 300.0)]
+)
+def test_estimate_duration_max_parallel(max_parallel, exp_duration, model):
+    """Test estimating duration of parallel steps with limited number of running steps."""
+    packages = PreUpgradeStep(
+        "Upgrade software packages of 'keystone'", parallel=True, max_parallel=max_parallel
+    )
+    packages.add_steps(
+        PreUpgradeStep(
+            f"Upgrade packages on 'keystone/{i}'",
+            coro=upgrade_packages(f"keystone/{i}", model, None),
+        )
+        for i in range(3)
+    )
+
+    assert estimate_duration(packages) == exp_duration
+
+
+def test_estimate_duration_expected(model):
+    """Test estimating duration of step with duration predicted from the previous runs."""
+    step = PreUpgradeStep("Back up MySQL databases", coro=backup(model))
+    step.expected_duration = 42.0
+
+    assert estimate_duration(step) == 42.0
+
+
+def test_estimate_application_durations():
+    """Test estimating duration of each application upgrade plan."""
+    plan = UpgradePlan("Upgrade cloud from 'ussuri' to 'victoria'")
+    parallel = UpgradeStep("Upgrade apps not sharing any machine in parallel", parallel=True)
+    for app, duration in [("keystone", 10.0), ("cinder", 20.0), ("glance", 30.0)]:
+        app_plan = ApplicationUpgradePlan(f"Upgrade plan for '{app}' to 'victoria'")
+        app_plan.add_step(UpgradeStep(f"Upgrade '{app}'", coro=run_step(app)))
+        app_plan.sub_steps[0].expected_duration = duration
+        (plan if app == "keystone" else parallel).add_step(app_plan)
+    plan.add_step(parallel)
+
+    assert [
+        (step.description, duration) for step, duration in estimate_application_durations(plan)
+    ] == [
+        ("Upgrade plan for 'keystone' to 'victoria'", 10.0),
+        ("Upgrade plan for 'cinder' to 'victoria'", 20.0),
+        ("Upgrade plan for 'glance' to 'victoria'", 30.0),
+    ]
+
+
+def _get_step(description: str, duration: float, step_type: type = UpgradeStep) -> UpgradeStep:
+    """Get step with sub-step taking the duration."""
+    step = step_type(description)
+    step.add_step(UpgradeStep(f"Run {description}", coro=run_step(description)))
+    step.sub_steps[0].expected_duration = duration
+    return step
+
+
+def test_order_by_duration():
+    """Test ordering sub-steps of the scheduled steps by their estimated duration."""
+    plan = UpgradePlan("Upgrading all applications deployed on machines with hypervisor.")
+    pipeline = UpgradeStep("Upgrade machines in pipeline", parallel=True, max_parallel=2)
+    pipeline.add_steps([_get_step("short", 10.0), _get_step("long", 30.0)])
+    unlimited = UpgradeStep("Upgrade units", parallel=True)
+    unlimited.add_steps([_get_step("short", 10.0), _get_step("long", 30.0)])
+    long_az = HypervisorUpgradePlan("Upgrade plan for 'az-0'")
+    long_az.add_steps([pipeline, unlimited])
+    short_az = _get_step("Upgrade plan for 'az-1'", 20.0, HypervisorUpgradePlan)
+    plan.add_steps([long_az, short_az])
+    sequential = UpgradeStep("Upgrade sequentially")
+    sequential.add_steps([_get_step("long", 30.0), _get_step("short", 10.0)])
+
+    order_by_duration(plan)
+    order_by_duration(sequential)
+
+    assert plan.sub_steps == [long_az, short_az]
+    assert [step.description for step in pipeline.sub_steps] == ["long", "short"]
+    assert [step.description for step in unlimited.sub_steps] == ["short", "long"]
+    assert [step.description for step in sequential.sub_steps] == ["long", "short"]
+
+
+def test_order_by_duration_expected_durations_changed():
+    """Test ordering the plan again once the durations are predicted from the history.
+
+    The order of the sub-steps running in parallel does not change the fingerprint.
+    """
+    pipeline = UpgradeStep("Upgrade machines in pipeline", parallel=True, max_parallel=1)
+    pipeline.add_steps([_get_step("first", 20.0), _get_step("second", 10.0)])
+    order_by_duration(pipeline)
+    fingerprint = pipeline.fingerprint
+
+    pipeline.sub_steps[1].sub_steps[0].expected_duration = 30.0
+    order_by_duration(pipeline)
+
+    assert [step.description for step in pipeline.sub_steps] == ["second", "first"]
+    assert pipeline.fingerprint == fingerprint
+
+
+def test_estimate_scheduled_durations():
+    """Test estimating duration of each step running limited number of sub-steps."""
+    plan = UpgradePlan("Upgrading all applications deployed on machines with hypervisor.")
+    azs = UpgradeStep("Upgrade AZs in parallel", parallel=True, max_parallel=1)
+    pipeline = UpgradeStep("Upgrade machines in pipeline", parallel=True, max_parallel=1)
+    pipeline.add_steps([_get_step("first", 20.0), _get_step("second", 10.0)])
+    az = HypervisorUpgradePlan("Upgrade plan for 'az-0'")
+    az.add_step(pipeline)
+    azs.add_steps([az, _get_step("Upgrade plan for 'az-1'", 5.0, HypervisorUpgradePlan)])
+    plan.add_steps([_get_step("unlimited", 1.0), azs])
+
+    assert [
+        (step.description, duration) for step, duration in estimate_scheduled_durations(plan)
+    ] == [("Upgrade AZs in parallel", 35.0), ("Upgrade machines in pipeline", 30.0)]
+
+
+def test_estimate_duration_empty():
+    """Test estimating duration of plan without steps."""
+    assert estimate_duration(UpgradePlan("Upgrade cloud from 'ussuri' to 'victoria'")) == 0.0
+
+
+@pytest.mark.parametrize(
+    "seconds, exp_duration", [(0, "0:00:00"), (59.6, "0:01:00"), (3 * 3600 + 125, "3:02:05")]
+)
+def test_format_duration(seconds, exp_duration):
+    """Test formatting duration for the user."""
+    assert format_duration(seconds) == exp_duration
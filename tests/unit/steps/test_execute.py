@@ -14,26 +14,39 @@
 
 import asyncio
 import unittest
+from collections import defaultdict
 from random import randint
 from textwrap import dedent
 from unittest.mock import AsyncMock, MagicMock, call, patch
 
 import pytest
 
-from cou.exceptions import HaltUpgradeExecution, RunUpgradeError
+from cou.exceptions import HaltUpgradeExecution, RunUpgradeError, StepDeadlineExceeded
 from cou.steps import (
     ApplicationUpgradePlan,
+    FailurePolicy,
     PostUpgradeStep,
     PreUpgradeStep,
+    UnitUpgradeStep,
     UpgradePlan,
     UpgradeStep,
 )
+from cou.steps.deadline import Deadline
 from cou.steps.execute import (
+    StepObserver,
+    _get_abandoned_machines,
+    _get_machine_lock,
+    _get_prompt_lock,
     _run_step,
+    _run_step_coroutine,
     _run_sub_steps_in_parallel,
     _run_sub_steps_sequentially,
+    add_observer,
     apply_step,
+    notify_plan_changed,
+    remove_observer,
 )
+from tests.unit.utils import generate_cou_machine
 
 
 @pytest.mark.asyncio
@@ -42,6 +55,7 @@ async def test_run_sub_steps_in_parallel(mock_apply_step):
     """Test running all sub-steps of step in parallel."""
     upgrade_step = MagicMock(spec_set=UpgradeStep())
     upgrade_step.parallel = True
+    upgrade_step.max_parallel = None
     upgrade_step.sub_steps = sub_steps = [
         PreUpgradeStep("pre-upgrade"),
         UpgradeStep("upgrade"),
@@ -52,6 +66,30 @@ async def test_run_sub_steps_in_parallel(mock_apply_step):
     mock_apply_step.assert_has_awaits([call(step, False, False) for step in sub_steps])
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize("max_parallel, exp_running", [(None, 5), (1, 1), (2, 2), (7, 5)])
+async def test_run_sub_steps_in_parallel_max_parallel(max_parallel, exp_running):
+    """Test running sub-steps of step in parallel with limited number of running sub-steps."""
+    running, max_running = 0, 0
+
+    async def _run(description):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    upgrade_step = UpgradeStep("upgrade", parallel=True, max_parallel=max_parallel)
+    upgrade_step.add_steps(
+        UpgradeStep(f"upgrade {i}", coro=_run(f"upgrade {i}")) for i in range(5)
+    )
+
+    await _run_sub_steps_in_parallel(upgrade_step, False, False)
+
+    assert max_running == exp_running
+    assert all(sub_step.done for sub_step in upgrade_step.sub_steps)
+
+
 @pytest.mark.asyncio
 @patch("cou.steps.execute.apply_step")
 async def test_run_sub_steps_in_parallel_fail(mock_apply_step):
@@ -69,6 +107,7 @@ async def test_run_sub_steps_in_parallel_fail(mock_apply_step):
 
     upgrade_step = MagicMock(spec_set=UpgradeStep())
     upgrade_step.parallel = True
+    upgrade_step.max_parallel = None
     upgrade_step.sub_steps = sub_steps = [
         PreUpgradeStep("pre-upgrade"),
         UpgradeStep("upgrade 1"),
@@ -90,12 +129,227 @@ async def test_run_sub_steps_in_parallel_fail(mock_apply_step):
     mock_apply_step.assert_has_awaits([call(step, False, False) for step in sub_steps])
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "failure_policy, exp_finished, exp_canceled",
+    [
+        (None, ["unit/0", "unit/2", "unit/3"], []),
+        (FailurePolicy.WAIT_ALL, ["unit/0", "unit/2", "unit/3"], []),
+        (FailurePolicy.FAIL_FAST, ["unit/0"], ["unit/2", "unit/3"]),
+        (FailurePolicy(50), ["unit/0", "unit/2", "unit/3"], []),
+    ],
+)
+async def test_run_sub_steps_in_parallel_failure_policy(
+    failure_policy, exp_finished, exp_canceled
+):
+    """Test canceling not started sub-steps according to failure policy."""
+    finished = []
+    machines = {"0": generate_cou_machine("0"), "1": generate_cou_machine("1")}
+
+    async def _upgrade(unit_name, fail=False):
+        await asyncio.sleep(0.01)
+        if fail:
+            raise Exception(f"{unit_name} failed")
+        finished.append(unit_name)
+
+    def _step(unit_name, machine_id, fail=False):
+        unit = MagicMock()
+        unit.machine = machines[machine_id]
+        return UnitUpgradeStep(unit_name, coro=_upgrade(unit_name, fail), unit=unit)
+
+    # unit/1 fails while unit/2 and unit/3 are waiting for the machine 1
+    upgrade_step = UpgradeStep("upgrade", parallel=True, failure_policy=failure_policy)
+    upgrade_step.add_steps(
+        [
+            _step("unit/0", "0"),
+            _step("unit/1", "1", fail=True),
+            _step("unit/2", "1"),
+            _step("unit/3", "1"),
+        ]
+    )
+
+    with pytest.raises(RunUpgradeError, match="unit/1: Exception\\('unit/1 failed'\\)"):
+        await _run_sub_steps_in_parallel(upgrade_step, False, False)
+
+    assert sorted(finished) == exp_finished
+    assert [step.description for step in upgrade_step.sub_steps if step.canceled] == exp_canceled
+
+
+@pytest.mark.asyncio
+async def test_run_sub_steps_in_parallel_fail_fast_running_siblings():
+    """Test canceling not started steps of running siblings, except for compensating steps."""
+    finished = []
+
+    async def _run(description, duration=0.0, fail=False):
+        await asyncio.sleep(duration)
+        if fail:
+            raise Exception(f"{description} failed")
+        finished.append(description)
+
+    def _unit_plan(unit_name, machine_id):
+        unit = MagicMock()
+        unit.machine = generate_cou_machine(machine_id)
+        unit_plan = UnitUpgradeStep(f"Upgrade plan for unit '{unit_name}'", unit=unit)
+        unit_plan.add_steps(
+            [
+                UnitUpgradeStep(f"pause {unit_name}", coro=_run(f"pause {unit_name}", 0.02)),
+                UnitUpgradeStep(f"upgrade {unit_name}", coro=_run(f"upgrade {unit_name}")),
+                UnitUpgradeStep(
+                    f"resume {unit_name}", coro=_run(f"resume {unit_name}"), compensating=True
+                ),
+            ]
+        )
+        return unit_plan
+
+    # unit/1 fails while unit/0 is being paused
+    upgrade_step = UpgradeStep("upgrade", parallel=True, failure_policy=FailurePolicy.FAIL_FAST)
+    failing_step = UnitUpgradeStep("unit/1", coro=_run("unit/1", 0.01, fail=True))
+    upgrade_step.add_steps([_unit_plan("unit/0", "0"), failing_step])
+
+    with pytest.raises(RunUpgradeError) as exc_info:
+        await _run_sub_steps_in_parallel(upgrade_step, False, False)
+
+    assert "Upgrade plan for unit 'unit/0': CanceledStep" in str(exc_info.value)
+    assert "unit/1: Exception('unit/1 failed')" in str(exc_info.value)
+    assert finished == ["pause unit/0", "resume unit/0"]
+    pause_step, upgrade_unit_step, resume_step = upgrade_step.sub_steps[0].sub_steps
+    assert upgrade_unit_step.canceled
+    assert not pause_step.canceled and not resume_step.canceled
+
+
+@pytest.mark.asyncio
+async def test_get_prompt_lock():
+    """Test getting the same prompt lock in the same event loop."""
+    assert _get_prompt_lock() is _get_prompt_lock()
+
+
+@pytest.mark.asyncio
+@patch("cou.steps.execute.prompt_input")
+async def test_apply_step_prompts_one_by_one(mock_prompt_input):
+    """Test that steps running in parallel do not prompt at the same time."""
+    prompting = []
+
+    async def _prompt_input(*_):
+        prompting.append(True)
+        assert len(prompting) == 1
+        await asyncio.sleep(0)
+        prompting.pop()
+        return "y"
+
+    mock_prompt_input.side_effect = _prompt_input
+    upgrade_plan = UpgradeStep("Upgrade apps in parallel", parallel=True)
+    for name in ("ceph-osd", "swift-storage"):
+        app_plan = ApplicationUpgradePlan(f"Upgrade plan for '{name}' to 'victoria'")
+        app_plan.add_step(UpgradeStep(f"Upgrade '{name}'", coro=AsyncMock()()))
+        upgrade_plan.add_step(app_plan)
+
+    await apply_step(upgrade_plan, prompt=True)
+
+    assert mock_prompt_input.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_get_machine_lock():
+    """Test getting the same lock for the same machine."""
+    assert _get_machine_lock("0") is _get_machine_lock("0")
+    assert _get_machine_lock("0") is not _get_machine_lock("1")
+
+
+@pytest.mark.asyncio
+async def test_run_step_coroutine_machine_exclusion():
+    """Test steps on the same machine are serialized and on other machines are not."""
+    running, max_running = defaultdict(int), defaultdict(int)
+
+    async def _work(machine_id):
+        running[machine_id] += 1
+        max_running[machine_id] = max(max_running[machine_id], running[machine_id])
+        await asyncio.sleep(0.01)
+        running[machine_id] -= 1
+
+    steps = []
+    for machine_id in ["0", "0", "0", "1"]:
+        unit = MagicMock()
+        unit.machine = generate_cou_machine(machine_id)
+        steps.append(UnitUpgradeStep(f"step on {machine_id}", coro=_work(machine_id), unit=unit))
+
+    await asyncio.gather(*(_run_step_coroutine(step) for step in steps))
+
+    assert max_running == {"0": 1, "1": 1}
+    assert all(step.done for step in steps)
+
+
+@pytest.mark.asyncio
+@patch("cou.steps.execute.progress_indicator", new=MagicMock())
+async def test_run_sub_steps_in_parallel_hard_deadline():
+    """Test step exceeding its hard deadline fails only its branch of the parallel group."""
+
+    async def _work(duration):
+        await asyncio.sleep(duration)
+
+    step = UpgradeStep("group", parallel=True)
+    hung_step = UpgradeStep("hung step", coro=_work(10))
+    hung_step.expected_duration = 0.001
+    step.add_steps([hung_step, UpgradeStep("other step", coro=_work(0.01))])
+
+    with patch("cou.steps.deadline.MIN_HARD_DEADLINE", 0.01), patch(
+        "cou.steps.deadline.MIN_SOFT_DEADLINE", 0.0
+    ):
+        with pytest.raises(RunUpgradeError, match="hung step: StepDeadlineExceeded"):
+            await _run_sub_steps_in_parallel(step, False, False)
+
+    assert all(sub_step.done for sub_step in step.sub_steps)
+    assert hung_step.canceled
+    assert not step.sub_steps[1].canceled
+
+
+@pytest.mark.asyncio
+async def test_run_step_coroutine_abandoned_machine():
+    """Test no step is run on machine with operation abandoned by hard deadline."""
+
+    async def _work(duration):
+        await asyncio.sleep(duration)
+
+    steps = []
+    for machine_id, duration in [("0", 10), ("0", 0), ("1", 0)]:
+        unit = MagicMock()
+        unit.machine = generate_cou_machine(machine_id)
+        steps.append(UnitUpgradeStep(f"step on {machine_id}", coro=_work(duration), unit=unit))
+
+    with patch("cou.steps.deadline.get_deadline", return_value=Deadline(None, 0.01)):
+        with pytest.raises(StepDeadlineExceeded):
+            await _run_step_coroutine(steps[0])
+
+    with pytest.raises(RunUpgradeError, match="machine 0 may still run an operation"):
+        await _run_step_coroutine(steps[1])
+
+    await _run_step_coroutine(steps[2])
+
+    assert _get_abandoned_machines() == {"0"}
+    assert not steps[1].started
+    assert steps[2].done
+    steps[1]._coro.close()
+
+
+@pytest.mark.asyncio
+@patch("cou.steps.execute._get_machine_lock")
+async def test_run_step_coroutine_no_machine(mock_get_machine_lock):
+    """Test steps without machine or with sub-steps are not locked."""
+    step = UpgradeStep("group", unit=MagicMock())
+    step.add_step(UpgradeStep("step", coro=AsyncMock()()))
+
+    await _run_step_coroutine(step)
+    await _run_step_coroutine(step.sub_steps[0])
+
+    mock_get_machine_lock.assert_not_called()
+
+
 @pytest.mark.asyncio
 @patch("cou.steps.execute.apply_step")
 async def test_run_sub_steps_sequentially(mock_apply_step):
     """Test running all sub-steps of step sequentially."""
     upgrade_step = MagicMock(spec_set=UpgradeStep())
     upgrade_step.parallel = True
+    upgrade_step.max_parallel = None
     upgrade_step.sub_steps = sub_steps = [
         PreUpgradeStep("pre-upgrade"),
         UpgradeStep("upgrade"),
@@ -106,6 +360,32 @@ async def test_run_sub_steps_sequentially(mock_apply_step):
     mock_apply_step.assert_has_awaits([call(step, False, False) for step in sub_steps])
 
 
+@pytest.mark.asyncio
+@patch("cou.steps.execute.apply_step")
+async def test_run_sub_steps_sequentially_replaced_steps(mock_apply_step):
+    """Test running sub-steps replaced by the running sub-step."""
+    upgrade_step = UpgradeStep("upgrade")
+    old_step, new_step = UpgradeStep("old upgrade"), UpgradeStep("new upgrade")
+    upgrade_step.replace_sub_steps([PreUpgradeStep("refresh"), old_step, PostUpgradeStep("post")])
+
+    async def _apply_step(step, *_):
+        if step.description == "refresh":
+            upgrade_step.replace_sub_steps([new_step], 1, 2)
+
+    mock_apply_step.side_effect = _apply_step
+
+    await _run_sub_steps_sequentially(upgrade_step, False, False)
+
+    mock_apply_step.assert_has_awaits(
+        [
+            call(upgrade_step.sub_steps[0], False, False),
+            call(new_step, False, False),
+            call(upgrade_step.sub_steps[2], False, False),
+        ]
+    )
+    assert call(old_step, False, False) not in mock_apply_step.await_args_list
+
+
 @pytest.mark.asyncio
 @patch("cou.steps.execute.apply_step")
 @patch("cou.steps.execute.logger")
@@ -113,6 +393,7 @@ async def test_run_sub_steps_sequentially_halt(mock_logger, mock_apply_step):
     """Test the sequential execution of all sub-steps and raising HaltUpgradeExecution."""
     upgrade_step = MagicMock(spec_set=UpgradeStep())
     upgrade_step.parallel = True
+    upgrade_step.max_parallel = None
     upgrade_step.sub_steps = sub_steps = [
         PreUpgradeStep("pre-upgrade"),
         UpgradeStep("upgrade 1", dependent=True),
@@ -142,6 +423,7 @@ async def test_run_sub_steps_sequentially_fail(mock_apply_step):
     """Test the sequential execution of all sub-steps and raising Exception."""
     upgrade_step = MagicMock(spec_set=UpgradeStep())
     upgrade_step.parallel = True
+    upgrade_step.max_parallel = None
     upgrade_step.sub_steps = sub_steps = [
         PreUpgradeStep("pre-upgrade"),
         UpgradeStep("upgrade 1", dependent=True),
@@ -171,6 +453,8 @@ async def test_run_step_sequentially_upgrade_step(
     """Test running upgrade step and all sub-steps sequentially."""
     upgrade_step = MagicMock(spec_set=UpgradeStep())
     upgrade_step.run = AsyncMock()
+    upgrade_step.expected_duration = None
+    upgrade_step.skipped = False
     upgrade_step.parallel = False
 
     await _run_step(upgrade_step, False)
@@ -191,6 +475,8 @@ async def test_run_step_sequentially_upgrade_step_overwrite(
     """Test running upgrade step and all sub-steps sequentially and overwrite progress."""
     upgrade_step = MagicMock(spec_set=UpgradeStep())
     upgrade_step.run = AsyncMock()
+    upgrade_step.expected_duration = None
+    upgrade_step.skipped = False
     upgrade_step.parallel = False
 
     await _run_step(upgrade_step, False, True)
@@ -212,6 +498,7 @@ async def test_run_step_sequentially_application_upgrade_plan(
     mock_indicator.spinner_id = 1  # simulate running indicator
     upgrade_step = MagicMock(spec_set=ApplicationUpgradePlan("test-app upgrade plan"))
     upgrade_step.run = AsyncMock()
+    upgrade_step.expected_duration = None
     upgrade_step.parallel = False
     upgrade_step.description = "Upgrade plan for 'app' to 'victoria'"
 
@@ -235,7 +522,10 @@ async def test_run_step_in_parallel_upgrade_step(
     """Test running upgrade step and all sub-steps in parallel."""
     upgrade_step = MagicMock(spec_set=UpgradeStep())
     upgrade_step.run = AsyncMock()
+    upgrade_step.expected_duration = None
+    upgrade_step.skipped = False
     upgrade_step.parallel = True
+    upgrade_step.max_parallel = None
 
     await _run_step(upgrade_step, False, True)
 
@@ -252,12 +542,15 @@ async def test_run_step_in_parallel_upgrade_step(
 async def test_apply_step_abort(mock_run_step, mock_prompt_input, input_value):
     upgrade_step = AsyncMock(spec_set=UpgradeStep())
     upgrade_step.description = "Test Step"
+    upgrade_step.expected_duration = 60.0
     mock_prompt_input.return_value = input_value
 
     with pytest.raises(SystemExit):
         await apply_step(upgrade_step, True)
 
-    mock_prompt_input.assert_awaited_once_with(["Test Step", "Continue"])
+    mock_prompt_input.assert_awaited_once_with(
+        ["Test Step\nEstimated duration: 0:01:00", "Continue"]
+    )
     mock_run_step.assert_not_awaited()
 
 
@@ -268,11 +561,14 @@ async def test_apply_step_abort(mock_run_step, mock_prompt_input, input_value):
 async def test_apply_step_continue(mock_run_step, mock_prompt_input, input_value):
     upgrade_step = AsyncMock(spec_set=UpgradeStep())
     upgrade_step.description = "Test Step"
+    upgrade_step.expected_duration = 60.0
     mock_prompt_input.return_value = input_value
 
     await apply_step(upgrade_step, True)
 
-    mock_prompt_input.assert_awaited_once_with(["Test Step", "Continue"])
+    mock_prompt_input.assert_awaited_once_with(
+        ["Test Step\nEstimated duration: 0:01:00", "Continue"]
+    )
     mock_run_step.assert_awaited_once_with(upgrade_step, True, False)
 
 
@@ -296,24 +592,141 @@ async def test_apply_step_non_interactive(mock_run_step, mock_prompt_input):
 async def test_apply_step_nonsense(mock_print_and_debug, mock_run_step, mock_prompt_input):
     upgrade_step = AsyncMock(spec_set=UpgradeStep())
     upgrade_step.description = "Test Step"
+    upgrade_step.expected_duration = 60.0
     mock_prompt_input.side_effect = ["x", "n"]
 
     with pytest.raises(SystemExit, match="1"):
         await apply_step(upgrade_step, True)
 
     mock_prompt_input.assert_has_awaits(
-        [call(["Test Step", "Continue"]), call(["Test Step", "Continue"])]
+        [
+            call(["Test Step\nEstimated duration: 0:01:00", "Continue"]),
+            call(["Test Step\nEstimated duration: 0:01:00", "Continue"]),
+        ]
     )
     mock_run_step.assert_not_awaited()
     mock_print_and_debug.assert_called_once_with("No valid input provided!")
 
 
+@pytest.fixture
+def observer():
+    """Register step observer for the test."""
+    observer = MagicMock(spec_set=StepObserver)
+    add_observer(observer)
+    yield observer
+    remove_observer(observer)
+
+
+@pytest.mark.asyncio
+@patch("cou.steps.execute._run_step")
+async def test_apply_step_observer(mock_run_step, observer):
+    """Test observer notified about the step execution."""
+    upgrade_step = UpgradeStep("Test Step", coro=AsyncMock()())
+
+    await apply_step(upgrade_step, False)
+
+    observer.step_started.assert_called_once_with(upgrade_step)
+    observer.step_finished.assert_called_once_with(upgrade_step, None)
+
+
+@pytest.mark.asyncio
+async def test_run_step_coroutine_observer_running(observer):
+    """Test observer notified about the running coroutine once the machine lock is acquired."""
+    events = []
+
+    async def _work(name):
+        events.append(f"{name} started")
+        await asyncio.sleep(0.01)
+        events.append(f"{name} finished")
+
+    unit = MagicMock()
+    unit.machine = generate_cou_machine("0")
+    steps = [UnitUpgradeStep(name, coro=_work(name), unit=unit) for name in ["first", "second"]]
+    observer.step_running.side_effect = lambda step: events.append(f"{step.description} running")
+
+    await asyncio.gather(*(_run_step_coroutine(step) for step in steps))
+
+    assert events == [
+        "first running",
+        "first started",
+        "first finished",
+        "second running",
+        "second started",
+        "second finished",
+    ]
+
+
+@pytest.mark.asyncio
+@patch("cou.steps.execute._run_step")
+async def test_apply_step_observer_step_failed(mock_run_step, observer):
+    """Test observer notified about the failed step."""
+    upgrade_step = UpgradeStep("Test Step", coro=AsyncMock()())
+    mock_run_step.side_effect = exp_error = RunUpgradeError("failed")
+
+    with pytest.raises(RunUpgradeError, match="failed"):
+        await apply_step(upgrade_step, False)
+
+    observer.step_started.assert_called_once_with(upgrade_step)
+    observer.step_finished.assert_called_once_with(upgrade_step, exp_error)
+
+
+@pytest.mark.asyncio
+@patch("cou.steps.execute._run_step")
+async def test_apply_step_observer_failed(mock_run_step, observer):
+    """Test failing observer does not affect the step execution."""
+    upgrade_step = UpgradeStep("Test Step", coro=AsyncMock()())
+    observer.step_started.side_effect = ValueError("observer failed")
+
+    await apply_step(upgrade_step, False)
+
+    mock_run_step.assert_awaited_once_with(upgrade_step, False, False)
+    observer.step_finished.assert_called_once_with(upgrade_step, None)
+
+
+def test_notify_plan_changed(observer):
+    """Test observer notified about the step with changed sub-steps."""
+    plan = UpgradePlan("Test Plan")
+
+    notify_plan_changed(plan)
+
+    observer.plan_changed.assert_called_once_with(plan)
+
+
+@pytest.mark.asyncio
+@patch("cou.steps.execute.progress_indicator")
+async def test_apply_step_skipped(mock_indicator):
+    """Test applying step with skipped coroutine."""
+    coro, sub_coro = AsyncMock(), AsyncMock()
+    upgrade_step = UpgradeStep("Test Step", coro=coro())
+    upgrade_step.add_step(UpgradeStep("Test Sub-step", coro=sub_coro()))
+    upgrade_step.skip()
+
+    await apply_step(upgrade_step, False)
+
+    coro.assert_not_awaited()
+    sub_coro.assert_awaited_once_with()
+    mock_indicator.start.assert_called_once_with("Test Sub-step")
+
+
+@pytest.mark.asyncio
+@patch("cou.steps.execute._run_step")
+async def test_apply_step_all_skipped(mock_run_step):
+    """Test applying step with all coroutines skipped."""
+    upgrade_step = UpgradeStep("Test Step", coro=AsyncMock()())
+    upgrade_step.skip()
+
+    await apply_step(upgrade_step, False)
+
+    mock_run_step.assert_not_awaited()
+
+
 @pytest.mark.asyncio
 @patch("cou.steps.execute.prompt_input")
 @patch("cou.steps.execute._run_step")
 async def test_apply_application_upgrade_plan(mock_run_step, mock_prompt_input):
     expected_prompt = (
-        "Test plan\n\tTest pre-upgrade step\n\tTest upgrade step\n\t" + "Test post-upgrade step\n"
+        "Test plan\n\tTest pre-upgrade step\n\tTest upgrade step\n\t"
+        "Test post-upgrade step\n\nEstimated duration: 0:01:30"
     )
     upgrade_plan = ApplicationUpgradePlan("Test plan")
     upgrade_plan.sub_steps = [
@@ -321,6 +734,8 @@ async def test_apply_application_upgrade_plan(mock_run_step, mock_prompt_input):
         UpgradeStep(description="Test upgrade step", coro=AsyncMock()),
         PostUpgradeStep(description="Test post-upgrade step", coro=AsyncMock()),
     ]
+    for step in upgrade_plan.sub_steps:
+        step.expected_duration = 30.0
 
     mock_prompt_input.side_effect = ["y"]
     await apply_step(upgrade_plan, True)
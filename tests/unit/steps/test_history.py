@@ -0,0 +1,256 @@
+#  Copyright 2023 Canonical Limited
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Test history of the durations of the upgrade steps."""
+import sqlite3
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from cou.exceptions import RunUpgradeError
+from cou.steps import UpgradePlan, UpgradeStep
+from cou.steps.history import DurationHistory, StepKey, _get_step_keys
+from tests.unit.utils import backup, generate_app_upgrade_plan, generate_upgrade_plan
+
+
+async def upgrade_charm(application_name: str) -> None:
+    """Upgrade charm."""
+
+
+async def upgrade_packages(unit: str) -> None:
+    """Upgrade packages."""
+
+
+async def wait_for_idle(apps: list[str]) -> None:
+    """Wait for applications."""
+
+
+def _generate_app(name: str, charm: str, units: int) -> MagicMock:
+    """Generate application with units."""
+    app = MagicMock()
+    app.name = name
+    app.charm = charm
+    app.units = {f"{name}/{i}": MagicMock() for i in range(units)}
+    return app
+
+
+def _generate_plan(current: str = "ussuri", target: str = "victoria") -> UpgradePlan:
+    """Generate upgrade plan for keystone."""
+    app_plan = generate_app_upgrade_plan(
+        "keystone-ha",
+        UpgradeStep("Upgrade packages on 'keystone-ha/0'", coro=upgrade_packages("keystone-ha/0")),
+        UpgradeStep("Upgrade 'keystone-ha'", coro=upgrade_charm("keystone-ha")),
+        UpgradeStep("Wait for 'keystone-ha'", coro=wait_for_idle(["keystone-ha"])),
+        target=target,
+    )
+    return generate_upgrade_plan(app_plan, current=current, target=target)
+
+
+@pytest.fixture
+def apps():
+    """Analyzed applications."""
+    return [_generate_app("keystone-ha", "keystone", 3)]
+
+
+def test_get_step_keys(apps):
+    """Test getting keys of steps with coroutines."""
+    plan = _generate_plan()
+
+    keys = [key for _, key in _get_step_keys(plan, {app.name: app for app in apps})]
+
+    assert keys == [
+        StepKey("backup", "", "ussuri->victoria", 0),
+        StepKey("upgrade_packages", "keystone", "ussuri->victoria", 1),
+        StepKey("upgrade_charm", "keystone", "ussuri->victoria", 3),
+        StepKey("wait_for_idle", "keystone", "ussuri->victoria", 3),
+    ]
+
+
+def test_duration_history_predict(apps, tmp_path):
+    """Test predicting durations of steps from the median of recorded durations."""
+    history = DurationHistory(tmp_path / "history.sqlite")
+    for duration in (100.0, 300.0, 200.0):
+        history.record(StepKey("upgrade_charm", "keystone", "ussuri->victoria", 3), duration)
+    history.record(StepKey("upgrade_charm", "keystone", "victoria->wallaby", 3), 1000.0)
+    plan = _generate_plan()
+
+    assert history.set_expected_durations(plan, apps) == 1
+    assert plan.sub_steps[0].expected_duration is None
+    assert [step.expected_duration for step in plan.sub_steps[1].sub_steps] == [None, 200.0, None]
+
+
+def test_duration_history_read_error(apps, tmp_path):
+    """Test predicting durations of steps if the history can not be read."""
+    history = DurationHistory(tmp_path / "history.sqlite")
+    (tmp_path / "history.sqlite").touch()
+    plan = _generate_plan()
+
+    with patch("cou.steps.history.sqlite3.connect", side_effect=sqlite3.Error("locked")):
+        assert history.set_expected_durations(plan, apps) == 0
+
+    assert all(step.expected_duration is None for step, _ in _get_step_keys(plan, {}))
+
+
+def test_get_step_keys_unit(apps):
+    """Test getting key of step changing unit."""
+    unit = MagicMock()
+    unit.name = "keystone-ha/1"
+    plan = UpgradePlan("Upgrade cloud from 'ussuri' to 'victoria'")
+    plan.add_step(UpgradeStep("Pause 'keystone-ha/1'", coro=backup(), unit=unit))
+
+    keys = [key for _, key in _get_step_keys(plan, {app.name: app for app in apps})]
+
+    assert keys == [StepKey("backup", "keystone", "ussuri->victoria", 1)]
+
+
+def test_duration_history_no_database(apps, tmp_path):
+    """Test predicting durations of steps does not create the database."""
+    history = DurationHistory(tmp_path / "cou" / "history.sqlite")
+
+    assert history.set_expected_durations(_generate_plan(), apps) == 0
+    assert not (tmp_path / "cou").exists()
+
+
+def test_duration_history_single_connection(apps, tmp_path):
+    """Test the connection to the database is opened once and closed."""
+    history = DurationHistory(tmp_path / "history.sqlite")
+    key = StepKey("upgrade_charm", "keystone", "ussuri->victoria", 3)
+
+    with patch("cou.steps.history.sqlite3.connect", wraps=sqlite3.connect) as mock_connect:
+        history.record(key, 100.0)
+        history.record(key, 300.0)
+        assert history.set_expected_durations(_generate_plan(), apps) == 1
+
+    mock_connect.assert_called_once_with(tmp_path / "history.sqlite")
+    connection = history._connection
+    history.close()
+    history.close()  # closing closed history does nothing
+    with pytest.raises(sqlite3.ProgrammingError):
+        connection.execute("SELECT 1")
+
+
+def test_duration_history_create_table_error(tmp_path):
+    """Test closing the connection if the table of durations can not be created."""
+    history = DurationHistory(tmp_path / "history.sqlite")
+    connection = MagicMock(spec_set=sqlite3.Connection)
+    connection.execute.side_effect = sqlite3.Error("disk I/O error")
+
+    with patch("cou.steps.history.sqlite3.connect", return_value=connection):
+        with pytest.raises(sqlite3.Error, match="disk I/O error"):
+            history.record(StepKey("backup", "", "ussuri->victoria", 0), 10.0)
+
+    connection.close.assert_called_once_with()
+
+
+@pytest.mark.parametrize(
+    "error, canceled, exp_recorded",
+    [(None, False, True), (RunUpgradeError("failed"), False, False), (None, True, False)],
+)
+def test_duration_history_step_finished(error, canceled, exp_recorded, apps, tmp_path):
+    """Test recording duration of completed step."""
+    history = DurationHistory(tmp_path / "history.sqlite")
+    plan = _generate_plan()
+    history.set_expected_durations(plan, apps)
+    step = plan.sub_steps[1].sub_steps[1]
+
+    with patch("cou.steps.history.time.monotonic", side_effect=[10.0, 70.0]):
+        history.step_running(step)
+        if canceled:
+            step.cancel()
+        history.step_finished(step, error)
+
+    history.set_expected_durations(plan, apps)
+    assert step.expected_duration == (60.0 if exp_recorded else None)
+
+
+def test_duration_history_step_finished_plan_changed(apps, tmp_path):
+    """Test recording duration of step added to the plan after the durations were predicted."""
+    history = DurationHistory(tmp_path / "history.sqlite")
+    plan = _generate_plan()
+    history.set_expected_durations(plan, apps)
+    next_hop = _generate_plan("victoria", "wallaby")
+    plan.add_step(next_hop)
+    step = next_hop.sub_steps[1].sub_steps[1]
+
+    with patch("cou.steps.history.time.monotonic", side_effect=[10.0, 40.0]):
+        history.step_running(step)
+        history.step_finished(step, None)
+
+    next_plan = _generate_plan("victoria", "wallaby")
+    history.set_expected_durations(next_plan, apps)
+    assert next_plan.sub_steps[1].sub_steps[1].expected_duration == 30.0
+
+
+def test_duration_history_plan_changed(apps, tmp_path):
+    """Test predicting durations of steps added to the plan while it is run."""
+    history = DurationHistory(tmp_path / "history.sqlite")
+    history.record(StepKey("upgrade_charm", "keystone", "ussuri->victoria", 3), 100.0)
+    history.record(StepKey("upgrade_charm", "keystone", "victoria->wallaby", 3), 200.0)
+    plan = UpgradePlan("Upgrade cloud from 'ussuri' to 'wallaby'")
+    plan.add_step(_generate_plan())
+    history.set_expected_durations(plan, apps)
+    plan.sub_steps[0].sub_steps[1].sub_steps[1].expected_duration = None
+    next_hop = _generate_plan("victoria", "wallaby")
+    plan.add_step(next_hop)
+
+    history.plan_changed(next_hop)
+
+    assert plan.sub_steps[0].sub_steps[1].sub_steps[1].expected_duration is None
+    assert next_hop.sub_steps[1].sub_steps[1].expected_duration == 200.0
+
+
+def test_duration_history_plan_changed_no_plan(apps, tmp_path):
+    """Test predicting durations of steps added to the plan without predicted durations."""
+    history = DurationHistory(tmp_path / "history.sqlite")
+    history.record(StepKey("upgrade_charm", "keystone", "ussuri->victoria", 3), 100.0)
+    plan = _generate_plan()
+
+    history.plan_changed(plan)
+
+    assert all(step.expected_duration is None for step, _ in _get_step_keys(plan, {}))
+
+
+def test_duration_history_step_finished_write_error(apps, tmp_path):
+    """Test recording duration of completed step if the history can not be written."""
+    history = DurationHistory(tmp_path / "history.sqlite")
+    plan = _generate_plan()
+    history.set_expected_durations(plan, apps)
+    step = plan.sub_steps[0]
+
+    history.step_running(step)
+    with patch("cou.steps.history.sqlite3.connect", side_effect=sqlite3.Error("locked")):
+        history.step_finished(step, None)  # no exception raised
+
+
+def test_duration_history_step_finished_not_running(apps, tmp_path):
+    """Test finishing step without coroutine, which is not recorded."""
+    history = DurationHistory(tmp_path / "history.sqlite")
+    plan = _generate_plan()
+    history.set_expected_durations(plan, apps)
+
+    history.step_running(plan)
+    history.step_finished(plan, None)
+
+    assert not (tmp_path / "history.sqlite").exists()
+
+
+def test_duration_history_step_finished_unknown_step(apps, tmp_path):
+    """Test finishing step, which is not part of the plan."""
+    history = DurationHistory(tmp_path / "history.sqlite")
+    history.set_expected_durations(_generate_plan(), apps)
+    step = UpgradeStep("Back up MySQL databases", coro=backup())
+
+    history.step_running(step)
+    history.step_finished(step, None)
+
+    assert not (tmp_path / "history.sqlite").exists()
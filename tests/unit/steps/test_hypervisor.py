@@ -16,13 +16,23 @@
 
 from unittest.mock import AsyncMock, MagicMock, call, patch
 
+import pytest
+
 from cou.apps.base import OpenStackApplication
 from cou.apps.core import NovaCompute
-from cou.steps import HypervisorUpgradePlan, PostUpgradeStep, PreUpgradeStep, UpgradeStep
+from cou.steps import (
+    HypervisorUpgradePlan,
+    PackageUpgradeStep,
+    PostUpgradeStep,
+    PreUpgradeStep,
+    UnitUpgradeStep,
+    UpgradeStep,
+)
+from cou.steps.estimate import estimate_duration, order_by_duration
 from cou.steps.hypervisor import AZs, HypervisorGroup, HypervisorUpgradePlanner
 from cou.utils.juju_utils import Application, Machine, SubordinateUnit, Unit
 from cou.utils.openstack import OpenStackRelease
-from tests.unit.utils import dedent_plan, generate_cou_machine
+from tests.unit.utils import dedent_plan, generate_cou_machine, run_step
 
 
 def _generate_app(name: str) -> MagicMock:
@@ -126,13 +136,14 @@ def test_generate_post_upgrade_steps():
     assert steps == exp_steps
 
 
+@patch("cou.steps.hypervisor.order_by_duration")
 @patch("cou.steps.hypervisor.HypervisorUpgradePlanner.get_azs")
 @patch("cou.steps.hypervisor.HypervisorUpgradePlanner._upgrade_plan_sanity_checks")
 @patch("cou.steps.hypervisor.HypervisorUpgradePlanner._generate_pre_upgrade_steps")
 @patch("cou.steps.hypervisor.HypervisorUpgradePlanner._generate_upgrade_steps")
 @patch("cou.steps.hypervisor.HypervisorUpgradePlanner._generate_post_upgrade_steps")
 def test_generate_upgrade_plan(
-    post_upgrade_steps, upgrade_steps, pre_upgrade_steps, sanity_checks, get_azs
+    post_upgrade_steps, upgrade_steps, pre_upgrade_steps, sanity_checks, get_azs, order
 ):
     """Test generating upgrade plan with hypervisors upgrade planer."""
     target = OpenStackRelease("victoria")
@@ -153,6 +164,7 @@ def test_generate_upgrade_plan(
     pre_upgrade_steps.assert_has_calls([call(target, group1), call(target, group2)])
     upgrade_steps.assert_has_calls([call(target, False, group1), call(target, False, group2)])
     post_upgrade_steps.assert_has_calls([call(target, group1), call(target, group2)])
+    order.assert_called_once_with(plan)
 
     assert plan.description == "Upgrading all applications deployed on machines with hypervisor."
     assert len(plan.sub_steps) == 2
@@ -382,19 +394,17 @@ def test_hypervisor_azs_grouping_units_different_o7k_release():
 
 
 def test_hypervisor_upgrade_plan(model):
-    """Testing generating hypervisors upgrade plan."""
+    """Testing generating hypervisors upgrade plan with the AZs upgraded in their order."""
     target = OpenStackRelease("victoria")
     exp_plan = dedent_plan(
         """\
     Upgrading all applications deployed on machines with hypervisor.
         Upgrade plan for [cinder/0, nova-compute/0] in 'az-0' to 'victoria'
-            Upgrade software packages of 'cinder' from the current APT repositories
-                Ψ Upgrade software packages on unit 'cinder/0'
+            Upgrade software packages on machines: 0 from the current APT repositories
+                Ψ Upgrade software packages on machine '0' using unit 'cinder/0'
             Refresh 'cinder' to the latest revision of 'ussuri/stable'
             Wait for up to 300s for app 'cinder' to reach the idle state
             Disable nova-compute scheduler from unit: 'nova-compute/0'
-            Upgrade software packages of 'nova-compute' from the current APT repositories
-                Ψ Upgrade software packages on unit 'nova-compute/0'
             Refresh 'nova-compute' to the latest revision of 'ussuri/stable'
             Wait for up to 300s for app 'nova-compute' to reach the idle state
             Change charm config of 'cinder' 'action-managed-upgrade' from 'False' to 'True'
@@ -423,8 +433,8 @@ def test_hypervisor_upgrade_plan(model):
             Verify that the workload of 'nova-compute' has been upgraded on units: nova-compute/0
         Upgrade plan for [nova-compute/1] in 'az-1' to 'victoria'
             Disable nova-compute scheduler from unit: 'nova-compute/1'
-            Upgrade software packages of 'nova-compute' from the current APT repositories
-                Ψ Upgrade software packages on unit 'nova-compute/1'
+            Upgrade software packages on machines: 1 from the current APT repositories
+                Ψ Upgrade software packages on machine '1' using unit 'nova-compute/1'
             Refresh 'nova-compute' to the latest revision of 'ussuri/stable'
             Wait for up to 300s for app 'nova-compute' to reach the idle state
             Change charm config of 'nova-compute' 'action-managed-upgrade' from 'False' to 'True'
@@ -442,8 +452,8 @@ def test_hypervisor_upgrade_plan(model):
             Verify that the workload of 'nova-compute' has been upgraded on units: nova-compute/1
         Upgrade plan for [nova-compute/2] in 'az-2' to 'victoria'
             Disable nova-compute scheduler from unit: 'nova-compute/2'
-            Upgrade software packages of 'nova-compute' from the current APT repositories
-                Ψ Upgrade software packages on unit 'nova-compute/2'
+            Upgrade software packages on machines: 2 from the current APT repositories
+                Ψ Upgrade software packages on machine '2' using unit 'nova-compute/2'
             Refresh 'nova-compute' to the latest revision of 'ussuri/stable'
             Wait for up to 300s for app 'nova-compute' to reach the idle state
             Change charm config of 'nova-compute' 'action-managed-upgrade' from 'False' to 'True'
@@ -526,13 +536,11 @@ def test_hypervisor_upgrade_plan_single_machine(model):
         """\
     Upgrading all applications deployed on machines with hypervisor.
         Upgrade plan for [cinder/0, nova-compute/0] in 'az-0' to 'victoria'
-            Upgrade software packages of 'cinder' from the current APT repositories
-                Ψ Upgrade software packages on unit 'cinder/0'
+            Upgrade software packages on machines: 0 from the current APT repositories
+                Ψ Upgrade software packages on machine '0' using unit 'cinder/0'
             Refresh 'cinder' to the latest revision of 'ussuri/stable'
             Wait for up to 300s for app 'cinder' to reach the idle state
             Disable nova-compute scheduler from unit: 'nova-compute/0'
-            Upgrade software packages of 'nova-compute' from the current APT repositories
-                Ψ Upgrade software packages on unit 'nova-compute/0'
             Refresh 'nova-compute' to the latest revision of 'ussuri/stable'
             Wait for up to 300s for app 'nova-compute' to reach the idle state
             Change charm config of 'cinder' 'action-managed-upgrade' from 'False' to 'True'
@@ -616,6 +624,489 @@ def test_hypervisor_upgrade_plan_single_machine(model):
     assert str(plan) == exp_plan
 
 
+def test_hypervisor_upgrade_plan_pipeline(model):
+    """Testing generating hypervisors upgrade plan with machines upgraded in pipeline."""
+    target = OpenStackRelease("victoria")
+    exp_plan = dedent_plan(
+        """\
+    Upgrading all applications deployed on machines with hypervisor.
+        Upgrade plan for [cinder/0, nova-compute/0, nova-compute/1] in 'az-0' to 'victoria'
+            Upgrade software packages on machines: 0, 1 from the current APT repositories
+                Ψ Upgrade software packages on machine '0' using unit 'cinder/0'
+                Ψ Upgrade software packages on machine '1' using unit 'nova-compute/1'
+            Refresh 'cinder' to the latest revision of 'ussuri/stable'
+            Wait for up to 300s for app 'cinder' to reach the idle state
+            Refresh 'nova-compute' to the latest revision of 'ussuri/stable'
+            Wait for up to 300s for app 'nova-compute' to reach the idle state
+            Upgrade 'cinder' from 'ussuri/stable' to the new channel: 'victoria/stable'
+            Wait for up to 300s for app 'cinder' to reach the idle state
+            Change charm config of 'cinder' 'openstack-origin' to 'cloud:focal-victoria'
+            Upgrade 'nova-compute' from 'ussuri/stable' to the new channel: 'victoria/stable'
+            Wait for up to 300s for app 'nova-compute' to reach the idle state
+            Change charm config of 'nova-compute' 'source' to 'cloud:focal-victoria'
+            Upgrade machines 0, 1 in 'az-0' in pipeline, at most 1 at a time
+                Ψ Upgrade plan for machine '0'
+                    Disable nova-compute scheduler from unit: 'nova-compute/0'
+                    Upgrade plan for unit 'cinder/0'
+                        Pause the unit: 'cinder/0'
+                        Upgrade the unit: 'cinder/0'
+                        Resume the unit: 'cinder/0'
+                    Upgrade plan for unit 'nova-compute/0'
+                        Verify that unit 'nova-compute/0' has no VMs running
+                        ├── Pause the unit: 'nova-compute/0'
+                        ├── Upgrade the unit: 'nova-compute/0'
+                        ├── Resume the unit: 'nova-compute/0'
+                    Enable nova-compute scheduler from unit: 'nova-compute/0'
+                Ψ Upgrade plan for machine '1'
+                    Disable nova-compute scheduler from unit: 'nova-compute/1'
+                    Upgrade plan for unit 'nova-compute/1'
+                        Verify that unit 'nova-compute/1' has no VMs running
+                        ├── Pause the unit: 'nova-compute/1'
+                        ├── Upgrade the unit: 'nova-compute/1'
+                        ├── Resume the unit: 'nova-compute/1'
+                    Enable nova-compute scheduler from unit: 'nova-compute/1'
+            Wait for up to 300s for app 'cinder' to reach the idle state
+            Verify that the workload of 'cinder' has been upgraded on units: cinder/0
+            Wait for up to 2400s for model 'test_model' to reach the idle state
+            Verify that the workload of 'nova-compute' has been upgraded on units: \
+nova-compute/0, nova-compute/1
+    """
+    )
+    machines = {f"{i}": generate_cou_machine(f"{i}", "az-0") for i in range(2)}
+    cinder = OpenStackApplication(
+        name="cinder",
+        can_upgrade_to="ussuri/stable",
+        charm="cinder",
+        channel="ussuri/stable",
+        config={
+            "openstack-origin": {"value": "distro"},
+            "action-managed-upgrade": {"value": True},
+        },
+        machines={"0": machines["0"]},
+        model=model,
+        origin="ch",
+        series="focal",
+        subordinate_to=[],
+        units={
+            "cinder/0": Unit(
+                name="cinder/0",
+                workload_version="16.4.2",
+                machine=machines["0"],
+            )
+        },
+        workload_version="16.4.2",
+    )
+    nova_compute = NovaCompute(
+        name="nova-compute",
+        can_upgrade_to="ussuri/stable",
+        charm="nova-compute",
+        channel="ussuri/stable",
+        config={"source": {"value": "distro"}, "action-managed-upgrade": {"value": True}},
+        machines=machines,
+        model=model,
+        origin="ch",
+        series="focal",
+        subordinate_to=[],
+        units={
+            f"nova-compute/{unit}": Unit(
+                name=f"nova-compute/{unit}",
+                workload_version="21.0.0",
+                machine=machines[f"{unit}"],
+            )
+            for unit in range(2)
+        },
+        workload_version="21.0.0",
+    )
+
+    planner = HypervisorUpgradePlanner(
+        [cinder, nova_compute], list(machines.values()), pipeline_window=1
+    )
+    plan = planner.generate_upgrade_plan(target, False)
+
+    assert str(plan) == exp_plan
+    assert plan.sub_steps[0].sub_steps[11].max_parallel == 1
+
+
+def test_hypervisor_generate_pipeline_step_no_units():
+    """Test generating pipeline of machines without steps of individual units."""
+    planner = HypervisorUpgradePlanner([], [], pipeline_window=2)
+
+    step = planner._generate_pipeline_step(HypervisorGroup("az-0", {}), [])
+
+    assert not step
+
+
+def test_hypervisor_generate_pipeline_step_longest_first():
+    """Test ordering pipeline of machines with the longest machine stage first."""
+    machines = [generate_cou_machine(f"{i}", "az-0") for i in range(2)]
+    units = [Unit(f"nova-compute/{i}", machines[i], "21.0.0") for i in range(2)]
+    units.append(Unit("cinder/0", machines[1], "16.4.2"))
+    steps = [
+        UnitUpgradeStep(f"Upgrade '{unit.name}'", coro=run_step(unit.name), unit=unit)
+        for unit in units
+    ]
+    planner = HypervisorUpgradePlanner([], [], pipeline_window=1)
+
+    step = planner._generate_pipeline_step(HypervisorGroup("az-0", {}), steps)
+    order_by_duration(step)
+
+    assert [sub_step.description for sub_step in step.sub_steps] == [
+        "Upgrade plan for machine '1'",
+        "Upgrade plan for machine '0'",
+    ]
+    assert estimate_duration(step) == 90.0
+
+
+def test_hypervisor_split_steps():
+    """Test splitting steps to steps of whole applications and of individual units."""
+    unit = Unit("nova-compute/0", generate_cou_machine("0", "az-0"), "21.0.0")
+    app_step = PreUpgradeStep("app", coro=AsyncMock())
+    unit_step = PreUpgradeStep("unit", coro=AsyncMock(), unit=unit)
+    units_step = UpgradeStep("units", parallel=True)
+    units_step.add_step(UnitUpgradeStep("unit plan", coro=AsyncMock(), unit=unit))
+    packages_step = PackageUpgradeStep("packages", parallel=True)
+    packages_step.add_step(UnitUpgradeStep("unit packages", coro=AsyncMock(), unit=unit))
+    planner = HypervisorUpgradePlanner([], [])
+
+    app_steps, units_steps = planner._split_steps([app_step, unit_step, units_step, packages_step])
+
+    assert app_steps == [app_step, packages_step]
+    assert units_steps == [unit_step, units_step]
+
+
+def test_hypervisor_upgrade_plan_parallel_azs(model):
+    """Testing generating hypervisors upgrade plan with AZs upgraded at the same time."""
+    target = OpenStackRelease("victoria")
+    exp_plan = dedent_plan(
+        """\
+    Upgrading all applications deployed on machines with hypervisor.
+        Upgrade software packages on machines: 0, 1, 2 from the current APT repositories
+            Ψ Upgrade software packages on machine '0' using unit 'cinder/0'
+            Ψ Upgrade software packages on machine '1' using unit 'nova-compute/1'
+            Ψ Upgrade software packages on machine '2' using unit 'nova-compute/2'
+        Refresh 'cinder' to the latest revision of 'ussuri/stable'
+        Wait for up to 300s for app 'cinder' to reach the idle state
+        Refresh 'nova-compute' to the latest revision of 'ussuri/stable'
+        Wait for up to 300s for app 'nova-compute' to reach the idle state
+        Upgrade 'cinder' from 'ussuri/stable' to the new channel: 'victoria/stable'
+        Wait for up to 300s for app 'cinder' to reach the idle state
+        Change charm config of 'cinder' 'openstack-origin' to 'cloud:focal-victoria'
+        Upgrade 'nova-compute' from 'ussuri/stable' to the new channel: 'victoria/stable'
+        Wait for up to 300s for app 'nova-compute' to reach the idle state
+        Change charm config of 'nova-compute' 'source' to 'cloud:focal-victoria'
+        Upgrade hypervisors in AZs 'az-0', 'az-1', 'az-2' in parallel, at most 2 at a time
+            Ψ Upgrade plan for [cinder/0, nova-compute/0] in 'az-0' to 'victoria'
+                Disable nova-compute scheduler from unit: 'nova-compute/0'
+                Upgrade plan for units: cinder/0
+                    Ψ Upgrade plan for unit 'cinder/0'
+                        Pause the unit: 'cinder/0'
+                        Upgrade the unit: 'cinder/0'
+                        Resume the unit: 'cinder/0'
+                Upgrade plan for units: nova-compute/0
+                    Ψ Upgrade plan for unit 'nova-compute/0'
+                        Verify that unit 'nova-compute/0' has no VMs running
+                        ├── Pause the unit: 'nova-compute/0'
+                        ├── Upgrade the unit: 'nova-compute/0'
+                        ├── Resume the unit: 'nova-compute/0'
+                Enable nova-compute scheduler from unit: 'nova-compute/0'
+            Ψ Upgrade plan for [nova-compute/1] in 'az-1' to 'victoria'
+                Disable nova-compute scheduler from unit: 'nova-compute/1'
+                Upgrade plan for units: nova-compute/1
+                    Ψ Upgrade plan for unit 'nova-compute/1'
+                        Verify that unit 'nova-compute/1' has no VMs running
+                        ├── Pause the unit: 'nova-compute/1'
+                        ├── Upgrade the unit: 'nova-compute/1'
+                        ├── Resume the unit: 'nova-compute/1'
+                Enable nova-compute scheduler from unit: 'nova-compute/1'
+            Ψ Upgrade plan for [nova-compute/2] in 'az-2' to 'victoria'
+                Disable nova-compute scheduler from unit: 'nova-compute/2'
+                Upgrade plan for units: nova-compute/2
+                    Ψ Upgrade plan for unit 'nova-compute/2'
+                        Verify that unit 'nova-compute/2' has no VMs running
+                        ├── Pause the unit: 'nova-compute/2'
+                        ├── Upgrade the unit: 'nova-compute/2'
+                        ├── Resume the unit: 'nova-compute/2'
+                Enable nova-compute scheduler from unit: 'nova-compute/2'
+        Wait for up to 300s for app 'cinder' to reach the idle state
+        Verify that the workload of 'cinder' has been upgraded on units: cinder/0
+        Wait for up to 2400s for model 'test_model' to reach the idle state
+        Verify that the workload of 'nova-compute' has been upgraded on units: nova-compute/0, \
+nova-compute/1, nova-compute/2
+    """
+    )
+    machines = {f"{i}": generate_cou_machine(f"{i}", f"az-{i}") for i in range(3)}
+    cinder = OpenStackApplication(
+        name="cinder",
+        can_upgrade_to="ussuri/stable",
+        charm="cinder",
+        channel="ussuri/stable",
+        config={
+            "openstack-origin": {"value": "distro"},
+            "action-managed-upgrade": {"value": True},
+        },
+        machines={"0": machines["0"]},
+        model=model,
+        origin="ch",
+        series="focal",
+        subordinate_to=[],
+        units={
+            "cinder/0": Unit(
+                name="cinder/0",
+                workload_version="16.4.2",
+                machine=machines["0"],
+            )
+        },
+        workload_version="16.4.2",
+    )
+    nova_compute = NovaCompute(
+        name="nova-compute",
+        can_upgrade_to="ussuri/stable",
+        charm="nova-compute",
+        channel="ussuri/stable",
+        config={"source": {"value": "distro"}, "action-managed-upgrade": {"value": True}},
+        machines=machines,
+        model=model,
+        origin="ch",
+        series="focal",
+        subordinate_to=[],
+        units={
+            f"nova-compute/{unit}": Unit(
+                name=f"nova-compute/{unit}",
+                workload_version="21.0.0",
+                machine=machines[f"{unit}"],
+            )
+            for unit in range(3)
+        },
+        workload_version="21.0.0",
+    )
+
+    planner = HypervisorUpgradePlanner(
+        [cinder, nova_compute], list(machines.values()), max_parallel_azs=5
+    )
+    plan = planner.generate_upgrade_plan(target, False)
+
+    assert str(plan) == exp_plan
+    assert plan.sub_steps[11].max_parallel == 2
+
+
+def test_hypervisor_upgrade_plan_parallel_azs_pipeline(model):
+    """Testing generating hypervisors upgrade plan with AZs upgraded in parallel in pipeline."""
+    target = OpenStackRelease("victoria")
+    exp_azs_plan = dedent_plan(
+        """\
+    Upgrade hypervisors in AZs 'az-0', 'az-1', 'az-2' in parallel, at most 2 at a time
+        Ψ Upgrade plan for [nova-compute/0, nova-compute/1] in 'az-0' to 'victoria'
+            Upgrade machines 0, 1 in 'az-0' in pipeline, at most 1 at a time
+                Ψ Upgrade plan for machine '0'
+                    Disable nova-compute scheduler from unit: 'nova-compute/0'
+                    Upgrade plan for unit 'nova-compute/0'
+                        Verify that unit 'nova-compute/0' has no VMs running
+                        ├── Pause the unit: 'nova-compute/0'
+                        ├── Upgrade the unit: 'nova-compute/0'
+                        ├── Resume the unit: 'nova-compute/0'
+                    Enable nova-compute scheduler from unit: 'nova-compute/0'
+                Ψ Upgrade plan for machine '1'
+                    Disable nova-compute scheduler from unit: 'nova-compute/1'
+                    Upgrade plan for unit 'nova-compute/1'
+                        Verify that unit 'nova-compute/1' has no VMs running
+                        ├── Pause the unit: 'nova-compute/1'
+                        ├── Upgrade the unit: 'nova-compute/1'
+                        ├── Resume the unit: 'nova-compute/1'
+                    Enable nova-compute scheduler from unit: 'nova-compute/1'
+        Ψ Upgrade plan for [nova-compute/2] in 'az-1' to 'victoria'
+            Upgrade machines 2 in 'az-1' in pipeline, at most 1 at a time
+                Ψ Upgrade plan for machine '2'
+                    Disable nova-compute scheduler from unit: 'nova-compute/2'
+                    Upgrade plan for unit 'nova-compute/2'
+                        Verify that unit 'nova-compute/2' has no VMs running
+                        ├── Pause the unit: 'nova-compute/2'
+                        ├── Upgrade the unit: 'nova-compute/2'
+                        ├── Resume the unit: 'nova-compute/2'
+                    Enable nova-compute scheduler from unit: 'nova-compute/2'
+        Ψ Upgrade plan for [nova-compute/3] in 'az-2' to 'victoria'
+            Upgrade machines 3 in 'az-2' in pipeline, at most 1 at a time
+                Ψ Upgrade plan for machine '3'
+                    Disable nova-compute scheduler from unit: 'nova-compute/3'
+                    Upgrade plan for unit 'nova-compute/3'
+                        Verify that unit 'nova-compute/3' has no VMs running
+                        ├── Pause the unit: 'nova-compute/3'
+                        ├── Upgrade the unit: 'nova-compute/3'
+                        ├── Resume the unit: 'nova-compute/3'
+                    Enable nova-compute scheduler from unit: 'nova-compute/3'
+    """
+    )
+    machines = {
+        f"{i}": generate_cou_machine(f"{i}", f"az-{az}") for i, az in enumerate([0, 0, 1, 2])
+    }
+    nova_compute = NovaCompute(
+        name="nova-compute",
+        can_upgrade_to="ussuri/stable",
+        charm="nova-compute",
+        channel="ussuri/stable",
+        config={"source": {"value": "distro"}, "action-managed-upgrade": {"value": True}},
+        machines=machines,
+        model=model,
+        origin="ch",
+        series="focal",
+        subordinate_to=[],
+        units={
+            f"nova-compute/{unit}": Unit(
+                name=f"nova-compute/{unit}",
+                workload_version="21.0.0",
+                machine=machines[f"{unit}"],
+            )
+            for unit in range(4)
+        },
+        workload_version="21.0.0",
+    )
+
+    planner = HypervisorUpgradePlanner(
+        [nova_compute], list(machines.values()), pipeline_window=1, max_parallel_azs=2
+    )
+    with patch.object(
+        nova_compute, "upgrade_plan_sanity_checks", wraps=nova_compute.upgrade_plan_sanity_checks
+    ) as mock_sanity_checks:
+        plan = planner.generate_upgrade_plan(target, False)
+
+    azs_plan = next(step for step in plan.sub_steps if step.description.startswith("Upgrade hyp"))
+    assert str(azs_plan) == exp_azs_plan
+    # the steps are generated only once for all AZs
+    mock_sanity_checks.assert_called_once_with(target)
+
+
+@pytest.mark.parametrize(
+    "max_parallel_azs, azs, cloud_azs, exp_max_parallel_azs",
+    [
+        (None, ["az-0", "az-1", "az-2"], [], {}),
+        (1, ["az-0", "az-1", "az-2"], [], {}),
+        (2, ["az-0", "az-1", "az-2"], [], {"": 2}),
+        (5, ["az-0", "az-1", "az-2"], [], {"": 2}),
+        (5, ["az-0", "az-1"], [], {}),
+        (5, ["az-0"], [], {}),
+        # AZs without machines to upgrade keep serving
+        (5, ["az-0", "az-1"], ["az-0", "az-1", "az-2"], {"": 2}),
+        (5, ["region-a/az-0", "region-a/az-1", "region-b/az-2"], [], {}),
+        (
+            5,
+            ["region-a/az-0", "region-a/az-1", "region-a/az-2", "region-b/az-3", "region-b/az-4"],
+            [],
+            {"region-a": 2, "region-b": 1},
+        ),
+    ],
+)
+def test_hypervisor_get_regions_max_parallel_azs(
+    max_parallel_azs, azs, cloud_azs, exp_max_parallel_azs
+):
+    """Test getting number of AZs of each region upgraded at the same time."""
+    machines = [
+        generate_cou_machine(f"{i}", az.rpartition("/")[2], region=az.rpartition("/")[0] or None)
+        for i, az in enumerate(azs)
+    ]
+    cloud_machines = machines + [
+        generate_cou_machine(f"{i}", az) for i, az in enumerate(cloud_azs, start=len(azs))
+    ]
+    planner = HypervisorUpgradePlanner(
+        [], machines, max_parallel_azs=max_parallel_azs, cloud_machines=cloud_machines
+    )
+    groups = AZs()
+    for machine in machines:
+        groups[machine.az].app_units["nova-compute"].append(MagicMock())
+        groups[machine.az].region = machine.region or ""
+
+    assert planner._get_regions_max_parallel_azs(groups) == exp_max_parallel_azs
+
+
+def test_hypervisor_upgrade_plan_parallel_azs_regions(model):
+    """Testing generating hypervisors upgrade plan with AZs of several regions."""
+    target = OpenStackRelease("victoria")
+    exp_regions_plan = dedent_plan(
+        """\
+    Upgrade hypervisors in regions 'region-a', 'region-b' in parallel
+        Ψ Upgrade hypervisors in AZs 'az-0', 'az-1', 'az-2' of region 'region-a' in parallel, \
+at most 2 at a time
+            Ψ Upgrade plan for [nova-compute/0] in 'az-0' to 'victoria'
+                Disable nova-compute scheduler from unit: 'nova-compute/0'
+                Upgrade plan for units: nova-compute/0
+                    Ψ Upgrade plan for unit 'nova-compute/0'
+                        Verify that unit 'nova-compute/0' has no VMs running
+                        ├── Pause the unit: 'nova-compute/0'
+                        ├── Upgrade the unit: 'nova-compute/0'
+                        ├── Resume the unit: 'nova-compute/0'
+                Enable nova-compute scheduler from unit: 'nova-compute/0'
+            Ψ Upgrade plan for [nova-compute/1] in 'az-1' to 'victoria'
+                Disable nova-compute scheduler from unit: 'nova-compute/1'
+                Upgrade plan for units: nova-compute/1
+                    Ψ Upgrade plan for unit 'nova-compute/1'
+                        Verify that unit 'nova-compute/1' has no VMs running
+                        ├── Pause the unit: 'nova-compute/1'
+                        ├── Upgrade the unit: 'nova-compute/1'
+                        ├── Resume the unit: 'nova-compute/1'
+                Enable nova-compute scheduler from unit: 'nova-compute/1'
+            Ψ Upgrade plan for [nova-compute/2] in 'az-2' to 'victoria'
+                Disable nova-compute scheduler from unit: 'nova-compute/2'
+                Upgrade plan for units: nova-compute/2
+                    Ψ Upgrade plan for unit 'nova-compute/2'
+                        Verify that unit 'nova-compute/2' has no VMs running
+                        ├── Pause the unit: 'nova-compute/2'
+                        ├── Upgrade the unit: 'nova-compute/2'
+                        ├── Resume the unit: 'nova-compute/2'
+                Enable nova-compute scheduler from unit: 'nova-compute/2'
+        Ψ Upgrade hypervisors in AZs 'az-3', 'az-4' of region 'region-b' in parallel, at most 1 \
+at a time
+            Ψ Upgrade plan for [nova-compute/3] in 'az-3' to 'victoria'
+                Disable nova-compute scheduler from unit: 'nova-compute/3'
+                Upgrade plan for units: nova-compute/3
+                    Ψ Upgrade plan for unit 'nova-compute/3'
+                        Verify that unit 'nova-compute/3' has no VMs running
+                        ├── Pause the unit: 'nova-compute/3'
+                        ├── Upgrade the unit: 'nova-compute/3'
+                        ├── Resume the unit: 'nova-compute/3'
+                Enable nova-compute scheduler from unit: 'nova-compute/3'
+            Ψ Upgrade plan for [nova-compute/4] in 'az-4' to 'victoria'
+                Disable nova-compute scheduler from unit: 'nova-compute/4'
+                Upgrade plan for units: nova-compute/4
+                    Ψ Upgrade plan for unit 'nova-compute/4'
+                        Verify that unit 'nova-compute/4' has no VMs running
+                        ├── Pause the unit: 'nova-compute/4'
+                        ├── Upgrade the unit: 'nova-compute/4'
+                        ├── Resume the unit: 'nova-compute/4'
+                Enable nova-compute scheduler from unit: 'nova-compute/4'
+    """
+    )
+    machines = {
+        f"{i}": generate_cou_machine(f"{i}", f"az-{i}", region=region)
+        for i, region in enumerate(["region-a"] * 3 + ["region-b"] * 2)
+    }
+    nova_compute = NovaCompute(
+        name="nova-compute",
+        can_upgrade_to="ussuri/stable",
+        charm="nova-compute",
+        channel="ussuri/stable",
+        config={"source": {"value": "distro"}, "action-managed-upgrade": {"value": False}},
+        machines=machines,
+        model=model,
+        origin="ch",
+        series="focal",
+        subordinate_to=[],
+        units={
+            f"nova-compute/{unit}": Unit(
+                name=f"nova-compute/{unit}",
+                workload_version="21.0.0",
+                machine=machines[f"{unit}"],
+            )
+            for unit in range(5)
+        },
+        workload_version="21.0.0",
+    )
+
+    planner = HypervisorUpgradePlanner([nova_compute], list(machines.values()), max_parallel_azs=3)
+    plan = planner.generate_upgrade_plan(target, False)
+
+    regions_plan = next(step for step in plan.sub_steps if "regions" in step.description)
+    assert str(regions_plan) == exp_regions_plan
+    assert [step.max_parallel for step in regions_plan.sub_steps] == [2, 1]
+
+
 def test_hypervisor_upgrade_plan_some_units_upgraded(model):
     """Testing generating hypervisors upgrade plan partially upgraded."""
     target = OpenStackRelease("victoria")
@@ -623,8 +1114,8 @@ def test_hypervisor_upgrade_plan_some_units_upgraded(model):
         """\
     Upgrading all applications deployed on machines with hypervisor.
         Upgrade plan for [cinder/1] in 'az-1' to 'victoria'
-            Upgrade software packages of 'cinder' from the current APT repositories
-                Ψ Upgrade software packages on unit 'cinder/1'
+            Upgrade software packages on machines: 1 from the current APT repositories
+                Ψ Upgrade software packages on machine '1' using unit 'cinder/1'
             Upgrade plan for units: cinder/1
                 Ψ Upgrade plan for unit 'cinder/1'
                     Pause the unit: 'cinder/1'
@@ -633,11 +1124,9 @@ def test_hypervisor_upgrade_plan_some_units_upgraded(model):
             Wait for up to 300s for app 'cinder' to reach the idle state
             Verify that the workload of 'cinder' has been upgraded on units: cinder/1
         Upgrade plan for [cinder/2, nova-compute/2] in 'az-2' to 'victoria'
-            Upgrade software packages of 'cinder' from the current APT repositories
-                Ψ Upgrade software packages on unit 'cinder/2'
+            Upgrade software packages on machines: 2 from the current APT repositories
+                Ψ Upgrade software packages on machine '2' using unit 'cinder/2'
             Disable nova-compute scheduler from unit: 'nova-compute/2'
-            Upgrade software packages of 'nova-compute' from the current APT repositories
-                Ψ Upgrade software packages on unit 'nova-compute/2'
             Upgrade plan for units: cinder/2
                 Ψ Upgrade plan for unit 'cinder/2'
                     Pause the unit: 'cinder/2'
@@ -742,3 +1231,40 @@ def test_hypervisor_upgrade_plan_some_units_upgraded(model):
     plan = planner.generate_upgrade_plan(target, False)
 
     assert str(plan) == exp_plan
+
+
+@patch("cou.steps.hypervisor.upgrade_packages")
+def test_hypervisor_generate_packages_upgrade_step(upgrade_packages):
+    """Test generating single software packages upgrade step per machine."""
+    machines = {f"{i}": generate_cou_machine(f"{i}", "az-0") for i in range(2)}
+    mysql = _generate_app("mysql")
+    mysql.packages_to_hold = ["mysql-server-core-8.0"]
+    nova_compute = _generate_app("nova-compute")
+    nova_compute.packages_to_hold = None
+    group = HypervisorGroup(
+        name="az-0",
+        app_units={
+            "mysql": [Unit("mysql/0", machines["0"], "8.0")],
+            "nova-compute": [
+                Unit("nova-compute/0", machines["0"], "21.0.0"),
+                Unit("nova-compute/1", machines["1"], "21.0.0"),
+            ],
+        },
+    )
+    planner = HypervisorUpgradePlanner([mysql, nova_compute], list(machines.values()))
+
+    step = planner._generate_packages_upgrade_step(group)
+
+    assert isinstance(step, PackageUpgradeStep)
+    assert step.parallel is True
+    assert [sub_step.description for sub_step in step.sub_steps] == [
+        "Upgrade software packages on machine '0' using unit 'mysql/0'",
+        "Upgrade software packages on machine '1' using unit 'nova-compute/1'",
+    ]
+    assert [sub_step.machine_id for sub_step in step.sub_steps] == ["0", "1"]
+    upgrade_packages.assert_has_calls(
+        [
+            call("mysql/0", mysql.model, ["mysql-server-core-8.0"]),
+            call("nova-compute/1", mysql.model, None),
+        ]
+    )
@@ -0,0 +1,244 @@
+#  Copyright 2023 Canonical Limited
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Test journal of the completed upgrade steps."""
+import json
+from unittest.mock import patch
+
+import pytest
+
+from cou.exceptions import RunUpgradeError
+from cou.steps import PreUpgradeStep, UpgradePlan, UpgradeStep
+from cou.steps.journal import StepJournal, _get_step_keys
+from tests.unit.utils import generate_app_upgrade_plan, generate_upgrade_plan, run_step
+
+MODEL_UUID = "8c0a9f5d-2e4b-4c1f-9f3e-6b1d2a7c5e90"
+
+
+@pytest.fixture(autouse=True)
+def journal_dir(tmp_path):
+    """Journal directory in temporary path."""
+    with patch("cou.steps.journal.COU_DIR_JOURNAL", tmp_path / "journal"):
+        yield tmp_path / "journal"
+
+
+def _generate_plan(*apps: str) -> UpgradePlan:
+    """Generate upgrade plan for applications."""
+    return generate_upgrade_plan(
+        *(
+            generate_app_upgrade_plan(
+                app,
+                UpgradeStep(f"Upgrade '{app}'", coro=run_step("upgrade")),
+                UpgradeStep(f"Wait for '{app}'", coro=run_step("wait")),
+                UpgradeStep(f"Wait for '{app}'", coro=run_step("wait")),
+            )
+            for app in apps
+        )
+    )
+
+
+def test_get_step_keys():
+    """Test getting keys of steps."""
+    plan = _generate_plan("keystone", "cinder")
+
+    keys = [key for _, key in _get_step_keys(plan)]
+    steps = [step for step, _ in _get_step_keys(plan)]
+
+    assert steps == [
+        plan,
+        plan.sub_steps[0],
+        plan.sub_steps[1],
+        *plan.sub_steps[1].sub_steps,
+        plan.sub_steps[2],
+        *plan.sub_steps[2].sub_steps,
+    ]
+    # keys are unique, even for steps with the same description
+    assert len(set(keys)) == len(steps)
+    # keys are deterministic and do not depend on other applications
+    assert keys == [key for _, key in _get_step_keys(_generate_plan("keystone", "cinder"))]
+    assert keys[:6] == [key for _, key in _get_step_keys(_generate_plan("keystone"))]
+
+
+def test_journal_fingerprint():
+    """Test plan fingerprint."""
+    journal = StepJournal(MODEL_UUID, _generate_plan("keystone"))
+
+    assert journal.fingerprint == StepJournal(MODEL_UUID, _generate_plan("keystone")).fingerprint
+    assert journal.fingerprint != StepJournal(MODEL_UUID, _generate_plan("cinder")).fingerprint
+
+
+def test_journal_records(journal_dir):
+    """Test recording the run to journal."""
+    plan = _generate_plan("keystone")
+    journal = StepJournal(MODEL_UUID, plan)
+
+    journal.start(resume=False)
+    journal.step_finished(plan.sub_steps[0], None)
+    journal.step_finished(plan.sub_steps[1], None)  # step without coroutine
+    journal.step_finished(plan.sub_steps[1].sub_steps[0], RunUpgradeError("failed"))
+    journal.finish()
+
+    records = [json.loads(line) for line in (journal_dir / f"{MODEL_UUID}.jsonl").open()]
+    assert [record["event"] for record in records] == ["start", "step", "finish"]
+    assert all(record["plan"] == journal.fingerprint for record in records)
+    assert records[0]["resume"] is False
+    assert records[1]["description"] == "Back up MySQL databases"
+
+
+def test_journal_records_replaced_step(journal_dir):
+    """Test recording step, which replaced other step of the plan during the run."""
+    plan = _generate_plan("keystone")
+    journal = StepJournal(MODEL_UUID, plan)
+    old_key = journal._get_key(plan.sub_steps[1])
+    plan.sub_steps[1] = _generate_plan("keystone").sub_steps[1]
+
+    journal.start(resume=False)
+    journal.step_finished(plan.sub_steps[1].sub_steps[0], None)
+
+    records = [json.loads(line) for line in (journal_dir / f"{MODEL_UUID}.jsonl").open()]
+    assert records[1]["description"] == "Upgrade 'keystone'"
+    assert journal._get_key(plan.sub_steps[1]) == old_key
+
+
+def test_journal_get_interrupted_run_no_journal():
+    """Test getting interrupted run without journal."""
+    journal = StepJournal(MODEL_UUID, _generate_plan("keystone"))
+
+    assert journal.get_interrupted_run() is None
+
+
+def test_journal_get_interrupted_run_finished():
+    """Test getting interrupted run if the last run was finished."""
+    plan = _generate_plan("keystone")
+    journal = StepJournal(MODEL_UUID, plan)
+    journal.start(resume=False)
+    journal.step_finished(plan.sub_steps[0], None)
+    journal.finish()
+
+    assert journal.get_interrupted_run() is None
+
+
+def test_journal_get_interrupted_run():
+    """Test getting interrupted run resumed multiple times."""
+    plan = _generate_plan("keystone")
+    keys = dict((id(step), key) for step, key in _get_step_keys(plan))
+    journal = StepJournal(MODEL_UUID, plan)
+    # finished run is ignored
+    journal.start(resume=False)
+    journal.step_finished(plan.sub_steps[1].sub_steps[2], None)
+    journal.finish()
+    # interrupted run
+    journal.start(resume=False)
+    journal.step_finished(plan.sub_steps[0], None)
+    # run resuming the interrupted run and interrupted again
+    journal.start(resume=True)
+    journal.step_finished(plan.sub_steps[1].sub_steps[0], None)
+
+    assert journal.get_interrupted_run() == (
+        journal.fingerprint,
+        {keys[id(plan.sub_steps[0])], keys[id(plan.sub_steps[1].sub_steps[0])]},
+    )
+
+
+def test_journal_get_interrupted_run_corrupted(journal_dir):
+    """Test getting interrupted run from journal with corrupted record."""
+    plan = _generate_plan("keystone")
+    journal = StepJournal(MODEL_UUID, plan)
+    journal.start(resume=False)
+    with open(journal_dir / f"{MODEL_UUID}.jsonl", "a", encoding="utf-8") as file:
+        file.write('{"event": "st')
+
+    assert journal.get_interrupted_run() == (journal.fingerprint, set())
+
+
+def test_journal_resume():
+    """Test resuming interrupted run with the same plan."""
+    plan = _generate_plan("keystone")
+    journal = StepJournal(MODEL_UUID, plan)
+    journal.start(resume=False)
+    journal.step_finished(plan.sub_steps[0], None)
+    journal.step_finished(plan.sub_steps[1].sub_steps[0], None)
+
+    new_plan = _generate_plan("keystone")
+    skipped = StepJournal(MODEL_UUID, new_plan).resume()
+
+    assert skipped == 2
+    assert new_plan.sub_steps[0].skipped is True
+    assert [step.skipped for step in new_plan.sub_steps[1].sub_steps] == [True, False, False]
+
+
+def test_journal_resume_changed_plan():
+    """Test resuming interrupted run with changed plan."""
+    plan = _generate_plan("keystone", "cinder")
+    journal = StepJournal(MODEL_UUID, plan)
+    journal.start(resume=False)
+    journal.step_finished(plan.sub_steps[0], None)
+    journal.step_finished(plan.sub_steps[1].sub_steps[0], None)
+    journal.step_finished(plan.sub_steps[2].sub_steps[0], None)
+
+    # keystone was upgraded and it is not part of the plan anymore
+    new_plan = _generate_plan("cinder")
+    new_plan.sub_steps[1].sub_steps[0].description = "Upgrade 'cinder' again"
+    skipped = StepJournal(MODEL_UUID, new_plan).resume()
+
+    assert skipped == 1
+    assert new_plan.sub_steps[0].skipped is True
+    assert not any(step.skipped for step in new_plan.sub_steps[1].sub_steps)
+
+
+def test_journal_resume_changed_arguments():
+    """Test resuming does not skip step called with different arguments."""
+    plan = _generate_plan("keystone")
+    journal = StepJournal(MODEL_UUID, plan)
+    journal.start(resume=False)
+    journal.step_finished(plan.sub_steps[0], None)
+    journal.step_finished(plan.sub_steps[1].sub_steps[0], None)
+
+    new_plan = _generate_plan("keystone")
+    new_plan.replace_sub_steps(
+        [PreUpgradeStep("Back up MySQL databases", coro=run_step("other"))], 0, 1
+    )
+    skipped = StepJournal(MODEL_UUID, new_plan).resume()
+
+    assert skipped == 1
+    assert new_plan.sub_steps[0].skipped is False
+    assert new_plan.sub_steps[1].sub_steps[0].skipped is True
+
+
+def test_journal_step_finished_unknown_step(journal_dir):
+    """Test step which is not part of the plan is not recorded."""
+    journal = StepJournal(MODEL_UUID, _generate_plan("keystone"))
+
+    journal.step_finished(UpgradeStep("Unknown step", coro=run_step("unknown")), None)
+
+    assert not (journal_dir / f"{MODEL_UUID}.jsonl").exists()
+
+
+def test_journal_resume_no_interrupted_run():
+    """Test resuming without interrupted run."""
+    plan = _generate_plan("keystone")
+
+    assert StepJournal(MODEL_UUID, plan).resume() == 0
+    assert not plan.sub_steps[0].skipped
+
+
+def test_journal_resume_other_model():
+    """Test resuming does not use journal of other model."""
+    plan = _generate_plan("keystone")
+    journal = StepJournal(MODEL_UUID, plan)
+    journal.start(resume=False)
+    journal.step_finished(plan.sub_steps[0], None)
+
+    new_plan = _generate_plan("keystone")
+
+    assert StepJournal("other-uuid", new_plan).resume() == 0
@@ -0,0 +1,254 @@
+#  Copyright 2023 Canonical Limited
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Test metrics of the upgrade progress."""
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from cou.exceptions import EnvironmentVariableError, RunUpgradeError
+from cou.steps import UpgradePlan, UpgradeStep
+from cou.steps.metrics import MetricsExporter, _format_labels
+from cou.utils.api_stats import api_stats
+from tests.unit.utils import generate_app_upgrade_plan, generate_upgrade_plan, run_step
+
+
+def _generate_plan() -> UpgradePlan:
+    """Generate upgrade plan for keystone."""
+    app_plan = generate_app_upgrade_plan(
+        "keystone",
+        UpgradeStep("Upgrade 'keystone'", coro=run_step("upgrade")),
+        UpgradeStep("Wait for 'keystone'", coro=run_step("wait")),
+    )
+    return generate_upgrade_plan(app_plan, UpgradeStep("Empty step"))
+
+
+def test_format_labels():
+    """Test formatting labels with escaped values."""
+    assert _format_labels() == ""
+    assert _format_labels(step='Upgrade "a\\b"\n', le="+Inf") == (
+        '{step="Upgrade \\"a\\\\b\\"\\n",le="+Inf"}'
+    )
+
+
+def test_metrics_exporter_render():
+    """Test rendering metrics of the upgrade progress."""
+    plan = _generate_plan()
+    backup, app_plan = plan.sub_steps[0], plan.sub_steps[1]
+    upgrade, wait = app_plan.sub_steps
+    exporter = MetricsExporter(plan)
+    api_stats.record_call("get_status", 0.3, False, 10)
+    api_stats.record_call("get_status", 2.0, True, 0)
+    api_stats.record_retry("get_status")
+
+    with patch("cou.steps.metrics.time.monotonic", side_effect=[0, 0, 0, 50, 60, 100, 110]):
+        exporter.step_started(plan)
+        exporter.step_started(backup)
+        exporter.step_started(upgrade)
+        exporter.step_finished(backup, None)
+        exporter.step_finished(upgrade, RunUpgradeError("failed"))
+        exporter.step_started(wait)
+        metrics = exporter.render()
+
+    lines = metrics.splitlines()
+    assert metrics.endswith("\n")
+    assert "# TYPE cou_steps gauge" in lines
+    assert 'cou_steps{type="UpgradePlan"} 1.0' in lines
+    assert 'cou_steps{type="ApplicationUpgradePlan"} 1.0' in lines
+    assert 'cou_steps{type="UpgradeStep"} 2.0' in lines
+    assert 'cou_steps_finished_total{type="PreUpgradeStep",outcome="succeeded"} 1.0' in lines
+    assert 'cou_steps_finished_total{type="UpgradeStep",outcome="failed"} 1.0' in lines
+    assert 'cou_steps_running{type="UpgradePlan",kind="UpgradePlan"} 1.0' in lines
+    assert 'cou_steps_running{type="UpgradeStep",kind="run_step"} 1.0' in lines
+    assert 'cou_step_running_seconds{type="UpgradePlan",kind="UpgradePlan"} 110.0' in lines
+    assert 'cou_step_running_seconds{type="UpgradeStep",kind="run_step"} 10.0' in lines
+    assert 'cou_step_duration_seconds_sum{kind="backup"} 50.0' in lines
+    assert 'cou_step_duration_seconds_count{kind="backup"} 1.0' in lines
+    assert 'cou_step_duration_seconds_sum{kind="run_step"} 60.0' in lines
+    assert 'cou_step_duration_seconds_count{kind="run_step"} 1.0' in lines
+    assert 'cou_step_failures_total{kind="run_step"} 1.0' in lines
+    assert "# TYPE cou_juju_api_call_duration_seconds histogram" in lines
+    assert 'cou_juju_api_call_duration_seconds_bucket{method="get_status",le="0.1"} 0.0' in lines
+    assert 'cou_juju_api_call_duration_seconds_bucket{method="get_status",le="0.5"} 1.0' in lines
+    assert 'cou_juju_api_call_duration_seconds_bucket{method="get_status",le="+Inf"} 2.0' in lines
+    assert 'cou_juju_api_call_duration_seconds_sum{method="get_status"} 2.3' in lines
+    assert 'cou_juju_api_call_duration_seconds_count{method="get_status"} 2.0' in lines
+    assert 'cou_juju_api_call_errors_total{method="get_status"} 1.0' in lines
+    assert 'cou_juju_api_call_retries_total{method="get_status"} 1.0' in lines
+
+
+def test_metrics_exporter_render_running_steps():
+    """Test rendering running steps aggregated by their type and kind."""
+    plan = _generate_plan()
+    app_plan = plan.sub_steps[1]
+    upgrade, wait = app_plan.sub_steps
+    exporter = MetricsExporter(plan)
+
+    with patch("cou.steps.metrics.time.monotonic", side_effect=[0, 0, 30, 40, 100]):
+        exporter.step_started(app_plan)
+        exporter.step_started(upgrade)
+        exporter.step_started(wait)
+        exporter.step_finished(app_plan, None)
+        lines = exporter.render().splitlines()
+
+    assert (
+        'cou_steps_finished_total{type="ApplicationUpgradePlan",outcome="succeeded"} 1.0' in lines
+    )
+    assert 'cou_steps_running{type="UpgradeStep",kind="run_step"} 2.0' in lines
+    assert 'cou_step_running_seconds{type="UpgradeStep",kind="run_step"} 100.0' in lines
+    assert not any(line.startswith("cou_step_duration_seconds_sum") for line in lines)
+
+
+def test_metrics_exporter_total_steps():
+    """Test counting steps in the plan again only if the plan changed."""
+    plan = _generate_plan()
+    exporter = MetricsExporter(plan)
+
+    total_steps = exporter._get_total_steps()
+
+    assert exporter._get_total_steps() is total_steps
+    plan.add_step(UpgradeStep("Upgrade 'glance'", coro=run_step("upgrade")))
+    assert exporter._get_total_steps() is not total_steps
+    assert 'cou_steps{type="UpgradeStep"} 3.0' in exporter.render().splitlines()
+
+
+def test_metrics_exporter_write(tmp_path):
+    """Test writing metrics to the textfile."""
+    path = tmp_path / "textfile" / "cou.prom"
+    exporter = MetricsExporter(_generate_plan(), path=path)
+
+    exporter.write()
+
+    assert path.read_text() == exporter.render()
+    assert list(path.parent.iterdir()) == [path]
+
+
+def test_metrics_exporter_write_error(tmp_path):
+    """Test writing metrics to the textfile which can not be written."""
+    path = tmp_path / "cou.prom"
+    path.mkdir()
+    exporter = MetricsExporter(_generate_plan(), path=path)
+
+    with patch("cou.steps.metrics.logger") as mock_logger:
+        exporter.write()  # no exception raised
+
+    mock_logger.warning.assert_called_once()
+
+
+def test_metrics_exporter_write_no_path():
+    """Test writing metrics without textfile."""
+    exporter = MetricsExporter(_generate_plan())
+
+    with patch.object(exporter, "render") as mock_render:
+        exporter.write()
+
+    mock_render.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_metrics_exporter_textfile(tmp_path):
+    """Test writing metrics to the textfile periodically until the exporter is stopped."""
+    path = tmp_path / "cou.prom"
+    exporter = MetricsExporter(_generate_plan(), path=path)
+
+    await exporter.start()
+    await asyncio.sleep(0)
+    assert path.exists()
+
+    path.unlink()
+    await exporter.stop()
+    assert path.exists()
+
+
+@pytest.mark.asyncio
+async def test_metrics_exporter_textfile_interval(tmp_path, monkeypatch):
+    """Test writing metrics to the textfile every interval from the environment."""
+    monkeypatch.setenv("COU_METRICS_INTERVAL", "0.5")
+    exporter = MetricsExporter(_generate_plan(), path=tmp_path / "cou.prom")
+
+    with patch.object(exporter, "_write_periodically", new_callable=AsyncMock) as mock_write:
+        await exporter.start()
+        await exporter.stop()
+
+    mock_write.assert_called_once_with(0.5)
+
+
+@pytest.mark.asyncio
+async def test_metrics_exporter_textfile_interval_invalid(tmp_path, monkeypatch):
+    """Test starting exporter with invalid interval of writing metrics to the textfile."""
+    monkeypatch.setenv("COU_METRICS_INTERVAL", "abc")
+    exporter = MetricsExporter(_generate_plan(), path=tmp_path / "cou.prom")
+
+    with pytest.raises(EnvironmentVariableError, match="COU_METRICS_INTERVAL"):
+        await exporter.start()
+
+    assert exporter._writer is None
+
+
+async def _request(port: int, request: bytes) -> bytes:
+    """Send HTTP request to the local endpoint."""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(request)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    await writer.wait_closed()
+    return response
+
+
+@pytest.mark.asyncio
+async def test_metrics_exporter_http():
+    """Test serving metrics from the local HTTP endpoint."""
+    exporter = MetricsExporter(_generate_plan(), port=0)
+    await exporter.start()
+    port = exporter._server.sockets[0].getsockname()[1]
+
+    try:
+        response = await _request(port, b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        not_found = await _request(port, b"GET /other HTTP/1.1\r\n\r\n")
+    finally:
+        await exporter.stop()
+
+    headers, body = response.split(b"\r\n\r\n", 1)
+    assert headers.startswith(b"HTTP/1.1 200 OK\r\n")
+    assert b"Content-Type: text/plain; version=0.0.4; charset=utf-8" in headers
+    assert b'cou_steps{type="UpgradePlan"} 1.0' in body
+    assert not_found.startswith(b"HTTP/1.1 404 Not Found\r\n")
+    assert exporter._server is None
+
+
+@pytest.mark.asyncio
+async def test_metrics_exporter_http_connection_error():
+    """Test serving metrics to the client which closed the connection."""
+    exporter = MetricsExporter(_generate_plan())
+    reader = AsyncMock(spec_set=asyncio.StreamReader)
+    reader.readline.side_effect = ConnectionResetError("reset")
+    writer = MagicMock(spec_set=asyncio.StreamWriter)
+
+    await exporter._handle_request(reader, writer)  # no exception raised
+
+    writer.write.assert_not_called()
+    writer.close.assert_called_once_with()
+
+
+@pytest.mark.asyncio
+async def test_metrics_exporter_http_error():
+    """Test serving metrics from the local HTTP endpoint if the port can not be bound."""
+    exporter = MetricsExporter(_generate_plan(), port=9717)
+
+    with patch("cou.steps.metrics.asyncio.start_server", side_effect=OSError("in use")):
+        await exporter.start()  # no exception raised
+
+    assert exporter._server is None
+    await exporter.stop()
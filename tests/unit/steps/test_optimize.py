@@ -0,0 +1,258 @@
+#  Copyright 2023 Canonical Limited
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Test plan optimization."""
+from unittest.mock import patch
+
+import pytest
+
+from cou.apps.core import Keystone
+from cou.steps import (
+    ApplicationUpgradePlan,
+    PostUpgradeStep,
+    PreUpgradeStep,
+    UpgradePlan,
+    UpgradeStep,
+)
+from cou.steps.optimize import CONFIG_CHANGED_DURATION, PlanOptimization, optimize_plan
+from cou.utils.juju_utils import Model, Unit
+from cou.utils.openstack import OpenStackRelease
+from tests.unit.utils import dedent_plan, generate_cou_machine
+
+
+@pytest.fixture
+def cou_model():
+    """Real COU model, which coroutines can be inspected, without any connection."""
+    with patch("cou.utils.juju_utils.FileJujuData"), patch("cou.utils.juju_utils.JujuModel"):
+        yield Model("test_model")
+
+
+def _config_step(model, app, key, value, dependent=False):
+    return UpgradeStep(
+        f"Change charm config of '{app}' '{key}' to '{value}'",
+        coro=model.set_application_config(app, {key: value}),
+        dependent=dependent,
+    )
+
+
+def _wait_step(model, timeout, apps, kwargs=None, step_type=PostUpgradeStep):
+    target = f"app '{apps[0]}'" if apps else "model"
+    return step_type(
+        f"Wait for up to {timeout}s for {target} to reach the idle state",
+        coro=model.wait_for_idle(timeout, apps=apps, **(kwargs or {})),
+    )
+
+
+def test_plan_optimization_str():
+    """Test summary of plan optimization."""
+    assert str(PlanOptimization()) == "Plan optimization found nothing to optimize."
+    assert str(PlanOptimization(2, 1, 150)) == (
+        "Plan optimization merged 2 charm config change step(s) and dropped 1 redundant wait "
+        "step(s), saving an estimated 0:02:30."
+    )
+
+
+def test_optimize_plan_merge_config(cou_model):
+    """Test merging adjacent config changes of the same application."""
+    plan = UpgradePlan("Upgrade cloud")
+    app_plan = ApplicationUpgradePlan("Upgrade plan for 'cinder' to 'victoria'")
+    app_plan.add_steps(
+        [
+            _config_step(cou_model, "cinder", "action-managed-upgrade", "True"),
+            _config_step(cou_model, "cinder", "openstack-origin", "cloud:focal-victoria"),
+            _wait_step(cou_model, 300, ["cinder"]),
+        ]
+    )
+    plan.add_step(app_plan)
+    exp_plan = dedent_plan(
+        """\
+    Upgrade cloud
+        Upgrade plan for 'cinder' to 'victoria'
+            Change charm config of 'cinder' 'action-managed-upgrade' to 'True' and 'openstack-origin' to 'cloud:focal-victoria'
+            Wait for up to 300s for app 'cinder' to reach the idle state
+    """  # noqa: E501 line too long
+    )
+
+    optimization = optimize_plan(plan)
+
+    assert str(plan) == exp_plan
+    assert optimization == PlanOptimization(1, 0, CONFIG_CHANGED_DURATION)
+    assert app_plan.sub_steps[0] == UpgradeStep(
+        "Change charm config of 'cinder' 'action-managed-upgrade' to 'True' and "
+        "'openstack-origin' to 'cloud:focal-victoria'",
+        coro=cou_model.set_application_config(
+            "cinder",
+            {"action-managed-upgrade": "True", "openstack-origin": "cloud:focal-victoria"},
+        ),
+    )
+
+
+def test_optimize_plan_merge_config_generated_plan(cou_model):
+    """Test merging config changes in plan generated for application with updated channel."""
+    target = OpenStackRelease("victoria")
+    machines = {"0": generate_cou_machine("0", "az-0")}
+    app = Keystone(
+        name="keystone",
+        can_upgrade_to="",
+        charm="keystone",
+        channel="victoria/stable",
+        config={
+            "openstack-origin": {"value": "distro"},
+            "action-managed-upgrade": {"value": True},
+        },
+        machines=machines,
+        model=cou_model,
+        origin="ch",
+        series="focal",
+        subordinate_to=[],
+        units={
+            f"keystone/{unit}": Unit(
+                name=f"keystone/{unit}", workload_version="17.0.1", machine=machines["0"]
+            )
+            for unit in range(3)
+        },
+        workload_version="17.1.0",
+    )
+    plan = UpgradePlan("Upgrade cloud")
+    plan.add_step(app.generate_upgrade_plan(target, False))
+    exp_plan = dedent_plan(
+        f"""\
+    Upgrade cloud
+        Upgrade plan for 'keystone' to 'victoria'
+            Upgrade software packages of 'keystone' from the current APT repositories
+                Ψ Upgrade software packages on unit 'keystone/0'
+                Ψ Upgrade software packages on unit 'keystone/1'
+                Ψ Upgrade software packages on unit 'keystone/2'
+            Change charm config of 'keystone' 'action-managed-upgrade' from 'True' to 'False' and 'openstack-origin' to 'cloud:focal-victoria'
+            Wait for up to 2400s for model '{cou_model.name}' to reach the idle state
+            Verify that the workload of 'keystone' has been upgraded on units: keystone/0, keystone/1, keystone/2
+    """  # noqa: E501 line too long
+    )
+
+    optimization = optimize_plan(plan)
+
+    assert str(plan) == exp_plan
+    assert optimization == PlanOptimization(1, 0, CONFIG_CHANGED_DURATION)
+
+
+@pytest.mark.parametrize(
+    "first, second",
+    [
+        # different applications
+        (("cinder", "openstack-origin", "a"), ("nova-compute", "source", "b")),
+        # same option changed twice
+        (("cinder", "openstack-origin", "a"), ("cinder", "openstack-origin", "b")),
+    ],
+)
+def test_optimize_plan_merge_config_not_possible(first, second, cou_model):
+    """Test config changes, which can not be merged."""
+    plan = UpgradePlan("Upgrade cloud")
+    plan.add_steps([_config_step(cou_model, *first), _config_step(cou_model, *second)])
+    exp_plan = str(plan)
+
+    optimization = optimize_plan(plan)
+
+    assert str(plan) == exp_plan
+    assert optimization == PlanOptimization()
+
+
+def test_optimize_plan_merge_config_not_adjacent(cou_model):
+    """Test config changes separated by another step are not merged."""
+    plan = UpgradePlan("Upgrade cloud")
+    plan.add_steps(
+        [
+            _config_step(cou_model, "cinder", "action-managed-upgrade", "True"),
+            UpgradeStep("Upgrade 'cinder'", coro=cou_model.upgrade_charm("cinder", "victoria")),
+            _config_step(cou_model, "cinder", "openstack-origin", "cloud:focal-victoria"),
+        ]
+    )
+    exp_plan = str(plan)
+
+    optimization = optimize_plan(plan)
+
+    assert str(plan) == exp_plan
+    assert optimization == PlanOptimization()
+
+
+@pytest.mark.parametrize(
+    "first_wait, second_wait",
+    [
+        ((300, ["cinder"]), (300, ["cinder"])),
+        ((300, ["cinder"]), (2400, None)),
+        ((300, ["cinder"]), (300, ["cinder", "nova-compute"])),
+    ],
+)
+def test_optimize_plan_drop_wait(first_wait, second_wait, cou_model):
+    """Test dropping wait covered by the following wait."""
+    plan = UpgradePlan("Upgrade cloud")
+    app_plan = ApplicationUpgradePlan("Upgrade plan for 'cinder' to 'victoria'")
+    second_wait_step = _wait_step(cou_model, *second_wait)
+    app_plan.add_steps(
+        [
+            PreUpgradeStep("Refresh 'cinder'", coro=cou_model.upgrade_charm("cinder", "ussuri")),
+            _wait_step(cou_model, *first_wait, step_type=PreUpgradeStep),
+            second_wait_step,
+        ]
+    )
+    plan.add_step(app_plan)
+
+    optimization = optimize_plan(plan)
+
+    assert app_plan.sub_steps[1] is second_wait_step
+    assert len(app_plan.sub_steps) == 2
+    assert optimization == PlanOptimization(0, 1, 30)
+
+
+@pytest.mark.parametrize(
+    "first_wait, second_wait",
+    [
+        ((300, ["cinder"]), (200, ["cinder"])),  # shorter timeout
+        ((300, None), (300, ["cinder"])),  # fewer applications
+        ((300, ["cinder", "nova-compute"]), (300, ["cinder"])),  # fewer applications
+        ((300, ["cinder"]), (300, ["nova-compute"])),  # different applications
+        ((300, ["cinder"], {"status": "blocked"}), (300, ["cinder"])),  # different status
+        ((300, ["cinder"], {"idle_period": 60}), (300, ["cinder"])),  # shorter idle period
+        ((300, ["cinder"], {"raise_on_blocked": True}), (300, ["cinder"])),  # less strict
+    ],
+)
+def test_optimize_plan_keep_wait(first_wait, second_wait, cou_model):
+    """Test keeping wait, which is not covered by the following wait."""
+    plan = UpgradePlan("Upgrade cloud")
+    plan.add_steps([_wait_step(cou_model, *first_wait), _wait_step(cou_model, *second_wait)])
+    exp_plan = str(plan)
+
+    optimization = optimize_plan(plan)
+
+    assert str(plan) == exp_plan
+    assert optimization == PlanOptimization()
+
+
+def test_optimize_plan_parallel(cou_model):
+    """Test sub-steps of parallel step are not optimized."""
+    plan = UpgradePlan("Upgrade cloud")
+    parallel_step = UpgradeStep("Upgrade in parallel", parallel=True)
+    parallel_step.add_steps(
+        [
+            _config_step(cou_model, "cinder", "action-managed-upgrade", "True"),
+            _config_step(cou_model, "cinder", "openstack-origin", "cloud:focal-victoria"),
+            _wait_step(cou_model, 300, ["cinder"]),
+            _wait_step(cou_model, 300, ["cinder"]),
+        ]
+    )
+    plan.add_step(parallel_step)
+    exp_plan = str(plan)
+
+    optimization = optimize_plan(plan)
+
+    assert str(plan) == exp_plan
+    assert optimization == PlanOptimization()
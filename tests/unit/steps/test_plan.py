@@ -30,10 +30,13 @@ from cou.exceptions import (
     MismatchedOpenStackVersions,
     NoTargetError,
     OutOfSupportRange,
+    RunUpgradeError,
     VaultSealed,
 )
 from cou.steps import (
     ApplicationUpgradePlan,
+    FailurePolicy,
+    PackageUpgradeStep,
     PostUpgradeStep,
     PreUpgradeStep,
     UnitUpgradeStep,
@@ -48,7 +51,7 @@ from cou.steps.ceph import set_require_osd_release_option
 from cou.steps.hypervisor import HypervisorGroup, HypervisorUpgradePlanner
 from cou.steps.nova_cloud_controller import archive, purge
 from cou.utils import app_utils
-from cou.utils.juju_utils import Machine, Unit
+from cou.utils.juju_utils import Machine, Model, Unit
 from cou.utils.openstack import OpenStackRelease
 from tests.unit.utils import dedent_plan, generate_cou_machine, get_applications
 
@@ -70,7 +73,7 @@ def generate_expected_upgrade_plan_principal(app, target, model):
             coro=model.wait_for_idle(300, apps=[app.name]),
         )
 
-    upgrade_packages = PreUpgradeStep(
+    upgrade_packages = PackageUpgradeStep(
         description=f"Upgrade software packages of '{app.name}' from the current APT repositories",
         parallel=True,
     )
@@ -78,6 +81,7 @@ def generate_expected_upgrade_plan_principal(app, target, model):
         UnitUpgradeStep(
             description=f"Upgrade software packages on unit '{unit.name}'",
             coro=app_utils.upgrade_packages(unit.name, model, None),
+            unit=unit,
         )
         for unit in app.units.values()
     )
@@ -179,11 +183,12 @@ async def test_generate_plan(mock_filter_hypervisors, model, cli_args):
                 Change charm config of 'keystone' 'openstack-origin' to 'cloud:focal-victoria'
                 Wait for up to 2400s for model 'test_model' to reach the idle state
                 Verify that the workload of 'keystone' has been upgraded on units: keystone/0
+        Refresh data plane upgrade plan after control plane upgrade
         Upgrading all applications deployed on machines with hypervisor.
             Upgrade plan for [nova-compute/0] in 'az-1' to 'victoria'
                 Disable nova-compute scheduler from unit: 'nova-compute/0'
-                Upgrade software packages of 'nova-compute' from the current APT repositories
-                    Ψ Upgrade software packages on unit 'nova-compute/0'
+                Upgrade software packages on machines: 1 from the current APT repositories
+                    Ψ Upgrade software packages on machine '1' using unit 'nova-compute/0'
                 Refresh 'nova-compute' to the latest revision of 'ussuri/stable'
                 Wait for up to 300s for app 'nova-compute' to reach the idle state
                 Change charm config of 'nova-compute' 'action-managed-upgrade' from 'False' to 'True'
@@ -341,11 +346,12 @@ async def test_generate_plan_with_warning_messages(mock_filter_hypervisors, mode
             Upgrade plan for 'ovn-chassis' to 'victoria'
                 Refresh 'ovn-chassis' to the latest revision of '22.03/stable'
                 Wait for up to 300s for app 'ovn-chassis' to reach the idle state
+        Refresh data plane upgrade plan after control plane upgrade
         Upgrading all applications deployed on machines with hypervisor.
             Upgrade plan for [nova-compute/0] in 'az-1' to 'victoria'
                 Disable nova-compute scheduler from unit: 'nova-compute/0'
-                Upgrade software packages of 'nova-compute' from the current APT repositories
-                    Ψ Upgrade software packages on unit 'nova-compute/0'
+                Upgrade software packages on machines: 1 from the current APT repositories
+                    Ψ Upgrade software packages on machine '1' using unit 'nova-compute/0'
                 Refresh 'nova-compute' to the latest revision of 'ussuri/stable'
                 Wait for up to 300s for app 'nova-compute' to reach the idle state
                 Change charm config of 'nova-compute' 'action-managed-upgrade' from 'False' to 'True'
@@ -508,6 +514,7 @@ def test_planstatus_warnings_property():
 @patch("cou.steps.plan._verify_model_idle")
 @patch("cou.steps.plan._verify_osd_noout_unset")
 @patch("cou.steps.plan._verify_vault_is_unsealed")
+@patch("cou.steps.plan._verify_target_release")
 @patch("cou.steps.plan._verify_hypervisors_cli_input")
 @patch("cou.steps.plan._verify_supported_series")
 @patch("cou.steps.plan._verify_highest_release_achieved")
@@ -519,6 +526,7 @@ async def test_pre_plan_sanity_checks(
     mock_verify_highest_release_achieved,
     mock_verify_supported_series,
     mock_verify_hypervisors_cli_input,
+    mock_verify_target_release,
     mock_verify_vault_is_unsealed,
     mock_verify_osd_noout_unset,
     mock_verify_model_idle,
@@ -532,6 +540,7 @@ async def test_pre_plan_sanity_checks(
     mock_verify_supported_series.assert_called_once_with(mock_analysis_result)
     mock_verify_data_plane_ready_to_upgrade.assert_called_once_with(cli_args, mock_analysis_result)
     mock_verify_hypervisors_cli_input.assert_called_once_with(cli_args, mock_analysis_result)
+    mock_verify_target_release.assert_called_once_with(cli_args, mock_analysis_result)
     mock_verify_nova_cloud_controller_scheduler_default_filters.assert_called_once_with(
         cli_args, mock_analysis_result
     )
@@ -821,6 +830,81 @@ def test_determine_upgrade_target_out_support_range():
         cou_plan._determine_upgrade_target(mock_analysis_result)
 
 
+@pytest.mark.parametrize(
+    "o7k_release, current_series, to, exp_targets",
+    [
+        (OpenStackRelease("ussuri"), "focal", None, ["victoria"]),
+        (OpenStackRelease("ussuri"), "focal", "victoria", ["victoria"]),
+        (OpenStackRelease("ussuri"), "focal", "yoga", ["victoria", "wallaby", "xena", "yoga"]),
+        (OpenStackRelease("yoga"), "jammy", "antelope", ["zed", "antelope"]),
+    ],
+)
+def test_determine_upgrade_targets(o7k_release, current_series, to, exp_targets):
+    """Test determining target releases of each hop of the upgrade."""
+    mock_analysis_result = MagicMock(spec=Analysis)()
+    mock_analysis_result.current_cloud_o7k_release = o7k_release
+    mock_analysis_result.current_cloud_series = current_series
+
+    targets = cou_plan._determine_upgrade_targets(mock_analysis_result, to)
+
+    assert targets == exp_targets
+
+
+@pytest.mark.parametrize(
+    "to, exp_error, exp_error_msg",
+    [
+        ("ussuri", NoTargetError, "Cannot upgrade cloud to 'ussuri'"),
+        ("train", NoTargetError, "Cannot upgrade cloud to 'train'"),
+        (
+            "zed",
+            OutOfSupportRange,
+            "Unable to upgrade cloud from Ubuntu series `focal` to 'zed'. The target release "
+            "needs to be supported by the current Ubuntu series 'focal': ussuri, victoria, "
+            "wallaby, xena, yoga.",
+        ),
+    ],
+)
+def test_determine_upgrade_targets_invalid(to, exp_error, exp_error_msg):
+    """Test determining target releases of each hop of the upgrade with invalid target."""
+    mock_analysis_result = MagicMock(spec=Analysis)()
+    mock_analysis_result.current_cloud_o7k_release = OpenStackRelease("ussuri")
+    mock_analysis_result.current_cloud_series = "focal"
+
+    with pytest.raises(exp_error, match=exp_error_msg):
+        cou_plan._determine_upgrade_targets(mock_analysis_result, to)
+
+
+@pytest.mark.parametrize(
+    "upgrade_group, to, exp_error",
+    [
+        (None, "yoga", False),
+        (CONTROL_PLANE, None, False),
+        (CONTROL_PLANE, "victoria", False),
+        (CONTROL_PLANE, "ussuri", False),
+        (CONTROL_PLANE, "wallaby", True),
+        (DATA_PLANE, "yoga", True),
+        (HYPERVISORS, "wallaby", True),
+    ],
+)
+def test_verify_target_release(upgrade_group, to, exp_error, cli_args):
+    """Test verifying that only the whole cloud is upgraded across several releases."""
+    cli_args.upgrade_group = upgrade_group
+    cli_args.to = to
+    mock_analysis_result = MagicMock(spec=Analysis)()
+    mock_analysis_result.current_cloud_o7k_release = OpenStackRelease("ussuri")
+
+    cou_plan._verify_target_release(cli_args, mock_analysis_result)
+
+    if exp_error:
+        assert cou_plan.PlanStatus.error_messages == [
+            f"Upgrade of the {upgrade_group} from 'ussuri' to '{to}' is not possible, because "
+            "it spans several releases. Only the whole cloud can be upgraded across several "
+            "releases."
+        ]
+    else:
+        assert cou_plan.PlanStatus.error_messages == []
+
+
 @pytest.mark.parametrize("force", [True, False])
 def test_create_upgrade_plan(force):
     """Test _create_upgrade_group."""
@@ -1346,6 +1430,7 @@ def test_generate_control_plane_plan(mock_create_upgrade_group):
             description="Control Plane principal(s) upgrade plan",
             target=target,
             force=force,
+            rolling=False,
         ),
         call(
             apps=[keystone_ldap],
@@ -1638,6 +1723,14 @@ async def test_generate_data_plane_hypervisors_plan(
     apps = [MagicMock(spec_set=OpenStackApplication)()]
     target = OpenStackRelease("victoria")
     analysis_result = MagicMock(spec_set=Analysis)()
+    cloud_machines = [Machine("0", (), "zone-0"), Machine("1", (), "zone-1")]
+    nova_compute = MagicMock(spec_set=OpenStackApplication)()
+    nova_compute.charm = "nova-compute"
+    nova_compute.units = {
+        f"nova-compute/{i}": Unit(f"nova-compute/{i}", machine, "21.0.0")
+        for i, machine in enumerate(cloud_machines)
+    }
+    analysis_result.apps_data_plane = [nova_compute]
     hypervisors_machines = [Machine("0", (), "zone-0")]
     mock_filter_hypervisors.return_value = hypervisors_machines
     hypervisor_planner_instance = mock_hypervisor_planner.return_value
@@ -1646,7 +1739,13 @@ async def test_generate_data_plane_hypervisors_plan(
     await cou_plan._generate_data_plane_hypervisors_plan(target, analysis_result, cli_args, apps)
 
     mock_filter_hypervisors.assert_called_once_with(cli_args, analysis_result)
-    mock_hypervisor_planner.assert_called_once_with(apps, hypervisors_machines)
+    mock_hypervisor_planner.assert_called_once_with(
+        apps,
+        hypervisors_machines,
+        cli_args.pipeline_hypervisors,
+        cli_args.max_parallel_azs,
+        cloud_machines,
+    )
     hypervisor_planner_instance.generate_upgrade_plan.assert_called_once_with(
         target, cli_args.force
     )
@@ -1674,7 +1773,9 @@ async def test_generate_data_plane_hypervisors_plan_none(
 
     assert isinstance(plan, UpgradePlan)  # plan is not None
     mock_filter_hypervisors.assert_called_once_with(cli_args, analysis_result)
-    mock_hypervisor_planner.assert_called_once_with(apps, hypervisors_machines)
+    mock_hypervisor_planner.assert_called_once_with(
+        apps, hypervisors_machines, cli_args.pipeline_hypervisors, cli_args.max_parallel_azs, []
+    )
 
 
 @patch("cou.steps.plan._create_upgrade_group")
@@ -1700,6 +1801,206 @@ def test_generate_data_plane_remaining_plan(mock_create_upgrade_group):
     mock_create_upgrade_group.assert_has_calls(expected_calls)
 
 
+def _generate_app_on_machines(name: str, *machine_ids: str) -> MagicMock:
+    """Generate principal application deployed on machines."""
+    app = MagicMock(spec_set=OpenStackApplication)()
+    app.name = name
+    app.is_subordinate = False
+    app.machines = {machine_id: MagicMock() for machine_id in machine_ids}
+    return app
+
+
+def test_group_apps_by_machines():
+    """Test grouping applications sharing machines."""
+    ceph_osd = _generate_app_on_machines("ceph-osd", "0", "1")
+    swift = _generate_app_on_machines("swift-storage", "2")
+    gnocchi = _generate_app_on_machines("gnocchi", "3")
+    ceilometer = _generate_app_on_machines("ceilometer", "1", "3")
+
+    groups = cou_plan._group_apps_by_machines([ceph_osd, swift, gnocchi, ceilometer])
+
+    assert groups == [[ceph_osd, gnocchi, ceilometer], [swift]]
+
+
+@patch("cou.steps.plan._generate_instance_plan")
+def test_generate_data_plane_remaining_plan_parallel(mock_generate_instance_plan):
+    """Test upgrading remaining data-plane apps not sharing machines in parallel."""
+    target = OpenStackRelease("victoria")
+    ceph_osd = _generate_app_on_machines("ceph-osd", "0", "1")
+    swift = _generate_app_on_machines("swift-storage", "2")
+    gnocchi = _generate_app_on_machines("gnocchi", "1")
+    mock_generate_instance_plan.side_effect = lambda app, *_: _generate_app_plan(app.name, "1")
+
+    plans = cou_plan._generate_data_plane_remaining_plan(target, [ceph_osd, swift, gnocchi], False)
+
+    assert len(plans) == 1
+    assert plans[0].description == "Remaining Data Plane principal(s) upgrade plan"
+    assert plans[0].parallel is False
+    parallel_step = plans[0].sub_steps[0]
+    assert parallel_step.description == "Upgrade apps not sharing any machine in parallel"
+    assert parallel_step.parallel is True
+    assert [step.description for step in parallel_step.sub_steps] == [
+        "Upgrade plan for apps sharing machines: ceph-osd, gnocchi",
+        "Upgrade plan for 'swift-storage' to 'victoria'",
+    ]
+    assert [step.description for step in parallel_step.sub_steps[0].sub_steps] == [
+        "Upgrade plan for 'ceph-osd' to 'victoria'",
+        "Upgrade plan for 'gnocchi' to 'victoria'",
+    ]
+    assert parallel_step.sub_steps[0].parallel is False
+
+
+async def _upgrade(name: str, version: str) -> None:
+    """Upgrade application to version."""
+
+
+def _generate_app_plan(name: str, version: str) -> ApplicationUpgradePlan:
+    """Generate upgrade plan for application."""
+    app_plan = ApplicationUpgradePlan(f"Upgrade plan for '{name}' to 'victoria'")
+    app_plan.add_step(UpgradeStep(f"Upgrade '{name}'", coro=_upgrade(name, version)))
+    return app_plan
+
+
+def test_reuse_unchanged_steps():
+    """Test reusing unchanged steps of the old plan."""
+    old_hypervisors = UpgradePlan(
+        "Upgrading all applications deployed on machines with hypervisor."
+    )
+    old_hypervisors.add_steps([_generate_app_plan("nova-compute", "25.0.0")])
+    old_remaining = UpgradePlan("Remaining Data Plane principal(s) upgrade plan")
+    old_remaining.add_steps(
+        [_generate_app_plan("ceph-osd", "15.2.0"), _generate_app_plan("swift", "2.25.0")]
+    )
+    new_hypervisors = UpgradePlan(
+        "Upgrading all applications deployed on machines with hypervisor."
+    )
+    new_hypervisors.add_steps([_generate_app_plan("nova-compute", "25.0.0")])
+    new_remaining = UpgradePlan("Remaining Data Plane principal(s) upgrade plan")
+    new_remaining.add_steps(
+        [
+            _generate_app_plan("ceph-osd", "15.2.0"),
+            _generate_app_plan("swift", "2.26.0"),
+            _generate_app_plan("gnocchi", "4.3.0"),
+        ]
+    )
+
+    steps = cou_plan._reuse_unchanged_steps(
+        [old_hypervisors, old_remaining], [new_hypervisors, new_remaining]
+    )
+
+    assert steps[0] is old_hypervisors
+    assert steps[1] is new_remaining
+    assert new_remaining.sub_steps[0] is old_remaining.sub_steps[0]
+    assert new_remaining.sub_steps[1] is not old_remaining.sub_steps[1]
+    assert [step.description for step in new_remaining.sub_steps] == [
+        "Upgrade plan for 'ceph-osd' to 'victoria'",
+        "Upgrade plan for 'swift' to 'victoria'",
+        "Upgrade plan for 'gnocchi' to 'victoria'",
+    ]
+
+
+def test_reuse_unchanged_steps_ordered():
+    """Test reusing unchanged steps of the old plan ordered by their durations."""
+
+    def generate_hypervisors_plan():
+        plan = UpgradePlan("Upgrading all applications deployed on machines with hypervisor.")
+        pipeline = UpgradeStep("Upgrade machines 0, 1 in pipeline", parallel=True, max_parallel=1)
+        pipeline.add_steps(
+            [_generate_app_plan("nova-compute", "25.0.0"), _generate_app_plan("ceph-osd", "15")]
+        )
+        plan.add_step(pipeline)
+        return plan
+
+    old_hypervisors = generate_hypervisors_plan()
+    old_hypervisors.sub_steps[0].sub_steps[1].sub_steps[0].expected_duration = 600.0
+    cou_plan.order_by_duration(old_hypervisors)
+
+    steps = cou_plan._reuse_unchanged_steps([old_hypervisors], [generate_hypervisors_plan()])
+
+    assert steps[0] is old_hypervisors
+    assert steps[0].sub_steps[0].sub_steps[0].description == (
+        "Upgrade plan for 'ceph-osd' to 'victoria'"
+    )
+
+
+@pytest.mark.asyncio
+@patch("cou.steps.plan.order_by_duration")
+@patch("cou.steps.plan.notify_plan_changed")
+@patch("cou.steps.plan._generate_data_plane_plan")
+async def test_refresh_data_plane_plan(
+    mock_generate_data_plane_plan, mock_notify_plan_changed, mock_order_by_duration, cli_args
+):
+    """Test refreshing data-plane part of the plan after control plane upgrade."""
+    target = OpenStackRelease("victoria")
+    analysis_result = MagicMock(spec_set=Analysis)()
+    analysis_result.refresh = AsyncMock()
+    analysis_result.apps_control_plane = [MagicMock(spec_set=OpenStackApplication)()]
+    analysis_result.apps_control_plane[0].name = "keystone"
+    cli_args.skip_apps = {"vault"}
+    failure_policy = FailurePolicy(50)
+    old_plans = [
+        _generate_app_plan("nova-compute", "25.0.0"),
+        _generate_app_plan("ceph-osd", "15"),
+    ]
+    new_plans = [
+        _generate_app_plan("nova-compute", "25.0.0"),
+        _generate_app_plan("ceph-osd", "16"),
+        UpgradePlan("Remaining Data Plane principal(s) upgrade plan"),  # empty plan
+    ]
+    mock_generate_data_plane_plan.return_value = new_plans
+    plan = UpgradePlan("Upgrade cloud from 'ussuri' to 'victoria'")
+    plan.add_steps(
+        [
+            _generate_app_plan("keystone", "17.0.1"),
+            UpgradeStep("Refresh data plane upgrade plan", coro=_upgrade("refresh", "")),
+            *old_plans,
+            PostUpgradeStep("Post upgrade step", coro=_upgrade("post", "")),
+        ]
+    )
+    plan.set_default_failure_policy(failure_policy)
+
+    await cou_plan._refresh_data_plane_plan(plan, old_plans, target, analysis_result, cli_args)
+
+    analysis_result.refresh.assert_awaited_once_with({"vault"}, {"keystone"})
+    mock_generate_data_plane_plan.assert_awaited_once_with(
+        target, analysis_result.refresh.return_value, cli_args
+    )
+    assert len(plan.sub_steps) == 5
+    assert plan.sub_steps[2] is old_plans[0]
+    assert plan.sub_steps[3] is new_plans[1]
+    assert plan.sub_steps[4].description == "Post upgrade step"
+    assert new_plans[1].failure_policy is failure_policy
+    mock_notify_plan_changed.assert_has_calls([call(old_plans[0]), call(new_plans[1])])
+    mock_order_by_duration.assert_has_calls([call(old_plans[0]), call(new_plans[1])])
+
+
+@pytest.mark.asyncio
+@patch("cou.steps.plan._generate_data_plane_plan")
+async def test_refresh_data_plane_plan_error(mock_generate_data_plane_plan, cli_args):
+    """Test refreshing data-plane part of the plan with failed plan generation."""
+    analysis_result = MagicMock(spec_set=Analysis)()
+    analysis_result.refresh = AsyncMock()
+    analysis_result.apps_control_plane = []
+    old_plans = [_generate_app_plan("nova-compute", "25.0.0")]
+    plan = UpgradePlan("Upgrade cloud from 'ussuri' to 'victoria'")
+    plan.add_steps(old_plans)
+
+    async def generate_data_plane_plan(*_):
+        cou_plan.PlanStatus.add_message(
+            "Unit 'nova-compute/0' is not ready", cou_plan.MessageType.ERROR
+        )
+        return []
+
+    mock_generate_data_plane_plan.side_effect = generate_data_plane_plan
+
+    with pytest.raises(RunUpgradeError, match="Unit 'nova-compute/0' is not ready"):
+        await cou_plan._refresh_data_plane_plan(
+            plan, old_plans, OpenStackRelease("victoria"), analysis_result, cli_args
+        )
+
+    assert plan.sub_steps == old_plans
+
+
 def test_generate_instance_plan_app():
     """Test _generate_instance_plan for OpenStackApplication."""
     app: OpenStackApplication = MagicMock(spec=OpenStackApplication)
@@ -1713,6 +2014,29 @@ def test_generate_instance_plan_app():
     app.generate_upgrade_plan.assert_called_once_with(target, False)
 
 
+@pytest.mark.parametrize(
+    "rolling, is_clustered, exp_rolling_plan",
+    [(True, True, True), (True, False, False), (False, True, False)],
+)
+def test_generate_instance_plan_app_rolling(rolling, is_clustered, exp_rolling_plan):
+    """Test _generate_instance_plan for OpenStackApplication upgraded in rolling waves."""
+    app: OpenStackApplication = MagicMock(spec=OpenStackApplication)
+    app.name = "test-app"
+    app.is_clustered = is_clustered
+    target = OpenStackRelease("victoria")
+
+    plan = cou_plan._generate_instance_plan(app, target, False, rolling)
+
+    if exp_rolling_plan:
+        assert plan == app.generate_rolling_upgrade_plan.return_value
+        app.generate_rolling_upgrade_plan.assert_called_once_with(target, False)
+        app.generate_upgrade_plan.assert_not_called()
+    else:
+        assert plan == app.generate_upgrade_plan.return_value
+        app.generate_upgrade_plan.assert_called_once_with(target, False)
+        app.generate_rolling_upgrade_plan.assert_not_called()
+
+
 def test_generate_instance_plan_hypervisors():
     """Test _generate_instance_plan for HypervisorUpgradePlanner."""
     hypervisors: HypervisorUpgradePlanner = MagicMock(spec=HypervisorUpgradePlanner)
@@ -2080,3 +2404,175 @@ async def test_post_upgrade_sanity_checks_ceph_mon_versions_consistent(
     await cou_plan.post_upgrade_sanity_checks(mock_analysis)
 
     mock_print_and_debug.assert_not_called()
+
+
+@pytest.mark.asyncio
+@patch("cou.steps.plan._add_release_upgrade_steps")
+async def test_generate_plan_multi_hop(mock_add_release_upgrade_steps, cli_args):
+    """Test generating plan for upgrade across several releases."""
+    cli_args.to = "xena"
+    analysis_result = MagicMock(spec_set=Analysis)()
+    analysis_result.current_cloud_o7k_release = OpenStackRelease("ussuri")
+    analysis_result.current_cloud_series = "focal"
+
+    async def add_release_upgrade_steps(plan, target, *_):
+        plan.add_step(_generate_app_plan("keystone", str(target)))
+
+    mock_add_release_upgrade_steps.side_effect = add_release_upgrade_steps
+    exp_plan = dedent_plan(
+        """\
+    Upgrade cloud from 'ussuri' to 'xena'
+        Upgrade cloud from 'ussuri' to 'victoria'
+            Upgrade plan for 'keystone' to 'victoria'
+                Upgrade 'keystone'
+        Upgrade cloud from 'victoria' to 'wallaby'
+            Analyze cloud and generate upgrade plan to 'wallaby'
+        Upgrade cloud from 'wallaby' to 'xena'
+            Analyze cloud and generate upgrade plan to 'xena'
+    """
+    )
+
+    plan = await cou_plan.generate_plan(analysis_result, cli_args)
+
+    assert str(plan) == exp_plan
+    mock_add_release_upgrade_steps.assert_awaited_once_with(
+        plan.sub_steps[0], OpenStackRelease("victoria"), analysis_result, cli_args
+    )
+    assert [cou_plan._is_next_hop_plan(step) for step in plan.sub_steps] == [False, True, True]
+    assert cou_plan.estimate_upgrade_duration(plan) == (
+        cou_plan.estimate_duration(plan) + 2 * cou_plan.estimate_duration(plan.sub_steps[0])
+    )
+
+
+def test_estimate_upgrade_duration():
+    """Test estimating duration of the upgrade to the next release."""
+    plan = UpgradePlan("Upgrade cloud from 'ussuri' to 'victoria'")
+    plan.add_step(_generate_app_plan("keystone", "18.0.0"))
+
+    assert cou_plan.estimate_upgrade_duration(plan) == cou_plan.estimate_duration(plan)
+
+
+def test_get_touched_apps():
+    """Test getting applications changed by the plan."""
+    model = MagicMock(spec_set=Model)()
+    plan = UpgradePlan("Upgrade cloud from 'ussuri' to 'victoria'")
+    app_plan = ApplicationUpgradePlan("Upgrade plan for 'keystone' to 'victoria'")
+    app_plan.add_steps(
+        [
+            UpgradeStep("Refresh 'keystone'", coro=Model.upgrade_charm(model, "keystone")),
+            UpgradeStep("Wait for 'keystone'", coro=_upgrade("keystone", "")),
+        ]
+    )
+    plan.add_steps(
+        [
+            PreUpgradeStep("Back up MySQL databases", coro=_upgrade("mysql", "")),
+            app_plan,
+            UpgradeStep(
+                "Change charm config of 'glance'",
+                coro=Model.set_application_config(model, "glance", {"source": "distro"}),
+            ),
+        ]
+    )
+
+    assert cou_plan._get_touched_apps(plan) == {"keystone", "glance"}
+
+
+@pytest.mark.asyncio
+@patch("cou.steps.plan.order_by_duration")
+@patch("cou.steps.plan.notify_plan_changed")
+@patch("cou.steps.plan._get_touched_apps")
+@patch("cou.steps.plan.verify_cloud")
+@patch("cou.steps.plan._add_release_upgrade_steps")
+async def test_generate_next_hop_plan(
+    mock_add_release_upgrade_steps,
+    mock_verify_cloud,
+    mock_get_touched_apps,
+    mock_notify_plan_changed,
+    mock_order_by_duration,
+    cli_args,
+):
+    """Test generating plan of the next hop during the upgrade."""
+    target = OpenStackRelease("wallaby")
+    cli_args.skip_apps = {"vault"}
+    analysis_result = MagicMock(spec_set=Analysis)()
+    analysis_result.refresh = AsyncMock()
+    refreshed_analysis = analysis_result.refresh.return_value
+    refreshed_analysis.current_cloud_o7k_release = OpenStackRelease("victoria")
+    refreshed_analysis.current_cloud_series = "focal"
+    analyses = [analysis_result]
+    previous_hop_plan = UpgradePlan("Upgrade cloud from 'ussuri' to 'victoria'")
+    failure_policy = MagicMock(spec_set=FailurePolicy)()
+    plan = UpgradePlan("Upgrade cloud from 'victoria' to 'wallaby'")
+    plan.failure_policy = failure_policy
+    app_plan = _generate_app_plan("keystone", "19.0.0")
+
+    async def add_release_upgrade_steps(plan, *_):
+        plan.add_step(app_plan)
+
+    mock_add_release_upgrade_steps.side_effect = add_release_upgrade_steps
+
+    await cou_plan._generate_next_hop_plan(plan, previous_hop_plan, target, analyses, cli_args)
+
+    mock_get_touched_apps.assert_called_once_with(previous_hop_plan)
+    analysis_result.refresh.assert_awaited_once_with({"vault"}, mock_get_touched_apps.return_value)
+    assert analyses == [analysis_result, refreshed_analysis]
+    mock_verify_cloud.assert_awaited_once_with(refreshed_analysis, cli_args)
+    mock_add_release_upgrade_steps.assert_awaited_once_with(
+        plan, target, refreshed_analysis, cli_args
+    )
+    assert plan.sub_steps == [app_plan]
+    assert app_plan.failure_policy is failure_policy
+    mock_notify_plan_changed.assert_called_once_with(plan)
+    mock_order_by_duration.assert_called_once_with(plan)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "o7k_release, error, exp_error_msg",
+    [
+        (
+            "ussuri",
+            None,
+            "Could not generate the upgrade plan to 'wallaby': The cloud should be upgraded to "
+            "'wallaby', but the next release is 'victoria'",
+        ),
+        (
+            "victoria",
+            "Model is not idle",
+            "Could not generate the upgrade plan to 'wallaby': Model is not idle",
+        ),
+    ],
+)
+@patch("cou.steps.plan._get_touched_apps")
+@patch("cou.steps.plan.verify_cloud")
+@patch("cou.steps.plan._add_release_upgrade_steps")
+async def test_generate_next_hop_plan_error(
+    mock_add_release_upgrade_steps,
+    mock_verify_cloud,
+    _,
+    o7k_release,
+    error,
+    exp_error_msg,
+    cli_args,
+):
+    """Test generating plan of the next hop during the upgrade with failed verification."""
+    analysis_result = MagicMock(spec_set=Analysis)()
+    analysis_result.refresh = AsyncMock()
+    refreshed_analysis = analysis_result.refresh.return_value
+    refreshed_analysis.current_cloud_o7k_release = OpenStackRelease(o7k_release)
+    refreshed_analysis.current_cloud_series = "focal"
+    plan = UpgradePlan("Upgrade cloud from 'victoria' to 'wallaby'")
+
+    async def verify_cloud(*_):
+        if error is not None:
+            cou_plan.PlanStatus.add_message(error, cou_plan.MessageType.ERROR)
+
+    mock_verify_cloud.side_effect = verify_cloud
+
+    with pytest.raises(RunUpgradeError, match=exp_error_msg):
+        await cou_plan._generate_next_hop_plan(
+            plan, UpgradePlan("test"), OpenStackRelease("wallaby"), [analysis_result], cli_args
+        )
+
+    mock_add_release_upgrade_steps.assert_not_awaited()
+    assert plan.sub_steps == []
@@ -0,0 +1,232 @@
+#  Copyright 2023 Canonical Limited
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Test upgrade plan serialized to a file."""
+import json
+from unittest.mock import AsyncMock
+
+import pytest
+
+from cou.apps.core import Keystone
+from cou.commands import CLIargs
+from cou.exceptions import PlanFileError
+from cou.steps import UpgradePlan, UpgradeStep
+from cou.steps.analyze import Analysis
+from cou.steps.plan_file import PLAN_FILE_VERSION, PlanFile
+from cou.utils.juju_utils import Machine, SubordinateUnit, Unit
+from tests.unit.utils import generate_app_upgrade_plan, generate_upgrade_plan, run_step
+
+MODEL_UUID = "8c0a9f5d-2e4b-4c1f-9f3e-6b1d2a7c5e90"
+ARGS = CLIargs(command="plan", upgrade_group="control-plane", skip_apps={"vault", "ceph-mon"})
+
+
+@pytest.fixture
+def analysis_result(model):
+    """Analysis of model with keystone application."""
+    model.uuid = MODEL_UUID
+    model.get_status_fingerprint = AsyncMock(return_value="status-fingerprint")
+    machines = {f"{i}": Machine(f"{i}", (("keystone", "keystone"),), f"az-{i}") for i in range(3)}
+    keystone = Keystone(
+        name="keystone",
+        can_upgrade_to="ussuri/stable",
+        charm="keystone",
+        channel="ussuri/stable",
+        config={"openstack-origin": {"value": "distro"}},
+        machines=machines,
+        model=model,
+        origin="ch",
+        series="focal",
+        subordinate_to=[],
+        units={
+            f"keystone/{i}": Unit(
+                name=f"keystone/{i}",
+                workload_version="17.0.1",
+                machine=machines[f"{i}"],
+                subordinates=[SubordinateUnit(f"keystone-ldap/{i}", "keystone-ldap")],
+            )
+            for i in range(3)
+        },
+        workload_version="17.0.1",
+        actions={"pause": "Pause the unit."},
+    )
+    return Analysis(model=model, apps=[keystone])
+
+
+def _generate_plan(*descriptions: str) -> UpgradePlan:
+    """Generate upgrade plan."""
+    return generate_upgrade_plan(
+        generate_app_upgrade_plan(
+            "keystone",
+            *(
+                UpgradeStep(description, coro=run_step(description), parallel=True)
+                for description in descriptions
+            ),
+        )
+    )
+
+
+@pytest.mark.asyncio
+async def test_plan_file_save_and_load(analysis_result, tmp_path):
+    """Test saving plan file and loading it again."""
+    path = tmp_path / "plan.json"
+    plan = _generate_plan("Upgrade 'keystone'")
+
+    plan_file = await PlanFile.create(analysis_result, plan, ARGS)
+    plan_file.save(path)
+    data = json.loads(path.read_text())
+
+    assert PlanFile.load(path) == plan_file
+    assert data["version"] == PLAN_FILE_VERSION
+    assert data["model_uuid"] == MODEL_UUID
+    assert data["status_fingerprint"] == "status-fingerprint"
+    assert data["arguments"]["upgrade_group"] == "control-plane"
+    assert data["arguments"]["skip_apps"] == ["ceph-mon", "vault"]
+    assert "command" not in data["arguments"]
+    assert data["plan"] == {
+        "type": "UpgradePlan",
+        "description": "Upgrade cloud from 'ussuri' to 'victoria'",
+        "parallel": False,
+        "sub_steps": [
+            {
+                "type": "PreUpgradeStep",
+                "description": "Back up MySQL databases",
+                "parallel": False,
+                "sub_steps": [],
+            },
+            {
+                "type": "ApplicationUpgradePlan",
+                "description": "Upgrade plan for 'keystone' to 'victoria'",
+                "parallel": False,
+                "sub_steps": [
+                    {
+                        "type": "UpgradeStep",
+                        "description": "Upgrade 'keystone'",
+                        "parallel": True,
+                        "sub_steps": [],
+                    }
+                ],
+            },
+        ],
+    }
+
+
+@pytest.mark.parametrize(
+    "content, exp_error",
+    [
+        ("{", "Could not load plan file"),
+        ("[]", "Could not load plan file"),
+        ('{"version": 4}', "Could not load plan file"),
+        ('{"version": 3}', "Unsupported version 3 of plan file"),
+    ],
+)
+def test_plan_file_load_invalid(content, exp_error, tmp_path):
+    """Test loading invalid plan file."""
+    path = tmp_path / "plan.json"
+    path.write_text(content)
+
+    with pytest.raises(PlanFileError, match=exp_error):
+        PlanFile.load(path)
+
+
+def test_plan_file_load_missing(tmp_path):
+    """Test loading missing plan file."""
+    with pytest.raises(PlanFileError, match="Could not load plan file"):
+        PlanFile.load(tmp_path / "plan.json")
+
+
+@pytest.mark.asyncio
+async def test_plan_file_get_analysis(analysis_result, tmp_path):
+    """Test getting saved analysis from plan file."""
+    path = tmp_path / "plan.json"
+    (await PlanFile.create(analysis_result, _generate_plan(), ARGS)).save(path)
+    analysis_result.model.get_application_config = AsyncMock(
+        return_value={"openstack-origin": {"value": "distro"}}
+    )
+
+    analysis = await PlanFile.load(path).get_analysis(analysis_result.model, ARGS)
+
+    assert analysis == analysis_result
+    keystone, exp_keystone = analysis.apps[0], analysis_result.apps[0]
+    assert isinstance(keystone, Keystone)
+    assert keystone.model is analysis_result.model
+    assert keystone.config == exp_keystone.config
+    assert keystone.machines == exp_keystone.machines
+    assert keystone.units == exp_keystone.units
+    assert (
+        keystone.units["keystone/0"].subordinates == exp_keystone.units["keystone/0"].subordinates
+    )
+    assert keystone.actions == exp_keystone.actions
+
+
+@pytest.mark.asyncio
+async def test_plan_file_get_analysis_config_changed(analysis_result):
+    """Test getting saved analysis uses the current configuration of applications."""
+    plan_file = await PlanFile.create(analysis_result, _generate_plan(), ARGS)
+    config = {"openstack-origin": {"value": "cloud:focal-victoria"}}
+    analysis_result.model.get_application_config = AsyncMock(return_value=config)
+
+    analysis = await plan_file.get_analysis(analysis_result.model, ARGS)
+
+    assert analysis.apps[0].config == config
+    analysis_result.model.get_application_config.assert_awaited_once_with("keystone")
+
+
+@pytest.mark.asyncio
+async def test_plan_file_get_analysis_model_changed(analysis_result):
+    """Test getting saved analysis from plan file if the model changed."""
+    plan_file = await PlanFile.create(analysis_result, _generate_plan(), ARGS)
+    analysis_result.model.get_status_fingerprint.return_value = "new-status-fingerprint"
+
+    assert await plan_file.get_analysis(analysis_result.model, ARGS) is None
+
+
+@pytest.mark.asyncio
+async def test_plan_file_get_analysis_other_model(analysis_result):
+    """Test getting saved analysis from plan file saved for other model."""
+    plan_file = await PlanFile.create(analysis_result, _generate_plan(), ARGS)
+    analysis_result.model.uuid = "other-uuid"
+
+    with pytest.raises(PlanFileError, match=f"The plan file was saved for model '{MODEL_UUID}'"):
+        await plan_file.get_analysis(analysis_result.model, ARGS)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "args, exp_changed",
+    [
+        (CLIargs(command="upgrade", upgrade_group="control-plane"), "skip_apps"),
+        (
+            CLIargs(command="upgrade", upgrade_group="data-plane", skip_apps={"vault"}),
+            "skip_apps, upgrade_group",
+        ),
+    ],
+)
+async def test_plan_file_get_analysis_other_args(analysis_result, args, exp_changed):
+    """Test getting saved analysis from plan file saved with other arguments."""
+    plan_file = await PlanFile.create(analysis_result, _generate_plan(), ARGS)
+
+    with pytest.raises(PlanFileError, match=f"saved with other values of {exp_changed}\\."):
+        await plan_file.get_analysis(analysis_result.model, args)
+
+    analysis_result.model.get_status_fingerprint.assert_awaited_once_with()
+
+
+@pytest.mark.asyncio
+async def test_plan_file_verify_plan(analysis_result):
+    """Test verifying upgrade plan against the saved plan."""
+    plan_file = await PlanFile.create(analysis_result, _generate_plan("Upgrade 'keystone'"), ARGS)
+
+    plan_file.verify_plan(_generate_plan("Upgrade 'keystone'"))
+
+    with pytest.raises(PlanFileError, match="The upgrade plan differs from the saved plan"):
+        plan_file.verify_plan(_generate_plan("Upgrade 'keystone' to 'victoria'"))
@@ -0,0 +1,266 @@
+#  Copyright 2023 Canonical Limited
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Test live view of the upgrade progress."""
+import asyncio
+import io
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from cou.exceptions import EnvironmentVariableError, RunUpgradeError
+from cou.steps import ApplicationUpgradePlan, UnitUpgradeStep, UpgradeStep
+from cou.steps.progress import GroupProgress, ProgressView
+from tests.unit.utils import run_step
+
+
+class TTY(io.StringIO):
+    """Output of the terminal."""
+
+    def isatty(self) -> bool:
+        """Get whether the output is a terminal."""
+        return True
+
+
+def _generate_unit(name: str) -> MagicMock:
+    """Generate unit."""
+    unit = MagicMock()
+    unit.name = name
+    return unit
+
+
+def _generate_app_plan(units: int) -> ApplicationUpgradePlan:
+    """Generate upgrade plan for nova-compute with two steps for each unit."""
+    app_plan = ApplicationUpgradePlan("Upgrade plan for 'nova-compute' to 'victoria'")
+    app_plan.add_step(UpgradeStep("Upgrade 'nova-compute'", coro=run_step("upgrade")))
+    unit_plans = UpgradeStep("Upgrade units", parallel=True)
+    for i in range(units):
+        unit = _generate_unit(f"nova-compute/{i}")
+        unit_plan = UnitUpgradeStep(f"Upgrade plan for unit '{unit.name}'", unit=unit)
+        unit_plan.add_steps(
+            [
+                UnitUpgradeStep(
+                    f"Upgrade packages on '{unit.name}'", coro=run_step("upgrade"), unit=unit
+                ),
+                UnitUpgradeStep(
+                    f"Restart services on '{unit.name}'", coro=run_step("restart"), unit=unit
+                ),
+            ]
+        )
+        unit_plans.add_step(unit_plan)
+
+    app_plan.add_step(unit_plans)
+    return app_plan
+
+
+@pytest.fixture(autouse=True)
+def progress_indicator():
+    """Mock progress indicator."""
+    with patch("cou.steps.progress.progress_indicator") as mock_progress_indicator:
+        mock_progress_indicator.text = None
+        yield mock_progress_indicator
+
+
+@pytest.mark.parametrize(
+    "group, finished, exp_text",
+    [
+        (
+            GroupProgress("Upgrade 'keystone'", 0.0, steps=4),
+            False,
+            "Upgrade 'keystone': 0/4 steps, 0 running",
+        ),
+        (
+            GroupProgress("Upgrade 'nova'", 0.0, steps=20, units=10, finished_units=4, running=3),
+            False,
+            "Upgrade 'nova': 4/10 units, 3 running, 2.0 units/min, ~0:03:00 left",
+        ),
+        (
+            GroupProgress(
+                "Upgrade 'nova'", 0.0, steps=20, units=10, finished_units=10, failed_steps=1
+            ),
+            True,
+            "Upgrade 'nova': 10/10 units, 1 failed in 0:02:00",
+        ),
+    ],
+)
+def test_group_progress_format(group, finished, exp_text):
+    """Test formatting progress of the group."""
+    assert group.format(120.0, finished) == exp_text
+
+
+def test_progress_view_render():
+    """Test rendering progress of the groups and the units running the longest."""
+    app_plan = _generate_app_plan(3)
+    upgrade, unit_plans = app_plan.sub_steps
+    unit_0, unit_1, unit_2 = unit_plans.sub_steps
+    view = ProgressView(io.StringIO())
+
+    with patch("cou.steps.progress.time.monotonic", side_effect=range(0, 100, 10)):
+        view.step_started(app_plan)  # 0
+        view.step_started(upgrade)  # 10
+        view.step_finished(upgrade, None)
+        view.step_started(unit_plans)
+        for unit_plan in (unit_0, unit_1, unit_2):
+            view.step_started(unit_plan)  # 20, 30, 40
+            view.step_started(unit_plan.sub_steps[0])
+        view.step_finished(unit_0.sub_steps[0], None)
+        view.step_started(unit_0.sub_steps[1])
+        view.step_finished(unit_0.sub_steps[1], None)
+        view.step_finished(unit_0, None)
+        view.step_finished(unit_1.sub_steps[0], RunUpgradeError("failed"))
+
+    assert view.render(80.0) == [
+        "Upgrade plan for 'nova-compute' to 'victoria': 1/3 units, 1 running, 1 failed, "
+        "0.8 units/min, ~0:02:40 left",
+        "   0:00:50  nova-compute/1  Upgrade packages on 'nova-compute/1'",
+        "   0:00:40  nova-compute/2  Upgrade packages on 'nova-compute/2'",
+    ]
+
+
+def test_progress_view_render_step_without_unit():
+    """Test rendering running step without unit only by its description."""
+    step = UpgradeStep("Back up MySQL databases", coro=run_step("backup"))
+    view = ProgressView(io.StringIO())
+
+    with patch("cou.steps.progress.time.monotonic", return_value=5.0):
+        view.step_started(step)
+
+    assert view.render(65.0) == ["   0:01:00  Back up MySQL databases"]
+
+
+def test_progress_view_render_max_in_flight(progress_indicator):
+    """Test rendering limited number of the running units and the current text."""
+    progress_indicator.text = "Upgrade packages on 'nova-compute/14'"
+    app_plan = _generate_app_plan(15)
+    view = ProgressView(io.StringIO())
+    for unit_plan in app_plan.sub_steps[1].sub_steps:
+        view.step_started(unit_plan)
+
+    lines = view.render(0.0)
+
+    assert len(lines) == 12
+    assert lines[-2:] == ["  ... and 5 more running", "Upgrade packages on 'nova-compute/14'"]
+
+
+@patch.dict(os.environ, {"COU_PROGRESS_INTERVAL": "0.5", "COU_PROGRESS_REPORT_INTERVAL": "300"})
+def test_progress_view_intervals():
+    """Test intervals of the view configured by the environment variables."""
+    view = ProgressView(io.StringIO())
+
+    assert view.interval == 0.5
+    assert view.report_interval == 300.0
+
+
+@pytest.mark.parametrize(
+    "name, value",
+    [("COU_PROGRESS_INTERVAL", "fast"), ("COU_PROGRESS_REPORT_INTERVAL", "0")],
+)
+def test_progress_view_intervals_invalid(name, value):
+    """Test intervals of the view which are not positive numbers."""
+    with patch.dict(os.environ, {name: value}), pytest.raises(
+        EnvironmentVariableError, match=f"{name} must be a positive number of seconds"
+    ):
+        ProgressView(io.StringIO())
+
+
+def test_progress_view_group_finished():
+    """Test printing the finished group."""
+    stream = io.StringIO()
+    app_plan = _generate_app_plan(1)
+    view = ProgressView(stream)
+
+    with patch("cou.steps.progress.time.monotonic", side_effect=[0.0, 15.0]):
+        view.step_started(app_plan)
+        view.step_finished(app_plan, None)
+
+    assert view.groups == {}
+    assert stream.getvalue() == (
+        "Upgrade plan for 'nova-compute' to 'victoria': 0/1 units in 0:00:15\n"
+    )
+
+
+def test_progress_view_group_finished_live(progress_indicator):
+    """Test clearing the outdated text of the paused spinner once the group is finished."""
+    app_plan = _generate_app_plan(1)
+    view = ProgressView(TTY())
+
+    view.step_started(app_plan)
+    view.step_finished(app_plan, None)
+
+    progress_indicator.stop.assert_called_once_with()
+
+
+def test_progress_view_report():
+    """Test printing progress of the running groups if the output is not a terminal."""
+    stream = io.StringIO()
+    view = ProgressView(stream)
+    view.step_started(_generate_app_plan(2))
+
+    view.report()
+
+    assert not view.live
+    assert stream.getvalue() == (
+        "Upgrade plan for 'nova-compute' to 'victoria': 0/2 units, 0 running\n"
+    )
+
+
+def test_progress_view_draw():
+    """Test redrawing the view in place and printing messages above it."""
+    stream = TTY()
+    view = ProgressView(stream)
+    view.step_started(_generate_app_plan(2))
+
+    view.draw()
+    view.print("Backed up MySQL")
+    view.draw()
+
+    line = "Upgrade plan for 'nova-compute' to 'victoria': 0/2 units, 0 running\n"
+    assert stream.getvalue() == (f"{line}\x1b[1F\x1b[JBacked up MySQL\n{line}\x1b[1F\x1b[J{line}")
+
+
+@pytest.mark.asyncio
+async def test_progress_view_start_stop(progress_indicator):
+    """Test showing the live view in place of the progress spinner."""
+    stream = TTY()
+    view = ProgressView(stream)
+    view.step_started(_generate_app_plan(2))
+
+    view.start()
+    await asyncio.sleep(0)
+    progress_indicator.pause.assert_called_once_with(view.print)
+    assert stream.getvalue().startswith("Upgrade plan for 'nova-compute'")
+
+    view.stop()
+    progress_indicator.resume.assert_called_once_with()
+    assert stream.getvalue().endswith("\x1b[1F\x1b[J")
+    assert view._task is None
+
+
+@pytest.mark.asyncio
+async def test_progress_view_start_stop_not_tty(progress_indicator):
+    """Test printing the progress periodically if the output is not a terminal."""
+    stream = io.StringIO()
+    view = ProgressView(stream)
+    view.step_started(_generate_app_plan(2))
+
+    view.report_interval = 0
+    view.start()
+    await asyncio.sleep(0.01)
+    view.stop()
+
+    progress_indicator.pause.assert_not_called()
+    progress_indicator.resume.assert_not_called()
+    assert stream.getvalue().startswith(
+        "Upgrade plan for 'nova-compute' to 'victoria': 0/2 units, 0 running\n"
+    )
@@ -0,0 +1,239 @@
+#  Copyright 2023 Canonical Limited
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Test critical path analysis of the executed upgrade plan."""
+import json
+
+import pytest
+
+from cou.exceptions import RunAnalysisError
+from cou.steps import UpgradePlan, UpgradeStep
+from cou.steps.execute import add_observer, apply_step, remove_observer
+from cou.steps.run_analysis import (
+    ExecutedStep,
+    format_run_report,
+    get_critical_path,
+    get_savings,
+    load_run,
+)
+from cou.steps.trace import StepTracer
+from tests.unit.utils import run_step
+
+
+def _event(step_id, parent, name, start, duration, parallel=False, outcome="succeeded"):
+    """Generate trace event of the step, with times in seconds."""
+    return {
+        "name": name,
+        "ph": "X",
+        "ts": start * 1_000_000,
+        "dur": duration * 1_000_000,
+        "pid": 1,
+        "tid": 1,
+        "args": {"id": step_id, "parent": parent, "parallel": parallel, "outcome": outcome},
+    }
+
+
+# Upgrade cloud (0-100s)
+#   Back up MySQL databases (0-10s)
+#   Upgrade hypervisors in parallel (10-70s)
+#     Upgrade machine '0' (10-40s)
+#     Upgrade machine '1' (10-70s)
+#       Upgrade packages (10-30s)
+#       Upgrade nova-compute (30-70s)
+#   Upgrade ceph-osd (70-100s)
+TRACE_EVENTS = [
+    {"name": "thread_name", "ph": "M", "pid": 1, "tid": 1, "args": {"name": "Upgrade cloud"}},
+    _event(3, 2, "Upgrade machine '0'", 10, 30),
+    _event(5, 4, "Upgrade packages", 10, 20),
+    _event(6, 4, "Upgrade nova-compute", 30, 40),
+    _event(4, 2, "Upgrade machine '1'", 10, 60),
+    _event(2, 1, "Upgrade hypervisors in parallel", 10, 60, parallel=True),
+    _event(1, None, "Upgrade cloud", 0, 100),
+    _event(7, 1, "Upgrade ceph-osd", 70, 30, outcome="failed"),
+    _event(8, 1, "Back up MySQL databases", 0, 10),
+]
+
+
+@pytest.fixture
+def trace_file(tmp_path):
+    """Trace of the upgrade run."""
+    path = tmp_path / "cou-20231215211717.trace.json"
+    path.write_text(json.dumps({"traceEvents": TRACE_EVENTS}))
+    return path
+
+
+def test_load_run(trace_file):
+    """Test rebuilding tree of the executed steps from trace."""
+    run = load_run(trace_file)
+
+    assert run.description == "Upgrade cloud"
+    assert run.duration == 100
+    assert [step.description for step in run.sub_steps] == [
+        "Back up MySQL databases",
+        "Upgrade hypervisors in parallel",
+        "Upgrade ceph-osd",
+    ]
+    assert run.sub_steps[1].parallel is True
+    assert [step.description for step in run.sub_steps[1].sub_steps[1].sub_steps] == [
+        "Upgrade packages",
+        "Upgrade nova-compute",
+    ]
+    assert run.sub_steps[2].outcome == "failed"
+    assert run.sub_steps[2].end == 100
+
+
+def test_load_run_from_log(trace_file, tmp_path):
+    """Test loading run from the log file with path to the trace."""
+    log_file = tmp_path / "cou-20231215211717.log"
+    log_file.write_text(
+        "2023-12-15 21:17:17 [cou.cli] [INFO] Starting the upgrade.\n"
+        "2023-12-15 23:17:17 [cou.steps.trace] [INFO] trace of the upgrade steps saved to "
+        f"{trace_file}\n"
+    )
+
+    assert load_run(log_file).description == "Upgrade cloud"
+
+
+def test_load_run_several_plans(tmp_path):
+    """Test loading run which applied several plans."""
+    path = tmp_path / "trace.json"
+    path.write_text(
+        json.dumps(
+            {
+                "traceEvents": [
+                    _event(2, None, "Upgrade cloud from 'victoria' to 'wallaby'", 60, 40),
+                    _event(1, None, "Upgrade cloud from 'ussuri' to 'victoria'", 10, 50),
+                ]
+            }
+        )
+    )
+
+    run = load_run(path)
+
+    assert run.description == "Upgrade run"
+    assert (run.start, run.duration) == (10, 90)
+    assert [step.description for step in run.sub_steps] == [
+        "Upgrade cloud from 'ussuri' to 'victoria'",
+        "Upgrade cloud from 'victoria' to 'wallaby'",
+    ]
+
+
+@pytest.mark.parametrize(
+    "file_name, content, exp_error",
+    [
+        ("cou.log", "no trace", "No trace of the upgrade steps was saved by the run"),
+        ("trace.json", "{", "Could not load trace"),
+        ("trace.json", '{"traceEvents": [{"ph": "X"}]}', "Could not load trace"),
+        ("trace.json", '{"traceEvents": []}', "No steps were recorded in trace"),
+    ],
+)
+def test_load_run_invalid(file_name, content, exp_error, tmp_path):
+    """Test loading run from invalid file."""
+    path = tmp_path / file_name
+    path.write_text(content)
+
+    with pytest.raises(RunAnalysisError, match=exp_error):
+        load_run(path)
+
+
+def test_load_run_missing_log(tmp_path):
+    """Test loading run from missing log file."""
+    with pytest.raises(RunAnalysisError, match="Could not read log file"):
+        load_run(tmp_path / "cou.log")
+
+
+def test_get_critical_path(trace_file):
+    """Test getting critical path through sequential and parallel steps."""
+    critical_path = get_critical_path(load_run(trace_file))
+
+    assert [step.description for step in critical_path] == [
+        "Back up MySQL databases",
+        "Upgrade packages",
+        "Upgrade nova-compute",
+        "Upgrade ceph-osd",
+    ]
+
+
+def test_get_savings(trace_file):
+    """Test ranking steps by the time saved if they were faster or parallel."""
+    savings = [
+        (saving.step.description, saving.change, saving.seconds)
+        for saving in get_savings(load_run(trace_file))
+    ]
+
+    assert savings == [
+        ("Upgrade cloud", "parallel", 40),
+        ("Upgrade nova-compute", "faster", 30),
+        ("Upgrade ceph-osd", "faster", 30),
+        ("Upgrade machine '1'", "parallel", 20),
+        ("Upgrade packages", "faster", 20),
+        ("Back up MySQL databases", "faster", 10),
+    ]
+
+
+def test_get_savings_no_slack():
+    """Test ignoring steps running in parallel with equally long steps."""
+    run = ExecutedStep("Upgrade units", 0, 10, parallel=True)
+    run.sub_steps = [ExecutedStep(f"Upgrade unit '{i}'", 0, 10) for i in range(2)]
+
+    assert get_savings(run) == []
+
+
+def test_format_run_report(trace_file):
+    """Test formatting report of the run."""
+    report = format_run_report(load_run(trace_file))
+
+    assert report.splitlines() == [
+        "Upgrade cloud took 0:01:40",
+        "",
+        "Critical path:",
+        "   0:00:10   10.0%  Back up MySQL databases",
+        "   0:00:20   20.0%  Upgrade packages",
+        "   0:00:40   40.0%  Upgrade nova-compute",
+        "   0:00:30   30.0%  Upgrade ceph-osd (failed)",
+        "",
+        "Largest potential savings:",
+        "   0:00:40  parallel  Upgrade cloud",
+        "   0:00:30  faster    Upgrade nova-compute",
+        "   0:00:30  faster    Upgrade ceph-osd",
+        "   0:00:20  parallel  Upgrade machine '1'",
+        "   0:00:20  faster    Upgrade packages",
+        "   0:00:10  faster    Back up MySQL databases",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_load_run_saved_by_tracer(tmp_path):
+    """Test loading run from the trace saved by the step tracer."""
+    plan = UpgradePlan("Upgrade cloud")
+    units_step = UpgradeStep("Upgrade units", parallel=True)
+    units_step.add_steps(
+        UpgradeStep(f"Upgrade unit 'keystone/{i}'", coro=run_step(f"{i}")) for i in range(2)
+    )
+    plan.add_step(units_step)
+    tracer = StepTracer()
+    add_observer(tracer)
+    try:
+        await apply_step(plan, prompt=False)
+    finally:
+        remove_observer(tracer)
+
+    tracer.save(tmp_path / "trace.json")
+    run = load_run(tmp_path / "trace.json")
+
+    assert run.description == "Upgrade cloud"
+    assert run.sub_steps[0].parallel is True
+    assert [step.description for step in run.sub_steps[0].sub_steps] == [
+        "Upgrade unit 'keystone/0'",
+        "Upgrade unit 'keystone/1'",
+    ]
@@ -14,20 +14,31 @@
 
 """Test steps package."""
 import asyncio
+import hashlib
 import re
-from unittest.mock import MagicMock
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 
+from cou.commands import CLIargs
 from cou.exceptions import CanceledStep
 from cou.steps import (
     DEPENDENCY_DESCRIPTION_PREFIX,
     BaseStep,
+    FailurePolicy,
     PostUpgradeStep,
     PreUpgradeStep,
     UpgradePlan,
+    UpgradeStep,
+    _get_stable_value,
     compare_step_coroutines,
+    get_coroutine_call,
 )
+from cou.steps.plan import MessageType
+from cou.utils.juju_utils import Machine, Model, Unit, retry
+from cou.utils.openstack import OpenStackRelease
+from tests.unit.utils import generate_cou_machine
 
 
 async def mock_coro(*args, **kwargs):
@@ -50,6 +61,31 @@ def test_compare_step_coroutines(coro1, coro2, exp_result):
     assert compare_step_coroutines(coro1, coro2) == exp_result
 
 
+@retry
+async def mock_retry_coro(arg1, arg2=2, *, kwarg1=None):
+    pass
+
+
+def test_get_coroutine_call():
+    """Test getting function call of coroutine."""
+    coro = mock_coro(1, kwarg1=True)
+
+    assert get_coroutine_call(coro) == (
+        "mock_coro",
+        {"args": (1,), "kwargs": {"kwarg1": True}},
+    )
+
+
+def test_get_coroutine_call_retry():
+    """Test getting function call of coroutine wrapped by retry."""
+    coro = mock_retry_coro(1, kwarg1=True)
+
+    assert get_coroutine_call(coro) == (
+        "mock_retry_coro",
+        {"arg1": 1, "arg2": 2, "kwarg1": True},
+    )
+
+
 @pytest.mark.parametrize(
     "description, parallel",
     [
@@ -79,6 +115,218 @@ def test_step_hash():
     assert hash(("test hash", False, coro)) == hash(step)
 
 
+@pytest.mark.parametrize(
+    "value, exp_value",
+    [
+        (None, None),
+        ("name", "name"),
+        ({"a": 1, "b": [True, 1.5]}, [["a", 1], ["b", [True, 1.5]]]),
+        (("a", 1), ["a", 1]),
+        ({"b", "a"}, ["a", "b"]),
+        (DEPENDENCY_DESCRIPTION_PREFIX, DEPENDENCY_DESCRIPTION_PREFIX),
+        (Unit("keystone/0", MagicMock(), "17.0.1"), "Unit(keystone/0)"),
+        (
+            Machine("0", (("keystone", "keystone"),), "az-0"),
+            [
+                "Machine",
+                ["machine_id", "0"],
+                ["apps_charms", [["keystone", "keystone"]]],
+                ["az", "az-0"],
+                ["region", None],
+            ],
+        ),
+        (OpenStackRelease("victoria"), "OpenStackRelease(victoria)"),
+        (UpgradePlan("Upgrade cloud"), "UpgradePlan(Upgrade cloud)"),
+        (FailurePolicy(25), ["FailurePolicy", ["max_failed_percentage", 25]]),
+        (MessageType.ERROR, "MessageType.ERROR"),
+        (mock_coro, "mock_coro"),
+    ],
+)
+def test_get_stable_value(value, exp_value):
+    """Test getting representation of value, which is the same in every process."""
+    assert _get_stable_value(value) == exp_value
+
+
+@pytest.mark.parametrize("value", [object(), MagicMock(), [1, object()]])
+def test_get_stable_value_unknown_type(value):
+    """Test getting representation of value without stable representation."""
+    with pytest.raises(TypeError, match="has no stable representation"):
+        _get_stable_value(value)
+
+
+def test_get_stable_value_ignored_fields():
+    """Test getting representation of dataclass without fields excluded from fingerprint."""
+    plan_args = CLIargs("plan", quiet=True, output=Path("plan.json"), to="yoga")
+    upgrade_args = CLIargs("upgrade", auto_approve=True, plan_file=Path("plan.json"), to="yoga")
+
+    assert _get_stable_value(plan_args) == _get_stable_value(upgrade_args)
+    assert _get_stable_value(plan_args) != _get_stable_value(CLIargs("plan", to="xena"))
+
+
+def test_step_kind():
+    """Test kind of BaseStep."""
+    model = Model("test-model")
+
+    assert UpgradePlan("plan").kind == "UpgradePlan"
+    assert BaseStep("step", coro=mock_coro()).kind == "mock_coro"
+    assert BaseStep("step", coro=model.run_action("keystone/0", "pause")).kind == (
+        "Model.run_action:pause"
+    )
+    assert BaseStep("step", coro=model.wait_for_idle(300)).kind == (
+        "JubilantModelMixin.wait_for_idle"
+    )
+
+
+def test_step_fingerprint():
+    """Test structural fingerprint of BaseStep."""
+    unit = Unit("keystone/0", MagicMock(), "17.0.1")
+
+    def generate_step(description="step", unit=unit, arg=1, step_type=PreUpgradeStep, **kwargs):
+        step = UpgradePlan("plan")
+        step.add_step(step_type(description, coro=mock_coro(arg), unit=unit, **kwargs))
+        return step
+
+    step = generate_step()
+
+    assert step.fingerprint == generate_step().fingerprint
+    assert re.fullmatch("[0-9a-f]{64}", step.fingerprint)
+    assert step.fingerprint != generate_step(description="other step").fingerprint
+    assert step.fingerprint != generate_step(unit=None).fingerprint
+    assert step.fingerprint != generate_step(arg=2).fingerprint
+    assert step.fingerprint != generate_step(step_type=PostUpgradeStep).fingerprint
+    assert step.fingerprint != generate_step(dependent=True).fingerprint
+
+
+@pytest.mark.parametrize(
+    "attribute, value",
+    [
+        ("parallel", False),
+        ("max_parallel", 2),
+        ("dependent", True),
+        ("unit", Unit("keystone/0", MagicMock(), "17.0.1")),
+        ("failure_policy", FailurePolicy.FAIL_FAST),
+        ("compensating", True),
+    ],
+)
+def test_step_fingerprint_changed_attribute(attribute, value):
+    """Test structural fingerprint of BaseStep changes with its attributes."""
+    step = UpgradePlan("plan")
+    step.add_step(UpgradeStep("step", parallel=True, coro=mock_coro()))
+    fingerprint = step.fingerprint
+
+    setattr(step.sub_steps[0], attribute, value)
+
+    assert getattr(step.sub_steps[0], attribute) == value
+    assert step.fingerprint != fingerprint
+
+
+def test_step_fingerprint_changed_coro():
+    """Test structural fingerprint of BaseStep changes with its coroutine."""
+    step = BaseStep("step", coro=mock_coro(1))
+    fingerprint = step.fingerprint
+
+    step.coro = mock_coro(2)
+
+    assert step.fingerprint != fingerprint
+    assert step.fingerprint == BaseStep("step", coro=mock_coro(2)).fingerprint
+    assert step.kind == "mock_coro"
+
+
+def test_step_fingerprint_plan_argument():
+    """Test structural fingerprint of BaseStep with the plan containing it as argument."""
+    plan = UpgradePlan("plan")
+    plan.add_step(BaseStep("refresh plan", coro=mock_coro(plan)))
+    fingerprint = plan.sub_steps[0].fingerprint
+
+    plan.add_step(BaseStep("step", coro=mock_coro()))
+
+    assert plan.sub_steps[0].fingerprint == fingerprint
+
+
+def test_step_fingerprint_unknown_argument():
+    """Test structural fingerprint of BaseStep with argument without stable representation."""
+    step = BaseStep("step", coro=mock_coro(object()))
+
+    assert step.kind == "mock_coro"
+    with pytest.raises(TypeError, match="has no stable representation"):
+        step.fingerprint
+
+
+@pytest.mark.parametrize("parallel, exp_same", [(True, True), (False, False)])
+def test_step_fingerprint_order(parallel, exp_same):
+    """Test structural fingerprint of BaseStep depends on order of only sequential sub-steps."""
+
+    def generate_step(*names):
+        step = UpgradeStep("step", parallel=parallel, max_parallel=1 if parallel else None)
+        step.add_steps(UpgradeStep(name, coro=mock_coro(name)) for name in names)
+        return step
+
+    assert (generate_step("a", "b").fingerprint == generate_step("b", "a").fingerprint) is exp_same
+
+
+def test_step_fingerprint_cached():
+    """Test structural fingerprint of BaseStep is computed again only if the step changed."""
+    step = UpgradePlan("plan")
+    sub_step = UpgradePlan("sub-plan")
+    sub_step.add_step(PreUpgradeStep("step", coro=mock_coro()))
+    other_sub_step = UpgradePlan("other sub-plan")
+    other_sub_step.add_step(PreUpgradeStep("step", coro=mock_coro()))
+    step.add_steps([sub_step, other_sub_step])
+    fingerprint = step.fingerprint
+
+    with patch("cou.steps.hashlib.sha256", wraps=hashlib.sha256) as mock_sha256:
+        sub_step.add_step(PreUpgradeStep("other step", coro=mock_coro()))
+        new_fingerprint = step.fingerprint
+
+        assert step.fingerprint == new_fingerprint
+        # only the new step, the changed sub-step and the plan are computed again
+        assert mock_sha256.call_count == 3
+
+    assert new_fingerprint != fingerprint
+    sub_step.sub_steps[0].description = "new step"
+    assert step.fingerprint != new_fingerprint
+
+
+def test_step_replace_sub_steps():
+    """Test replacing sub-steps of BaseStep."""
+    step = UpgradePlan("plan")
+    step.add_steps(PreUpgradeStep(f"step {i}", coro=mock_coro(i)) for i in range(3))
+    fingerprint = step.fingerprint
+    new_step = PreUpgradeStep("new step", coro=mock_coro())
+
+    step.replace_sub_steps([new_step], 1, 2)
+
+    assert [sub_step.description for sub_step in step.sub_steps] == [
+        "step 0",
+        "new step",
+        "step 2",
+    ]
+    assert step.fingerprint != fingerprint
+    new_fingerprint = step.fingerprint
+    new_step.description = "changed step"
+    assert step.fingerprint != new_fingerprint
+
+    step.replace_sub_steps([])
+
+    assert step.sub_steps == []
+
+
+@pytest.mark.asyncio
+async def test_step_fingerprint_after_run():
+    """Test structural fingerprint of BaseStep does not change when the step is run."""
+
+    async def coro(value):
+        result = value
+        await asyncio.sleep(0)
+        return result
+
+    step = BaseStep("step", coro=coro(1))
+
+    await step.run()
+
+    assert step.fingerprint == BaseStep("step", coro=coro(1)).fingerprint
+
+
 @pytest.mark.parametrize(
     "description, parallel, args",
     [("test", False, ()), ("test description", True, ("name", 1, 2))],
@@ -218,6 +466,15 @@ async def test_properties():
     assert upgrade_step.all_done is True
 
 
+def test_step_machine_id():
+    """Test BaseStep machine_id property."""
+    unit = MagicMock()
+    unit.machine = generate_cou_machine("1")
+
+    assert BaseStep(description="test").machine_id is None
+    assert BaseStep(description="test", unit=unit).machine_id == "1"
+
+
 def test_step_add_step():
     """Test BaseStep adding sub steps."""
     exp_sub_steps = 3
@@ -288,6 +545,35 @@ def test_step_cancel_unsafe():
     mock_task.cancel.assert_called_once_with("canceled: BaseStep(test plan)")
 
 
+def test_step_skip():
+    """Test skipping step coroutine."""
+    plan = BaseStep(description="plan", coro=mock_coro())
+    plan.sub_steps = sub_steps = [BaseStep(description="sub", coro=mock_coro())]
+
+    plan.skip()
+
+    assert plan.skipped is True
+    assert sub_steps[0].skipped is False
+    assert bool(plan) is True
+
+    sub_steps[0].skip()
+
+    assert bool(plan) is False
+
+
+@pytest.mark.asyncio
+async def test_step_run_skipped():
+    """Test BaseStep run skipped step."""
+    coro = AsyncMock()
+    step = BaseStep(description="test plan", coro=coro())
+    step.skip()
+
+    await step.run()
+
+    coro.assert_not_awaited()
+    assert step._task is None
+
+
 @pytest.mark.asyncio
 async def test_step_run():
     """Test BaseStep run."""
@@ -422,3 +708,72 @@ async def test_step_full_run(sub_steps, exp_order, parallel):
         await step_run(plan)
 
     assert steps_order == exp_order
+
+
+@pytest.mark.parametrize(
+    "value, exp_policy, exp_str",
+    [
+        ("wait-all", FailurePolicy.WAIT_ALL, "wait-all"),
+        ("Fail-Fast", FailurePolicy.FAIL_FAST, "fail-fast"),
+        ("threshold=25%", FailurePolicy(25), "threshold=25%"),
+        ("threshold=12.5", FailurePolicy(12.5), "threshold=12.5%"),
+    ],
+)
+def test_failure_policy_from_string(value, exp_policy, exp_str):
+    """Test creating failure policy from string."""
+    policy = FailurePolicy.from_string(value)
+
+    assert policy == exp_policy
+    assert str(policy) == exp_str
+
+
+@pytest.mark.parametrize("value", ["fail-slow", "threshold=abc", "threshold=-1%", "threshold=101"])
+def test_failure_policy_from_string_invalid(value):
+    """Test creating failure policy from invalid string."""
+    with pytest.raises(ValueError):
+        FailurePolicy.from_string(value)
+
+
+@pytest.mark.parametrize(
+    "policy, failed, exp_result",
+    [
+        (FailurePolicy.WAIT_ALL, 10, False),
+        (FailurePolicy.FAIL_FAST, 0, False),
+        (FailurePolicy.FAIL_FAST, 1, True),
+        (FailurePolicy(20), 2, False),
+        (FailurePolicy(20), 3, True),
+    ],
+)
+def test_failure_policy_should_cancel(policy, failed, exp_result):
+    """Test checking if remaining sub-steps should be canceled."""
+    assert policy.should_cancel(failed, 10) is exp_result
+
+
+def test_step_started():
+    """Test step started property."""
+    plan = UpgradePlan("plan")
+    step = BaseStep("test", coro=mock_coro())
+    plan.add_step(step)
+
+    assert plan.started is False
+
+    step._task = MagicMock()
+
+    assert step.started is True
+    assert plan.started is True
+
+
+def test_step_set_default_failure_policy():
+    """Test setting default failure policy to step and its sub-steps."""
+    plan = UpgradePlan("plan")
+    step = BaseStep("test", parallel=True, failure_policy=FailurePolicy.WAIT_ALL)
+    sub_step = BaseStep("test", parallel=True)
+    sub_step.add_step(BaseStep("test", coro=mock_coro()))
+    step.add_step(sub_step)
+    plan.add_step(step)
+
+    plan.set_default_failure_policy(FailurePolicy.FAIL_FAST)
+
+    assert plan.failure_policy == FailurePolicy.FAIL_FAST
+    assert step.failure_policy == FailurePolicy.WAIT_ALL
+    assert sub_step.failure_policy == FailurePolicy.FAIL_FAST
@@ -0,0 +1,156 @@
+#  Copyright 2023 Canonical Limited
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Test trace of the upgrade steps."""
+import json
+from unittest.mock import patch
+
+import pytest
+
+from cou.exceptions import RunUpgradeError
+from cou.steps import UnitUpgradeStep, UpgradePlan, UpgradeStep
+from cou.steps.execute import add_observer, apply_step, remove_observer
+from cou.steps.trace import StepTracer, get_step_outcome
+from cou.utils.juju_utils import Machine, Unit
+from tests.unit.utils import run_step
+
+
+async def _fail(description: str) -> None:
+    """Fail step."""
+    raise RunUpgradeError(description)
+
+
+def _generate_unit(name: str, machine_id: str) -> Unit:
+    """Generate unit on machine."""
+    return Unit(name, Machine(machine_id, (), "az-0"), "17.0.1")
+
+
+@pytest.mark.parametrize(
+    "canceled, skipped, error, exp_outcome",
+    [
+        (False, False, None, "succeeded"),
+        (False, True, None, "skipped"),
+        (False, False, RunUpgradeError("failed"), "failed"),
+        (True, False, None, "canceled"),
+    ],
+)
+def test_get_step_outcome(canceled, skipped, error, exp_outcome):
+    """Test getting outcome of the finished step."""
+    step = UpgradeStep("Upgrade 'keystone'", coro=run_step("keystone"))
+    if canceled:
+        step.cancel()
+    if skipped:
+        step.skip()
+
+    assert get_step_outcome(step, error) == exp_outcome
+
+
+@pytest.mark.asyncio
+async def test_step_tracer(tmp_path):
+    """Test tracing steps running in parallel on separate tracks."""
+    plan = UpgradePlan("Upgrade cloud")
+    units_step = UpgradeStep("Upgrade units", parallel=True)
+    units_step.add_steps(
+        UnitUpgradeStep(f"Upgrade unit 'nova-compute/{i}'", coro=run_step(f"{i}"), unit=unit)
+        for i, unit in enumerate(_generate_unit(f"nova-compute/{i}", f"{i}") for i in range(2))
+    )
+    plan.add_step(units_step)
+    tracer = StepTracer()
+    add_observer(tracer)
+
+    try:
+        await apply_step(plan, prompt=False)
+    finally:
+        remove_observer(tracer)
+
+    tracer.save(tmp_path / "trace.json")
+    data = json.loads((tmp_path / "trace.json").read_text())
+
+    events = {event["name"]: event for event in data["traceEvents"] if event["ph"] == "X"}
+    assert list(events) == [
+        "Upgrade unit 'nova-compute/0'",
+        "Upgrade unit 'nova-compute/1'",
+        "Upgrade units",
+        "Upgrade cloud",
+    ]
+    assert events["Upgrade cloud"]["tid"] == events["Upgrade units"]["tid"]
+    assert len({event["tid"] for event in events.values()}) == 3
+    assert events["Upgrade unit 'nova-compute/1'"]["args"] == {
+        "id": 4,
+        "parent": 2,
+        "type": "UnitUpgradeStep",
+        "kind": "run_step",
+        "parallel": False,
+        "outcome": "succeeded",
+        "unit": "nova-compute/1",
+        "machine": "1",
+    }
+    assert events["Upgrade units"]["args"] == {
+        "id": 2,
+        "parent": 1,
+        "type": "UpgradeStep",
+        "kind": "UpgradeStep",
+        "parallel": True,
+        "outcome": "succeeded",
+    }
+    assert events["Upgrade cloud"]["args"]["parent"] is None
+    for event in events.values():
+        assert event["ts"] >= 0
+        assert event["dur"] >= 0
+
+    tracks = [event["args"]["name"] for event in data["traceEvents"] if event["ph"] == "M"]
+    assert tracks == [
+        "Upgrade cloud",
+        "Upgrade unit 'nova-compute/0'",
+        "Upgrade unit 'nova-compute/1'",
+    ]
+    assert "start_time" in data["otherData"]
+
+
+@pytest.mark.asyncio
+async def test_step_tracer_failed_step():
+    """Test tracing failed step."""
+    step = UpgradeStep("Upgrade 'keystone'", coro=_fail("keystone"))
+    tracer = StepTracer()
+    add_observer(tracer)
+
+    try:
+        with pytest.raises(RunUpgradeError):
+            await apply_step(step, prompt=False)
+    finally:
+        remove_observer(tracer)
+
+    [event] = tracer.events[1:]
+    assert event["args"]["outcome"] == "failed"
+    assert event["args"]["error"] == "RunUpgradeError('keystone')"
+
+
+def test_step_tracer_not_started_step():
+    """Test ignoring step which was not started."""
+    tracer = StepTracer()
+
+    tracer.step_finished(UpgradeStep("Upgrade 'keystone'", coro=run_step("keystone")), None)
+
+    assert tracer.events == []
+
+
+def test_step_tracer_save_failed(tmp_path):
+    """Test saving trace to path which can not be written."""
+    tracer = StepTracer()
+    path = tmp_path / "trace.json"
+    path.mkdir()
+
+    with patch("cou.logging.logger") as mock_logger:
+        tracer.save(path)
+
+    mock_logger.warning.assert_called_once()
@@ -12,17 +12,45 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from pathlib import Path
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 from juju.errors import JujuError
 
 from cou import cli
-from cou.exceptions import COUException, HighestReleaseAchieved, TimeoutException
+from cou.exceptions import (
+    COUException,
+    EnvironmentVariableError,
+    HighestReleaseAchieved,
+    RunAnalysisError,
+    RunUpgradeError,
+    TimeoutException,
+)
 from cou.ssdlc import SSDLCSysEvent
-from cou.steps import PreUpgradeStep, UpgradePlan
+from cou.steps import (
+    ApplicationUpgradePlan,
+    FailurePolicy,
+    PreUpgradeStep,
+    UnitUpgradeStep,
+    UpgradePlan,
+    UpgradeStep,
+    execute,
+)
 from cou.steps.analyze import Analysis
+from cou.steps.history import DurationHistory
+from cou.steps.journal import StepJournal
+from cou.steps.metrics import MetricsExporter
 from cou.steps.plan import PlanStatus
+from cou.steps.progress import ProgressView
+from cou.steps.trace import StepTracer
+
+
+@pytest.fixture(autouse=True)
+def profiler():
+    """Profiler of the run, which is never started by the tests."""
+    with patch("cou.cli.Profiler") as mock_profiler:
+        yield mock_profiler
 
 
 @pytest.mark.parametrize(
@@ -63,7 +91,7 @@ def test_get_log_level(quiet, verbosity, level):
 @pytest.mark.asyncio
 @patch("cou.cli.Model")
 @patch("cou.cli.print_and_debug")
-@patch("cou.cli.generate_plan", new_callable=AsyncMock)
+@patch("cou.cli.generate_plan", new_callable=AsyncMock, return_value=UpgradePlan("Upgrade"))
 @patch("cou.cli.verify_cloud", new_callable=AsyncMock)
 @patch("cou.cli.Analysis.create", new_callable=AsyncMock)
 @patch("cou.cli.PlanStatus", spec_set=PlanStatus)
@@ -92,10 +120,201 @@ async def test_analyze_and_generate_plan(
 
 @pytest.mark.asyncio
 @patch("cou.cli.Model")
+@patch("builtins.print")
+@patch("cou.cli.print_and_debug")
+@patch("cou.cli.estimate_upgrade_duration")
+@patch("cou.cli.generate_plan", new_callable=AsyncMock, return_value=UpgradePlan("Upgrade"))
+@patch("cou.cli.verify_cloud", new_callable=AsyncMock)
+@patch("cou.cli.Analysis.create", new_callable=AsyncMock)
+@patch("cou.cli.PlanStatus", spec_set=PlanStatus)
+async def test_analyze_and_generate_plan_estimate(
+    mock_plan_status,
+    _,
+    __,
+    mock_generate_plan,
+    mock_estimate_upgrade_duration,
+    ___,
+    mock_print,
+    cou_model,
+    cli_args,
+):
+    """Test analyze_and_generate_plan function printing estimated duration of the upgrade."""
+    mock_plan_status.error_messages = []
+    mock_plan_status.warning_messages = []
+    mock_estimate_upgrade_duration.return_value = 3725.0
+
+    await cli.analyze_and_generate_plan(cou_model.return_value, cli_args)
+
+    mock_estimate_upgrade_duration.assert_called_once_with(mock_generate_plan.return_value)
+    mock_print.assert_any_call("Estimated duration of the upgrade: 1:02:05")
+
+
+@pytest.mark.asyncio
+@patch("cou.cli.Model")
+@patch("builtins.print")
 @patch("cou.cli.print_and_debug")
 @patch("cou.cli.generate_plan", new_callable=AsyncMock)
 @patch("cou.cli.verify_cloud", new_callable=AsyncMock)
 @patch("cou.cli.Analysis.create", new_callable=AsyncMock)
+@patch("cou.cli.PlanStatus", spec_set=PlanStatus)
+async def test_analyze_and_generate_plan_history(
+    mock_plan_status,
+    mock_analyze,
+    _,
+    mock_generate_plan,
+    __,
+    mock_print,
+    cou_model,
+    cli_args,
+):
+    """Test analyze_and_generate_plan function predicting durations from history."""
+    mock_plan_status.error_messages = []
+    mock_plan_status.warning_messages = []
+    history = MagicMock(spec_set=DurationHistory)
+    plan = UpgradePlan("Upgrade cloud from 'ussuri' to 'victoria'")
+    app_plan = ApplicationUpgradePlan("Upgrade plan for 'keystone' to 'victoria'")
+    app_plan.add_step(PreUpgradeStep("Back up keystone", coro=AsyncMock()()))
+    app_plan.sub_steps[0].expected_duration = 1260.0
+    plan.add_step(app_plan)
+    pipeline = UpgradeStep("Upgrade machines 0, 1 in pipeline", parallel=True, max_parallel=1)
+    pipeline.add_steps(
+        UpgradeStep(f"Upgrade plan for machine '{i}'", coro=AsyncMock()()) for i in range(2)
+    )
+    plan.add_step(pipeline)
+    machine_1 = pipeline.sub_steps[1]
+    mock_generate_plan.return_value = plan
+
+    def set_expected_durations(plan, apps):
+        machine_1.expected_duration = 60.0
+
+    history.set_expected_durations.side_effect = set_expected_durations
+
+    await cli.analyze_and_generate_plan(cou_model.return_value, cli_args, history)
+
+    history.set_expected_durations.assert_called_once_with(plan, mock_analyze.return_value.apps)
+    assert pipeline.sub_steps[0] is machine_1
+    mock_print.assert_any_call("Estimated duration of the application upgrade plans:")
+    mock_print.assert_any_call("     0:21:00  Upgrade plan for 'keystone' to 'victoria'")
+    mock_print.assert_any_call("Estimated duration of the scheduled hypervisors upgrades:")
+    mock_print.assert_any_call("     0:01:30  Upgrade machines 0, 1 in pipeline")
+    mock_print.assert_any_call("Estimated duration of the upgrade: 0:22:30")
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("optimize", [True, False])
+@patch("cou.cli.Model")
+@patch("cou.cli.print_and_debug")
+@patch("cou.cli.optimize_plan")
+@patch("cou.cli.generate_plan", new_callable=AsyncMock, return_value=UpgradePlan("Upgrade"))
+@patch("cou.cli.verify_cloud", new_callable=AsyncMock)
+@patch("cou.cli.Analysis.create", new_callable=AsyncMock)
+@patch("cou.cli.PlanStatus", spec_set=PlanStatus)
+async def test_analyze_and_generate_plan_optimize(
+    mock_plan_status,
+    _,
+    __,
+    mock_generate_plan,
+    mock_optimize_plan,
+    mock_print_and_debug,
+    cou_model,
+    optimize,
+    cli_args,
+):
+    """Test analyze_and_generate_plan function with plan optimization."""
+    cou_model.return_value.connect.side_effect = AsyncMock()
+    model = await cli.get_model(cli_args)
+    mock_plan_status.error_messages = []
+    mock_plan_status.warning_messages = []
+    cli_args.optimize_plan = optimize
+
+    plan = await cli.analyze_and_generate_plan(model, cli_args)
+
+    assert plan == mock_generate_plan.return_value
+    if optimize:
+        mock_optimize_plan.assert_called_once_with(plan)
+    else:
+        mock_optimize_plan.assert_not_called()
+    mock_print_and_debug.assert_called_once_with(plan)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("model_changed", [True, False])
+@patch("cou.cli.PlanFile")
+@patch("cou.cli.print_and_debug")
+@patch("cou.cli.generate_plan", new_callable=AsyncMock, return_value=UpgradePlan("Upgrade"))
+@patch("cou.cli.verify_cloud", new_callable=AsyncMock)
+@patch("cou.cli.Analysis.create", new_callable=AsyncMock)
+@patch("cou.cli.PlanStatus", spec_set=PlanStatus)
+async def test_analyze_and_generate_plan_plan_file(
+    mock_plan_status,
+    mock_analyze,
+    mock_verify_cloud,
+    mock_generate_plan,
+    _,
+    mock_plan_file,
+    model_changed,
+    model,
+    cli_args,
+):
+    """Test analyze_and_generate_plan function with saved plan file."""
+    mock_plan_status.error_messages = []
+    mock_plan_status.warning_messages = []
+    cli_args.plan_file = Path("plan.json")
+    plan_file = mock_plan_file.load.return_value
+    plan_file.get_analysis = AsyncMock(return_value=None if model_changed else MagicMock())
+    exp_analysis = (
+        mock_analyze.return_value if model_changed else plan_file.get_analysis.return_value
+    )
+
+    plan = await cli.analyze_and_generate_plan(model, cli_args)
+
+    mock_plan_file.load.assert_called_once_with(Path("plan.json"))
+    plan_file.get_analysis.assert_awaited_once_with(model, cli_args)
+    if model_changed:
+        mock_analyze.assert_awaited_once_with(model, skip_apps=cli_args.skip_apps)
+    else:
+        mock_analyze.assert_not_awaited()
+    mock_verify_cloud.assert_awaited_once_with(exp_analysis, args=cli_args)
+    mock_generate_plan.assert_awaited_once_with(exp_analysis, cli_args)
+    plan_file.verify_plan.assert_called_once_with(plan)
+
+
+@pytest.mark.asyncio
+@patch("cou.cli.PlanFile")
+@patch("cou.cli.print_and_debug")
+@patch("cou.cli.generate_plan", new_callable=AsyncMock, return_value=UpgradePlan("Upgrade"))
+@patch("cou.cli.verify_cloud", new_callable=AsyncMock)
+@patch("cou.cli.Analysis.create", new_callable=AsyncMock)
+@patch("cou.cli.PlanStatus", spec_set=PlanStatus)
+async def test_analyze_and_generate_plan_output(
+    mock_plan_status,
+    mock_analyze,
+    _,
+    mock_generate_plan,
+    __,
+    mock_plan_file,
+    model,
+    cli_args,
+):
+    """Test analyze_and_generate_plan function saving the plan file."""
+    mock_plan_status.error_messages = []
+    mock_plan_status.warning_messages = []
+    cli_args.output = Path("plan.json")
+    mock_plan_file.create = AsyncMock()
+
+    plan = await cli.analyze_and_generate_plan(model, cli_args)
+
+    mock_plan_file.load.assert_not_called()
+    mock_plan_file.create.assert_awaited_once_with(mock_analyze.return_value, plan, cli_args)
+    mock_plan_file.create.return_value.save.assert_called_once_with(Path("plan.json"))
+
+
+@pytest.mark.asyncio
+@patch("cou.cli.Model")
+@patch("cou.cli.print_and_debug")
+@patch("cou.cli.generate_plan", new_callable=AsyncMock, return_value=UpgradePlan("Upgrade"))
+@patch("cou.cli.verify_cloud", new_callable=AsyncMock)
+@patch("cou.cli.Analysis.create", new_callable=AsyncMock)
 @patch("cou.cli.logger")
 @patch("cou.cli.PlanStatus", spec_set=PlanStatus)
 async def test_analyze_and_generate_plan_with_errors(
@@ -129,7 +348,7 @@ async def test_analyze_and_generate_plan_with_errors(
 @pytest.mark.asyncio
 @patch("cou.cli.Model")
 @patch("cou.cli.print_and_debug")
-@patch("cou.cli.generate_plan", new_callable=AsyncMock)
+@patch("cou.cli.generate_plan", new_callable=AsyncMock, return_value=UpgradePlan("Upgrade"))
 @patch("cou.cli.verify_cloud", new_callable=AsyncMock)
 @patch("cou.cli.Analysis.create", new_callable=AsyncMock)
 @patch("cou.cli.logger")
@@ -223,6 +442,296 @@ async def test_apply_upgrade_plan_with_prompt_continue(
     mock_continue_upgrade.assert_awaited_once()
 
 
+@pytest.mark.asyncio
+@patch("cou.cli.apply_step")
+@patch("builtins.print")
+async def test_apply_upgrade_plan_failure_policy(_, mock_apply_step, cli_args):
+    """Test apply_upgrade_plan function setting the failure policy."""
+    cli_args.prompt = False
+    cli_args.failure_policy = FailurePolicy.FAIL_FAST
+
+    plan = UpgradePlan(description="Upgrade cloud from 'ussuri' to 'victoria'")
+    step = PreUpgradeStep(description="Upgrade units", parallel=True)
+    explicit_step = PreUpgradeStep(
+        description="Upgrade units", parallel=True, failure_policy=FailurePolicy.WAIT_ALL
+    )
+    for parallel_step in (step, explicit_step):
+        parallel_step.add_step(UnitUpgradeStep(description="Upgrade unit", coro=AsyncMock()()))
+    plan.add_steps([step, explicit_step])
+
+    await cli.apply_upgrade_plan(plan, cli_args)
+
+    mock_apply_step.assert_called_once_with(plan, False)
+    assert plan.failure_policy == FailurePolicy.FAIL_FAST
+    assert step.failure_policy == FailurePolicy.FAIL_FAST
+    assert explicit_step.failure_policy == FailurePolicy.WAIT_ALL
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("resume", [True, False])
+@patch("cou.cli.apply_step")
+@patch("builtins.print")
+async def test_apply_upgrade_plan_journal(mock_print, mock_apply_step, resume, cli_args):
+    """Test apply_upgrade_plan function recording the run to journal."""
+    cli_args.prompt = False
+    cli_args.resume = resume
+    journal = MagicMock(spec_set=StepJournal)
+    journal.resume.return_value = 3
+    plan = UpgradePlan(description="Upgrade cloud from 'ussuri' to 'victoria'")
+
+    async def check_observer(*_):
+        assert journal in execute._observers
+
+    mock_apply_step.side_effect = check_observer
+
+    await cli.apply_upgrade_plan(plan, cli_args, journal)
+
+    mock_apply_step.assert_awaited_once_with(plan, False)
+    assert journal not in execute._observers
+    journal.start.assert_called_once_with(resume=resume)
+    journal.finish.assert_called_once_with()
+    if resume:
+        journal.resume.assert_called_once_with()
+        mock_print.assert_any_call("Resuming interrupted upgrade, skipping 3 completed step(s).")
+    else:
+        journal.resume.assert_not_called()
+
+
+@pytest.mark.asyncio
+@patch("cou.cli.apply_step")
+@patch("builtins.print")
+async def test_apply_upgrade_plan_journal_failed(_, mock_apply_step, cli_args):
+    """Test apply_upgrade_plan function not finishing journal run if upgrade failed."""
+    cli_args.prompt = False
+    journal = MagicMock(spec_set=StepJournal)
+    plan = UpgradePlan(description="Upgrade cloud from 'ussuri' to 'victoria'")
+    mock_apply_step.side_effect = RunUpgradeError("failed")
+
+    with pytest.raises(RunUpgradeError, match="failed"):
+        await cli.apply_upgrade_plan(plan, cli_args, journal)
+
+    assert journal not in execute._observers
+    journal.start.assert_called_once()
+    journal.finish.assert_not_called()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("error", [None, RunUpgradeError("failed")])
+@patch("cou.cli.get_trace_file")
+@patch("cou.cli.apply_step")
+@patch("builtins.print")
+async def test_apply_upgrade_plan_tracer(_, mock_apply_step, mock_get_trace_file, error, cli_args):
+    """Test apply_upgrade_plan function saving the trace even if upgrade failed."""
+    cli_args.prompt = False
+    tracer = MagicMock(spec_set=StepTracer)
+    plan = UpgradePlan(description="Upgrade cloud from 'ussuri' to 'victoria'")
+
+    async def check_observer(*_):
+        assert tracer in execute._observers
+        if error is not None:
+            raise error
+
+    mock_apply_step.side_effect = check_observer
+
+    if error is None:
+        await cli.apply_upgrade_plan(plan, cli_args, tracer=tracer)
+    else:
+        with pytest.raises(RunUpgradeError, match="failed"):
+            await cli.apply_upgrade_plan(plan, cli_args, tracer=tracer)
+
+    assert tracer not in execute._observers
+    tracer.save.assert_called_once_with(mock_get_trace_file.return_value)
+
+
+@pytest.mark.asyncio
+@patch("cou.cli.apply_step")
+@patch("builtins.print")
+async def test_apply_upgrade_plan_history(_, mock_apply_step, cli_args):
+    """Test apply_upgrade_plan function recording durations of the steps to history."""
+    cli_args.prompt = False
+    history = MagicMock(spec_set=DurationHistory)
+    plan = UpgradePlan(description="Upgrade cloud from 'ussuri' to 'victoria'")
+
+    async def check_observer(*_):
+        assert history in execute._observers
+
+    mock_apply_step.side_effect = check_observer
+
+    await cli.apply_upgrade_plan(plan, cli_args, history=history)
+
+    mock_apply_step.assert_awaited_once_with(plan, False)
+    assert history not in execute._observers
+    history.close.assert_called_once_with()
+
+
+@pytest.mark.asyncio
+@patch("cou.cli.apply_step")
+@patch("builtins.print")
+async def test_apply_upgrade_plan_metrics(_, mock_apply_step, cli_args):
+    """Test apply_upgrade_plan function exporting metrics even if upgrade failed."""
+    cli_args.prompt = False
+    metrics = AsyncMock(spec_set=MetricsExporter)
+    plan = UpgradePlan(description="Upgrade cloud from 'ussuri' to 'victoria'")
+
+    async def check_observer(*_):
+        metrics.start.assert_awaited_once_with()
+        assert metrics in execute._observers
+        raise RunUpgradeError("failed")
+
+    mock_apply_step.side_effect = check_observer
+
+    with pytest.raises(RunUpgradeError, match="failed"):
+        await cli.apply_upgrade_plan(plan, cli_args, metrics=metrics)
+
+    assert metrics not in execute._observers
+    metrics.stop.assert_awaited_once_with()
+
+
+@pytest.mark.asyncio
+@patch("cou.cli.apply_step")
+@patch("builtins.print")
+async def test_apply_upgrade_plan_progress(_, mock_apply_step, cli_args):
+    """Test apply_upgrade_plan function showing the progress view even if upgrade failed."""
+    cli_args.prompt = False
+    progress = MagicMock(spec_set=ProgressView)
+    plan = UpgradePlan(description="Upgrade cloud from 'ussuri' to 'victoria'")
+
+    async def check_observer(*_):
+        progress.start.assert_called_once_with()
+        assert progress in execute._observers
+        raise RunUpgradeError("failed")
+
+    mock_apply_step.side_effect = check_observer
+
+    with pytest.raises(RunUpgradeError, match="failed"):
+        await cli.apply_upgrade_plan(plan, cli_args, progress=progress)
+
+    assert progress not in execute._observers
+    progress.stop.assert_called_once_with()
+
+
+@pytest.mark.asyncio
+@patch.dict("os.environ", {"COU_STEP_DEADLINES": "backup=ten"})
+@patch("cou.cli.get_model")
+async def test_run_upgrade_subcommand_invalid_deadlines(mock_get_model, cli_args):
+    """Test run upgrade subcommand with deadlines of the steps in invalid format."""
+    with pytest.raises(EnvironmentVariableError, match="COU_STEP_DEADLINES is not valid"):
+        await cli.run_upgrade_subcommand(cli_args)
+
+    mock_get_model.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+@patch("cou.cli.DurationHistory")
+@patch("cou.cli.StepTracer")
+@patch("cou.cli.StepJournal")
+@patch("cou.cli.get_model")
+@patch("cou.cli.analyze_and_generate_plan")
+@patch("cou.cli.apply_upgrade_plan")
+async def test_run_upgrade_subcommand(
+    mock_apply_upgrade_plan,
+    mock_analyze_and_generate_plan,
+    mock_get_model,
+    mock_journal,
+    mock_tracer,
+    mock_history,
+    cli_args,
+):
+    """Test run upgrade subcommand with journal for the model."""
+    model = mock_get_model.return_value
+    plan = mock_analyze_and_generate_plan.return_value
+
+    await cli.run_upgrade_subcommand(cli_args)
+
+    mock_analyze_and_generate_plan.assert_awaited_once_with(
+        model, cli_args, mock_history.return_value
+    )
+    mock_journal.assert_called_once_with(model.uuid, plan)
+    mock_apply_upgrade_plan.assert_awaited_once_with(
+        plan,
+        cli_args,
+        mock_journal.return_value,
+        mock_tracer.return_value,
+        mock_history.return_value,
+        None,
+        None,
+    )
+
+
+@pytest.mark.asyncio
+@patch("cou.cli.MetricsExporter")
+@patch("cou.cli.DurationHistory")
+@patch("cou.cli.StepTracer")
+@patch("cou.cli.StepJournal")
+@patch("cou.cli.get_model")
+@patch("cou.cli.analyze_and_generate_plan")
+@patch("cou.cli.apply_upgrade_plan")
+async def test_run_upgrade_subcommand_metrics(
+    mock_apply_upgrade_plan,
+    mock_analyze_and_generate_plan,
+    _,
+    mock_journal,
+    mock_tracer,
+    mock_history,
+    mock_metrics,
+    cli_args,
+):
+    """Test run upgrade subcommand exporting metrics of the upgrade."""
+    cli_args.metrics_file = Path("/var/lib/node_exporter/cou.prom")
+    cli_args.metrics_port = 9717
+    plan = mock_analyze_and_generate_plan.return_value
+
+    await cli.run_upgrade_subcommand(cli_args)
+
+    mock_metrics.assert_called_once_with(plan, Path("/var/lib/node_exporter/cou.prom"), 9717)
+    mock_apply_upgrade_plan.assert_awaited_once_with(
+        plan,
+        cli_args,
+        mock_journal.return_value,
+        mock_tracer.return_value,
+        mock_history.return_value,
+        mock_metrics.return_value,
+        None,
+    )
+
+
+@pytest.mark.asyncio
+@patch("cou.cli.ProgressView")
+@patch("cou.cli.DurationHistory")
+@patch("cou.cli.StepTracer")
+@patch("cou.cli.StepJournal")
+@patch("cou.cli.get_model")
+@patch("cou.cli.analyze_and_generate_plan")
+@patch("cou.cli.apply_upgrade_plan")
+async def test_run_upgrade_subcommand_progress(
+    mock_apply_upgrade_plan,
+    mock_analyze_and_generate_plan,
+    _,
+    mock_journal,
+    mock_tracer,
+    mock_history,
+    mock_progress,
+    cli_args,
+):
+    """Test run upgrade subcommand showing the progress view without prompts."""
+    cli_args.quiet = False
+    cli_args.prompt = False
+    plan = mock_analyze_and_generate_plan.return_value
+
+    await cli.run_upgrade_subcommand(cli_args)
+
+    mock_progress.assert_called_once_with()
+    mock_apply_upgrade_plan.assert_awaited_once_with(
+        plan,
+        cli_args,
+        mock_journal.return_value,
+        mock_tracer.return_value,
+        mock_history.return_value,
+        None,
+        mock_progress.return_value,
+    )
+
+
 @pytest.mark.asyncio
 @patch("cou.cli.apply_step")
 @patch("cou.cli.continue_upgrade")
@@ -301,12 +810,18 @@ async def test_continue_upgrade(
 
 
 @pytest.mark.asyncio
-@pytest.mark.parametrize("command", ["plan", "upgrade", "other1", "other2"])
+@pytest.mark.parametrize("command", ["plan", "upgrade", "analyze-run", "other1", "other2"])
+@patch("cou.cli.run_analyze_run_subcommand")
 @patch("cou.cli.get_model")
 @patch("cou.cli.analyze_and_generate_plan")
 @patch("cou.cli.apply_upgrade_plan")
 async def test_run_command(
-    mock_apply_upgrade_plan, mock_analyze_and_generate_plan, mock_get_model, command, cli_args
+    mock_apply_upgrade_plan,
+    mock_analyze_and_generate_plan,
+    mock_get_model,
+    mock_run_analyze_run_subcommand,
+    command,
+    cli_args,
 ):
     """Test run command function."""
     cli_args.command = command
@@ -319,6 +834,118 @@ async def test_run_command(
     elif command == "upgrade":
         mock_analyze_and_generate_plan.assert_awaited_once()
         mock_apply_upgrade_plan.assert_awaited_once()
+    elif command == "analyze-run":
+        mock_run_analyze_run_subcommand.assert_called_once_with(cli_args)
+        mock_get_model.assert_not_called()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("error", [None, COUException("failed")])
+@patch("cou.cli.DurationHistory")
+@patch("cou.cli.get_model")
+@patch("cou.cli.analyze_and_generate_plan")
+async def test_run_plan_subcommand_history(
+    mock_analyze_and_generate_plan, mock_get_model, mock_history, error, cli_args
+):
+    """Test run plan subcommand closing the history even if the plan failed."""
+    mock_analyze_and_generate_plan.side_effect = error
+
+    if error is None:
+        await cli.run_plan_subcommand(cli_args)
+    else:
+        with pytest.raises(COUException, match="failed"):
+            await cli.run_plan_subcommand(cli_args)
+
+    mock_analyze_and_generate_plan.assert_awaited_once_with(
+        mock_get_model.return_value, cli_args, mock_history.return_value
+    )
+    mock_history.return_value.close.assert_called_once_with()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("error", [None, COUException("failed")])
+@patch("cou.cli.DurationHistory")
+@patch("cou.cli.StepJournal")
+@patch("cou.cli.get_model")
+@patch("cou.cli.analyze_and_generate_plan")
+@patch("cou.cli.apply_upgrade_plan")
+async def test_run_upgrade_subcommand_history(
+    mock_apply_upgrade_plan,
+    mock_analyze_and_generate_plan,
+    mock_get_model,
+    mock_journal,
+    mock_history,
+    error,
+    cli_args,
+):
+    """Test run upgrade subcommand closing the history even if the plan failed."""
+    mock_analyze_and_generate_plan.side_effect = error
+
+    if error is None:
+        await cli.run_upgrade_subcommand(cli_args)
+        mock_apply_upgrade_plan.assert_awaited_once()
+    else:
+        with pytest.raises(COUException, match="failed"):
+            await cli.run_upgrade_subcommand(cli_args)
+        mock_apply_upgrade_plan.assert_not_awaited()
+
+    mock_analyze_and_generate_plan.assert_awaited_once_with(
+        mock_get_model.return_value, cli_args, mock_history.return_value
+    )
+    mock_history.return_value.close.assert_called_once_with()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("error", [None, COUException("failed")])
+@patch("cou.cli.get_loop_profile_file")
+@patch("cou.cli.LoopProfiler")
+@patch("cou.cli.run_plan_subcommand")
+async def test_run_command_profile(
+    mock_run_plan_subcommand, mock_loop_profiler, mock_get_loop_profile_file, error, cli_args
+):
+    """Test run command function profiling the event loop even if the command failed."""
+    cli_args.command = "plan"
+    cli_args.profile = True
+    loop_profiler = mock_loop_profiler.return_value
+
+    async def check_profiler(*_):
+        loop_profiler.start.assert_called_once_with()
+        loop_profiler.stop.assert_not_called()
+        if error is not None:
+            raise error
+
+    mock_run_plan_subcommand.side_effect = check_profiler
+
+    if error is None:
+        await cli._run_command(cli_args)
+    else:
+        with pytest.raises(COUException, match="failed"):
+            await cli._run_command(cli_args)
+
+    loop_profiler.stop.assert_called_once_with()
+    loop_profiler.save.assert_called_once_with(mock_get_loop_profile_file.return_value)
+
+
+@patch("cou.cli.load_run")
+@patch("cou.cli.format_run_report")
+@patch("builtins.print")
+def test_run_analyze_run_subcommand(mock_print, mock_format_run_report, mock_load_run, cli_args):
+    """Test run analyze-run subcommand printing the report of the run."""
+    cli_args.run_file = Path("cou-20231215211717.log")
+
+    cli.run_analyze_run_subcommand(cli_args)
+
+    mock_load_run.assert_called_once_with(cli_args.run_file)
+    mock_format_run_report.assert_called_once_with(mock_load_run.return_value)
+    mock_print.assert_called_once_with(mock_format_run_report.return_value)
+
+
+def test_run_analyze_run_subcommand_no_file(cli_args):
+    """Test run analyze-run subcommand without file of the run."""
+    cli_args.run_file = None
+
+    with pytest.raises(RunAnalysisError, match="No log or trace file"):
+        cli.run_analyze_run_subcommand(cli_args)
 
 
 @patch("cou.cli.log_ssdlc_system_event")
@@ -369,6 +996,65 @@ def test_entrypoint(
     mock_log_ssdlc.assert_any_call(SSDLCSysEvent.SHUTDOWN)
 
 
+@pytest.mark.parametrize("quiet", [True, False])
+@patch("cou.cli.print")
+@patch("cou.cli.api_stats")
+@patch("cou.cli.get_api_stats_file")
+@patch("cou.cli.log_ssdlc_system_event", new=MagicMock())
+@patch("cou.cli.progress_indicator", new=MagicMock())
+@patch("cou.cli.parse_args")
+@patch("cou.cli.get_log_level", new=MagicMock())
+@patch("cou.cli.setup_logging", new=MagicMock())
+@patch("cou.cli._run_command", new=AsyncMock())
+def test_entrypoint_api_stats(
+    mock_parse_args, mock_get_api_stats_file, mock_api_stats, mock_print, quiet
+):
+    """Test entrypoint saving and printing statistics of Juju API calls."""
+    args = mock_parse_args.return_value
+    args.command = "plan"
+    args.quiet = quiet
+
+    cli.entrypoint()
+
+    mock_api_stats.save.assert_called_once_with(mock_get_api_stats_file.return_value)
+    if quiet:
+        mock_print.assert_not_called()
+    else:
+        mock_print.assert_any_call(mock_api_stats.get_summary.return_value)
+
+
+@pytest.mark.parametrize("profile", [True, False])
+@patch("builtins.print", new=MagicMock())
+@patch("cou.cli.get_profile_files")
+@patch("cou.cli.log_ssdlc_system_event", new=MagicMock())
+@patch("cou.cli.progress_indicator", new=MagicMock())
+@patch("cou.cli.parse_args")
+@patch("cou.cli.get_log_level", new=MagicMock())
+@patch("cou.cli.setup_logging", new=MagicMock())
+@patch("cou.cli._run_command")
+def test_entrypoint_profile(
+    mock_run_command, mock_parse_args, mock_get_profile_files, profile, profiler
+):
+    """Test entrypoint profiling the run even if it failed."""
+    args = mock_parse_args.return_value
+    args.command = "plan"
+    args.profile = profile
+    mock_run_command.side_effect = COUException("failed")
+    mock_get_profile_files.return_value = (Path("cou.prof"), Path("cou.profile.txt"))
+
+    with pytest.raises(SystemExit):
+        cli.entrypoint()
+
+    if profile:
+        profiler.return_value.start.assert_called_once_with()
+        profiler.return_value.stop.assert_called_once_with()
+        profiler.return_value.save.assert_called_once_with(
+            Path("cou.prof"), Path("cou.profile.txt")
+        )
+    else:
+        profiler.assert_not_called()
+
+
 @patch("cou.cli.log_ssdlc_system_event")
 @patch("cou.cli.progress_indicator")
 @patch("cou.cli.parse_args", new=MagicMock())
@@ -13,12 +13,14 @@
 # limitations under the License.
 
 from argparse import ArgumentParser, ArgumentTypeError
+from pathlib import Path
 from unittest.mock import ANY, patch
 
 import pytest
 
 from cou import commands
 from cou.commands import CLIargs
+from cou.steps import FailurePolicy
 
 
 @pytest.mark.parametrize("auto_approve, expected_result", [(True, False), (False, True)])
@@ -36,6 +38,8 @@ def test_cliargs_prompt(auto_approve, expected_result):
         ["help"],
         ["help", "plan"],
         ["help", "upgrade"],
+        ["help", "analyze-run"],
+        ["analyze-run", "-h"],
         ["plan", "-h"],
         ["upgrade", "-h"],
         ["plan", "control-plane", "-h"],
@@ -103,6 +107,42 @@ def test_parse_args_quiet_verbose_exclusive(mock_error, args):
                 **{"upgrade_group": None}
             ),
         ),
+        (
+            ["plan", "--to", "yoga"],
+            CLIargs(command="plan", to="yoga"),
+        ),
+        (
+            ["plan", "control-plane", "--rolling"],
+            CLIargs(command="plan", upgrade_group="control-plane", rolling=True),
+        ),
+        (
+            ["plan", "--rolling", "--to", "yoga"],
+            CLIargs(command="plan", rolling=True, to="yoga"),
+        ),
+        (
+            ["upgrade", "--rolling"],
+            CLIargs(command="upgrade", rolling=True),
+        ),
+        (
+            ["plan", "control-plane", "--no-rolling"],
+            CLIargs(command="plan", upgrade_group="control-plane", rolling=False),
+        ),
+        (
+            ["plan", "data-plane", "--pipeline-hypervisors", "2"],
+            CLIargs(command="plan", upgrade_group="data-plane", pipeline_hypervisors=2),
+        ),
+        (
+            ["plan", "hypervisors", "--pipeline-hypervisors", "3"],
+            CLIargs(command="plan", upgrade_group="hypervisors", pipeline_hypervisors=3),
+        ),
+        (
+            ["upgrade", "--pipeline-hypervisors", "2", "--max-parallel-azs", "3", "--to", "yoga"],
+            CLIargs(command="upgrade", pipeline_hypervisors=2, max_parallel_azs=3, to="yoga"),
+        ),
+        (
+            ["plan", "hypervisors", "--max-parallel-azs", "4"],
+            CLIargs(command="plan", upgrade_group="hypervisors", max_parallel_azs=4),
+        ),
         (
             ["plan", "--no-backup"],
             CLIargs(
@@ -830,6 +870,10 @@ def test_parse_args_plan(args, expected_cliargs):
                 **{"upgrade_group": "hypervisors"}
             ),
         ),
+        (
+            ["upgrade", "--to", "yoga", "--auto-approve"],
+            CLIargs(command="upgrade", auto_approve=True, to="yoga"),
+        ),
     ],
 )
 def test_parse_args_upgrade(args, expected_cliargs):
@@ -874,6 +918,15 @@ def test_parse_args_hypervisors_exclusive_options_reverse_order(mock_error):
         ["plan", "--purge_before", "2000-01-02"],
         ["plan", "--purge_before", "2000-01-02 03:04"],
         ["plan", "--purge_before", "2000-01-02 03:04:05"],
+        ["plan", "--to", "foo"],
+        ["upgrade", "--to", "Yoga"],
+        ["plan", "hypervisors", "--pipeline-hypervisors", "0"],
+        ["plan", "hypervisors", "--rolling"],
+        ["upgrade", "--pipeline-hypervisors", "0"],
+        ["upgrade", "data-plane", "--rolling"],
+        ["upgrade", "control-plane", "--max-parallel-azs", "2"],
+        ["upgrade", "data-plane", "--pipeline-hypervisors", "-1"],
+        ["upgrade", "hypervisors", "--max-parallel-azs", "0"],
     ],
 )
 def test_parse_invalid_args(args):
@@ -890,6 +943,8 @@ def test_parse_invalid_args(args):
         ["plan", "data-plane", "--availability-zone zone-1"],
         ["upgrade", "data-plane", "--machine 1"],
         ["upgrade", "data-plane", "--availability-zone zone-1"],
+        ["plan", "control-plane", "--to", "yoga"],
+        ["upgrade", "hypervisors", "--to", "yoga"],
     ],
 )
 @patch("cou.commands.argparse.ArgumentParser.error", autospec=True)
@@ -902,6 +957,13 @@ def test_parse_args_raise_exception(mock_error, args):
     assert "unrecognized arguments" in str(mock_error.call_args)
 
 
+def test_parse_args_analyze_run():
+    """Test parsing 'analyze-run' subcommand."""
+    parsed_args = commands.parse_args(["analyze-run", "cou-20231215211717.log"])
+
+    assert parsed_args == CLIargs(command="analyze-run", run_file=Path("cou-20231215211717.log"))
+
+
 def test_capitalize_usage_prefix():
     """Test add usage with capitalized prefix."""
     parser = ArgumentParser(formatter_class=commands.CapitalizeHelpFormatter)
@@ -984,3 +1046,118 @@ def test_skip_apps_multiple_apps_repeating():
     # Ensure multiple different applications are accepted repeating the skip-apps option
     args = commands.parse_args(["upgrade", "--skip-apps=vault", "--skip-apps=gnocchi"])
     assert args.skip_apps == {"vault", "gnocchi"}
+
+
+@pytest.mark.parametrize(
+    "args, exp_optimize_plan",
+    [
+        (["plan"], False),
+        (["plan", "--optimize-plan"], True),
+        (["plan", "control-plane", "--optimize-plan"], True),
+        (["upgrade", "--optimize-plan", "data-plane", "--no-optimize-plan"], False),
+    ],
+)
+def test_optimize_plan(args, exp_optimize_plan):
+    """Test parsing --optimize-plan option."""
+    parsed_args = commands.parse_args(args)
+
+    assert parsed_args.optimize_plan is exp_optimize_plan
+
+
+@pytest.mark.parametrize(
+    "args, exp_failure_policy",
+    [
+        (["upgrade"], None),
+        (["upgrade", "--failure-policy=wait-all"], FailurePolicy.WAIT_ALL),
+        (["upgrade", "hypervisors", "--failure-policy", "fail-fast"], FailurePolicy.FAIL_FAST),
+        (["upgrade", "--failure-policy=threshold=10%", "data-plane"], FailurePolicy(10)),
+    ],
+)
+def test_failure_policy(args, exp_failure_policy):
+    """Test parsing --failure-policy option."""
+    parsed_args = commands.parse_args(args)
+
+    assert parsed_args.failure_policy == exp_failure_policy
+
+
+@pytest.mark.parametrize("value", ["fail-slow", "threshold=", "threshold=101%"])
+def test_failure_policy_arg_invalid(value):
+    """Test parsing invalid failure policy."""
+    with pytest.raises(ArgumentTypeError):
+        commands.failure_policy_arg(value)
+
+
+@pytest.mark.parametrize(
+    "args, exp_resume",
+    [
+        (["upgrade"], False),
+        (["upgrade", "--resume"], True),
+        (["upgrade", "control-plane", "--resume"], True),
+        (["upgrade", "hypervisors", "--resume"], True),
+    ],
+)
+def test_resume(args, exp_resume):
+    """Test parsing --resume option."""
+    parsed_args = commands.parse_args(args)
+
+    assert parsed_args.resume is exp_resume
+
+
+def test_resume_plan():
+    """Test --resume option is not available for plan."""
+    with pytest.raises(SystemExit):
+        commands.parse_args(["plan", "--resume"])
+
+
+@pytest.mark.parametrize(
+    "args, exp_output",
+    [
+        (["plan"], None),
+        (["plan", "--output", "plan.json"], Path("plan.json")),
+        (["plan", "control-plane", "-o", "plan.json"], Path("plan.json")),
+        (["plan", "hypervisors", "--output=plan.json"], Path("plan.json")),
+    ],
+)
+def test_output(args, exp_output):
+    """Test parsing --output option."""
+    parsed_args = commands.parse_args(args)
+
+    assert parsed_args.output == exp_output
+
+
+@pytest.mark.parametrize(
+    "args, exp_plan_file",
+    [
+        (["upgrade"], None),
+        (["upgrade", "--plan-file", "plan.json"], Path("plan.json")),
+        (["upgrade", "data-plane", "--plan-file=plan.json"], Path("plan.json")),
+    ],
+)
+def test_plan_file(args, exp_plan_file):
+    """Test parsing --plan-file option."""
+    parsed_args = commands.parse_args(args)
+
+    assert parsed_args.plan_file == exp_plan_file
+
+
+@pytest.mark.parametrize(
+    "args, exp_metrics_file, exp_metrics_port",
+    [
+        (["upgrade"], None, None),
+        (["upgrade", "--metrics-file", "cou.prom"], Path("cou.prom"), None),
+        (["upgrade", "data-plane", "--metrics-port=9717"], None, 9717),
+    ],
+)
+def test_metrics(args, exp_metrics_file, exp_metrics_port):
+    """Test parsing --metrics-file and --metrics-port options."""
+    parsed_args = commands.parse_args(args)
+
+    assert parsed_args.metrics_file == exp_metrics_file
+    assert parsed_args.metrics_port == exp_metrics_port
+
+
+@pytest.mark.parametrize("value", ["0", "65536", "-1"])
+def test_port_arg_invalid(value):
+    """Test port_arg with invalid ports."""
+    with pytest.raises(ArgumentTypeError, match="port must be between 1 and 65535"):
+        commands.port_arg(value)
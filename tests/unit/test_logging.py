@@ -16,7 +16,18 @@ from unittest.mock import MagicMock, patch
 
 import pytest
 
-from cou.logging import TracebackInfoFilter, filter_debug_logs, get_log_file, setup_logging
+from cou.logging import (
+    COU_DIR_LOG,
+    TracebackInfoFilter,
+    filter_debug_logs,
+    get_api_stats_file,
+    get_log_file,
+    get_loop_profile_file,
+    get_profile_files,
+    get_trace_file,
+    save_run_file,
+    setup_logging,
+)
 
 
 def test_filter_clears_exc_info_and_text():
@@ -47,7 +58,9 @@ def test_setup_logging(log_level):
         mock_logging.FileHandler.return_value = log_file_handler
         mock_logging.StreamHandler.return_value = console_handler
 
-        setup_logging(log_file, log_level)
+        with patch("cou.logging._log_file", None):
+            setup_logging(log_file, log_level)
+            assert get_trace_file() == log_file.with_suffix(".trace.json")
 
         mock_logging.FileHandler.assert_called_with(log_file)
         mock_root_logger.addHandler.assert_any_call(log_file_handler)
@@ -89,3 +102,61 @@ def test_filter_debug_logs(name, level, exp_result):
     mock_record.levelname = level
 
     assert filter_debug_logs(mock_record) is exp_result
+
+
+@pytest.mark.parametrize(
+    "get_file, exp_names",
+    [
+        (get_trace_file, ["cou-20240101120000.trace.json"]),
+        (get_api_stats_file, ["cou-20240101120000.api-stats.json"]),
+        (get_profile_files, ["cou-20240101120000.prof", "cou-20240101120000.profile.txt"]),
+        (get_loop_profile_file, ["cou-20240101120000.asyncio.json"]),
+    ],
+)
+def test_get_run_files(get_file, exp_names):
+    """Test getting files of the run named after its log file."""
+    log_file = COU_DIR_LOG / "cou-20240101120000.log"
+
+    with patch("cou.logging._log_file", log_file):
+        files = get_file()
+
+    files = files if isinstance(files, tuple) else (files,)
+    assert [file.name for file in files] == exp_names
+    assert all(file.parent == COU_DIR_LOG for file in files)
+
+
+@patch("cou.logging._log_file", None)
+def test_get_run_files_no_log_file():
+    """Test getting files of the run before the logging is set up."""
+    trace_file = get_trace_file()
+
+    assert trace_file.parent == COU_DIR_LOG
+    assert trace_file.name.startswith("cou-")
+    assert trace_file.name.endswith(".trace.json")
+
+
+def test_save_run_file(tmp_path):
+    """Test saving file of the run to a new directory."""
+    path = tmp_path / "log" / "cou.trace.json"
+
+    with patch("cou.logging.logger") as mock_logger:
+        save_run_file(path, lambda path: path.write_text("{}"), "trace")
+
+    assert path.read_text() == "{}"
+    mock_logger.info.assert_called_once_with("%s saved to %s", "trace", path)
+
+
+def test_save_run_file_failed(tmp_path):
+    """Test failing to save file of the run is only logged."""
+    path = tmp_path / "cou.trace.json"
+    error = PermissionError("denied")
+    write = MagicMock(side_effect=error)
+
+    with patch("cou.logging.logger") as mock_logger:
+        save_run_file(path, write, "trace")
+
+    write.assert_called_once_with(path)
+    mock_logger.warning.assert_called_once_with(
+        "could not save %s to %s: %r", "trace", path, error
+    )
+    mock_logger.info.assert_not_called()
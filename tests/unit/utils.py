@@ -18,7 +18,7 @@ from unittest.mock import MagicMock
 
 from juju.client.client import FullStatus
 
-from cou.steps import BaseStep
+from cou.steps import ApplicationUpgradePlan, BaseStep, PreUpgradeStep, UpgradePlan
 from cou.utils.juju_utils import Application, Machine, Unit
 
 
@@ -28,13 +28,44 @@ def assert_steps(step_1: BaseStep, step_2: BaseStep) -> None:
     assert step_1 == step_2, msg
 
 
+async def run_step(description: str) -> None:
+    """Run step."""
+
+
+async def backup() -> None:
+    """Back up databases."""
+
+
+def generate_upgrade_plan(
+    *steps: BaseStep, current: str = "ussuri", target: str = "victoria"
+) -> UpgradePlan:
+    """Generate cloud upgrade plan starting with the backup of MySQL databases."""
+    plan = UpgradePlan(f"Upgrade cloud from '{current}' to '{target}'")
+    plan.add_step(PreUpgradeStep("Back up MySQL databases", coro=backup()))
+    plan.add_steps(steps)
+    return plan
+
+
+def generate_app_upgrade_plan(
+    app: str, *steps: BaseStep, target: str = "victoria"
+) -> ApplicationUpgradePlan:
+    """Generate upgrade plan for application."""
+    app_plan = ApplicationUpgradePlan(f"Upgrade plan for '{app}' to '{target}'")
+    app_plan.add_steps(steps)
+    return app_plan
+
+
 def generate_cou_machine(
-    machine_id: str, az: str | None = None, apps_charms: tuple = tuple(tuple())
+    machine_id: str,
+    az: str | None = None,
+    apps_charms: tuple = tuple(tuple()),
+    region: str | None = None,
 ) -> MagicMock:
     machine = MagicMock(spec_set=Machine)()
     machine.machine_id = machine_id
     machine.az = az
     machine.apps_charms = apps_charms
+    machine.region = region
     return machine
 
 
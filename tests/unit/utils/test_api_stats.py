@@ -0,0 +1,141 @@
+#  Copyright 2023 Canonical Limited
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Test statistics of the Juju API calls."""
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from cou.utils.api_stats import ApiStats, CallStats, _get_payload_size, api_stats, instrument
+
+
+@pytest.mark.parametrize(
+    "result, exp_size",
+    [
+        (None, 0),
+        ("stdout", 6),
+        (b"data", 4),
+        ({"return-code": 0}, 18),
+        (MagicMock(spec_set=["to_json"], to_json=MagicMock(return_value="{}")), 2),
+        (MagicMock(spec_set=["results"], results={"a": 1}), 8),
+        (object(), 0),
+    ],
+)
+def test_get_payload_size(result, exp_size):
+    """Test getting size of the call result."""
+    assert _get_payload_size(result) == exp_size
+
+
+def test_call_stats_add_call():
+    """Test adding calls to the latency histogram."""
+    stats = CallStats()
+
+    stats.add_call(0.05, False, 10)
+    stats.add_call(0.1, True, 0)
+    stats.add_call(2.0, False, 5)
+    stats.add_call(1000.0, False, 0)
+
+    assert stats.calls == 4
+    assert stats.errors == 1
+    assert stats.total_time == 1002.15
+    assert stats.max_time == 1000.0
+    assert stats.payload_size == 15
+    assert stats.latency_histogram == [2, 0, 0, 1, 0, 0, 0, 0, 0, 1]
+
+
+@pytest.mark.asyncio
+async def test_instrument():
+    """Test recording calls of instrumented function."""
+
+    @instrument
+    async def get_status(fail: bool) -> str:
+        """Get status."""
+        api_stats.record_retry("_get_status")
+        if fail:
+            raise ValueError("failed")
+
+        return "status"
+
+    assert await get_status(False) == "status"
+    with pytest.raises(ValueError, match="failed"):
+        await get_status(True)
+
+    stats = api_stats.calls["get_status"]
+    assert stats.calls == 2
+    assert stats.errors == 1
+    assert stats.retries == 2
+    assert stats.payload_size == 6
+    assert get_status.__name__ == "get_status"
+    assert "_get_status" not in api_stats.calls
+
+
+def test_api_stats_record_retry_without_call():
+    """Test recording retry outside of instrumented call."""
+    stats = ApiStats()
+
+    stats.record_retry("connect")
+
+    assert stats.calls["connect"].retries == 1
+    assert stats.calls["connect"].calls == 0
+
+
+def test_api_stats_get_summary():
+    """Test getting summary table sorted by total time."""
+    stats = ApiStats()
+    stats.record_call("get_status", 0.5, False, 2048)
+    stats.record_call("get_status", 1.5, False, 2048)
+    stats.record_call("wait_for_idle", 120.0, True, 0)
+    stats.record_retry("connect")
+
+    assert stats.get_summary().splitlines() == [
+        "Juju API call  Calls  Errors  Retries  Avg [s]  Max [s]  Size [KiB]",
+        "wait_for_idle      1       1        0   120.00   120.00         0.0",
+        "get_status         2       0        0     1.00     1.50         4.0",
+        "connect            0       0        1        -     0.00         0.0",
+    ]
+
+
+def test_api_stats_save(tmp_path):
+    """Test saving statistics as JSON."""
+    stats = ApiStats()
+    stats.record_call("get_status", 0.5, False, 10)
+    path = tmp_path / "stats" / "api-stats.json"
+
+    stats.save(path)
+
+    data = json.loads(path.read_text())
+    assert data["calls"]["get_status"]["calls"] == 1
+    assert data["calls"]["get_status"]["latency_histogram"]["0.5"] == 1
+    assert data["calls"]["get_status"]["latency_histogram"]["+Inf"] == 0
+
+
+def test_api_stats_save_failed(tmp_path):
+    """Test saving statistics to path which can not be written."""
+    path = tmp_path / "api-stats.json"
+    path.mkdir()
+
+    with patch("cou.logging.logger") as mock_logger:
+        ApiStats().save(path)
+
+    mock_logger.warning.assert_called_once()
+
+
+def test_api_stats_reset():
+    """Test removing all recorded calls."""
+    stats = ApiStats()
+    stats.record_call("get_status", 0.5, False, 10)
+
+    stats.reset()
+
+    assert not stats.calls
@@ -0,0 +1,169 @@
+#  Copyright 2023 Canonical Limited
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Test diagnostics of the units holding up waiting for the model to be idle."""
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from cou.utils.idle_wait import BlockingUnit, IdleWaitTracker, _parse_since
+
+NOW = datetime(2023, 10, 18, 10, 0, 0, tzinfo=timezone.utc)
+
+
+def _generate_unit(
+    workload: str, agent: str, message: str = "", since: str = "18 Oct 2023 09:48:00Z"
+) -> MagicMock:
+    """Generate status of the unit."""
+    unit = MagicMock()
+    unit.workload_status.current = workload
+    unit.workload_status.message = message
+    unit.workload_status.since = since
+    unit.juju_status.current = agent
+    unit.juju_status.since = since
+    return unit
+
+
+def _generate_status(units: dict[str, MagicMock]) -> MagicMock:
+    """Generate status of the model with units of the applications."""
+    status = MagicMock()
+    status.apps = {name.split("/")[0]: MagicMock() for name in units}
+    status.get_units.side_effect = lambda app: {
+        name: unit for name, unit in units.items() if name.startswith(f"{app}/")
+    }
+    return status
+
+
+@pytest.fixture(autouse=True)
+def progress_indicator():
+    """Mock progress indicator."""
+    with patch("cou.utils.idle_wait.progress_indicator") as mock_progress_indicator:
+        mock_progress_indicator.text = "Wait for 'keystone'"
+        yield mock_progress_indicator
+
+
+@pytest.mark.parametrize(
+    "since, exp_time",
+    [
+        ("18 Oct 2023 09:41:09Z", datetime(2023, 10, 18, 9, 41, 9, tzinfo=timezone.utc)),
+        ("", None),
+        (None, None),
+    ],
+)
+def test_parse_since(since, exp_time):
+    """Test parsing time since the status was set."""
+    assert _parse_since(since) == exp_time
+
+
+def test_blocking_unit_format():
+    """Test formatting blocking unit."""
+    unit = BlockingUnit("keystone/0", "maintenance", "executing", "installing", NOW)
+
+    assert unit.format(datetime(2023, 10, 18, 10, 12, 0, tzinfo=timezone.utc)) == (
+        "keystone/0 maintenance/executing for 0:12:00: 'installing'"
+    )
+    assert BlockingUnit("keystone/0", "waiting", "idle", "", NOW).format(NOW) == (
+        "keystone/0 waiting/idle for 0:00:00"
+    )
+
+
+def test_idle_wait_tracker_update():
+    """Test tracking units which are not in the target status or their agent is not idle."""
+    tracker = IdleWaitTracker("active")
+    status = _generate_status(
+        {
+            "keystone/0": _generate_unit("active", "idle"),
+            "keystone/1": _generate_unit("active", "executing"),
+            "keystone/2": _generate_unit("maintenance", "idle", "installing", "invalid"),
+            "glance/0": _generate_unit("blocked", "idle", "missing relation"),
+        }
+    )
+
+    tracker.update(status, "keystone")
+
+    assert sorted(tracker.blocking_units) == ["keystone/1", "keystone/2"]
+    assert tracker.blocking_units["keystone/1"].since == datetime(
+        2023, 10, 18, 9, 48, tzinfo=timezone.utc
+    )
+
+    tracker.update(status)
+
+    assert sorted(tracker.blocking_units) == ["glance/0", "keystone/1", "keystone/2"]
+
+
+def test_idle_wait_tracker_update_keeps_state_time():
+    """Test keeping the time the unit entered its state if the time since is unknown."""
+    tracker = IdleWaitTracker("active")
+    unit = _generate_unit("maintenance", "executing", since="")
+
+    with patch("cou.utils.idle_wait.datetime") as mock_datetime:
+        mock_datetime.strptime = datetime.strptime
+        mock_datetime.now.side_effect = [NOW, NOW.replace(minute=10), NOW.replace(minute=20)]
+        tracker.update(_generate_status({"keystone/0": unit}))
+        tracker.update(_generate_status({"keystone/0": unit}))
+        assert tracker.blocking_units["keystone/0"].since == NOW
+
+        unit.juju_status.current = "idle"
+        tracker.update(_generate_status({"keystone/0": unit}))
+        assert tracker.blocking_units["keystone/0"].since == NOW.replace(minute=20)
+
+
+def test_idle_wait_tracker_report(progress_indicator):
+    """Test reporting the blocking units every interval and restoring the progress output."""
+    status = _generate_status({"keystone/0": _generate_unit("maintenance", "executing", "msg")})
+
+    with patch("cou.utils.idle_wait.time.monotonic", side_effect=[0, 30, 70, 70]), patch(
+        "cou.utils.idle_wait.logger"
+    ) as mock_logger:
+        tracker = IdleWaitTracker("active", report_interval=60)
+        tracker.update(status)
+        mock_logger.info.assert_not_called()
+        tracker.update(status)
+
+    mock_logger.info.assert_called_once()
+    progress_indicator.update.assert_called_once()
+    text = progress_indicator.update.call_args.args[0]
+    assert text.startswith("Wait for 'keystone' (waiting for keystone/0 maintenance/executing")
+
+    tracker.finish()
+    progress_indicator.update.assert_called_with("Wait for 'keystone'")
+
+
+def test_idle_wait_tracker_report_no_blocking_units(progress_indicator):
+    """Test reporting without any blocking units."""
+    tracker = IdleWaitTracker("active")
+
+    tracker.report(NOW)
+    tracker.finish()
+
+    progress_indicator.update.assert_not_called()
+
+
+def test_idle_wait_tracker_get_summary():
+    """Test compact summary of the blocking units, the longest blocked first."""
+    tracker = IdleWaitTracker("active")
+    tracker.blocking_units = {
+        f"keystone/{i}": BlockingUnit(
+            f"keystone/{i}", "waiting", "idle", "", NOW.replace(minute=i)
+        )
+        for i in range(7)
+    }
+    tracker.blocking_units["keystone/6"] = BlockingUnit(
+        "keystone/6", "waiting", "idle", "", NOW.replace(hour=9)
+    )
+
+    summary = tracker.get_summary(NOW.replace(minute=30))
+
+    assert summary.startswith("keystone/6 waiting/idle for 1:30:00, keystone/0 waiting/idle")
+    assert summary.endswith("keystone/3 waiting/idle for 0:27:00 and 2 more")
@@ -12,13 +12,21 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import asyncio
+import threading
 from unittest.mock import AsyncMock, MagicMock, call, patch
 
 import jubilant
 import pytest
 from juju.action import Action
 from juju.application import Application
-from juju.client._definitions import ApplicationStatus, Base, UnitStatus
+from juju.client._definitions import (
+    ApplicationStatus,
+    Base,
+    DetailedStatus,
+    FullStatus,
+    MachineStatus,
+    UnitStatus,
+)
 from juju.client.connector import NoConnectionException
 from juju.machine import Machine
 from juju.model import Model
@@ -29,11 +37,13 @@ from cou.exceptions import (
     ApplicationError,
     ApplicationNotFound,
     CommandRunFailed,
+    EnvironmentVariableError,
     TimeoutException,
     UnitNotFound,
     WaitForApplicationsTimeout,
 )
 from cou.utils import juju_utils
+from cou.utils.api_stats import api_stats
 
 
 @pytest.mark.parametrize(
@@ -129,6 +139,7 @@ async def test_retry_with_failures():
     test_model = TestModel()
     await test_model.func()
     obj.run.assert_has_calls([call()] * 3)
+    assert api_stats.calls["func"].retries == 2
 
 
 @pytest.mark.asyncio
@@ -257,6 +268,15 @@ def test_coumodel_name_connected(mocked_model):
     model.juju_data.current_model.assert_not_called()
 
 
+def test_coumodel_uuid(mocked_model):
+    """Test Model uuid property."""
+    mocked_model.info.uuid = "8c0a9f5d-2e4b-4c1f-9f3e-6b1d2a7c5e90"
+
+    model = juju_utils.Model("test-model")
+
+    assert model.uuid == "8c0a9f5d-2e4b-4c1f-9f3e-6b1d2a7c5e90"
+
+
 @pytest.mark.asyncio
 async def test_coumodel_connect(mocked_model):
     """Test Model connection."""
@@ -433,6 +453,129 @@ async def test_coumodel_run_action(mock_get_waited_action_object, mocked_model):
     assert action == mocked_result
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "action_name, retries, exp_awaits",
+    [
+        ("pause", 0, 1),  # retries are disabled by default
+        ("pause", 2, 2),
+        ("resume", 2, 2),
+        ("instance-count", 2, 2),
+        ("run-deferred-hooks", 2, 2),
+        ("openstack-upgrade", 2, 1),  # not idempotent action
+    ],
+)
+@patch("cou.utils.juju_utils.asyncio.sleep", new_callable=AsyncMock)
+@patch("cou.utils.juju_utils.Model._get_waited_action_object")
+async def test_coumodel_run_action_retry(
+    mock_get_waited_action_object, mock_sleep, action_name, retries, exp_awaits, mocked_model
+):
+    """Test Model run action retrying only idempotent actions."""
+    mocked_model.units.get.return_value = mocked_unit = AsyncMock(Unit)
+    mocked_result = AsyncMock(Action)
+    mock_get_waited_action_object.side_effect = [ActionFailed(MagicMock()), mocked_result]
+    model = juju_utils.Model("test-model")
+    model._unit_retry_limit = retries
+
+    if exp_awaits == 1:
+        with pytest.raises(ActionFailed):
+            await model.run_action("test_unit/0", action_name, raise_on_failure=True)
+    else:
+        assert await model.run_action("test_unit/0", action_name) == mocked_result
+
+    assert mocked_unit.run_action.await_count == exp_awaits
+    assert mock_sleep.await_count == exp_awaits - 1
+
+
+def test_coumodel_unit_retries_env(mocked_model, monkeypatch):
+    """Test Model reads the retries of operations on units from the environment."""
+    monkeypatch.setenv("COU_UNIT_RETRIES", "3")
+    monkeypatch.setenv("COU_UNIT_RETRY_BUDGET", "10")
+    monkeypatch.setenv("COU_UNIT_RETRY_BACKOFF", "0.5")
+
+    model = juju_utils.Model("test-model")
+
+    assert model._unit_retry_limit == 3
+    assert model._unit_retry_budget == 10
+    assert model._unit_retry_backoff == 0.5
+
+
+@pytest.mark.parametrize(
+    "name, value",
+    [("COU_UNIT_RETRIES", "-1"), ("COU_UNIT_RETRY_BUDGET", "a"), ("COU_UNIT_RETRY_BACKOFF", "0")],
+)
+def test_coumodel_unit_retries_env_invalid(name, value, mocked_model, monkeypatch):
+    """Test Model fails with invalid retries of operations on units in the environment."""
+    monkeypatch.setenv(name, value)
+
+    with pytest.raises(EnvironmentVariableError, match=name):
+        juju_utils.Model("test-model")
+
+
+@pytest.mark.asyncio
+@patch("cou.utils.juju_utils.random.uniform", side_effect=lambda low, high: high)
+@patch("cou.utils.juju_utils.asyncio.sleep", new_callable=AsyncMock)
+async def test_coumodel_run_with_unit_retries(mock_sleep, _, mocked_model):
+    """Test retrying operation on unit with exponential backoff."""
+    func = AsyncMock(side_effect=[Exception("1"), Exception("2"), Exception("3"), "ok"])
+    model = juju_utils.Model("test-model")
+    model._unit_retry_limit, model._unit_retry_backoff = 3, 2
+
+    result = await model._run_with_unit_retries("test-unit/0", "pause", func)
+
+    assert result == "ok"
+    assert func.await_count == 4
+    mock_sleep.assert_has_awaits([call(2), call(4), call(8)])
+
+
+@pytest.mark.asyncio
+@patch("cou.utils.juju_utils.asyncio.sleep", new_callable=AsyncMock)
+async def test_coumodel_run_with_unit_retries_budget(mock_sleep, mocked_model):
+    """Test retrying operation on unit stops when unit retry budget is exhausted."""
+    func = AsyncMock(side_effect=Exception("failed"))
+    model = juju_utils.Model("test-model")
+    model._unit_retry_limit, model._unit_retry_budget = 2, 3
+
+    with pytest.raises(Exception, match="failed"):
+        await model._run_with_unit_retries("test-unit/0", "pause", func)
+    with pytest.raises(Exception, match="failed"):
+        await model._run_with_unit_retries("test-unit/0", "resume", func)
+    # other unit has its own budget
+    with pytest.raises(Exception, match="failed"):
+        await model._run_with_unit_retries("test-unit/1", "pause", func)
+
+    # 3 attempts for pause, 2 for resume (budget exhausted) and 3 for the other unit
+    assert func.await_count == 8
+    assert mock_sleep.await_count == 5
+
+
+@pytest.mark.asyncio
+async def test_coumodel_run_with_unit_retries_unit_not_found(mocked_model):
+    """Test retrying operation on unit is not done if unit does not exist."""
+    func = AsyncMock(side_effect=UnitNotFound("not found"))
+    model = juju_utils.Model("test-model")
+    model._unit_retry_limit = 2
+
+    with pytest.raises(UnitNotFound):
+        await model._run_with_unit_retries("test-unit/0", "pause", func)
+
+    func.assert_awaited_once_with()
+
+
+@pytest.mark.asyncio
+@patch("cou.utils.juju_utils.asyncio.sleep", new_callable=AsyncMock)
+@patch("cou.utils.juju_utils.Model._dispatch_update_status_hook")
+async def test_coumodel_update_status_retry(mock_dispatch, _, mocked_model):
+    """Test Model update_status is retried."""
+    mock_dispatch.side_effect = [CommandRunFailed("cmd", {"return-code": 1}), None]
+    model = juju_utils.Model("test-model")
+    model._unit_retry_limit = 1
+
+    await model.update_status("test-unit/0")
+
+    assert mock_dispatch.await_count == 2
+
+
 @pytest.mark.asyncio
 async def test_coumodel_run_on_unit(mocked_model):
     """Test Model run on unit."""
@@ -789,6 +932,50 @@ async def test_coumodel_wait_for_idle(
     error_func.assert_called_once_with(mock_status, "app1", "app2")
 
 
+@pytest.mark.parametrize("value, exp_interval", [(None, 300.0), ("60", 60.0)])
+def test_coumodel_wait_report_interval(value, exp_interval, mocked_model, monkeypatch):
+    """Test Model reads the interval of reporting the units not yet idle from the environment."""
+    if value is not None:
+        monkeypatch.setenv("COU_WAIT_REPORT_INTERVAL", value)
+
+    assert juju_utils.Model("test-model")._wait_report_interval == exp_interval
+
+
+def test_coumodel_wait_report_interval_invalid(mocked_model, monkeypatch):
+    """Test Model fails with invalid interval of reporting the units not yet idle."""
+    monkeypatch.setenv("COU_WAIT_REPORT_INTERVAL", "0")
+
+    with pytest.raises(EnvironmentVariableError, match="COU_WAIT_REPORT_INTERVAL"):
+        juju_utils.Model("test-model")
+
+
+@pytest.mark.asyncio
+@patch("cou.utils.juju_utils.IdleWaitTracker")
+async def test_coumodel_wait_for_idle_report_interval(
+    mock_tracker, mocked_model, mocked_jubilant_juju
+):
+    """Test Model reports the units not yet idle every interval."""
+    model = juju_utils.Model("test-model")
+    model._wait_report_interval = 60.0
+
+    await model.wait_for_idle(60, status="blocked", apps=["app1"])
+
+    mock_tracker.assert_called_once_with("blocked", 60.0)
+
+
+@pytest.mark.asyncio
+async def test_coumodel_wait_for_idle_in_thread(mocked_model, mocked_jubilant_juju):
+    """Test Model waits for apps in a thread, so the event loop is not blocked."""
+    model = juju_utils.Model("test-model")
+    threads = []
+    mocked_jubilant_juju.wait.side_effect = lambda **_: threads.append(threading.get_ident())
+
+    await model.wait_for_idle(60, apps=["app1"])
+
+    mocked_jubilant_juju.wait.assert_called_once()
+    assert threads != [threading.get_ident()]
+
+
 @pytest.mark.asyncio
 @patch("cou.utils.juju_utils.Model._get_supported_apps")
 async def test_coumodel_wait_for_idle_apps(
@@ -911,10 +1098,13 @@ async def test_wait_for_idle_jubilant_waiterror_conversion(
 async def test_get_machines(mocked_model):
     """Test Model getting machines from model."""
     expected_machines = {
-        "0": juju_utils.Machine("0", (("my_app1", "app1"), ("my_app2", "app2")), "zone-1"),
-        "1": juju_utils.Machine("1", (("my_app1", "app1"),), "zone-2"),
-        "2": juju_utils.Machine("2", (("my_app1", "app1"),), "zone-3"),
+        "0": juju_utils.Machine(
+            "0", (("my_app1", "app1"), ("my_app2", "app2")), "zone-1", "serverstack"
+        ),
+        "1": juju_utils.Machine("1", (("my_app1", "app1"),), "zone-2", "serverstack"),
+        "2": juju_utils.Machine("2", (("my_app1", "app1"),), "zone-3", "serverstack"),
     }
+    mocked_model.info.cloud_region = "serverstack"
     mocked_model.machines = {f"{i}": _generate_juju_machine(f"{i}") for i in range(3)}
     mocked_model.units = {
         "my_app1/0": _generate_juju_unit("my_app1", "0", "0"),
@@ -981,6 +1171,51 @@ def _generate_app_status(units: dict[str, MagicMock]) -> MagicMock:
     return status
 
 
+def _generate_full_status(
+    workload_version: str = "17.0.1", hardware: str = "arch=amd64 availability-zone=az-1"
+) -> FullStatus:
+    """Generate full status with single application."""
+    unit = UnitStatus(
+        machine="0",
+        workload_version=workload_version,
+        workload_status=DetailedStatus(status="active", info="Unit is ready"),
+        subordinates={},
+    )
+    app = ApplicationStatus(
+        base=Base("20.04/stable", "ubuntu"),
+        charm="ch:keystone-1",
+        charm_channel="ussuri/stable",
+        units={"keystone/0": unit},
+        workload_version=workload_version,
+    )
+    return FullStatus(
+        applications={"keystone": app}, machines={"0": MachineStatus(hardware=hardware)}
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "other_status, exp_same",
+    [
+        (_generate_full_status(), True),
+        (_generate_full_status(workload_version="18.0.0"), False),
+        (_generate_full_status(hardware="arch=amd64 availability-zone=az-2"), False),
+    ],
+)
+@patch("cou.utils.juju_utils.Model.get_status")
+async def test_coumodel_get_status_fingerprint(
+    mock_get_status, other_status, exp_same, mocked_model
+):
+    """Test Model getting fingerprint of model state."""
+    model = juju_utils.Model("test-model")
+    mock_get_status.side_effect = [_generate_full_status(), other_status]
+
+    fingerprint = await model.get_status_fingerprint()
+
+    assert (fingerprint == await model.get_status_fingerprint()) is exp_same
+    assert len(fingerprint) == 64
+
+
 @pytest.mark.asyncio
 @patch("cou.utils.juju_utils.Model.get_status")
 @patch("cou.utils.juju_utils.Model._get_machines")
@@ -1101,6 +1336,36 @@ async def test_get_applications(mock_get_machines, mock_get_status, mocked_model
     assert len(apps["app4"].machines) == 1
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize("workload_version, exp_reused", [("17.0.1", True), ("18.1.0", False)])
+@patch("cou.utils.juju_utils.Model.get_status")
+@patch("cou.utils.juju_utils.Model._get_machines")
+async def test_get_applications_cached(
+    mock_get_machines, mock_get_status, workload_version, exp_reused, mocked_model
+):
+    """Test Model getting applications with config and actions of unchanged ones reused."""
+    config = {"openstack-origin": {"value": "distro"}}
+    new_config = {"openstack-origin": {"value": "cloud:focal-victoria"}}
+    mock_get_status.return_value = _generate_full_status()
+    mock_get_machines.return_value = {"0": juju_utils.Machine("0", (), "az-1")}
+    mocked_model.applications = {"keystone": _generate_juju_app("keystone")}
+    mocked_app = mocked_model.applications["keystone"]
+    mocked_app.units = [_generate_juju_unit("keystone", "0", "0")]
+    mocked_app.get_config = AsyncMock(side_effect=[config, new_config])
+    mocked_app.get_actions = AsyncMock(return_value={"pause": "Pause the unit."})
+
+    model = juju_utils.Model("test-model")
+    cached = await model.get_applications()
+    mock_get_status.return_value = _generate_full_status(workload_version)
+    apps = await model.get_applications(cached)
+
+    assert apps["keystone"].workload_version == workload_version
+    assert apps["keystone"].config == (config if exp_reused else new_config)
+    assert apps["keystone"].actions == {"pause": "Pause the unit."}
+    assert mocked_app.get_config.await_count == (1 if exp_reused else 2)
+    assert mocked_app.get_actions.await_count == (1 if exp_reused else 2)
+
+
 def test_unit_repr():
     unit = juju_utils.Unit(name="foo/0", machine=MagicMock(), workload_version="1")
     assert repr(unit) == "foo/0"
@@ -1227,3 +1492,31 @@ async def test_coumodel_get_application_status_failed(mocked_model):
         match="Cannot find 'app-not-exists' in model 'mocked-model'.",
     ):
         await model.get_application_status(app_name="app-not-exists")
+
+
+@pytest.mark.asyncio
+async def test_wait_for_idle_timeout_blocking_units(mocked_model, mocked_jubilant_juju):
+    """Test that WaitForApplicationsTimeout carries summary of the units not yet idle."""
+    unit = MagicMock()
+    unit.workload_status.current = "maintenance"
+    unit.workload_status.message = "installing packages"
+    unit.workload_status.since = "18 Oct 2023 09:41:09Z"
+    unit.juju_status.current = "executing"
+    unit.juju_status.since = "18 Oct 2023 09:40:00Z"
+    status = MagicMock()
+    status.get_units.return_value = {"app1/0": unit}
+
+    def wait(ready, error, successes):
+        ready(status)
+        raise TimeoutError("Timeout waiting for apps")
+
+    mocked_jubilant_juju.wait.side_effect = wait
+    model = juju_utils.Model("test-model")
+
+    with pytest.raises(WaitForApplicationsTimeout) as exc_info:
+        await model.wait_for_idle(timeout=1, apps=["app1"])
+
+    assert str(exc_info.value).startswith(
+        "Timeout waiting for apps\nUnits not yet active and idle: app1/0 maintenance/executing for "
+    )
+    assert str(exc_info.value).endswith(": 'installing packages'")
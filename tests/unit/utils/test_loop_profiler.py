@@ -0,0 +1,284 @@
+#  Copyright 2023 Canonical Limited
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Test profiling of the asyncio tasks and the event loop."""
+import asyncio
+import json
+import time
+from unittest.mock import ANY, MagicMock, patch
+
+import pytest
+
+from cou.exceptions import EnvironmentVariableError
+from cou.utils.loop_profiler import BlockingCall, LoopProfiler, TaskStats, _TimedCoroutine
+
+
+async def _busy(duration: float) -> str:
+    """Block the event loop and then await."""
+    time.sleep(duration)
+    await asyncio.sleep(duration)
+    return "done"
+
+
+async def _fail() -> None:
+    """Fail after awaiting."""
+    await asyncio.sleep(0)
+    raise ValueError("failed")
+
+
+@pytest.mark.asyncio
+async def test_loop_profiler_tasks():
+    """Test recording running and awaiting time of the tasks by their coroutine."""
+    profiler = LoopProfiler()
+    profiler.start()
+    try:
+        results = await asyncio.gather(_busy(0.05), _busy(0.01), return_exceptions=True)
+        with pytest.raises(ValueError, match="failed"):
+            await asyncio.create_task(_fail(), name="failing-task")
+    finally:
+        profiler.stop()
+
+    assert results == ["done", "done"]
+    busy, fail = profiler.tasks["_busy"], profiler.tasks["_fail"]
+    assert busy.tasks == busy.finished == 2
+    assert busy.running_time >= 0.06
+    assert busy.awaiting_time >= 0.06
+    assert busy.longest_step >= 0.05
+    assert busy.steps == 4
+    assert fail.tasks == fail.finished == 1
+
+
+async def _wait(event: asyncio.Event) -> None:
+    """Await the event without blocking the event loop."""
+    await event.wait()
+
+
+async def _block(event: asyncio.Event, duration: float) -> None:
+    """Set the event and block the event loop after awaiting."""
+    await asyncio.sleep(0.01)
+    event.set()
+    time.sleep(duration)
+
+
+@pytest.mark.asyncio
+async def test_loop_profiler_tasks_ready():
+    """Test recording time the tasks were ready to run, but the event loop was blocked."""
+    profiler = LoopProfiler()
+    profiler.start()
+    try:
+        event = asyncio.Event()
+        await asyncio.gather(_wait(event), _block(event, 0.05))
+    finally:
+        profiler.stop()
+
+    wait = profiler.tasks["_wait"]
+    assert wait.awaiting_time >= 0.01
+    assert wait.ready_time >= 0.05
+
+
+@pytest.mark.asyncio
+async def test_loop_profiler_stop_unfinished_tasks():
+    """Test recording time of the tasks not finished when the profiler is stopped."""
+    profiler = LoopProfiler()
+    profiler.start()
+    task = asyncio.create_task(_wait(asyncio.Event()))
+
+    async def stop():
+        await asyncio.sleep(0.05)
+        time.sleep(0.01)
+        profiler.stop()
+        time.sleep(0.1)
+
+    await asyncio.create_task(stop())
+    await asyncio.sleep(0)
+    task.cancel()
+
+    wait, stop_stats = profiler.tasks["_wait"], profiler.tasks[stop.__qualname__]
+    assert wait.finished == 0
+    assert wait.awaiting_time >= 0.05
+    assert wait.steps == 1
+    assert stop_stats.finished == 0
+    assert stop_stats.steps == 2
+    assert 0.01 <= stop_stats.longest_step < 0.1  # the step is recorded until stopped
+
+
+@pytest.mark.asyncio
+async def test_loop_profiler_task_factory():
+    """Test creating tasks with the original task factory of the event loop."""
+    loop = asyncio.get_running_loop()
+    task_factory = MagicMock(
+        side_effect=lambda loop, coro, **kwargs: asyncio.Task(coro, loop=loop)
+    )
+    loop.set_task_factory(task_factory)
+    profiler = LoopProfiler()
+    profiler.start()
+    try:
+        assert await asyncio.create_task(_busy(0)) == "done"
+    finally:
+        profiler.stop()
+        loop.set_task_factory(None)
+
+    task_factory.assert_called_with(loop, ANY)
+    assert isinstance(task_factory.call_args.args[1], _TimedCoroutine)
+    assert profiler.tasks["_busy"].finished == 1
+
+
+@pytest.mark.asyncio
+async def test_timed_coroutine():
+    """Test the wrapped coroutine is accessible through the timed coroutine."""
+    stats = TaskStats("_busy")
+    coro = _busy(0)
+    timed_coro = _TimedCoroutine(coro, stats)
+
+    assert timed_coro.cr_frame is coro.cr_frame
+    assert await timed_coro == "done"
+
+    failed_coro = _TimedCoroutine(_busy(0), stats)
+    with pytest.raises(ValueError, match="thrown"):
+        failed_coro.throw(ValueError("thrown"))
+
+    closed_coro = _TimedCoroutine(_busy(0), stats)
+    closed_coro.close()
+    assert closed_coro.cr_frame is None
+    assert stats.finished == 1  # only the steps run by a task are recorded
+
+
+def test_loop_profiler_blocking_threshold(monkeypatch):
+    """Test the blocking threshold is read from the environment variable."""
+    monkeypatch.setenv("COU_LOOP_BLOCKING_THRESHOLD", "2.5")
+
+    assert LoopProfiler().blocking_threshold == 2.5
+
+
+def test_loop_profiler_blocking_threshold_invalid(monkeypatch):
+    """Test the blocking threshold in the environment variable is validated."""
+    monkeypatch.setenv("COU_LOOP_BLOCKING_THRESHOLD", "slow")
+
+    with pytest.raises(EnvironmentVariableError, match="COU_LOOP_BLOCKING_THRESHOLD"):
+        LoopProfiler()
+
+
+@pytest.mark.asyncio
+async def test_loop_profiler_stop_restores_task_factory():
+    """Test stopping the profiler restores the original task factory."""
+    loop = asyncio.get_running_loop()
+    profiler = LoopProfiler()
+
+    profiler.stop()  # stopping the profiler which was not started does nothing
+    profiler.start()
+    assert loop.get_task_factory() is not None
+    profiler.stop()
+
+    assert loop.get_task_factory() is None
+    assert loop.call_soon == type(loop).call_soon.__get__(loop)
+    assert profiler._monitor is None
+    assert profiler._watchdog is None
+
+
+@pytest.mark.asyncio
+async def test_loop_profiler_blocking_call(monkeypatch):
+    """Test capturing stack of the call blocking the event loop."""
+    monkeypatch.setenv("COU_LOOP_BLOCKING_THRESHOLD", "0.2")
+    profiler = LoopProfiler()
+    profiler.start()
+    try:
+        await asyncio.sleep(0.15)
+        time.sleep(0.6)  # blocking call
+        await asyncio.sleep(0.15)
+    finally:
+        profiler.stop()
+
+    assert len(profiler.blocking_calls) == 1
+    assert profiler.blocking_calls[0].duration >= 0.4
+    assert "test_loop_profiler_blocking_call" in profiler.blocking_calls[0].stack
+    assert profiler.lag_max >= 0.4
+    assert sum(profiler.lag_histogram) >= 2
+
+
+def test_loop_profiler_record_lag():
+    """Test recording lag of the event loop and keeping only the longest blocking calls."""
+    profiler = LoopProfiler()
+
+    for i in range(12):
+        profiler._blocked_stack = f"stack {i}"
+        profiler._record_lag(i + 1.0)
+    profiler._record_lag(0.001)
+
+    assert profiler.lag_histogram == [1, 0, 0, 0, 1, 4, 7]
+    assert profiler.lag_max == 12.0
+    assert sorted(call.duration for call in profiler.blocking_calls) == [
+        3.0,
+        4.0,
+        5.0,
+        6.0,
+        7.0,
+        8.0,
+        9.0,
+        10.0,
+        11.0,
+        12.0,
+    ]
+
+
+def test_loop_profiler_summary_and_save(tmp_path):
+    """Test summary and saved profile of the event loop."""
+    profiler = LoopProfiler()
+    profiler.tasks = {
+        "wait_for_idle": TaskStats("wait_for_idle", 1, 1, running_time=0.5, awaiting_time=1.5),
+        "apply_step": TaskStats(
+            "apply_step", 3, 2, running_time=2.0, awaiting_time=8.0, ready_time=0.25, steps=5
+        ),
+    }
+    profiler.blocking_calls = [BlockingCall(1.5, 'File "juju.py", line 1, in wait')]
+    profiler._record_lag(0.02)
+    path = tmp_path / "log" / "cou.asyncio.json"
+
+    summary = profiler.get_summary()
+    profiler.save(path)
+
+    assert summary.splitlines() == [
+        "Event loop lag: 1 samples, mean 0.020 s, max 0.020 s",
+        "Coroutines of the tasks with the longest running time (of 4 tasks):",
+        "  apply_step: 3 tasks, running 2.000 s, awaiting 8.000 s, ready 0.250 s, "
+        "longest step 0.000 s",
+        "  wait_for_idle: 1 tasks, running 0.500 s, awaiting 1.500 s, ready 0.000 s, "
+        "longest step 0.000 s",
+        "Calls blocking the event loop for more than 0.5 s:",
+        "  blocked for 1.50 s in:",
+        '    File "juju.py", line 1, in wait',
+    ]
+    data = json.loads(path.read_text())
+    assert data["tasks"][1] == {
+        "coroutine": "apply_step",
+        "tasks": 3,
+        "finished": 2,
+        "running_time": 2.0,
+        "awaiting_time": 8.0,
+        "ready_time": 0.25,
+        "steps": 5,
+        "longest_step": 0.0,
+    }
+    assert data["lag"]["histogram"]["0.05"] == 1
+    assert data["blocking_calls"] == [
+        {"duration": 1.5, "stack": 'File "juju.py", line 1, in wait'}
+    ]
+
+
+def test_loop_profiler_save_error(tmp_path):
+    """Test saving the profile to a path which can not be written."""
+    (tmp_path / "cou.asyncio.json").mkdir()
+
+    with patch("cou.logging.logger") as mock_logger:
+        LoopProfiler().save(tmp_path / "cou.asyncio.json")  # no exception raised
+
+    mock_logger.warning.assert_called_once()
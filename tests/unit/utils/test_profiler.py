@@ -0,0 +1,71 @@
+#  Copyright 2023 Canonical Limited
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+"""Test profiling of the run."""
+import pstats
+import tracemalloc
+from unittest.mock import patch
+
+from cou.utils.profiler import Profiler
+
+
+def _allocate() -> list[bytes]:
+    """Allocate memory."""
+    return [bytes(1024) for _ in range(1024)]
+
+
+def test_profiler(tmp_path):
+    """Test profiling CPU time and memory and saving the profile."""
+    profile_file, summary_file = tmp_path / "log" / "cou.prof", tmp_path / "log" / "cou.txt"
+    profiler = Profiler()
+
+    profiler.start()
+    data = _allocate()
+    profiler.stop()
+    profiler.stop()  # stopping the profiler again does nothing
+    profiler.save(profile_file, summary_file)
+
+    assert len(data) == 1024
+    assert not tracemalloc.is_tracing()
+    assert profiler.peak_memory >= 1024 * 1024
+    assert any(func[2] == "_allocate" for func in pstats.Stats(str(profile_file)).stats)
+    summary = summary_file.read_text()
+    assert summary.startswith("CPU profile\n")
+    assert "_allocate" in summary
+    assert "Peak traced memory: " in summary
+    assert "test_profiler.py" in summary
+
+
+def test_profiler_not_started(tmp_path):
+    """Test profiler which was not started."""
+    profiler = Profiler()
+
+    profiler.stop()
+    profiler.save(tmp_path / "cou.prof", tmp_path / "cou.txt")
+
+    assert profiler.get_summary() == "No profile was recorded."
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_profiler_save_error(tmp_path):
+    """Test saving the profile to a path which can not be written."""
+    profiler = Profiler()
+    profiler.start()
+    profiler.stop()
+    (tmp_path / "cou.prof").mkdir()
+
+    with patch("cou.logging.logger") as mock_logger:
+        profiler.save(tmp_path / "cou.prof", tmp_path / "cou.txt")  # no exception raised
+
+    mock_logger.warning.assert_called_once()
+    assert (tmp_path / "cou.txt").exists()
@@ -12,11 +12,13 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 from typing import Optional
-from unittest.mock import patch
+from unittest.mock import MagicMock, call, patch
 
 import pytest
+from log_symbols.symbols import LogSymbols
 
-from cou.utils import SmartHalo, prompt_input
+from cou.exceptions import EnvironmentVariableError
+from cou.utils import SmartHalo, get_env_count, get_env_seconds, prompt_input
 from cou.utils.text_styler import bold, normal
 
 
@@ -117,6 +119,7 @@ def test_smart_halo_behavior_tty(
         ("succeed", (None,)),  # succeed without text
         ("fail", ()),
         ("stop_and_persist", ("Saved!",)),
+        ("update", ("Waiting...",)),
     ],
 )
 def test_smart_halo_behavior_non_tty(
@@ -137,6 +140,58 @@ def test_smart_halo_behavior_non_tty(
         mock_print.assert_not_called()
 
 
+def test_smart_halo_update_tty(mocker, fake_halo):
+    mocker.patch("sys.stdout.isatty", return_value=True)
+    fake_halo.return_value.text = "Loading..."
+
+    halo = SmartHalo()
+    assert halo.text == "Loading..."
+
+    halo.update("Waiting...")
+    assert halo.text == "Waiting..."
+
+
+@pytest.mark.parametrize("isatty", [True, False])
+def test_smart_halo_paused(mocker, fake_halo, isatty):
+    mocker.patch("sys.stdout.isatty", return_value=isatty)
+    mock_print = mocker.patch("builtins.print")
+    printer = MagicMock()
+    halo = SmartHalo()
+
+    halo.pause(printer)
+    halo.start("Loading...")
+    assert halo.text == "Loading..."
+    halo.update("Waiting...")
+    assert halo.text == "Waiting..."
+    halo.succeed()
+    assert halo.text is None
+    halo.succeed()
+    halo.info("Info...")
+    halo.stop_and_persist("Saved!")
+    halo.start("Failing...")
+    halo.fail()
+    halo.start("Stopping...")
+    halo.stop()
+    assert halo.text is None
+    halo.resume()
+
+    assert printer.call_args_list == [
+        call(f"Waiting... {LogSymbols.SUCCESS.value}"),
+        call(f"Info... {LogSymbols.INFO.value}"),
+        call("Saved!"),
+    ]
+    mock_print.assert_not_called()
+    fake_halo.return_value.start.assert_not_called()
+    fake_halo.return_value.succeed.assert_not_called()
+    assert halo.printer is None
+
+
+def test_smart_halo_text_non_tty(mocker):
+    mocker.patch("sys.stdout.isatty", return_value=False)
+
+    assert SmartHalo().text is None
+
+
 @pytest.mark.parametrize(
     "isatty, spinner_id",
     [
@@ -154,3 +209,45 @@ def test_smart_halo_behavior_spinner_id(mocker, fake_halo, isatty, spinner_id):
     halo = SmartHalo()
 
     assert halo.spinner_id == spinner_id
+
+
+@pytest.mark.parametrize("value, exp_seconds", [(None, 5.0), ("0.25", 0.25), (" 60 ", 60.0)])
+def test_get_env_seconds(value, exp_seconds, monkeypatch):
+    """Test getting number of seconds from the environment variable."""
+    if value is not None:
+        monkeypatch.setenv("COU_TEST_INTERVAL", value)
+
+    assert get_env_seconds("COU_TEST_INTERVAL", 5.0) == exp_seconds
+
+
+@pytest.mark.parametrize("value", ["", "fast", "0", "-1", "inf", "nan"])
+def test_get_env_seconds_invalid(value, monkeypatch):
+    """Test getting number of seconds from the environment variable with invalid value."""
+    monkeypatch.setenv("COU_TEST_INTERVAL", value)
+
+    with pytest.raises(
+        EnvironmentVariableError,
+        match=f"COU_TEST_INTERVAL must be a positive number of seconds, got '{value}'",
+    ):
+        get_env_seconds("COU_TEST_INTERVAL", 5.0)
+
+
+@pytest.mark.parametrize("value, exp_count", [(None, 5), ("0", 0), (" 3 ", 3)])
+def test_get_env_count(value, exp_count, monkeypatch):
+    """Test getting count from the environment variable."""
+    if value is not None:
+        monkeypatch.setenv("COU_TEST_COUNT", value)
+
+    assert get_env_count("COU_TEST_COUNT", 5) == exp_count
+
+
+@pytest.mark.parametrize("value", ["", "many", "1.5", "-1"])
+def test_get_env_count_invalid(value, monkeypatch):
+    """Test getting count from the environment variable with invalid value."""
+    monkeypatch.setenv("COU_TEST_COUNT", value)
+
+    with pytest.raises(
+        EnvironmentVariableError,
+        match=f"COU_TEST_COUNT must be a non-negative integer, got '{value}'",
+    ):
+        get_env_count("COU_TEST_COUNT", 5)